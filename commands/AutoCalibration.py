@@ -25,6 +25,7 @@ Options:
     --quality-only      Only perform quality assessment without calibration
     -r, --report        Generate detailed quality report
     --min-files         Override minimum files per master (default: from config)
+    --rejection         Pixel rejection method for masters (sigma|winsorized|linear_fit|minmax|percentile|none)
     --no-cleanup        Skip cleanup operations after processing
     --dry-run           Show what would be done without making changes
     --log-file          Write logs to specified file (default: astrofiler.log)
@@ -382,7 +383,7 @@ def analyze_calibration_opportunities(config, session_id=None, min_files=None):
         logging.error(f"Error analyzing calibration opportunities: {e}")
         return {'error': str(e)}
 
-def create_master_frames(config, session_id=None, force=False, dry_run=False, verbose=False):
+def create_master_frames(config, session_id=None, force=False, dry_run=False, verbose=False, rejection=None):
     """Create master calibration frames - wrapper for core library function"""
     ensure_astrofiler_imports()
     
@@ -398,7 +399,8 @@ def create_master_frames(config, session_id=None, force=False, dry_run=False, ve
             force=force,
             dry_run=dry_run,
             verbose=verbose,
-            progress_callback=create_cli_progress_callback("Creating masters")
+            progress_callback=create_cli_progress_callback("Creating masters"),
+            rejection=rejection
         )
         
         return success
@@ -551,75 +553,42 @@ def clear_all_masters(config, dry_run=False):
         logging.error(f"Error clearing master frames: {e}")
         return False
 
-def perform_quality_assessment(config, session_id=None, generate_report=False):
+def perform_quality_assessment(config, session_id=None, generate_report=False, force=False):
     """Perform enhanced quality assessment with SEP star detection and database updates"""
-    from astrofiler.core.enhanced_quality import EnhancedQualityAnalyzer
-    from astrofiler.models import fitsFile
+    from astrofiler.core.quality_engine import QualityAssessmentEngine, find_frames_needing_assessment
     
     logging.info("Starting enhanced quality assessment with SEP star detection...")
     
     try:
-        analyzer = EnhancedQualityAnalyzer()
-        
-        # Get files to assess - focus on light frames
-        if session_id:
-            query = fitsFile.select().where(
-                fitsFile.fitsFileSession == session_id,
-                fitsFile.fitsFileName.is_null(False),
-                fitsFile.fitsFileSoftDelete == False
-            )
-        else:
-            # Analyze light frames by default
-            query = fitsFile.select().where(
-                fitsFile.fitsFileType == 'LIGHT',
-                fitsFile.fitsFileName.is_null(False),
-                fitsFile.fitsFileSoftDelete == False
-            )
-        
-        files_to_assess = list(query)
+        # Light frames (or one session) without metrics or changed since their last analysis
+        files_to_assess = find_frames_needing_assessment(session_id, force=force)
         
         if not files_to_assess:
-            logging.info("No files found for quality assessment")
+            logging.info("No files need quality assessment")
             return True
         
         logging.info(f"Analyzing quality for {len(files_to_assess)} files...")
         
-        # Analyze each file and update database
-        successful = 0
-        failed = 0
         quality_metrics = []
         
-        for i, fits_file in enumerate(files_to_assess):
-            try:
-                logging.info(f"[{i+1}/{len(files_to_assess)}] Analyzing {fits_file.fitsFileObject}...")
+        def log_result(candidate, results):
+            if results.get("status") == "success":
+                quality_metrics.append(results)
                 
-                # Analyze and update database
-                results = analyzer.analyze_and_update_file(
-                    fits_file.fitsFileName,
-                    fits_file.fitsFileId,
-                    progress_callback=None
-                )
-                
-                if results.get("status") == "success":
-                    successful += 1
-                    quality_metrics.append(results)
-                    
-                    # Log key metrics
-                    fwhm = results.get('avg_fwhm_arcsec', 'N/A')
-                    stars = results.get('star_count', 'N/A')
-                    snr = results.get('image_snr', 'N/A')
-                    logging.info(f"  [OK] FWHM: {fwhm}, Stars: {stars}, SNR: {snr:.1f}")
-                else:
-                    failed += 1
-                    logging.warning(f"  [FAIL] Failed: {results.get('message', 'Unknown error')}")
-                    
-            except Exception as e:
-                failed += 1
-                logging.error(f"  [ERROR] Error: {e}")
-                continue
+                # Log key metrics
+                fwhm = results.get('avg_fwhm_arcsec', 'N/A')
+                stars = results.get('star_count', 'N/A')
+                snr = results.get('image_snr') or 0.0
+                logging.info(f"  [OK] {os.path.basename(candidate.path)} FWHM: {fwhm}, Stars: {stars}, SNR: {snr:.1f}")
+            else:
+                logging.warning(f"  [FAIL] {os.path.basename(candidate.path)}: {results.get('message', 'Unknown error')}")
+        
+        # Frames are analyzed in worker processes; metrics are committed in batches,
+        # so an interrupted run resumes with the frames not yet written
+        stats = QualityAssessmentEngine().assess(files_to_assess, result_callback=log_result)
         
         # Summary statistics
-        logging.info(f"\nQuality assessment complete: {successful} successful, {failed} failed")
+        logging.info(f"\nQuality assessment complete: {stats['analyzed']} successful, {stats['failed']} failed")
         
         if quality_metrics:
             # Calculate average metrics
@@ -800,6 +769,9 @@ def generate_quality_report(quality_results, config):
 
 def main():
     """Main CLI entry point"""
+    ensure_astrofiler_imports()
+    from astrofiler.core.stacking import REJECTION_METHODS
+
     parser = argparse.ArgumentParser(
         description='AstroFiler Auto-Calibration CLI Tool',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -817,13 +789,15 @@ def main():
     parser.add_argument('-s', '--session', type=str,
                        help='Specific session ID to process')
     parser.add_argument('-f', '--force', action='store_true',
-                       help='Force operation even if masters exist')
+                       help='Force operation even if masters exist (quality: reanalyze every frame)')
     parser.add_argument('--quality-only', action='store_true',
                        help='Only perform quality assessment without calibration')
     parser.add_argument('-r', '--report', action='store_true',
                        help='Generate detailed quality report')
     parser.add_argument('--min-files', type=int,
                        help='Override minimum files per master')
+    parser.add_argument('--rejection', choices=list(REJECTION_METHODS),
+                       help='Pixel rejection method for master creation (default: stack_rejection from config, else sigma)')
     parser.add_argument('--no-cleanup', action='store_true',
                        help='Skip cleanup operations after processing')
     parser.add_argument('--dry-run', action='store_true',
@@ -857,20 +831,21 @@ def main():
             success = opportunities is not None
             
         elif args.operation == 'masters':
-            success = create_master_frames(config, args.session, args.force, args.dry_run, args.verbose)
+            success = create_master_frames(config, args.session, args.force, args.dry_run, args.verbose,
+                                           rejection=args.rejection)
             
         elif args.operation == 'calibrate-lights':
             success = calibrate_light_frames(config, args.session, args.force, args.dry_run)
             
         elif args.operation == 'quality':
-            success = perform_quality_assessment(config, args.session, args.report)
+            success = perform_quality_assessment(config, args.session, args.report, args.force)
             
         elif args.operation == 'clear-masters':
             success = clear_all_masters(config, args.dry_run)
             
         elif args.operation == 'all':
             if args.quality_only:
-                success = perform_quality_assessment(config, args.session, args.report)
+                success = perform_quality_assessment(config, args.session, args.report, args.force)
             else:
                 success = run_complete_workflow(config, args.session, args.force, args.dry_run)
         
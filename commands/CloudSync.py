@@ -559,6 +559,7 @@ def perform_complete_sync_cli(cloud_config, repo_path):
     from astrofiler.ui.cloud_sync_dialog import list_gcs_bucket_files, download_file_from_gcs, upload_file_to_backup
     from astrofiler.models import fitsFile
     from astrofiler.core import fitsProcessing
+    from astrofiler.core.services import wait_for_hash_backfill
     import configparser
     
     # Read configuration file
@@ -672,6 +673,11 @@ def perform_complete_sync_cli(cloud_config, repo_path):
             except Exception as e:
                 logging.error(f"Failed to download {cloud_file['name']}: {e}")
     
+    # Full hashes deferred during registration are computed on a daemon thread
+    if not wait_for_hash_backfill(timeout=0):
+        print("Waiting for the background hash backfill to finish...")
+        wait_for_hash_backfill()
+
     print(f"\nPhase 1 completed:")
     print(f"  Files downloaded: {downloaded_count}")
     print(f"  Files registered: {registered_count}")
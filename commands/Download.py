@@ -68,6 +68,7 @@ def ensure_astrofiler_imports():
 
 from astrofiler.services.telescope import SmartTelescopeManager
 from astrofiler.core import fitsProcessing
+from astrofiler.core.services import wait_for_hash_backfill
 from astrofiler.models import Mapping as MappingModel
 from astropy.io import fits as astropy_fits
 
@@ -342,6 +343,11 @@ def download_files(telescope_type, hostname, network, destination, username=None
             failed_count += 1
             logger.error(f"Failed to download {file_name}: {error}")
     
+    # Full hashes deferred during registration are computed on a daemon thread
+    if not wait_for_hash_backfill(timeout=0):
+        logger.info("Waiting for the background hash backfill to finish...")
+        wait_for_hash_backfill()
+
     logger.info(f"Download completed: {downloaded_count} downloaded, {registered_count} registered, {failed_count} failed")
     return failed_count == 0
 
@@ -18,6 +18,8 @@ Options:
     -s, --single-mapping CARD/INPUT/OUTPUT
                         Add a temporary one-time mapping (e.g., -s OBJECT/Unknown/M31)
                         Can be used multiple times. Mapping is removed after completion.
+    -w, --workers       Number of parallel ingest workers (default: ingest_workers
+                        from astrofiler.ini, 0 = one per CPU core)
 
 Requirements:
     - astrofiler.ini configuration file
@@ -69,6 +71,8 @@ def ensure_astrofiler_imports():
         sys.path.insert(0, src_path)
 
 from astrofiler.core import fitsProcessing
+from astrofiler.core.parallel_ingest import resolve_workers
+from astrofiler.core.services import wait_for_hash_backfill
 from astrofiler.database import setup_database
 from astrofiler.models import Mapping as MappingModel
 from astropy.io import fits as astropy_fits
@@ -209,6 +213,7 @@ Examples:
     python LoadRepo.py --source /path/to/source  # Override source folder
     python LoadRepo.py -s OBJECT/Unknown/M31     # Temporary mapping for this run only
     python LoadRepo.py -s OBJECT/Unknown/M31 -s FILTER//RGB  # Multiple temporary mappings
+    python LoadRepo.py -w 8                      # Ingest with 8 parallel workers
 
 Note: 
     - For database synchronization with existing files, use SyncRepo.py instead.
@@ -227,6 +232,8 @@ Note:
                         help='Override repository folder path')
     parser.add_argument('-s', '--single-mapping', action='append', metavar='CARD/INPUT/OUTPUT',
                         help='Add a temporary one-time mapping (e.g., -s OBJECT/Unknown/M31). Can be used multiple times. Mapping is removed after completion.')
+    parser.add_argument('-w', '--workers', type=int,
+                        help='Number of parallel ingest workers (default: ingest_workers from astrofiler.ini, 0 = one per CPU core)')
     
     args = parser.parse_args()
     
@@ -339,7 +346,8 @@ Note:
         
         result = processor.registerFitsImages(
             moveFiles=True,  # Always move files from source to repository
-            progress_callback=None  # Disabled for non-interactive use
+            progress_callback=None,  # Disabled for non-interactive use
+            workers=resolve_workers(args.workers)
         )
         
         # Handle the new tuple return format (registered_files, duplicate_count)
@@ -381,6 +389,11 @@ Note:
             except Exception as e:
                 logger.warning(f"Could not remove Masters folder {masters_source_dir}: {e}")
 
+        # Full hashes deferred during ingest are computed on a daemon thread
+        if not wait_for_hash_backfill(timeout=0):
+            logger.info("Waiting for the background hash backfill to finish...")
+            wait_for_hash_backfill()
+
         # Report results
         logger.info(f"=== Processing Complete ===")
         logger.info(f"Files processed: {len(registered_files)}")
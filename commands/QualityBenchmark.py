@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+QualityBenchmark.py - Command line utility to compare quality analysis modes
+
+This script analyzes the FITS files in a folder with the full-resolution
+quality analysis and with a binned analysis mode ('balanced': 2x2 binned
+detection, 'fast': 4x4 binned detection, both measuring stars on
+full-resolution cutouts), and reports the time taken by each and the relative
+difference of the binned metrics from the full ones.
+
+Usage:
+    python QualityBenchmark.py [options] FOLDER
+
+Options:
+    -h, --help          Show this help message and exit
+    -v, --verbose       Enable verbose logging
+    -m, --mode          Binned mode to compare with the full analysis
+                        (balanced or fast, default: fast)
+    -n, --limit         Analyze at most this many files (default: all)
+
+Examples:
+    # Compare the fast mode with the full analysis for a session folder
+    python QualityBenchmark.py /path/to/session
+
+    # Compare the balanced mode on the first 20 frames
+    python QualityBenchmark.py -m balanced -n 20 /path/to/session
+
+Note: Both modes read every file, so the first mode to touch a file pays for
+the cold disk read; the full analysis runs first.
+"""
+
+import sys
+import os
+import argparse
+import logging
+
+import numpy as np
+
+# Configure Python path for new package structure - must be before any astrofiler imports
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+src_path = os.path.join(project_root, 'src')
+
+# Ensure src path is first in path to avoid conflicts with root astrofiler.py
+if src_path in sys.path:
+    sys.path.remove(src_path)
+sys.path.insert(0, src_path)
+
+from astrofiler.core.enhanced_quality import EnhancedQualityAnalyzer
+
+FITS_EXTENSIONS = ('.fits', '.fit', '.fts', '.fits.gz', '.fit.gz', '.fts.gz', '.fz')
+
+METRICS = ('avg_fwhm_pixels', 'avg_hfr_pixels', 'avg_eccentricity', 'image_snr', 'star_count')
+
+def setup_logging(verbose=False):
+    """Setup logging configuration"""
+    level = logging.DEBUG if verbose else logging.INFO
+    logging.basicConfig(
+        level=level,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    return logging.getLogger(__name__)
+
+def find_files(folder, limit=None):
+    """Return up to limit FITS file paths below folder."""
+    files = []
+    for root, dirs, names in os.walk(folder):
+        for name in sorted(names):
+            if name.lower().endswith(FITS_EXTENSIONS):
+                files.append(os.path.join(root, name))
+                if limit and len(files) >= limit:
+                    return files
+    return files
+
+def main():
+    """Main function to compare quality analysis modes from command line."""
+    parser = argparse.ArgumentParser(
+        description="Compare binned quality analysis with the full analysis",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('folder', help='Folder containing FITS files to analyze')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Enable verbose logging')
+    parser.add_argument('-m', '--mode', choices=['balanced', 'fast'], default='fast',
+                        help='Binned mode to compare with the full analysis (default: fast)')
+    parser.add_argument('-n', '--limit', type=int,
+                        help='Analyze at most this many files (default: all)')
+
+    args = parser.parse_args()
+    logger = setup_logging(args.verbose)
+
+    files = find_files(args.folder, args.limit)
+    if not files:
+        logger.error(f"No FITS files found in {args.folder}")
+        return 1
+    logger.info(f"Comparing '{args.mode}' with the full analysis on {len(files)} files")
+
+    analyzer = EnhancedQualityAnalyzer(analysis_mode='full')
+    full_seconds = fast_seconds = 0.0
+    errors = {metric: [] for metric in METRICS}
+    for path in files:
+        comparison = analyzer.compare_analysis_modes(path, args.mode)
+        full_seconds += comparison['full_seconds']
+        fast_seconds += comparison['fast_seconds']
+        for metric, error in comparison['relative_error'].items():
+            errors[metric].append(error)
+
+    logger.info(f"{'Full analysis':<40} {full_seconds:8.2f} s  {full_seconds / len(files):6.2f} s/frame")
+    logger.info(f"{args.mode.capitalize() + ' analysis':<40} {fast_seconds:8.2f} s  "
+                f"{fast_seconds / len(files):6.2f} s/frame")
+    if fast_seconds > 0:
+        logger.info(f"Speedup: {full_seconds / fast_seconds:.1f}x")
+    for metric in METRICS:
+        if errors[metric]:
+            values = np.abs(errors[metric])
+            logger.info(f"{metric:<20} median |error| {np.median(values):7.2%}  "
+                        f"max |error| {np.max(values):7.2%}  ({len(values)} frames)")
+        else:
+            logger.info(f"{metric:<20} no frames with the metric from both modes")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
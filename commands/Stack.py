@@ -13,6 +13,9 @@ Notes:
       * Precalibrated sessions (iTelescope/SeeStar): stacks non-soft-deleted light frames
       * Other sessions: stacks calibrated, non-soft-deleted light frames
   - Star registration for light stacking uses astroalign (required).
+  - Frames are weighted and poor frames rejected from their stored quality
+    metrics (FWHM, SNR, star count, eccentricity) before any file is read;
+    see the stack_frame_* / stack_reject_* settings in astrofiler.ini.
 
 Examples:
   .venv\Scripts\python commands\Stack.py --all
@@ -20,6 +23,7 @@ Examples:
   .venv\Scripts\python commands\Stack.py --session 12345
   .venv\Scripts\python commands\Stack.py --unstacked --dry-run
     .venv\Scripts\python commands\Stack.py --session 12345 --photometric
+  .venv\Scripts\python commands\Stack.py --unstacked --rejection winsorized
 """
 
 import argparse
@@ -90,28 +94,6 @@ def _get_stack_candidates(session_id: str, precalibrated: bool):
     )
 
 
-def _select_best_reference_path(files) -> Optional[str]:
-    best_ref_path = None
-    best_hfr = None
-
-    for f in files:
-        p = getattr(f, 'fitsFileName', None)
-        if not p or not os.path.exists(p):
-            continue
-        hfr = getattr(f, 'fitsFileAvgHFRArcsec', None)
-        if hfr is None:
-            continue
-        try:
-            hfr_val = float(hfr)
-        except Exception:
-            continue
-        if best_hfr is None or hfr_val < best_hfr:
-            best_hfr = hfr_val
-            best_ref_path = p
-
-    return best_ref_path
-
-
 def _default_output_path(session, file_paths: List[str], object_name: str) -> str:
     from astrofiler.core.utils import sanitize_filesystem_name
 
@@ -143,7 +125,9 @@ def _mark_files_stacked(file_ids: List[str]) -> None:
     FitsFileModel.update(fitsFileStacked=1).where(FitsFileModel.fitsFileId.in_(file_ids)).execute()
 
 
-def stack_session(session_id: str, dry_run: bool, logger: logging.Logger, photometric: bool = False) -> bool:
+def stack_session(session_id: str, dry_run: bool, logger: logging.Logger, photometric: bool = False,
+                  rejection: Optional[str] = None) -> bool:
+    from astrofiler.core.frame_weighting import select_stack_frames
     from astrofiler.core.master_manager import get_master_manager
     from astrofiler.models import fitsSession as FitsSessionModel
 
@@ -170,7 +154,9 @@ def stack_session(session_id: str, dry_run: bool, logger: logging.Logger, photom
             )
         return True
 
-    file_paths = [f.fitsFileName for f in candidates if f.fitsFileName and os.path.exists(f.fitsFileName)]
+    # Reject and weight frames from stored quality metrics before any pixel I/O
+    selection = select_stack_frames(candidates)
+    file_paths = selection.paths
     if len(file_paths) < 2:
         logger.info(f"Not enough frames to stack for session {session_id} (found {len(file_paths)}); skipping")
         return True
@@ -185,12 +171,14 @@ def stack_session(session_id: str, dry_run: bool, logger: logging.Logger, photom
     else:
         output_path = _default_output_path(session, file_paths, object_name)
 
-    best_ref_path = _select_best_reference_path(candidates)
+    best_ref_path = selection.reference_path
 
     if dry_run:
         mode = 'photometric' if photometric else 'deep'
         logger.info(f"[DRY RUN] Would stack ({mode}) session {session_id} -> {output_path}")
         logger.info(f"[DRY RUN]   Frames: {len(file_paths)}")
+        for path, reason in selection.rejected.items():
+            logger.info(f"[DRY RUN]   Rejected: {os.path.basename(path)} ({reason})")
         if best_ref_path:
             logger.info(f"[DRY RUN]   Reference: {best_ref_path}")
         return True
@@ -207,6 +195,8 @@ def stack_session(session_id: str, dry_run: bool, logger: logging.Logger, photom
     mode = 'photometric' if photometric else 'deep'
     logger.info(f"Stacking ({mode}) session {session_id} ({object_name})")
     logger.info(f"Output: {output_path}")
+    if selection.rejected:
+        logger.info(f"Rejected {len(selection.rejected)} frame(s) on stored quality metrics")
 
     master_manager = get_master_manager()
     if photometric:
@@ -216,6 +206,7 @@ def stack_session(session_id: str, dry_run: bool, logger: logging.Logger, photom
             reference_path=best_ref_path,
             progress_callback=_progress_callback,
             thumbnail_session_id=str(session.fitsSessionId),
+            frame_weights=selection.weights,
         )
     else:
         ok = master_manager._create_master_sigma_clip(
@@ -225,6 +216,8 @@ def stack_session(session_id: str, dry_run: bool, logger: logging.Logger, photom
             reference_path=best_ref_path,
             progress_callback=_progress_callback,
             thumbnail_session_id=str(session.fitsSessionId),
+            rejection=rejection,
+            frame_weights=selection.weights,
         )
 
     if not ok or not os.path.exists(output_path):
@@ -232,7 +225,9 @@ def stack_session(session_id: str, dry_run: bool, logger: logging.Logger, photom
         return False
 
     try:
-        _mark_files_stacked([str(f.fitsFileId) for f in candidates if getattr(f, 'fitsFileId', None)])
+        stacked_paths = set(file_paths)
+        _mark_files_stacked([str(f.fitsFileId) for f in candidates
+                             if getattr(f, 'fitsFileId', None) and f.fitsFileName in stacked_paths])
     except Exception as e:
         logger.warning(f"Stack created but failed to mark files stacked in DB: {e}")
 
@@ -266,6 +261,8 @@ def _select_target_sessions(mode_all: bool, mode_unstacked: bool, single_session
 
 
 def main() -> int:
+    from astrofiler.core.stacking import REJECTION_METHODS
+
     parser = argparse.ArgumentParser(
         description='Batch stack light sessions',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -282,6 +279,11 @@ def main() -> int:
         action='store_true',
         help='Use photometry-safe stacking (registered mean, no sigma clipping). Default is deep/pretty sigma-clipped stacking.',
     )
+    parser.add_argument(
+        '--rejection',
+        choices=list(REJECTION_METHODS),
+        help='Pixel rejection method for deep stacking (default: stack_rejection from astrofiler.ini, else sigma)',
+    )
     parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose logging')
 
     args = parser.parse_args()
@@ -308,6 +310,7 @@ def main() -> int:
                 dry_run=args.dry_run,
                 logger=logger,
                 photometric=bool(args.photometric),
+                rejection=args.rejection,
             )
             if not ok:
                 failures += 1
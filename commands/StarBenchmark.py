@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+StarBenchmark.py - Command line utility to measure star measurement speed
+
+This script builds synthetic frames with a given number of stars, cuts a
+25x25 pixel cutout around each star as the quality analysis does, and
+measures FWHM, eccentricity and HFR with the original per-star loop (astropy
+sigma_clipped_stats, coordinate grids and radial profile per cutout) and with
+the batched kernels of astrofiler.core.star_measurement. It reports the
+measurement time per frame for each, and checks that both agree.
+
+Usage:
+    python StarBenchmark.py [options]
+
+Options:
+    -h, --help          Show this help message and exit
+    -v, --verbose       Enable verbose logging
+    -s, --stars         Comma separated star counts per frame
+                        (default: 10,100,1000)
+    -r, --repeat        Frames measured per star count (default: 3)
+
+Examples:
+    # Benchmark 10, 100 and 1000 stars per frame
+    python StarBenchmark.py
+
+    # Benchmark 5000 stars per frame, 5 frames
+    python StarBenchmark.py -s 5000 -r 5
+"""
+
+import sys
+import os
+import time
+import argparse
+import logging
+import warnings
+
+import numpy as np
+
+# Configure Python path for new package structure - must be before any astrofiler imports
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+src_path = os.path.join(project_root, 'src')
+
+# Ensure src path is first in path to avoid conflicts with root astrofiler.py
+if src_path in sys.path:
+    sys.path.remove(src_path)
+sys.path.insert(0, src_path)
+
+from astropy.stats import sigma_clipped_stats
+from astrofiler.core.star_measurement import measure_stars
+
+CUTOUT_SIZE = 25
+
+def setup_logging(verbose=False):
+    """Setup logging configuration"""
+    level = logging.DEBUG if verbose else logging.INFO
+    logging.basicConfig(
+        level=level,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    return logging.getLogger(__name__)
+
+def synthetic_cutouts(count, rng):
+    """Cutouts of Gaussian stars with random width, elongation and flux on a noisy sky."""
+    yy, xx = np.mgrid[:CUTOUT_SIZE, :CUTOUT_SIZE]
+    cutouts = np.empty((count, CUTOUT_SIZE, CUTOUT_SIZE), dtype=np.float32)
+    for index in range(count):
+        cx, cy = CUTOUT_SIZE // 2 + rng.uniform(-1.0, 1.0, 2)
+        sigma = rng.uniform(1.0, 3.5)
+        stretch = 1.0 + rng.uniform(0.0, 0.4)
+        angle = rng.uniform(0.0, np.pi)
+        u = (xx - cx) * np.cos(angle) + (yy - cy) * np.sin(angle)
+        v = (yy - cy) * np.cos(angle) - (xx - cx) * np.sin(angle)
+        flux = rng.uniform(1e3, 5e4)
+        star = flux / (2 * np.pi * sigma * sigma * stretch) * \
+            np.exp(-(u ** 2 / (2 * (sigma * stretch) ** 2) + v ** 2 / (2 * sigma ** 2)))
+        cutouts[index] = rng.normal(1000.0, 15.0, star.shape) + star
+    return cutouts
+
+def legacy_measure_star(cutout):
+    """Original behaviour: background, radial FWHM, moments and HFR for one cutout."""
+    mean, median, std = sigma_clipped_stats(cutout, sigma=2.0)
+    cutout = cutout - median
+    peak_y, peak_x = np.unravel_index(np.argmax(cutout), cutout.shape)
+    if cutout[peak_y, peak_x] < 3 * std:
+        return {'fwhm': None, 'eccentricity': None, 'hfr': None}
+    return {
+        'fwhm': legacy_fwhm(cutout, peak_x, peak_y),
+        'eccentricity': legacy_eccentricity(cutout, peak_x, peak_y),
+        'hfr': legacy_hfr(cutout, peak_x, peak_y),
+    }
+
+def legacy_fwhm(cutout, center_x, center_y):
+    """Radial profile FWHM with one mask per 0.25 pixel bin."""
+    y, x = np.mgrid[:cutout.shape[0], :cutout.shape[1]]
+    r = np.sqrt((x - center_x) ** 2 + (y - center_y) ** 2)
+    r_max = min(cutout.shape) // 2
+    r_bins = np.linspace(0, r_max, int(r_max * 4) + 1)
+    profile, counts = [], []
+    for i in range(len(r_bins) - 1):
+        mask = (r >= r_bins[i]) & (r < r_bins[i + 1])
+        profile.append(np.mean(cutout[mask]) if np.any(mask) else 0)
+        counts.append(np.sum(mask))
+    profile, counts = np.array(profile), np.array(counts)
+    r_centers = ((r_bins[:-1] + r_bins[1:]) / 2)[counts >= 3]
+    profile = profile[counts >= 3]
+    if len(profile) == 0 or np.max(profile) <= 0:
+        return None
+    half_max = np.max(profile) / 2.0
+    last = np.where(profile >= half_max)[0][-1]
+    radius = r_centers[last]
+    if last < len(profile) - 1 and profile[last] != profile[last + 1]:
+        radius += (half_max - profile[last]) * (r_centers[last + 1] - radius) / (profile[last + 1] - profile[last])
+    fwhm = radius * 2.0
+    return float(fwhm) if 0.5 <= fwhm <= 50.0 else None
+
+def legacy_eccentricity(cutout, center_x, center_y):
+    """Eccentricity from second moments of the positive flux."""
+    yy, xx = np.mgrid[0:cutout.shape[0], 0:cutout.shape[1]]
+    mask = cutout > 0
+    weights, x, y = cutout[mask], (xx - center_x)[mask], (yy - center_y)[mask]
+    total = np.sum(weights)
+    if total <= 0:
+        return None
+    m20 = np.sum(weights * x ** 2) / total
+    m02 = np.sum(weights * y ** 2) / total
+    m11 = np.sum(weights * x * y) / total
+    trace, det = m20 + m02, m20 * m02 - m11 ** 2
+    if det <= 0 or trace <= 0:
+        return None
+    root = np.sqrt((m20 - m02) ** 2 + 4 * m11 ** 2)
+    a_sq, b_sq = (trace + root) / 2, (trace - root) / 2
+    if a_sq <= 0 or b_sq <= 0:
+        return None
+    return float(np.clip(np.sqrt(1 - b_sq / a_sq), 0.0, 1.0))
+
+def legacy_hfr(cutout, center_x, center_y):
+    """Half flux radius from the enclosed flux at 100 radii."""
+    y, x = np.ogrid[:cutout.shape[0], :cutout.shape[1]]
+    r = np.sqrt((x - center_x) ** 2 + (y - center_y) ** 2)
+    mask = cutout > 0
+    flux, radius = cutout[mask], r[mask]
+    total = np.sum(flux)
+    if total <= 0:
+        return None
+    r_bins = np.linspace(0, np.max(radius), 100)
+    enclosed = np.array([np.sum(flux[radius <= step]) for step in r_bins])
+    index = np.searchsorted(enclosed, total / 2.0)
+    return float(r_bins[index]) if 0 < index < len(r_bins) else None
+
+def max_difference(legacy, batched):
+    """Largest relative difference between the two methods, or None if they disagree on failures."""
+    worst = 0.0
+    for key, values in batched.items():
+        reference = np.array([np.nan if result[key] is None else result[key] for result in legacy])
+        if not np.array_equal(np.isnan(reference), np.isnan(values)):
+            return None
+        both = ~np.isnan(reference)
+        if np.any(both):
+            worst = max(worst, float(np.max(np.abs(values[both] - reference[both]) /
+                                            np.maximum(np.abs(reference[both]), 1e-12))))
+    return worst
+
+def main():
+    """Main function to benchmark star measurement from command line."""
+    parser = argparse.ArgumentParser(
+        description="Measure per-frame star measurement time",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Enable verbose logging')
+    parser.add_argument('-s', '--stars', default='10,100,1000',
+                        help='Comma separated star counts per frame (default: 10,100,1000)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Frames measured per star count (default: 3)')
+
+    args = parser.parse_args()
+    logger = setup_logging(args.verbose)
+    warnings.filterwarnings('ignore', category=RuntimeWarning)
+
+    try:
+        star_counts = [int(value) for value in args.stars.split(',') if value.strip()]
+    except ValueError:
+        logger.error(f"Invalid star counts: {args.stars}")
+        return 1
+
+    rng = np.random.default_rng(0)
+    repeat = max(1, args.repeat)
+    agree = True
+    logger.info(f"{'Stars':>6} {'Per-star loop':>16} {'Batched':>12} {'Speedup':>8}  Max difference")
+    for count in star_counts:
+        frames = [synthetic_cutouts(count, rng) for _ in range(repeat)]
+
+        start = time.perf_counter()
+        legacy = [[legacy_measure_star(cutout) for cutout in frame] for frame in frames]
+        legacy_seconds = (time.perf_counter() - start) / repeat
+
+        start = time.perf_counter()
+        batched = [measure_stars(frame) for frame in frames]
+        batched_seconds = (time.perf_counter() - start) / repeat
+
+        differences = [max_difference(old, new) for old, new in zip(legacy, batched)]
+        if any(difference is None for difference in differences):
+            agree = False
+            difference_text = "failed measurements differ"
+        else:
+            difference_text = f"{max(differences):.1e}"
+        logger.info(f"{count:>6} {legacy_seconds * 1000:>13.1f} ms {batched_seconds * 1000:>9.1f} ms "
+                    f"{legacy_seconds / max(batched_seconds, 1e-9):>7.1f}x  {difference_text}")
+
+    if not agree:
+        logger.error("Batched measurements differ from the per-star loop!")
+        return 1
+    logger.info("Batched and per-star measurements agree")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,6 +15,11 @@ Options:
     -c, --config    Path to configuration file (default: astrofiler.ini)
     -r, --repo      Override repository folder path
     -n, --clear     Clear database before sync (recommended for clean sync)
+    -i, --incremental
+                    Only hash and register files that are new or changed since
+                    the last sync (uses the file journal); report missing files
+    -w, --workers   Number of parallel ingest workers (default: ingest_workers
+                    from astrofiler.ini, 0 = one per CPU core)
 
 Requirements:
     - astrofiler.ini configuration file
@@ -33,6 +38,9 @@ Example:
     
     # Sync specific repository folder
     python SyncRepo.py -r /path/to/repository
+    
+    # Quick sync that skips files unchanged since the last sync
+    python SyncRepo.py -i
 """
 
 import sys
@@ -58,6 +66,8 @@ def ensure_astrofiler_imports():
         sys.path.insert(0, src_path)
 
 from astrofiler.core import fitsProcessing
+from astrofiler.core.parallel_ingest import resolve_workers
+from astrofiler.core.services import wait_for_hash_backfill
 from astrofiler.database import setup_database
 
 def setup_logging(verbose=False):
@@ -108,6 +118,8 @@ Examples:
     python SyncRepo.py -c custom.ini       # Custom config file
     python SyncRepo.py -r /path/to/repo    # Override repository folder
     python SyncRepo.py -n                  # Clear database before sync
+    python SyncRepo.py -w 8                # Sync with 8 parallel workers
+    python SyncRepo.py -i                  # Incremental sync of new/changed files
         """
     )
     
@@ -119,6 +131,10 @@ Examples:
                         help='Override repository folder path')
     parser.add_argument('-n', '--clear', action='store_true',
                         help="Clear database before sync (recommended for clean sync)")
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help='Only register files that are new or changed since the last sync')
+    parser.add_argument('-w', '--workers', type=int,
+                        help='Number of parallel ingest workers (default: ingest_workers from astrofiler.ini, 0 = one per CPU core)')
     
     args = parser.parse_args()
     
@@ -144,6 +160,7 @@ Examples:
         
         logger.info(f"Repository folder: {repo_folder}")
         logger.info(f"Clear database: {args.clear}")
+        logger.info(f"Incremental: {args.incremental}")
         
         # Validate paths
         validate_paths(repo_folder)
@@ -156,7 +173,7 @@ Examples:
         if args.clear:
             logger.info("Clear mode detected - clearing database tables...")
             try:
-                from astrofiler.models import fitsFile, fitsSession, Mapping, Masters
+                from astrofiler.models import fitsFile, fitsSession, Mapping, Masters, FileJournal
                 
                 # Clear all tables in dependency order
                 logger.info("Clearing fitsFile table...")
@@ -164,6 +181,9 @@ Examples:
                 
                 logger.info("Clearing fitsSession table...")
                 fitsSession.delete().execute()
+                
+                logger.info("Clearing file journal...")
+                FileJournal.delete().execute()
                                
                 logger.info("Database tables cleared successfully for sync.")
                 
@@ -178,14 +198,41 @@ Examples:
         if args.repo:
             processor.repoFolder = repo_folder
         
+        if args.incremental:
+            logger.info("Starting incremental repository sync...")
+            sync_result = processor.syncRepositoryIncremental(
+                progress_callback=None,  # Disabled for non-interactive use
+                repo_folder=repo_folder,
+                workers=resolve_workers(args.workers)
+            )
+            # Full hashes deferred during ingest are computed on a daemon thread
+            if not wait_for_hash_backfill(timeout=0):
+                logger.info("Waiting for the background hash backfill to finish...")
+                wait_for_hash_backfill()
+            
+            logger.info("=== Incremental Repository Sync Complete ===")
+            logger.info(f"Unchanged files skipped: {sync_result['unchanged']}")
+            logger.info(f"New or modified files: {sync_result['changed']}")
+            logger.info(f"Files synchronized: {len(sync_result['registered'])}")
+            if sync_result['missing']:
+                logger.warning(f"Registered files missing from disk: {len(sync_result['missing'])}")
+                for missing_path in sync_result['missing']:
+                    logger.warning(f"  Missing: {missing_path}")
+            return 0
+        
         # Process files - scan the repository folder instead of source folder
         logger.info("Starting repository sync...")
         
         result = processor.registerFitsImages(
             moveFiles=False,  # Never move files during sync
             progress_callback=None,  # Disabled for non-interactive use
-            source_folder=repo_folder  # Use repository folder as source
+            source_folder=repo_folder,  # Use repository folder as source
+            workers=resolve_workers(args.workers)
         )
+        # Full hashes deferred during ingest are computed on a daemon thread
+        if not wait_for_hash_backfill(timeout=0):
+            logger.info("Waiting for the background hash backfill to finish...")
+            wait_for_hash_backfill()
         
         # Handle the new tuple return format (registered_files, duplicate_count)
         if isinstance(result, tuple):
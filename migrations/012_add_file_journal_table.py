@@ -0,0 +1,42 @@
+"""Peewee migrations -- 012_add_file_journal_table.py.
+
+Adds the `fileJournal` table used by incremental repository syncs to skip
+files whose stat signature (size, mtime_ns, inode) has not changed.
+
+This migration is defensive/idempotent: it does nothing if the table exists.
+
+"""
+
+from contextlib import suppress
+
+import peewee as pw
+from peewee_migrate import Migrator
+
+
+def migrate(migrator: Migrator, database: pw.Database, *, fake=False):
+    try:
+        existing_tables = set(database.get_tables())
+    except Exception:
+        existing_tables = set()
+
+    if any(t.lower() == 'filejournal' for t in existing_tables):
+        return
+
+    class FileJournal(pw.Model):
+        path = pw.TextField(primary_key=True)
+        file_size = pw.BigIntegerField()
+        mtime_ns = pw.BigIntegerField()
+        inode = pw.BigIntegerField(null=True)
+        file_hash = pw.TextField(null=True)
+        fits_file_id = pw.TextField(null=True)
+        last_seen = pw.DateTimeField(null=True)
+
+        class Meta:
+            table_name = 'fileJournal'
+
+    migrator.create_model(FileJournal)
+
+
+def rollback(migrator: Migrator, database: pw.Database, *, fake=False):
+    with suppress(Exception):
+        migrator.remove_model('fileJournal')
@@ -0,0 +1,52 @@
+"""Peewee migrations -- 013_add_file_size_partial_hash.py.
+
+Adds `fitsFileSize` and `fitsFilePartialHash` to `fitsfile` for tiered
+duplicate detection, and an index on the header fingerprint columns used to
+find duplicate candidates (DATE-OBS, INSTRUME, EXPTIME).
+
+This migration is defensive: it only adds columns that are missing.
+
+"""
+
+from contextlib import suppress
+
+import peewee as pw
+from peewee_migrate import Migrator
+
+
+def _column_names(database: pw.Database, table: str) -> set[str]:
+    try:
+        cursor = database.execute_sql(f"PRAGMA table_info({table})")
+        return {row[1] for row in cursor.fetchall()}
+    except Exception:
+        return set()
+
+
+def migrate(migrator: Migrator, database: pw.Database, *, fake=False):
+    existing = _column_names(database, 'fitsfile')
+
+    fields = {}
+    if 'fitsFileSize' not in existing:
+        fields['fitsFileSize'] = pw.BigIntegerField(null=True)
+    if 'fitsFilePartialHash' not in existing:
+        fields['fitsFilePartialHash'] = pw.TextField(null=True)
+
+    if fields:
+        migrator.add_fields('fitsfile', **fields)
+
+    with suppress(Exception):
+        database.execute_sql(
+            'CREATE INDEX IF NOT EXISTS "idx_fitsfile_fingerprint" '
+            'ON "fitsFile" ("fitsFileDate", "fitsFileInstrument", "fitsFileExpTime")'
+        )
+
+
+def rollback(migrator: Migrator, database: pw.Database, *, fake=False):
+    with suppress(Exception):
+        database.execute_sql('DROP INDEX IF EXISTS "idx_fitsfile_fingerprint"')
+
+    existing = _column_names(database, 'fitsfile')
+    to_remove = [c for c in ['fitsFileSize', 'fitsFilePartialHash'] if c in existing]
+    if to_remove:
+        with suppress(Exception):
+            migrator.remove_fields('fitsfile', *to_remove)
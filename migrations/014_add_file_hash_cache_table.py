@@ -0,0 +1,44 @@
+"""Peewee migrations -- 014_add_file_hash_cache_table.py.
+
+Adds the `fileHashCache` table used by FileHashCalculator to reuse SHA-256 and
+MD5 digests of files whose (device, inode, size, mtime_ns) has not changed.
+
+This migration is defensive/idempotent: it does nothing if the table exists.
+
+"""
+
+from contextlib import suppress
+
+import peewee as pw
+from peewee_migrate import Migrator
+
+
+def migrate(migrator: Migrator, database: pw.Database, *, fake=False):
+    try:
+        existing_tables = set(database.get_tables())
+    except Exception:
+        existing_tables = set()
+
+    if any(t.lower() == 'filehashcache' for t in existing_tables):
+        return
+
+    class FileHashCache(pw.Model):
+        device = pw.BigIntegerField()
+        inode = pw.BigIntegerField()
+        file_size = pw.BigIntegerField()
+        mtime_ns = pw.BigIntegerField()
+        sha256 = pw.TextField(null=True)
+        md5 = pw.TextField(null=True)
+        path = pw.TextField(null=True)
+        hashed_at = pw.DateTimeField(null=True)
+
+        class Meta:
+            table_name = 'fileHashCache'
+            primary_key = pw.CompositeKey('device', 'inode')
+
+    migrator.create_model(FileHashCache)
+
+
+def rollback(migrator: Migrator, database: pw.Database, *, fake=False):
+    with suppress(Exception):
+        migrator.remove_model('fileHashCache')
@@ -0,0 +1,151 @@
+"""Peewee migrations -- 015_add_numeric_matching_columns.py.
+
+Exposure, binning, CCD temperature, gain and offset are stored as TEXT, so
+matching compares strings ("300" != "300.0") and range queries cannot use an
+index. This migration adds typed shadow columns next to the text columns of
+`fitsfile`, `fitssession` and `Masters`, backfills them, and installs
+triggers that keep them in sync on every INSERT/UPDATE, so existing writers
+do not need to set them.
+
+It also adds composite indexes for the real access patterns:
+- calibration session matching (type, telescope, imager, binning, date)
+- files by session and type
+- files by object, date and filter (light session building)
+- master matching (type, telescope, instrument, binning, exposure)
+
+This migration is defensive: it only adds missing columns, and all SQL uses
+IF NOT EXISTS.
+
+"""
+
+from contextlib import suppress
+
+import peewee as pw
+from peewee_migrate import Migrator
+
+
+# table -> [(text column, shadow column, SQL type)]
+NUMERIC_COLUMNS = {
+    'fitsFile': [
+        ('fitsFileExpTime', 'fitsFileExpTimeValue', 'REAL'),
+        ('fitsFileXBinning', 'fitsFileXBinningValue', 'INTEGER'),
+        ('fitsFileYBinning', 'fitsFileYBinningValue', 'INTEGER'),
+        ('fitsFileCCDTemp', 'fitsFileCCDTempValue', 'REAL'),
+        ('fitsFileGain', 'fitsFileGainValue', 'REAL'),
+        ('fitsFileOffset', 'fitsFileOffsetValue', 'REAL'),
+    ],
+    'fitsSession': [
+        ('fitsSessionExposure', 'fitsSessionExposureValue', 'REAL'),
+        ('fitsSessionBinningX', 'fitsSessionBinningXValue', 'INTEGER'),
+        ('fitsSessionBinningY', 'fitsSessionBinningYValue', 'INTEGER'),
+        ('fitsSessionCCDTemp', 'fitsSessionCCDTempValue', 'REAL'),
+        ('fitsSessionGain', 'fitsSessionGainValue', 'REAL'),
+        ('fitsSessionOffset', 'fitsSessionOffsetValue', 'REAL'),
+    ],
+    'Masters': [
+        ('exposure_time', 'exposure_time_value', 'REAL'),
+        ('binning_x', 'binning_x_value', 'INTEGER'),
+        ('binning_y', 'binning_y_value', 'INTEGER'),
+        ('ccd_temp', 'ccd_temp_value', 'REAL'),
+        ('gain', 'gain_value', 'REAL'),
+        ('offset', 'offset_value', 'REAL'),
+    ],
+}
+
+# table -> model name registered with the migrator (peewee_migrate lower-cases
+# model class names; Masters was created by migration 007 as `Masters`)
+MODEL_NAMES = {
+    'fitsFile': 'fitsfile',
+    'fitsSession': 'fitssession',
+    'Masters': 'Masters',
+}
+
+INDEXES = [
+    ('idx_fitssession_calibration_match', 'fitsSession',
+     ['fitsSessionObjectName', 'fitsSessionTelescope', 'fitsSessionImager',
+      'fitsSessionBinningXValue', 'fitsSessionBinningYValue', 'fitsSessionDate']),
+    ('idx_fitsfile_session_type', 'fitsFile', ['fitsFileSession', 'fitsFileType']),
+    ('idx_fitsfile_object_date', 'fitsFile', ['fitsFileObject', 'fitsFileDate', 'fitsFileFilter']),
+    ('idx_masters_match', 'Masters',
+     ['master_type', 'telescope', 'instrument', 'binning_x_value', 'binning_y_value',
+      'exposure_time_value']),
+]
+
+
+def _column_names(database: pw.Database, table: str) -> set[str]:
+    try:
+        cursor = database.execute_sql(f"PRAGMA table_info({table})")
+        return {row[1] for row in cursor.fetchall()}
+    except Exception:
+        return set()
+
+
+def _numeric_sql(column: str, sql_type: str) -> str:
+    """SQL expression converting a TEXT column to a number, or NULL if not numeric."""
+    value = f'trim({column})'
+    return (f"CASE WHEN {value} <> '' AND {value} NOT GLOB '*[^0-9.eE+-]*' "
+            f"THEN CAST({value} AS {sql_type}) END")
+
+
+def _install_numeric_support(database: pw.Database) -> None:
+    for table, columns in NUMERIC_COLUMNS.items():
+        if not _column_names(database, table):
+            continue
+        assignments = ', '.join(
+            f'"{shadow}" = {_numeric_sql(f"NEW.{text}", sql_type)}'
+            for text, shadow, sql_type in columns)
+        watched = ', '.join(f'"{text}"' for text, _shadow, _type in columns)
+        lower = table.lower()
+        with suppress(Exception):
+            database.execute_sql(
+                f'CREATE TRIGGER IF NOT EXISTS "trg_{lower}_numeric_insert" AFTER INSERT ON "{table}" '
+                f'BEGIN UPDATE "{table}" SET {assignments} WHERE rowid = NEW.rowid; END')
+        with suppress(Exception):
+            database.execute_sql(
+                f'CREATE TRIGGER IF NOT EXISTS "trg_{lower}_numeric_update" AFTER UPDATE OF {watched} '
+                f'ON "{table}" BEGIN UPDATE "{table}" SET {assignments} WHERE rowid = NEW.rowid; END')
+
+        # Backfill existing rows
+        backfill = ', '.join(
+            f'"{shadow}" = {_numeric_sql(f"{text}", sql_type)}'
+            for text, shadow, sql_type in columns)
+        with suppress(Exception):
+            database.execute_sql(f'UPDATE "{table}" SET {backfill}')
+
+    for name, table, columns in INDEXES:
+        column_list = ', '.join(f'"{column}"' for column in columns)
+        with suppress(Exception):
+            database.execute_sql(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({column_list})')
+
+
+def migrate(migrator: Migrator, database: pw.Database, *, fake=False):
+    for table, columns in NUMERIC_COLUMNS.items():
+        existing = _column_names(database, table)
+        if not existing:
+            continue
+        fields = {}
+        for _text, shadow, sql_type in columns:
+            if shadow not in existing:
+                fields[shadow] = pw.FloatField(null=True) if sql_type == 'REAL' else pw.IntegerField(null=True)
+        if fields:
+            migrator.add_fields(MODEL_NAMES[table], **fields)
+
+    # Runs after the queued add_fields operations
+    migrator.run(_install_numeric_support, database)
+
+
+def rollback(migrator: Migrator, database: pw.Database, *, fake=False):
+    for name, _table, _columns in INDEXES:
+        with suppress(Exception):
+            database.execute_sql(f'DROP INDEX IF EXISTS "{name}"')
+    for table, columns in NUMERIC_COLUMNS.items():
+        lower = table.lower()
+        with suppress(Exception):
+            database.execute_sql(f'DROP TRIGGER IF EXISTS "trg_{lower}_numeric_insert"')
+        with suppress(Exception):
+            database.execute_sql(f'DROP TRIGGER IF EXISTS "trg_{lower}_numeric_update"')
+        existing = _column_names(database, table)
+        to_remove = [shadow for _text, shadow, _type in columns if shadow in existing]
+        if to_remove:
+            with suppress(Exception):
+                migrator.remove_fields(MODEL_NAMES[table], *to_remove)
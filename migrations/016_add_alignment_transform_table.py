@@ -0,0 +1,43 @@
+"""Peewee migrations -- 016_add_alignment_transform_table.py.
+
+Adds the `alignmentTransform` table used by FrameAligner to reuse the affine
+transform registering a light frame onto a reference frame, keyed by the
+SHA-256 of both files.
+
+This migration is defensive/idempotent: it does nothing if the table exists.
+
+"""
+
+from contextlib import suppress
+
+import peewee as pw
+from peewee_migrate import Migrator
+
+
+def migrate(migrator: Migrator, database: pw.Database, *, fake=False):
+    try:
+        existing_tables = set(database.get_tables())
+    except Exception:
+        existing_tables = set()
+
+    if any(t.lower() == 'alignmenttransform' for t in existing_tables):
+        return
+
+    class AlignmentTransform(pw.Model):
+        frame_hash = pw.TextField()
+        reference_hash = pw.TextField()
+        matrix = pw.TextField()
+        method = pw.TextField(default='astroalign')
+        frame_path = pw.TextField(null=True)
+        created_at = pw.DateTimeField(null=True)
+
+        class Meta:
+            table_name = 'alignmentTransform'
+            primary_key = pw.CompositeKey('frame_hash', 'reference_hash')
+
+    migrator.create_model(AlignmentTransform)
+
+
+def rollback(migrator: Migrator, database: pw.Database, *, fake=False):
+    with suppress(Exception):
+        migrator.remove_model('alignmentTransform')
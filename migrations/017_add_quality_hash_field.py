@@ -0,0 +1,36 @@
+"""Peewee migrations -- 017_add_quality_hash_field.py.
+
+Adds `fitsFileQualityHash` to `fitsfile`: the SHA-256 of the file when its
+quality metrics were measured, so the quality assessment engine can skip
+frames that are unchanged since their last analysis.
+
+This migration is defensive: it only adds columns that are missing.
+
+"""
+
+from contextlib import suppress
+
+import peewee as pw
+from peewee_migrate import Migrator
+
+
+def _column_names(database: pw.Database, table: str) -> set[str]:
+    try:
+        cursor = database.execute_sql(f"PRAGMA table_info({table})")
+        return {row[1] for row in cursor.fetchall()}
+    except Exception:
+        return set()
+
+
+def migrate(migrator: Migrator, database: pw.Database, *, fake=False):
+    existing = _column_names(database, 'fitsfile')
+
+    if 'fitsFileQualityHash' not in existing:
+        migrator.add_fields('fitsfile', fitsFileQualityHash=pw.TextField(null=True))
+
+
+def rollback(migrator: Migrator, database: pw.Database, *, fake=False):
+    existing = _column_names(database, 'fitsfile')
+    if 'fitsFileQualityHash' in existing:
+        with suppress(Exception):
+            migrator.remove_fields('fitsfile', 'fitsFileQualityHash')
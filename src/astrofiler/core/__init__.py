@@ -9,6 +9,23 @@ astrofiler_file.py for better maintainability and organization:
 - calibration: Master frame creation and calibration processing
 - enhanced_quality: Advanced image quality assessment with SEP star detection
 - repository: File organization and repository management
+- parallel_ingest: Worker-pool ingest engine for bulk registration
+- file_manifest: Single-pass ingest scan with pre-parsed headers
+- repository_sync: Incremental repository sync driven by the file journal
+- registration_writer: Batched, transactional fitsFile inserts
+- stacking: Band-wise frame stacking with pluggable pixel rejection
+- alignment: Register-once light frame alignment with cached transforms and
+  a process pool for star registration
+- frame_weighting: Frame rejection and weighting from stored quality metrics
+- calibration_engine: Session light calibration with masters prepared once
+  and shared with a worker pool
+- master_cache: Process-wide LRU cache of decoded master frames
+- fits_access: Shared FITS image reads with header-only probing, memory
+  mapping and row-band sections
+- quality_engine: Parallel, resumable quality assessment of the archive
+- star_measurement: Batched FWHM, eccentricity and HFR kernels for star cutouts
+- session_quality: Grouped SQL session quality rollups, refreshed as frame
+  metrics are written
 """
 
 import os
@@ -27,6 +44,18 @@ from .repository import RepositoryManager
 from .master_manager import MasterFrameManager, get_master_manager
 from .compress_files import get_fits_compressor, compress_fits_file, is_compression_enabled
 from .session_processing import SessionProcessor
+from .parallel_ingest import ParallelIngestEngine, get_ingest_worker_count, register_manifest_entries, resolve_workers
+from .file_manifest import FileManifestEntry, build_ingest_manifest
+from .repository_sync import IncrementalRepositorySync, clear_file_journal
+from .registration_writer import BatchedRegistrationWriter
+from .stacking import BandStack, REJECTION_METHODS, combine_stack, combine_sigma_clip
+from .alignment import FrameAligner, RegistrationPool
+from .frame_weighting import FrameSelection, select_stack_frames
+from .calibration_engine import CalibrationMasters, SessionCalibrationEngine
+from .master_cache import MasterFrameCache, get_master_cache
+from .fits_access import FitsImageInfo, FitsImageReader, probe_fits_image, read_fits_image
+from .quality_engine import QualityAssessmentEngine, find_frames_needing_assessment
+from .services.hash_backfill import start_hash_backfill
 from .utils import (
     normalize_file_path,
     sanitize_filesystem_name,
@@ -87,62 +116,51 @@ class fitsProcessing:
             precount=precount,
         )
     
-    def registerFitsImages(self, moveFiles=True, progress_callback=None, source_folder=None):
-        """Register multiple FITS images from source folder."""
-        import os
-        processed_files = []
-        
+    def registerFitsImages(self, moveFiles=True, progress_callback=None, source_folder=None, workers=None):
+        """Register multiple FITS images from source folder.
+
+        Args:
+            moveFiles: Whether to move files into the repository structure
+            progress_callback: Optional callback(current, total, filename) -> bool
+            source_folder: Folder to scan; defaults to configured sourceFolder
+            workers: Number of ingest workers. None reads 'ingest_workers' from
+                astrofiler.ini; values above 1 use the ParallelIngestEngine.
+        """
         # Use specified folder or default to sourceFolder
         scan_folder = source_folder if source_folder else self.sourceFolder
         
-        # First, count total files to process
-        total_files = 0
+        # Walk the tree once, reading each primary header a single time. Master
+        # calibration frames are filtered from the pre-parsed headers and handled
+        # by registerMasters().
         from .compress_files import get_fits_compressor
-        compressor = get_fits_compressor()
-
-        def _is_master_fits_by_imagetyp(file_path: str) -> bool:
-            """Return True if FITS header IMAGETYP indicates a master calibration frame."""
-            try:
-                from astropy.io import fits
-                hdr = fits.getheader(file_path, 0)
-                imagetyp = str(hdr.get('IMAGETYP', '')).upper()
-                if 'MASTER' not in imagetyp:
-                    return False
-                return any(token in imagetyp for token in ('DARK', 'FLAT', 'BIAS'))
-            except Exception:
-                return False
-        
-        for root, dirs, files in os.walk(scan_folder):
-            for file in files:
-                # Use the comprehensive FITS file detection that includes compressed files
-                file_path = os.path.join(root, file)
-                if compressor.is_fits_file(file_path):
-                    if _is_master_fits_by_imagetyp(file_path):
-                        continue
-                    total_files += 1
+        manifest = build_ingest_manifest(scan_folder, get_fits_compressor())
+        candidates = [entry for entry in manifest if not entry.is_master]
+        registered = register_manifest_entries(
+            self.file_processor, candidates, moveFiles, progress_callback, workers)
+        processed_files = [entry.path for entry, _file_id in registered]
         
-        current_file = 0
-        for root, dirs, files in os.walk(scan_folder):
-            for file in files:
-                # Use the comprehensive FITS file detection that includes compressed files
-                file_path = os.path.join(root, file)
-                if compressor.is_fits_file(file_path) or file.lower().endswith('.xisf'):
-                    if compressor.is_fits_file(file_path) and _is_master_fits_by_imagetyp(file_path):
-                        continue
-                    current_file += 1
-                    try:
-                        result = self.registerFitsImage(root, file, moveFiles)
-                        if result:  # If registration was successful
-                            processed_files.append(file_path)
-                        if progress_callback:
-                            # Call with expected signature: current, total, filename
-                            if not progress_callback(current_file, total_files, file_path):
-                                break  # Stop if callback returns False (user cancelled)
-                    except Exception as e:
-                        import logging
-                        logger = logging.getLogger(__name__)
-                        logger.error(f"Error processing {file}: {e}")
+        # Full hashes deferred during ingest are filled in on a background thread
+        if registered and self.file_processor.lazy_full_hash:
+            start_hash_backfill()
         
+        return self._cleanup_empty_subdirectories(scan_folder, processed_files)
+
+    def syncRepositoryIncremental(self, progress_callback=None, repo_folder=None, workers=None):
+        """Register only new or modified repository files using the file journal.
+
+        Args:
+            progress_callback: Optional callback(current, total, filename) -> bool
+            repo_folder: Repository folder to scan; defaults to configured repoFolder
+            workers: Number of ingest workers (None reads 'ingest_workers')
+
+        Returns:
+            dict with 'registered', 'unchanged', 'changed' and 'missing' keys
+        """
+        sync = IncrementalRepositorySync(self.file_processor)
+        return sync.sync(repo_folder or self.repoFolder, progress_callback, workers)
+
+    def _cleanup_empty_subdirectories(self, scan_folder, processed_files):
+        """Remove empty subdirectories left behind in the scanned folder."""
         # Attempt to remove any leftover subdirectories in the incoming folder.
         # Walk bottom-up so child directories are tried before parents.
         # Ignore OSError (directory not empty) and continue.
@@ -367,6 +385,34 @@ __all__ = [
     'RepositoryManager',
     'MasterFrameManager',
     'SessionProcessor',
+    'ParallelIngestEngine',
+    'get_ingest_worker_count',
+    'resolve_workers',
+    'register_manifest_entries',
+    'FileManifestEntry',
+    'build_ingest_manifest',
+    'IncrementalRepositorySync',
+    'clear_file_journal',
+    'BatchedRegistrationWriter',
+    'BandStack',
+    'REJECTION_METHODS',
+    'combine_stack',
+    'combine_sigma_clip',
+    'FrameAligner',
+    'RegistrationPool',
+    'FrameSelection',
+    'select_stack_frames',
+    'CalibrationMasters',
+    'SessionCalibrationEngine',
+    'MasterFrameCache',
+    'get_master_cache',
+    'FitsImageInfo',
+    'FitsImageReader',
+    'probe_fits_image',
+    'read_fits_image',
+    'QualityAssessmentEngine',
+    'find_frames_needing_assessment',
+    'start_hash_backfill',
     'get_master_manager',
     'get_fits_compressor',
     'compress_fits_file',
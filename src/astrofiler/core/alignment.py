@@ -0,0 +1,517 @@
+"""
+Register-once frame alignment for AstroFiler light stacking.
+
+astroalign.register() detects stars, matches asterisms and warps the frame on
+every call, and light stacking used to call it for each frame in every pass
+and again for every stack built from the same frames. FrameAligner splits
+the work: the star-matching transform is computed once per (frame,
+reference) pair with astroalign.find_transform(), persisted in the
+alignmentTransform table keyed by the SHA-256 of both files, and applied on
+every later pass or stack with a cubic affine warp.
+
+RegistrationPool runs star registration for a whole stack in worker
+processes and yields the aligned frames back in input order, with a bounded
+number of frames in flight. Workers do not use the database: the pool loads
+the cached transforms of the reference up front, and the workers return the
+transforms they compute for the pool to store. align_frame() holds the registration fallbacks
+(SEP sub-object retry, WCS reprojection, unaligned frame) shared by the pool
+and the in-process path.
+"""
+
+import os
+import json
+import logging
+import datetime
+import functools
+import configparser
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .fits_access import probe_fits_image, read_fits_image
+from .services.file_hash_calculator import FileHashCalculator, get_file_hash_calculator
+from .utils import get_worker_count, ordered_process_map
+from ..exceptions import FileProcessingError
+
+logger = logging.getLogger(__name__)
+
+# Spline order of the warp; astroalign.apply_transform() also uses cubic interpolation
+_WARP_ORDER = 3
+
+# SEP sub-object limit used for star detection (matches MasterFrameManager's module setup)
+_SEP_SUB_OBJECT_LIMIT = 65536
+
+# Registration errors that mean "no usable transform" rather than a bug
+_DEBLEND_OVERFLOW_MESSAGES = ("deblending overflow", "sub-objects reached", "object deblending overflow")
+
+
+def is_alignment_cache_enabled(config_path: str = 'astrofiler.ini') -> bool:
+    """
+    Check whether alignment transforms are persisted in the database.
+
+    Reads 'alignment_cache' from the DEFAULT section of astrofiler.ini.
+
+    Returns:
+        True unless disabled (default True)
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    try:
+        return config.getboolean('DEFAULT', 'alignment_cache', fallback=True)
+    except ValueError:
+        return True
+
+
+def warp_to_reference(data: np.ndarray, matrix: np.ndarray,
+                      shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Warp a frame onto the reference grid with an affine transform.
+
+    Args:
+        data: 2D frame data
+        matrix: 3x3 matrix mapping frame (x, y) to reference (x, y)
+        shape: Reference (height, width)
+
+    Returns:
+        (aligned, footprint): float32 aligned data, and a boolean mask that is
+        True where the reference pixel has no frame data (as astroalign returns)
+    """
+    from scipy import ndimage
+
+    inverse = np.linalg.inv(np.asarray(matrix, dtype=np.float64))
+    # ndimage maps output (row, col) to input (row, col); the matrix is in (x, y)
+    rowcol = np.array([[inverse[1, 1], inverse[1, 0]],
+                       [inverse[0, 1], inverse[0, 0]]])
+    offset = np.array([inverse[1, 2], inverse[0, 2]])
+
+    aligned = ndimage.affine_transform(
+        np.asarray(data, dtype=np.float32), rowcol, offset=offset, output_shape=tuple(shape),
+        output=np.float32, order=_WARP_ORDER, mode='constant', cval=0.0)
+    coverage = ndimage.affine_transform(
+        np.ones(np.shape(data), dtype=np.uint8), rowcol, offset=offset, output_shape=tuple(shape),
+        order=0, mode='constant', cval=0)
+    return aligned, coverage == 0
+
+
+class FrameAligner:
+    """
+    Aligns frames onto one reference frame, computing each transform at most once.
+
+    Transforms are kept in memory for the lifetime of the aligner and, when the
+    alignment cache is enabled, persisted so later stacks skip star matching.
+
+    An aligner given known_transforms (as in registration workers) never uses
+    the database: frames are hashed without the hash cache, cached transforms
+    are looked up in known_transforms, and computed transforms are collected
+    for take_new_transforms() instead of being stored.
+    """
+
+    def __init__(self, reference_path: str, reference_data: np.ndarray,
+                 use_cache: Optional[bool] = None,
+                 known_transforms: Optional[Dict[str, np.ndarray]] = None,
+                 reference_hash: Optional[str] = None) -> None:
+        """
+        Initialize the aligner.
+
+        Args:
+            reference_path: Path of the reference frame
+            reference_data: Reference frame data
+            use_cache: Persist transforms in the database (None reads 'alignment_cache')
+            known_transforms: Cached transforms onto this reference by frame
+                hash (see load_transforms()); given, the aligner does not use
+                the database
+            reference_hash: SHA-256 of the reference file, if already known
+        """
+        self.reference_path = reference_path
+        self.reference = np.asarray(reference_data, dtype=np.float32)
+        self.use_cache = is_alignment_cache_enabled() if use_cache is None else use_cache
+        self._reference_hash: Optional[str] = reference_hash
+        self._transforms: Dict[str, np.ndarray] = {}
+        self._known = known_transforms
+        self._calculator = (get_file_hash_calculator() if known_transforms is None
+                            else FileHashCalculator(use_cache=False))
+        self._new_transforms: List[Tuple[Tuple[str, str], str, np.ndarray]] = []
+        self.computed = 0
+        self.reused = 0
+
+    def _file_hash(self, file_path: str) -> Optional[str]:
+        try:
+            return self._calculator.calculate_sha256(file_path)
+        except FileProcessingError as e:
+            logger.debug(f"Alignment cache disabled for {file_path}: {e}")
+            return None
+
+    def _cache_keys(self, file_path: str) -> Optional[Tuple[str, str]]:
+        if not self.use_cache:
+            return None
+        reference_hash = self.reference_hash()
+        frame_hash = self._file_hash(file_path)
+        if reference_hash is None or frame_hash is None:
+            return None
+        return frame_hash, reference_hash
+
+    def _cache_error(self, error: Exception) -> None:
+        """Disable persistence if the table is missing; otherwise just log."""
+        if 'no such table' in str(error).lower():
+            logger.info("Alignment transform table not available, alignment caching disabled")
+            self.use_cache = False
+        else:
+            logger.debug(f"Alignment transform cache unavailable: {error}")
+
+    def _load(self, keys: Tuple[str, str]) -> Optional[np.ndarray]:
+        if self._known is not None:
+            return self._known.get(keys[0])
+        try:
+            from ..models import AlignmentTransform
+            row = AlignmentTransform.get_or_none(
+                (AlignmentTransform.frame_hash == keys[0]) &
+                (AlignmentTransform.reference_hash == keys[1]))
+            return None if row is None else np.asarray(row.get_matrix(), dtype=np.float64)
+        except Exception as e:
+            self._cache_error(e)
+            return None
+
+    def _store(self, keys: Tuple[str, str], file_path: str, matrix: np.ndarray) -> None:
+        try:
+            from ..models import AlignmentTransform
+            AlignmentTransform.insert(
+                frame_hash=keys[0],
+                reference_hash=keys[1],
+                matrix=json.dumps(matrix.tolist()),
+                method='astroalign',
+                frame_path=str(file_path),
+                created_at=datetime.datetime.now(),
+            ).on_conflict_replace().execute()
+        except Exception as e:
+            self._cache_error(e)
+
+    def reference_hash(self) -> Optional[str]:
+        """SHA-256 of the reference file, or None if it cannot be read."""
+        if self._reference_hash is None:
+            self._reference_hash = self._file_hash(self.reference_path)
+        return self._reference_hash
+
+    def load_transforms(self) -> Dict[str, np.ndarray]:
+        """
+        Load the cached transforms onto the reference.
+
+        Returns:
+            dict: frame SHA-256 -> 3x3 matrix (empty if the cache is disabled)
+        """
+        reference_hash = self.reference_hash() if self.use_cache else None
+        if reference_hash is None:
+            return {}
+        try:
+            from ..models import AlignmentTransform
+            rows = AlignmentTransform.select().where(AlignmentTransform.reference_hash == reference_hash)
+            return {row.frame_hash: np.asarray(row.get_matrix(), dtype=np.float64) for row in rows}
+        except Exception as e:
+            self._cache_error(e)
+            return {}
+
+    def take_new_transforms(self) -> List[Tuple[Tuple[str, str], str, np.ndarray]]:
+        """
+        Return and forget the transforms computed since the last call.
+
+        Only an aligner with known_transforms collects transforms; others
+        store them as they are computed.
+
+        Returns:
+            list: ((frame hash, reference hash), frame path, matrix) entries
+        """
+        transforms, self._new_transforms = self._new_transforms, []
+        return transforms
+
+    def store_transforms(self, transforms: Iterable[Tuple[Tuple[str, str], str, np.ndarray]]) -> None:
+        """Persist transforms returned by take_new_transforms() of another aligner."""
+        if not self.use_cache:
+            return
+        for keys, file_path, matrix in transforms:
+            self._store(keys, file_path, matrix)
+
+    def transform_for(self, data: np.ndarray, file_path: str) -> np.ndarray:
+        """
+        Return the transform aligning a frame onto the reference.
+
+        Args:
+            data: Frame data (used only if the transform must be computed)
+            file_path: Frame path
+
+        Returns:
+            3x3 matrix mapping frame (x, y) to reference (x, y)
+
+        Raises:
+            Exception: Whatever astroalign.find_transform() raises when no
+                transform can be found (callers keep their fallbacks)
+        """
+        path_key = os.path.abspath(file_path)
+        matrix = self._transforms.get(path_key)
+        if matrix is not None:
+            self.reused += 1
+            return matrix
+
+        keys = self._cache_keys(file_path)
+        if keys is not None:
+            matrix = self._load(keys)
+        if matrix is not None:
+            self.reused += 1
+        else:
+            import astroalign as aa
+            transform, _matches = aa.find_transform(np.asarray(data, dtype=np.float32), self.reference)
+            matrix = np.asarray(transform.params, dtype=np.float64)
+            self.computed += 1
+            if keys is not None and self.use_cache:
+                if self._known is not None:
+                    self._new_transforms.append((keys, str(file_path), matrix))
+                else:
+                    self._store(keys, file_path, matrix)
+
+        self._transforms[path_key] = matrix
+        return matrix
+
+    def register(self, data: np.ndarray, file_path: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Align a frame onto the reference, like astroalign.register().
+
+        Args:
+            data: Frame data
+            file_path: Frame path (identifies the cached transform)
+
+        Returns:
+            (aligned, footprint) with footprint True where there is no frame data
+        """
+        matrix = self.transform_for(data, file_path)
+        return warp_to_reference(data, matrix, self.reference.shape)
+
+
+def get_registration_worker_count(config_path: str = 'astrofiler.ini') -> int:
+    """
+    Get the number of processes used for star registration.
+
+    Reads 'registration_workers' from the DEFAULT section of astrofiler.ini.
+    A value of 1 registers frames in the calling process.
+
+    Returns:
+        Worker count (default: CPU count - 1, at most 4)
+    """
+    return get_worker_count('registration_workers', config_path)
+
+
+def _is_maxiter_error(exc: Exception) -> bool:
+    try:
+        import astroalign as aa
+        max_iter_error = getattr(aa, 'MaxIterError', None)
+        if max_iter_error is not None and isinstance(exc, max_iter_error):
+            return True
+    except Exception:
+        pass
+    return exc.__class__.__name__ == 'MaxIterError'
+
+
+def _is_deblend_overflow(exc: Exception) -> bool:
+    return any(message in str(exc) for message in _DEBLEND_OVERFLOW_MESSAGES)
+
+
+def _masked(aligned: np.ndarray, footprint: Optional[np.ndarray]) -> np.ndarray:
+    aligned = aligned.astype(np.float32, copy=False)
+    if footprint is not None:
+        aligned = aligned.copy()
+        aligned[footprint] = np.nan
+    return aligned
+
+
+def _wcs_reproject(data: np.ndarray, file_path: str, reference_header: Any,
+                   shape: Tuple[int, int]) -> Optional[np.ndarray]:
+    """Reproject a frame onto the reference WCS, or None if either lacks a celestial WCS."""
+    if reference_header is None or data.ndim != 2:
+        return None
+    try:
+        import warnings
+        from astropy.wcs import WCS, FITSFixedWarning
+        from reproject import reproject_interp  # type: ignore
+
+        warnings.filterwarnings('ignore', category=FITSFixedWarning)
+        source_wcs = WCS(probe_fits_image(file_path).header)
+        reference_wcs = WCS(reference_header)
+        if not (getattr(source_wcs, 'has_celestial', False) and getattr(reference_wcs, 'has_celestial', False)):
+            return None
+        reprojected, footprint = reproject_interp(
+            (data.astype(np.float32, copy=False), source_wcs),
+            reference_wcs,
+            shape_out=shape,
+            order='bilinear',
+        )
+        return _masked(np.asarray(reprojected, dtype=np.float32), np.asarray(footprint) <= 0)
+    except Exception:
+        return None
+
+
+def align_frame(aligner: FrameAligner, data: np.ndarray, file_path: str,
+                reference_header: Any = None) -> np.ndarray:
+    """
+    Align a frame onto the aligner's reference, with the stacking fallbacks.
+
+    On a SEP deblending overflow, star matching is retried once with a 4x
+    sub-object limit. If no transform can be found, the frame is reprojected
+    through its WCS when both headers have one, and otherwise stacked
+    unaligned with a warning.
+
+    Args:
+        aligner: Aligner for the reference frame
+        data: Frame data
+        file_path: Frame path
+        reference_header: Reference header for the WCS fallback
+
+    Returns:
+        float32 aligned data, NaN where the frame has no data
+
+    Raises:
+        Exception: Registration errors that are not recoverable
+    """
+    if os.path.abspath(file_path) == os.path.abspath(aligner.reference_path):
+        return data.astype(np.float32, copy=False)
+    try:
+        return _masked(*aligner.register(data, file_path))
+    except Exception as e:
+        error = e
+        # SEP deblending overflow makes astroalign raise TypeError ("Input type
+        # for target not supported"); retry once with a higher sub-object limit.
+        if _is_deblend_overflow(error):
+            try:
+                import sep
+                original_limit = sep.get_sub_object_limit()
+                sep.set_sub_object_limit(original_limit * 4)
+                logger.info("Increased SEP sub-object limit to %d for %s",
+                            sep.get_sub_object_limit(), os.path.basename(file_path))
+                try:
+                    return _masked(*aligner.register(data, file_path))
+                finally:
+                    sep.set_sub_object_limit(original_limit)
+            except ImportError:
+                pass
+            except Exception as retry_error:
+                error = retry_error
+
+        recoverable = (
+            _is_maxiter_error(error) or
+            isinstance(error, TypeError) or
+            "Input type for target not supported" in str(error) or
+            _is_deblend_overflow(error)
+        )
+        if not recoverable:
+            raise error
+
+        aligned = _wcs_reproject(data, file_path, reference_header, aligner.reference.shape)
+        if aligned is not None:
+            logger.warning("Star registration failed for %s: %s. Used WCS reprojection fallback.",
+                           os.path.basename(file_path), error)
+            return aligned
+        logger.warning("Star registration failed for %s: %s. Proceeding without alignment for this frame.",
+                       os.path.basename(file_path), error)
+        return data.astype(np.float32, copy=False)
+
+
+# Per-process state of registration workers
+_worker_aligner: Optional[FrameAligner] = None
+_worker_reference_header: Any = None
+
+
+def _init_registration_worker(reference_path: str, use_cache: bool, reference_hash: Optional[str],
+                              known_transforms: Dict[str, np.ndarray]) -> None:
+    """Load the reference frame once per worker process."""
+    global _worker_aligner, _worker_reference_header
+    try:
+        import sep
+        sep.set_sub_object_limit(max(sep.get_sub_object_limit(), _SEP_SUB_OBJECT_LIMIT))
+    except Exception:
+        pass
+    reference, _worker_reference_header = read_fits_image(reference_path)
+    _worker_aligner = FrameAligner(reference_path, reference.astype(np.float32, copy=False), use_cache,
+                                   known_transforms=known_transforms, reference_hash=reference_hash)
+
+
+def _register_file(aligner: FrameAligner, reference_header: Any, file_path: str,
+                   shape: Tuple[int, int]) -> Tuple[Optional[np.ndarray], Optional[str], List]:
+    """
+    Read and align one frame.
+
+    Returns:
+        (aligned, None, transforms) or (None, reason, transforms), where
+        transforms are the aligner's new transforms (see take_new_transforms())
+    """
+    try:
+        data, _header = read_fits_image(file_path)
+        if data.shape != tuple(shape):
+            return None, f"dimensions {data.shape} differ from {tuple(shape)}", aligner.take_new_transforms()
+        aligned = align_frame(aligner, data.astype(np.float32, copy=False), file_path, reference_header)
+        return aligned, None, aligner.take_new_transforms()
+    except Exception as e:
+        return None, str(e), aligner.take_new_transforms()
+
+
+def _register_file_in_worker(file_path: str, shape: Tuple[int, int]
+                             ) -> Tuple[Optional[np.ndarray], Optional[str], List]:
+    return _register_file(_worker_aligner, _worker_reference_header, file_path, shape)
+
+
+class RegistrationPool:
+    """
+    Registers the frames of a stack in worker processes.
+
+    Frames are yielded in input order. At most max_pending frames are queued
+    or held in flight, so memory stays bounded however fast the workers are.
+    Transforms computed by the workers are stored by the pool.
+    """
+
+    def __init__(self, reference_path: str, reference_data: np.ndarray, reference_header: Any = None,
+                 workers: Optional[int] = None, max_pending: Optional[int] = None) -> None:
+        """
+        Initialize the pool.
+
+        Args:
+            reference_path: Path of the reference frame
+            reference_data: Reference frame data (used by the in-process path)
+            reference_header: Reference header (WCS fallback)
+            workers: Worker processes (None reads 'registration_workers'; 1 runs in-process)
+            max_pending: Maximum frames in flight (default 2 per worker)
+        """
+        self.reference_path = reference_path
+        self.reference_header = reference_header
+        self.aligner = FrameAligner(reference_path, reference_data)
+        self.workers = get_registration_worker_count() if workers is None else max(1, workers)
+        self.max_pending = max_pending or self.workers * 2
+
+    def _register_serial(self, file_paths: Iterable[str], shape: Tuple[int, int]
+                         ) -> Iterator[Tuple[str, Tuple[Optional[np.ndarray], Optional[str], List]]]:
+        for file_path in file_paths:
+            yield file_path, _register_file(self.aligner, self.reference_header, file_path, shape)
+
+    def align_files(self, file_paths: Iterable[str],
+                    shape: Tuple[int, int]) -> Iterator[Tuple[str, Optional[np.ndarray]]]:
+        """
+        Read and align frames onto the reference.
+
+        Args:
+            file_paths: Frame paths, in the order results should be yielded
+            shape: Expected (height, width); other frames are skipped
+
+        Yields:
+            (file_path, aligned) where aligned is None if the frame was skipped
+        """
+        file_paths = list(file_paths)
+        shape = tuple(shape)
+        initargs = (self.reference_path, False, None, {})
+        if self.workers > 1 and len(file_paths) > 1:
+            logger.info(f"Registering {len(file_paths)} frames with {self.workers} worker processes")
+            if self.aligner.use_cache:
+                initargs = (self.reference_path, True, self.aligner.reference_hash(),
+                            self.aligner.load_transforms())
+        results = ordered_process_map(
+            functools.partial(_register_file_in_worker, shape=shape), file_paths,
+            lambda paths: self._register_serial(paths, shape), self.workers, self.max_pending,
+            'Registration', initializer=_init_registration_worker, initargs=initargs)
+        for file_path, (aligned, reason, transforms) in results:
+            self.aligner.store_transforms(transforms)
+            if reason:
+                logger.warning(f"Skipping frame {file_path}: {reason}")
+            yield file_path, aligned
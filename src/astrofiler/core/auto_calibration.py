@@ -202,7 +202,8 @@ def analyze_calibration_opportunities(config: configparser.ConfigParser, session
 
 
 def create_master_frames(config: configparser.ConfigParser, session_id: Optional[str] = None, 
-                        force: bool = False, dry_run: bool = False, verbose: bool = False, progress_callback=None) -> bool:
+                        force: bool = False, dry_run: bool = False, verbose: bool = False, progress_callback=None,
+                        rejection: Optional[str] = None) -> bool:
     """
     Create master calibration frames from calibration sessions.
     
@@ -213,6 +214,8 @@ def create_master_frames(config: configparser.ConfigParser, session_id: Optional
         dry_run: Show what would be done without making changes
         verbose: Enable verbose output showing which files are used
         progress_callback: Optional callback for progress updates
+        rejection: Pixel rejection method, a key of REJECTION_METHODS
+            (None reads 'stack_rejection' from astrofiler.ini)
     
     Returns:
         True if successful, False otherwise
@@ -322,7 +325,8 @@ def create_master_frames(config: configparser.ConfigParser, session_id: Optional
                     session.cal_type,
                     min_files_per_master,
                     master_progress,
-                    verbose=verbose
+                    verbose=verbose,
+                    rejection=rejection
                 )
                 
                 if master_path:
@@ -367,6 +371,7 @@ def calibrate_light_frames(config: configparser.ConfigParser, session_id: Option
     """
     try:
         from .light_calibration import calibrate_session_lights, find_light_sessions_for_calibration, get_calibration_statistics
+        from .master_cache import get_master_cache
         
         logging.info("Starting light frame calibration...")
         if force_recalibrate:
@@ -456,6 +461,9 @@ def calibrate_light_frames(config: configparser.ConfigParser, session_id: Option
         logging.info(f"  - Sessions processed: {calibrated_count}/{total_sessions}")
         logging.info(f"  - Frames calibrated: {frames_calibrated}")
         logging.info(f"  - Sessions with errors: {error_count}")
+        cache_stats = get_master_cache().stats()
+        logging.info(f"  - Master cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                     f"{cache_stats['bytes'] / (1024 * 1024):.0f} MB held")
         logging.info(f"  - Final status: {final_stats['calibrated_frames']}/{final_stats['total_light_frames']} frames calibrated ({final_stats['calibration_percentage']:.1f}%)")
         
         return True
@@ -476,70 +484,31 @@ def perform_quality_assessment(config: configparser.ConfigParser, session_id: Op
     try:
         logging.info("Starting enhanced quality assessment with SEP star detection...")
         
-        # Import the enhanced quality analyzer
-        from .enhanced_quality import EnhancedQualityAnalyzer
-        from ..models import fitsFile, db
+        from .quality_engine import QualityAssessmentEngine, find_frames_needing_assessment
         
-        analyzer = EnhancedQualityAnalyzer()
-        
-        # Get files to analyze
+        # Frames without metrics, or whose file changed since they were measured
         if session_id:
             logging.info(f"Assessing specific session: {session_id}")
-            files_to_analyze = list(fitsFile.select().where(
-                fitsFile.fitsFileSession == session_id,
-                fitsFile.fitsFileName.is_null(False),
-                fitsFile.fitsFileSoftDelete == False
-            ))
         else:
             logging.info("Assessing quality of all light frames...")
-            # Focus on light frames for quality assessment
-            files_to_analyze = list(fitsFile.select().where(
-                fitsFile.fitsFileType == 'LIGHT',
-                fitsFile.fitsFileName.is_null(False),
-                fitsFile.fitsFileSoftDelete == False
-            ).limit(100))  # Limit to prevent overwhelming analysis
-        
-        if not files_to_analyze:
-            logging.warning("No files found for quality assessment")
+        candidates = find_frames_needing_assessment(session_id)
+        
+        if not candidates:
+            logging.info("All frames already have up-to-date quality metrics")
             return True
         
-        logging.info(f"Analyzing quality for {len(files_to_analyze)} files...")
+        logging.info(f"Analyzing quality for {len(candidates)} files...")
         
-        # Analyze each file
-        successful_analyses = 0
-        failed_analyses = 0
+        def engine_progress(done, total, message):
+            # 80% of the progress range for file analysis
+            if progress_callback:
+                progress_callback(int(10 + done * 80.0 / max(total, 1)), message)
+            return True
         
-        for i, fits_file in enumerate(files_to_analyze):
-            try:
-                # Create progress callback for individual file
-                def file_progress(current, total, message):
-                    # Calculate overall progress using current/total ratio
-                    file_progress_weight = 80.0 / len(files_to_analyze)  # 80% for file analysis
-                    overall_progress = 10 + (i * file_progress_weight) + (current * file_progress_weight / max(total, 1))
-                    
-                    if progress_callback:
-                        progress_callback(int(overall_progress), 
-                                        f"Analyzing {fits_file.fitsFileObject} ({i+1}/{len(files_to_analyze)}): {message}")
-                    return True
-                
-                # Perform quality analysis
-                quality_results = analyzer.analyze_and_update_file(
-                    fits_file.fitsFileName, 
-                    fits_file.fitsFileId,
-                    progress_callback=file_progress
-                )
-                
-                if quality_results.get("status") == "success":
-                    successful_analyses += 1
-                    logging.debug(f"Successfully analyzed {fits_file.fitsFileName}")
-                else:
-                    failed_analyses += 1
-                    logging.warning(f"Failed to analyze {fits_file.fitsFileName}: {quality_results.get('message', 'Unknown error')}")
-                
-            except Exception as e:
-                failed_analyses += 1
-                logging.error(f"Error analyzing {fits_file.fitsFileName}: {e}")
-                continue
+        # Metrics are committed in batches, so an interrupted run resumes where it stopped
+        stats = QualityAssessmentEngine().assess(candidates, progress_callback=engine_progress)
+        successful_analyses = stats['analyzed']
+        failed_analyses = stats['failed']
         
         # Update progress
         if progress_callback:
@@ -0,0 +1,406 @@
+"""
+Session-level light frame calibration engine for AstroFiler.
+
+calibrate_light_frame() used to reopen the dark, flat and bias masters for
+every light, convert them to float64, recompute (Dark - Bias) and the
+normalized flat, and MD5 the master files for the header. CalibrationMasters
+does that work once per session:
+
+- the bias-corrected dark (Dark - Bias), the bias (used when there is no
+  dark) and the normalized, clamped flat are computed once and held as
+  float32
+- master checksums for the calibrated headers are computed once
+- prepared sets are kept in the process-wide master cache (master_cache),
+  so sessions that share masters prepare them once per workflow
+
+SessionCalibrationEngine copies the prepared masters into shared memory and
+calibrates the lights of a session in worker processes, which attach to the
+shared arrays instead of receiving or reloading them. Results are yielded
+in input order; database updates are left to the caller so they can be
+committed in one batch.
+"""
+
+import os
+import logging
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .master_cache import get_master_cache, load_master_array, master_cache_key
+from .services.file_hash_calculator import get_file_hash_calculator
+from .utils import get_processing_precision, get_worker_count, ordered_process_map
+
+logger = logging.getLogger(__name__)
+
+# Normalized flat values are clamped to this floor before dividing
+FLAT_THRESHOLD = 0.1
+
+# Maximum difference of a float32 calibration from a float64 one, relative to
+# the peak absolute value of the calibrated frame: three float32 roundings
+# (subtract, divide, output) at 2**-24 each, plus float32 masters, with margin
+FLOAT32_TOLERANCE = 1e-6
+
+# Prepared arrays that may be shared with worker processes
+_SHARED_ARRAYS = ('dark', 'bias', 'flat')
+
+
+def get_calibration_worker_count(config_path: str = 'astrofiler.ini') -> int:
+    """
+    Get the number of processes used to calibrate light frames.
+
+    Reads 'calibration_workers' from the DEFAULT section of astrofiler.ini.
+    A value of 1 calibrates frames in the calling process.
+
+    Returns:
+        Worker count (default: CPU count - 1, at most 4)
+    """
+    return get_worker_count('calibration_workers', config_path)
+
+
+def _read_master(path: str) -> np.ndarray:
+    """Writable float32 copy of a master, decoded through the master cache."""
+    return np.array(load_master_array(path), dtype=np.float32)
+
+
+def master_checksum(path: str) -> Optional[str]:
+    """Truncated MD5 of a master file, as written to calibrated headers."""
+    try:
+        return get_file_hash_calculator().calculate_md5(path)[:16]
+    except Exception:
+        return None
+
+
+class CalibrationMasters:
+    """
+    Master frames for one session, loaded and combined once.
+
+    Attributes:
+        dark_master, flat_master, bias_master: Master paths (None if not used)
+        dark: Bias-corrected dark (Dark - Bias), float32
+        bias: Bias, float32; only set when there is no dark
+        flat: Flat normalized by its mean after dark subtraction and clamped
+            to FLAT_THRESHOLD, float32
+        dark_step, bias_step, flat_step: Calibration step descriptions
+        checksums: Truncated MD5 per master type
+        failed: Master types that could not be loaded or prepared
+    """
+
+    def __init__(self, dark_master: Optional[str] = None, flat_master: Optional[str] = None,
+                 bias_master: Optional[str] = None) -> None:
+        self.dark_master = dark_master if dark_master and os.path.exists(dark_master) else None
+        self.flat_master = flat_master if flat_master and os.path.exists(flat_master) else None
+        self.bias_master = bias_master if bias_master and os.path.exists(bias_master) else None
+        self.dark: Optional[np.ndarray] = None
+        self.bias: Optional[np.ndarray] = None
+        self.flat: Optional[np.ndarray] = None
+        self.dark_step: Optional[str] = None
+        self.bias_step: Optional[str] = None
+        self.flat_step: Optional[str] = None
+        self.checksums: Dict[str, Optional[str]] = {}
+        self.failed: List[str] = []
+        self._shared: List[shared_memory.SharedMemory] = []
+        self._owner = False
+        self._attached = False
+        self._descriptor: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def load(cls, dark_master: Optional[str] = None, flat_master: Optional[str] = None,
+             bias_master: Optional[str] = None) -> 'CalibrationMasters':
+        """
+        Load the masters and precompute the bias-corrected dark and normalized flat.
+
+        A master that cannot be loaded is logged and left out, as the
+        per-frame calibration did.
+        """
+        masters = cls(dark_master, flat_master, bias_master)
+        masters._prepare()
+        for kind in ('bias', 'dark', 'flat'):
+            path = getattr(masters, f'{kind}_master')
+            if path:
+                masters.checksums[kind] = master_checksum(path)
+        return masters
+
+    @classmethod
+    def cached(cls, dark_master: Optional[str] = None, flat_master: Optional[str] = None,
+               bias_master: Optional[str] = None) -> 'CalibrationMasters':
+        """
+        Like load(), but served from the process-wide master cache.
+
+        Prepared sets are keyed by the Masters id and file hash of each
+        master, so sessions sharing masters prepare them once. The arrays of
+        a cached set are read-only. A set in which a master failed to load
+        is not cached.
+        """
+        paths = {'dark': dark_master, 'flat': flat_master, 'bias': bias_master}
+        paths = {kind: path for kind, path in paths.items() if path and os.path.exists(path)}
+        try:
+            key = ('prepared',) + tuple(
+                (kind, master_cache_key(paths[kind]) if kind in paths else None)
+                for kind in ('dark', 'flat', 'bias'))
+        except Exception as e:
+            logger.debug(f"Master cache unavailable, loading masters directly: {e}")
+            return cls.load(dark_master, flat_master, bias_master)
+
+        cache = get_master_cache()
+        masters = cache.get(key)
+        if masters is None:
+            masters = cls.load(dark_master, flat_master, bias_master)
+            arrays = [data for data in (masters.dark, masters.bias, masters.flat) if data is not None]
+            for data in arrays:
+                data.flags.writeable = False
+            if not masters.failed:
+                cache.put(key, masters, sum(data.nbytes for data in arrays), paths.values())
+        return masters
+
+    def _prepare(self) -> None:
+        bias = None
+        if self.bias_master:
+            try:
+                bias = _read_master(self.bias_master)
+            except Exception as e:
+                logger.warning(f"Failed to load bias master {self.bias_master}: {e}")
+                self.failed.append('bias')
+
+        if self.dark_master:
+            try:
+                dark = _read_master(self.dark_master)
+                name = os.path.basename(self.dark_master)
+                # Dark masters contain uncorrected bias signal; remove it once here
+                if bias is not None and bias.shape == dark.shape:
+                    dark -= bias
+                    self.dark_step = f"DARK: {name} - BIAS corrected"
+                    logger.info(f"Bias-corrected dark frame: bias mean={np.mean(bias):.2f} ADU removed")
+                else:
+                    if bias is not None:
+                        logger.warning(f"Bias shape {bias.shape} doesn't match dark {dark.shape}, skipping bias correction")
+                    else:
+                        logger.warning("No bias master available - dark correction will leave residual bias signal")
+                    self.dark_step = f"DARK: {name} - NO BIAS CORRECTION"
+                self.dark = dark
+            except Exception as e:
+                logger.error(f"Failed to load dark master {self.dark_master}: {e}")
+                self.failed.append('dark')
+        elif bias is not None:
+            self.bias = bias
+            self.bias_step = f"BIAS: {os.path.basename(self.bias_master)}"
+
+        if self.flat_master:
+            try:
+                flat = _read_master(self.flat_master)
+                dark_corrected = False
+                if self.dark is not None and self.dark.shape == flat.shape:
+                    flat -= self.dark
+                    dark_corrected = True
+                    logger.info("Subtracted bias-corrected dark (Dark - Bias) from flat master")
+                elif self.dark is not None:
+                    logger.warning("Corrected dark shape doesn't match flat shape, skipping dark subtraction from flat")
+
+                flat_mean = float(np.mean(flat, dtype=np.float64))
+                if flat_mean <= 0:
+                    raise ValueError("Flat frame mean is zero or negative after bias subtraction")
+                flat /= flat_mean
+                low = flat < FLAT_THRESHOLD
+                if np.any(low):
+                    logger.warning(f"Flat frame has {int(np.sum(low))} pixels below threshold, clamping to {FLAT_THRESHOLD}")
+                    np.maximum(flat, FLAT_THRESHOLD, out=flat)
+                self.flat = flat
+                note = "dark-corrected" if dark_corrected else "raw"
+                self.flat_step = f"FLAT: {os.path.basename(self.flat_master)} ({note}, mean: {flat_mean:.1f})"
+            except Exception as e:
+                logger.error(f"Failed to prepare flat master {self.flat_master}: {e}")
+                self.failed.append('flat')
+
+    @property
+    def empty(self) -> bool:
+        """True if no master could be prepared."""
+        return self.dark is None and self.bias is None and self.flat is None
+
+    def apply(self, light: np.ndarray, progress_callback: Optional[Callable] = None
+              ) -> Tuple[np.ndarray, List[str]]:
+        """
+        Calibrate one light frame.
+
+        Computes (Light - (Dark - Bias)) / Flat, or (Light - Bias) / Flat when
+        there is no dark. A master whose shape differs from the light is
+        skipped with an error.
+
+        Floating-point lights are calibrated in place, in their own precision;
+        other lights are first converted to the configured processing
+        precision. In float32 the result differs from a float64 calibration
+        by at most FLOAT32_TOLERANCE relative to the frame's peak value.
+
+        Args:
+            light: Light frame data
+            progress_callback: Optional callback for progress messages
+
+        Returns:
+            (calibrated data, calibration steps applied)
+        """
+        if light.dtype.kind == 'f' and light.flags.writeable:
+            calibrated = light
+        else:
+            calibrated = np.array(light, dtype=np.dtype(get_processing_precision()))
+        steps: List[str] = []
+        for kind, step in (('dark', self.dark_step), ('bias', self.bias_step), ('flat', self.flat_step)):
+            master = getattr(self, kind)
+            if master is None:
+                continue
+            if progress_callback:
+                progress_callback(f"Applying {kind} correction...")
+            if master.shape != calibrated.shape:
+                message = (f"{kind.title()} frame shape {master.shape} doesn't match "
+                           f"light frame {calibrated.shape}")
+                logger.error(f"Failed to apply {kind} correction: {message}")
+                if progress_callback:
+                    progress_callback(f"Warning: Failed to apply {kind} correction: {message}")
+                continue
+            if kind == 'flat':
+                np.divide(calibrated, master, out=calibrated)
+            else:
+                np.subtract(calibrated, master, out=calibrated)
+            steps.append(step)
+        return calibrated, steps
+
+    # ------------------------------------------------------------------
+    # Shared memory
+    # ------------------------------------------------------------------
+
+    def share(self) -> Dict[str, Any]:
+        """
+        Copy the prepared arrays into shared memory.
+
+        Returns:
+            Picklable descriptor for CalibrationMasters.attach()
+        """
+        if self._descriptor is not None:
+            return self._descriptor
+        arrays = {}
+        for name in _SHARED_ARRAYS:
+            data = getattr(self, name)
+            if data is None:
+                continue
+            block = shared_memory.SharedMemory(create=True, size=max(1, data.nbytes))
+            self._shared.append(block)
+            shared = np.ndarray(data.shape, dtype=data.dtype, buffer=block.buf)
+            shared[...] = data
+            arrays[name] = (block.name, data.shape, data.dtype.str)
+        self._owner = True
+        state = {key: getattr(self, key) for key in (
+            'dark_master', 'flat_master', 'bias_master', 'dark_step', 'bias_step', 'flat_step', 'checksums')}
+        self._descriptor = {'arrays': arrays, 'state': state}
+        return self._descriptor
+
+    @classmethod
+    def attach(cls, descriptor: Dict[str, Any]) -> 'CalibrationMasters':
+        """Attach to masters shared by CalibrationMasters.share() (read-only)."""
+        masters = cls()
+        for key, value in descriptor['state'].items():
+            setattr(masters, key, value)
+        for name, (block_name, shape, dtype) in descriptor['arrays'].items():
+            block = shared_memory.SharedMemory(name=block_name)
+            masters._shared.append(block)
+            data = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+            data.flags.writeable = False
+            setattr(masters, name, data)
+        masters._attached = True
+        return masters
+
+    def close(self) -> None:
+        """Release shared memory (and remove it if this process created it)."""
+        if self._attached:
+            # Attached arrays are views of the blocks; drop them before closing
+            for name in _SHARED_ARRAYS:
+                setattr(self, name, None)
+        for block in self._shared:
+            try:
+                block.close()
+                if self._owner:
+                    block.unlink()
+            except (OSError, BufferError) as e:
+                logger.debug(f"Error releasing shared calibration masters: {e}")
+        self._shared = []
+        self._owner = False
+        self._attached = False
+        self._descriptor = None
+
+
+_worker_masters: Optional[CalibrationMasters] = None
+
+
+def _init_calibration_worker(descriptor: Dict[str, Any]) -> None:
+    """Attach to the shared masters once per worker process."""
+    global _worker_masters
+    _worker_masters = CalibrationMasters.attach(descriptor)
+
+
+def _calibrate_file(masters: CalibrationMasters, light_path: str) -> Dict:
+    # Imported here: light_calibration builds on this module
+    from .light_calibration import calibrate_light_frame
+    return calibrate_light_frame(light_path, masters=masters)
+
+
+def _calibrate_file_in_worker(light_path: str) -> Dict:
+    return _calibrate_file(_worker_masters, light_path)
+
+
+class SessionCalibrationEngine:
+    """
+    Calibrates the light frames of a session against one set of masters.
+
+    The masters are loaded and prepared once, copied into shared memory and
+    used by every worker. At most max_pending frames are queued or in flight.
+    Use as a context manager, or call close(), to release the shared memory.
+    """
+
+    def __init__(self, dark_master: Optional[str] = None, flat_master: Optional[str] = None,
+                 bias_master: Optional[str] = None, workers: Optional[int] = None,
+                 max_pending: Optional[int] = None) -> None:
+        """
+        Initialize the engine and prepare the masters.
+
+        Args:
+            dark_master: Path to master dark frame
+            flat_master: Path to master flat frame
+            bias_master: Path to master bias frame
+            workers: Worker processes (None reads 'calibration_workers'; 1 runs in-process)
+            max_pending: Maximum frames in flight (default 2 per worker)
+        """
+        self.masters = CalibrationMasters.cached(dark_master, flat_master, bias_master)
+        self.workers = get_calibration_worker_count() if workers is None else max(1, workers)
+        self.max_pending = max_pending or self.workers * 2
+
+    def __enter__(self) -> 'SessionCalibrationEngine':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Release the shared masters."""
+        self.masters.close()
+
+    def _calibrate_serial(self, light_paths: Iterable[str]) -> Iterator[Tuple[str, Dict]]:
+        for light_path in light_paths:
+            yield light_path, _calibrate_file(self.masters, light_path)
+
+    def calibrate_files(self, light_paths: Iterable[str]) -> Iterator[Tuple[str, Dict]]:
+        """
+        Calibrate light frames, writing cal_ files next to the inputs.
+
+        Args:
+            light_paths: Light frame paths, in the order results should be yielded
+
+        Yields:
+            (light_path, result) with the calibrate_light_frame() result dict
+        """
+        light_paths = list(light_paths)
+        if self.workers <= 1 or len(light_paths) < 2:
+            yield from self._calibrate_serial(light_paths)
+            return
+
+        logger.info(f"Calibrating {len(light_paths)} frames with {self.workers} worker processes")
+        yield from ordered_process_map(_calibrate_file_in_worker, light_paths, self._calibrate_serial,
+                                       self.workers, self.max_pending, 'Calibration',
+                                       initializer=_init_calibration_worker,
+                                       initargs=(self.masters.share(),))
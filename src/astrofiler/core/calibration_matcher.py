@@ -0,0 +1,206 @@
+"""
+In-memory calibration session matcher for AstroFiler.
+
+SessionProcessor.linkSessions() used to run up to three
+"SELECT ... ORDER BY fitsSessionDate DESC LIMIT 1" queries per light session.
+CalibrationSessionMatcher loads every bias, dark and flat session once,
+indexes them by their matching criteria into date-sorted lists, and answers
+"most recent matching session on or before this date" with a bisect.
+"""
+
+import logging
+import configparser
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..models.fits_session import fitsSession as fitsSessionModel
+
+logger = logging.getLogger(__name__)
+
+# Default maximum CCD temperature difference between a light and its dark (degrees C)
+DEFAULT_DARK_TEMPERATURE_TOLERANCE = 5.0
+
+_CALIBRATION_TYPES = ('Bias', 'Dark', 'Flat')
+
+# Session columns needed for matching (typed shadows plus their TEXT originals)
+MATCH_COLUMNS = (
+    fitsSessionModel.fitsSessionId,
+    fitsSessionModel.fitsSessionObjectName,
+    fitsSessionModel.fitsSessionDate,
+    fitsSessionModel.fitsSessionTelescope,
+    fitsSessionModel.fitsSessionImager,
+    fitsSessionModel.fitsSessionExposure,
+    fitsSessionModel.fitsSessionExposureValue,
+    fitsSessionModel.fitsSessionBinningX,
+    fitsSessionModel.fitsSessionBinningXValue,
+    fitsSessionModel.fitsSessionBinningY,
+    fitsSessionModel.fitsSessionBinningYValue,
+    fitsSessionModel.fitsSessionCCDTemp,
+    fitsSessionModel.fitsSessionCCDTempValue,
+    fitsSessionModel.fitsSessionGain,
+    fitsSessionModel.fitsSessionGainValue,
+    fitsSessionModel.fitsSessionOffset,
+    fitsSessionModel.fitsSessionOffsetValue,
+    fitsSessionModel.fitsSessionFilter,
+)
+
+
+def get_dark_temperature_tolerance(config_path: str = 'astrofiler.ini') -> float:
+    """
+    Get the configured dark CCD temperature tolerance.
+
+    Reads 'dark_temperature_tolerance' from the DEFAULT section of astrofiler.ini.
+
+    Returns:
+        Maximum temperature difference in degrees C (default 5.0)
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    try:
+        return config.getfloat('DEFAULT', 'dark_temperature_tolerance',
+                               fallback=DEFAULT_DARK_TEMPERATURE_TOLERANCE)
+    except ValueError:
+        return DEFAULT_DARK_TEMPERATURE_TOLERANCE
+
+
+def _date_key(value: Any) -> Optional[str]:
+    """Return a sortable 'YYYY-MM-DD' key for a session date, or None."""
+    if value is None or value == '':
+        return None
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    return str(value)[:10]
+
+
+def _numeric(value: Any, raw: Any) -> Any:
+    """Prefer a typed shadow column value, falling back to the raw TEXT value."""
+    return raw if value is None else value
+
+
+def _parse_temperature(value: Any) -> Optional[float]:
+    """Parse a CCD temperature, or None if it is not numeric."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class CalibrationSessionMatcher:
+    """
+    Finds the most recent matching bias, dark or flat session for a light session.
+
+    Sessions match when telescope, imager, binning, gain and offset are equal,
+    plus exposure time for darks and filter for flats. Numeric fields are
+    compared by their typed shadow columns, so "300" and "300.0" match. Darks
+    must also be within temperature_tolerance degrees of the light's CCD
+    temperature; when either temperature is not numeric the raw values must
+    be identical.
+    """
+
+    def __init__(self, temperature_tolerance: Optional[float] = None) -> None:
+        """
+        Initialize an empty matcher; call load() to index the calibration sessions.
+
+        Args:
+            temperature_tolerance: Maximum CCD temperature difference for darks
+                in degrees C (None reads 'dark_temperature_tolerance', default 5.0)
+        """
+        if temperature_tolerance is None:
+            temperature_tolerance = get_dark_temperature_tolerance()
+        self.temperature_tolerance = temperature_tolerance
+        # cal type -> criteria key -> (sorted date keys, matching (session id, ccd temp) entries)
+        self._index: Dict[str, Dict[Tuple, Tuple[List[str], List[Tuple[str, Any]]]]] = {
+            cal_type: {} for cal_type in _CALIBRATION_TYPES
+        }
+
+    @staticmethod
+    def _criteria(cal_type: str, session: Any) -> Tuple:
+        """Return the matching key of a session for a calibration type."""
+        key = (
+            session.fitsSessionTelescope,
+            session.fitsSessionImager,
+            _numeric(session.fitsSessionBinningXValue, session.fitsSessionBinningX),
+            _numeric(session.fitsSessionBinningYValue, session.fitsSessionBinningY),
+            _numeric(session.fitsSessionGainValue, session.fitsSessionGain),
+            _numeric(session.fitsSessionOffsetValue, session.fitsSessionOffset),
+        )
+        if cal_type == 'Dark':
+            return key + (_numeric(session.fitsSessionExposureValue, session.fitsSessionExposure),)
+        if cal_type == 'Flat':
+            return key + (session.fitsSessionFilter,)
+        return key
+
+    def load(self) -> 'CalibrationSessionMatcher':
+        """
+        Load and index all calibration sessions with a single query.
+
+        Returns:
+            self, for chaining
+        """
+        query = (fitsSessionModel
+                 .select(*MATCH_COLUMNS)
+                 .where(fitsSessionModel.fitsSessionObjectName.in_(list(_CALIBRATION_TYPES)))
+                 .namedtuples())
+
+        entries: Dict[str, Dict[Tuple, List[Tuple[str, str, Any]]]] = {
+            cal_type: {} for cal_type in _CALIBRATION_TYPES
+        }
+        count = 0
+        for session in query:
+            date_key = _date_key(session.fitsSessionDate)
+            if date_key is None:
+                continue  # Undated sessions can never be "on or before" a light date
+            cal_type = session.fitsSessionObjectName
+            entries[cal_type].setdefault(self._criteria(cal_type, session), []).append(
+                (date_key, str(session.fitsSessionId),
+                 _numeric(session.fitsSessionCCDTempValue, session.fitsSessionCCDTemp)))
+            count += 1
+
+        for cal_type, groups in entries.items():
+            index = self._index[cal_type]
+            index.clear()
+            for key, sessions in groups.items():
+                sessions.sort(key=lambda entry: entry[0])  # Stable: ties keep load order
+                index[key] = ([entry[0] for entry in sessions],
+                              [(entry[1], entry[2]) for entry in sessions])
+
+        logger.debug(f"Calibration matcher indexed {count} calibration sessions")
+        return self
+
+    def _temperature_matches(self, light_temp: Any, dark_temp: Any) -> bool:
+        light_value = _parse_temperature(light_temp)
+        dark_value = _parse_temperature(dark_temp)
+        if light_value is None or dark_value is None:
+            return light_temp == dark_temp
+        return abs(light_value - dark_value) <= self.temperature_tolerance
+
+    def find(self, cal_type: str, light_session: Any) -> Optional[str]:
+        """
+        Find the most recent matching calibration session on or before the light's date.
+
+        Args:
+            cal_type: 'Bias', 'Dark' or 'Flat'
+            light_session: Light session row (model instance or named tuple)
+
+        Returns:
+            Calibration session ID, or None if no session matches
+        """
+        date_key = _date_key(light_session.fitsSessionDate)
+        if date_key is None:
+            return None
+        group = self._index[cal_type].get(self._criteria(cal_type, light_session))
+        if group is None:
+            return None
+
+        dates, sessions = group
+        position = bisect_right(dates, date_key)
+        if cal_type != 'Dark':
+            return sessions[position - 1][0] if position else None
+
+        # Walk back from the most recent dark until one is within temperature tolerance
+        for i in range(position - 1, -1, -1):
+            session_id, ccd_temp = sessions[i]
+            light_temp = _numeric(light_session.fitsSessionCCDTempValue, light_session.fitsSessionCCDTemp)
+            if self._temperature_matches(light_temp, ccd_temp):
+                return session_id
+        return None
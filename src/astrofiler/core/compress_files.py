@@ -34,7 +34,8 @@ import tempfile
 from pathlib import Path
 from typing import Optional, Tuple
 from astropy.io import fits
-import hashlib
+from .fits_access import probe_fits_image
+from .services.file_hash_calculator import get_file_hash_calculator
 
 # Import config for temp folder
 try:
@@ -110,11 +111,10 @@ class FitsCompressor:
         # Check for FITS internal compression by examining the file structure
         if file_path.lower().endswith(('.fits', '.fit', '.fts', '.fits.fz', '.fit.fz', '.fts.fz', '.fz')):
             try:
-                with fits.open(file_path) as hdul:
-                    # Check if there are CompImageHDU (compressed image) extensions
-                    for hdu in hdul:
-                        if isinstance(hdu, fits.CompImageHDU):
-                            return True
+                # Check if the image is in a CompImageHDU (headers only)
+                info = probe_fits_image(file_path)
+                if info is not None and info.compressed:
+                    return True
             except Exception:
                 # If we can't read the file, assume it's not compressed
                 pass
@@ -195,11 +195,8 @@ class FitsCompressor:
         Returns:
             Hexadecimal hash string
         """
-        sha256_hash = hashlib.sha256()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(8192), b""):
-                sha256_hash.update(chunk)
-        return sha256_hash.hexdigest()
+        # Verification must read the bytes, so bypass the hash cache
+        return get_file_hash_calculator().calculate_sha256(file_path, use_cache=False)
     
     def compress_fits_file(self, input_path: str, replace_original: bool = True, 
                           algorithm: str = None) -> Optional[str]:
@@ -509,40 +506,34 @@ class FitsCompressor:
             Optimal algorithm name, or None if unable to determine
         """
         try:
-            with fits.open(fits_path) as hdul:
-                # Find the primary data HDU
-                data_hdu = None
-                for hdu in hdul:
-                    if hasattr(hdu, 'data') and hdu.data is not None:
-                        data_hdu = hdu
-                        break
-                
-                if data_hdu is None:
-                    logger.warning("No data found in FITS file for compression analysis")
-                    return 'fits_gzip2'  # Default fallback
-                
-                data_dtype = data_hdu.data.dtype
-                logger.info(f"FITS data type detected: {data_dtype}")
-                
-                # Integer data: Use RICE (lossless, designed for integers, NINA compatible)
-                if data_dtype.kind in ['i', 'u']:  # signed or unsigned integer
-                    if data_dtype.itemsize <= 2:  # 8-bit or 16-bit integers
-                        logger.info("Using RICE compression for integer data (NINA compatible)")
-                        return 'fits_rice'
-                    else:  # 32-bit+ integers - RICE may not be optimal
-                        logger.info("Using GZIP-2 for large integer data") 
-                        return 'fits_gzip2'
-                
-                # Floating-point data: Use GZIP-2 (best compression, lossless)
-                elif data_dtype.kind == 'f':  # floating point
-                    logger.info("Using GZIP-2 compression for floating-point data")
+            # The data type comes from BITPIX/BZERO, so no pixels are decoded
+            info = probe_fits_image(fits_path)
+            if info is None:
+                logger.warning("No data found in FITS file for compression analysis")
+                return 'fits_gzip2'  # Default fallback
+
+            data_dtype = info.dtype
+            logger.info(f"FITS data type detected: {data_dtype}")
+
+            # Integer data: Use RICE (lossless, designed for integers, NINA compatible)
+            if data_dtype.kind in ['i', 'u']:  # signed or unsigned integer
+                if data_dtype.itemsize <= 2:  # 8-bit or 16-bit integers
+                    logger.info("Using RICE compression for integer data (NINA compatible)")
+                    return 'fits_rice'
+                else:  # 32-bit+ integers - RICE may not be optimal
+                    logger.info("Using GZIP-2 for large integer data") 
                     return 'fits_gzip2'
-                
-                # Complex or other data types: Use conservative GZIP-1
-                else:
-                    logger.info(f"Using GZIP-1 for unknown data type: {data_dtype}")
-                    return 'fits_gzip1'
-                
+            
+            # Floating-point data: Use GZIP-2 (best compression, lossless)
+            elif data_dtype.kind == 'f':  # floating point
+                logger.info("Using GZIP-2 compression for floating-point data")
+                return 'fits_gzip2'
+            
+            # Complex or other data types: Use conservative GZIP-1
+            else:
+                logger.info(f"Using GZIP-1 for unknown data type: {data_dtype}")
+                return 'fits_gzip1'
+            
         except Exception as e:
             logger.error(f"Error analyzing FITS file for compression: {e}")
             return 'fits_gzip2'  # Safe fallback
@@ -8,12 +8,23 @@ This module provides advanced quality metrics including:
 - Half Flux Radius (HFR) calculation
 - Signal-to-noise ratio assessment
 - Image scale calculation from FITS headers
+
+The 'full' analysis mode detects and measures stars on the full-resolution
+frame. The 'balanced' and 'fast' modes estimate the background and detect
+stars on a binned copy of the frame and measure only the selected stars on
+full-resolution cutouts (see FastAnalysisSettings). The mode is read from
+'quality_analysis_mode' in astrofiler.ini; compare_analysis_modes() reports
+the accuracy of a fast mode against the full path.
 """
 
 import os
+import math
+import time
 import logging
+import configparser
 import numpy as np
 import warnings
+from dataclasses import dataclass
 from typing import Dict, List, Optional, Tuple
 from astropy.io import fits
 from astropy import units as u
@@ -21,7 +32,9 @@ from astropy.coordinates import SkyCoord
 from astropy.wcs import WCS
 from astropy.wcs import FITSFixedWarning
 from astropy.stats import sigma_clipped_stats, mad_std
-from .utils import fits_image_data
+from .utils import get_processing_precision
+from .fits_access import read_fits_image
+from .star_measurement import measure_star_cutouts
 import datetime
 
 # Suppress warnings for cleaner output
@@ -56,14 +69,109 @@ except ImportError:
     SCIPY_AVAILABLE = False
     logger.warning("scipy not available. Some advanced fitting methods will be limited.")
 
+# Analysis result keys and the fitsFile columns they are stored in
+QUALITY_METRIC_FIELDS = {
+    "avg_fwhm_arcsec": "fitsFileAvgFWHMArcsec",
+    "avg_eccentricity": "fitsFileAvgEccentricity",
+    "avg_hfr_arcsec": "fitsFileAvgHFRArcsec",
+    "image_snr": "fitsFileImageSNR",
+    "star_count": "fitsFileStarCount",
+    "image_scale": "fitsFileImageScale",
+}
+
+
+def quality_metric_updates(quality_results: Dict) -> Dict:
+    """
+    Map the metrics present in an analysis result to fitsFile column values.
+
+    Args:
+        quality_results: Result of EnhancedQualityAnalyzer.analyze_image_quality()
+
+    Returns:
+        dict: fitsFile field name -> value, for metrics that are not None
+    """
+    return {column: quality_results[key] for key, column in QUALITY_METRIC_FIELDS.items()
+            if quality_results.get(key) is not None}
+
+
+@dataclass(frozen=True)
+class FastAnalysisSettings:
+    """Parameters of the binned analysis path."""
+    bin_factor: int  # Background and detection run on bin_factor x bin_factor binned pixels
+    cutout_size: int = 25  # Full-resolution cutout measured around each selected star
+
+
+# Speed/accuracy presets; None runs the full-resolution analysis
+QUALITY_ANALYSIS_MODES = {
+    'full': None,
+    'balanced': FastAnalysisSettings(bin_factor=2),
+    'fast': FastAnalysisSettings(bin_factor=4),
+}
+DEFAULT_QUALITY_ANALYSIS_MODE = 'full'
+
+
+def get_quality_analysis_mode(config_path: str = 'astrofiler.ini') -> str:
+    """
+    Get the quality analysis mode.
+
+    Reads 'quality_analysis_mode' from the DEFAULT section of astrofiler.ini:
+    'full', 'balanced' (2x2 binned detection) or 'fast' (4x4 binned detection).
+
+    Returns:
+        Mode name (default 'full')
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    mode = config.get('DEFAULT', 'quality_analysis_mode',
+                      fallback=DEFAULT_QUALITY_ANALYSIS_MODE).strip().lower()
+    if mode not in QUALITY_ANALYSIS_MODES:
+        logger.warning(f"Unknown quality_analysis_mode '{mode}', using '{DEFAULT_QUALITY_ANALYSIS_MODE}'")
+        return DEFAULT_QUALITY_ANALYSIS_MODE
+    return mode
+
+
+def bin_image(data: np.ndarray, factor: int) -> np.ndarray:
+    """
+    Average factor x factor blocks of an image into a float32 array.
+
+    Rows and columns that do not fill a whole block are dropped, so binned
+    pixel (i, j) covers full-resolution pixels [i*factor, (i+1)*factor).
+
+    Args:
+        data: 2D image (any numeric dtype; may be memory-mapped)
+        factor: Block size in pixels
+
+    Returns:
+        numpy.ndarray: C-contiguous float32 binned image
+    """
+    height = data.shape[0] // factor * factor
+    width = data.shape[1] // factor * factor
+    image = data[:height, :width]
+    # Adding strided views is several times faster than a reshaped mean()
+    binned = np.zeros((height // factor, width // factor), dtype=np.float32)
+    for dy in range(factor):
+        rows = image[dy::factor].astype(np.float32)
+        for dx in range(factor):
+            binned += rows[:, dx::factor]
+    binned *= np.float32(1.0 / (factor * factor))
+    return binned
+
+
 
 class EnhancedQualityAnalyzer:
     """
     Advanced quality analyzer with SEP-based star detection and photometry capabilities.
     """
     
-    def __init__(self):
-        """Initialize the enhanced quality analyzer."""
+    def __init__(self, analysis_mode: Optional[str] = None):
+        """
+        Initialize the enhanced quality analyzer.
+
+        Args:
+            analysis_mode: 'full', 'balanced' or 'fast' (None reads
+                'quality_analysis_mode' from astrofiler.ini)
+        """
+        self.analysis_mode = analysis_mode or get_quality_analysis_mode()
         self.min_star_count = 3  # Minimum stars needed for reliable analysis
         self.max_star_count = 10  # Maximum stars to analyze (top brightest for quality metrics)
         
@@ -80,13 +188,15 @@ class EnhancedQualityAnalyzer:
         self.fwhm_estimate = 4.0  # Initial FWHM estimate in pixels (photutils fallback)
         
     def analyze_image_quality(self, fits_file_path: str, 
-                            progress_callback: Optional[callable] = None) -> Dict:
+                            progress_callback: Optional[callable] = None,
+                            analysis_mode: Optional[str] = None) -> Dict:
         """
         Perform comprehensive quality analysis with star detection and photometry.
         
         Args:
             fits_file_path: Path to FITS file
             progress_callback: Optional progress callback function
+            analysis_mode: Override the analyzer's mode ('full', 'balanced' or 'fast')
             
         Returns:
             dict: Quality analysis results including:
@@ -96,77 +206,137 @@ class EnhancedQualityAnalyzer:
                 - image_snr: Overall image signal-to-noise ratio
                 - star_count: Number of detected stars
                 - image_scale: Image scale in arcsec/pixel
+                - analysis_mode: Mode the frame was analyzed with
         """
         try:
+            mode = analysis_mode or self.analysis_mode
+            if mode not in QUALITY_ANALYSIS_MODES:
+                return {"status": "error", "message": f"Unknown analysis mode: {mode}",
+                        "file_path": fits_file_path}
+            fast_settings = QUALITY_ANALYSIS_MODES[mode]
+
             if progress_callback:
                 should_continue = progress_callback(0, 100, "Loading FITS file...")
                 if not should_continue:
                     return {"status": "cancelled"}
             
-            # Load FITS file
-            with fits.open(fits_file_path) as hdul:
-                raw_data, header = fits_image_data(hdul)
-                if raw_data is None:
-                    return {"status": "error", "message": "No image data found in FITS file"}
-                data = raw_data.astype(np.float64)
-                
-                results = {
-                    "file_path": fits_file_path,
-                    "avg_fwhm_arcsec": None,
-                    "avg_eccentricity": None,
-                    "avg_hfr_arcsec": None,
-                    "image_snr": None,
-                    "star_count": 0,
-                    "image_scale": None,
-                    "analysis_timestamp": datetime.datetime.now().isoformat(),
-                    "status": "success"
-                }
-                
-                # Step 1: Calculate image scale from header (20%)
-                if progress_callback:
-                    should_continue = progress_callback(10, 100, "Calculating image scale...")
-                    if not should_continue:
-                        return {"status": "cancelled"}
-                
-                image_scale = self._calculate_image_scale(header)
-                results["image_scale"] = image_scale
-                
-                # Step 2: Calculate basic image SNR (20%)
-                if progress_callback:
-                    should_continue = progress_callback(20, 100, "Calculating image SNR...")
-                    if not should_continue:
-                        return {"status": "cancelled"}
-                
+            # Load FITS file; the full analysis runs in the configured precision
+            # (float32 by default). The binned modes keep the decoded (memory-mapped)
+            # frame and only convert the binned image and the star cutouts.
+            try:
+                if fast_settings is None:
+                    data, header = read_fits_image(fits_file_path, dtype=np.dtype(get_processing_precision()))
+                else:
+                    data, header = read_fits_image(fits_file_path)
+            except ValueError:
+                return {"status": "error", "message": "No image data found in FITS file"}
+
+        except Exception as e:
+            logger.error(f"Error analyzing {fits_file_path}: {e}")
+            return {
+                "status": "error",
+                "message": str(e),
+                "file_path": fits_file_path
+            }
+
+        return self.analyze_image_data(data, header, fits_file_path, progress_callback, mode)
+
+    def analyze_image_data(self, data: np.ndarray, header: fits.Header, fits_file_path: str = "",
+                           progress_callback: Optional[callable] = None,
+                           analysis_mode: Optional[str] = None) -> Dict:
+        """
+        Perform quality analysis on an image that is already decoded.
+
+        Used by analyze_image_quality() and by ingest, which analyzes the
+        pixels it has read anyway instead of opening the file again.
+
+        Args:
+            data: 2D image data
+            header: Header of the image (for the image scale)
+            fits_file_path: Path of the file the image came from (for reporting)
+            progress_callback: Optional progress callback function
+            analysis_mode: Override the analyzer's mode ('full', 'balanced' or 'fast')
+
+        Returns:
+            dict: Quality analysis results, as for analyze_image_quality()
+        """
+        try:
+            mode = analysis_mode or self.analysis_mode
+            if mode not in QUALITY_ANALYSIS_MODES:
+                return {"status": "error", "message": f"Unknown analysis mode: {mode}",
+                        "file_path": fits_file_path}
+            fast_settings = QUALITY_ANALYSIS_MODES[mode]
+
+            results = {
+                "file_path": fits_file_path,
+                "avg_fwhm_arcsec": None,
+                "avg_eccentricity": None,
+                "avg_hfr_arcsec": None,
+                "image_snr": None,
+                "star_count": 0,
+                "image_scale": None,
+                "analysis_mode": mode,
+                "analysis_timestamp": datetime.datetime.now().isoformat(),
+                "status": "success"
+            }
+            
+            # Step 1: Calculate image scale from header (20%)
+            if progress_callback:
+                should_continue = progress_callback(10, 100, "Calculating image scale...")
+                if not should_continue:
+                    return {"status": "cancelled"}
+            
+            image_scale = self._calculate_image_scale(header)
+            results["image_scale"] = image_scale
+            
+            # Step 2: Calculate basic image SNR (20%)
+            if progress_callback:
+                should_continue = progress_callback(20, 100, "Calculating image SNR...")
+                if not should_continue:
+                    return {"status": "cancelled"}
+            
+            if fast_settings is None:
                 results["image_snr"] = self._calculate_image_snr(data)
-                
-                # Step 3: Detect stars (30%)
+            else:
+                # A strided sample has the same pixel statistics as the whole frame
+                step = fast_settings.bin_factor
+                results["image_snr"] = self._calculate_image_snr(
+                    np.asarray(data[::step, ::step], dtype=np.float32))
+            
+            # Step 3: Detect stars (30%)
+            if progress_callback:
+                should_continue = progress_callback(40, 100, "Detecting stars...")
+                if not should_continue:
+                    return {"status": "cancelled"}
+            
+            if fast_settings is None:
+                sources = self._detect_stars(data)
+            else:
+                sources = self._detect_stars_binned(data, fast_settings)
+            results["star_count"] = len(sources) if sources is not None else 0
+            
+            if sources is not None and len(sources) >= self.min_star_count:
+                # Step 4: Measure star properties (30%)
                 if progress_callback:
-                    should_continue = progress_callback(40, 100, "Detecting stars...")
+                    should_continue = progress_callback(70, 100, 
+                                    f"Analyzing {len(sources)} stars...")
                     if not should_continue:
                         return {"status": "cancelled"}
                 
-                sources = self._detect_stars(data)
-                results["star_count"] = len(sources) if sources is not None else 0
-                
-                if sources is not None and len(sources) >= self.min_star_count:
-                    # Step 4: Measure star properties (30%)
-                    if progress_callback:
-                        should_continue = progress_callback(70, 100, 
-                                        f"Analyzing {len(sources)} stars...")
-                        if not should_continue:
-                            return {"status": "cancelled"}
-                    
+                if fast_settings is None:
                     star_metrics = self._analyze_star_properties(data, sources, image_scale)
-                    results.update(star_metrics)
                 else:
-                    logger.warning(f"Insufficient stars detected ({results['star_count']}) for "
-                                 f"reliable analysis in {fits_file_path}")
-                
-                if progress_callback:
-                    progress_callback(100, 100, "Quality analysis completed!")
-                
-                return results
-                
+                    star_metrics = self._analyze_star_cutouts(data, sources, image_scale, fast_settings)
+                results.update(star_metrics)
+            else:
+                logger.warning(f"Insufficient stars detected ({results['star_count']}) for "
+                             f"reliable analysis in {fits_file_path}")
+            
+            if progress_callback:
+                progress_callback(100, 100, "Quality analysis completed!")
+            
+            return results
+            
         except Exception as e:
             logger.error(f"Error analyzing {fits_file_path}: {e}")
             return {
@@ -174,6 +344,47 @@ class EnhancedQualityAnalyzer:
                 "message": str(e),
                 "file_path": fits_file_path
             }
+
+    def compare_analysis_modes(self, fits_file_path: str, mode: str = 'fast') -> Dict:
+        """
+        Analyze a frame with the full path and a binned mode and compare them.
+
+        Args:
+            fits_file_path: Path to FITS file
+            mode: Binned mode to evaluate ('balanced' or 'fast')
+
+        Returns:
+            dict: 'full' and 'fast' analysis results, 'full_seconds' and
+            'fast_seconds' wall times, 'speedup', and 'relative_error' mapping
+            each metric both paths produced to (fast - full) / full
+        """
+        timings = {}
+        results = {}
+        for key, key_mode in (('full', 'full'), ('fast', mode)):
+            start = time.perf_counter()
+            results[key] = self.analyze_image_quality(fits_file_path, analysis_mode=key_mode)
+            timings[key] = time.perf_counter() - start
+
+        relative_error = {}
+        for metric in ('avg_fwhm_pixels', 'avg_hfr_pixels', 'avg_eccentricity', 'image_snr', 'star_count'):
+            full_value = results['full'].get(metric)
+            fast_value = results['fast'].get(metric)
+            if full_value and fast_value is not None:
+                relative_error[metric] = (fast_value - full_value) / full_value
+
+        comparison = {
+            'mode': mode,
+            'full': results['full'],
+            'fast': results['fast'],
+            'full_seconds': timings['full'],
+            'fast_seconds': timings['fast'],
+            'speedup': timings['full'] / timings['fast'] if timings['fast'] > 0 else None,
+            'relative_error': relative_error,
+        }
+        errors = ", ".join(f"{metric} {error:+.1%}" for metric, error in relative_error.items())
+        logger.info(f"{os.path.basename(fits_file_path)}: '{mode}' analysis {timings['fast']:.2f}s vs "
+                    f"full {timings['full']:.2f}s; {errors or 'no comparable metrics'}")
+        return comparison
     
     def update_file_quality_metrics(self, fits_file_id: str, quality_results: Dict) -> bool:
         """
@@ -191,25 +402,7 @@ class EnhancedQualityAnalyzer:
             from astrofiler.models import fitsFile
             
             # Prepare update data
-            update_data = {}
-            
-            if quality_results.get("avg_fwhm_arcsec") is not None:
-                update_data["fitsFileAvgFWHMArcsec"] = quality_results["avg_fwhm_arcsec"]
-            
-            if quality_results.get("avg_eccentricity") is not None:
-                update_data["fitsFileAvgEccentricity"] = quality_results["avg_eccentricity"]
-            
-            if quality_results.get("avg_hfr_arcsec") is not None:
-                update_data["fitsFileAvgHFRArcsec"] = quality_results["avg_hfr_arcsec"]
-            
-            if quality_results.get("image_snr") is not None:
-                update_data["fitsFileImageSNR"] = quality_results["image_snr"]
-            
-            if quality_results.get("star_count") is not None:
-                update_data["fitsFileStarCount"] = quality_results["star_count"]
-            
-            if quality_results.get("image_scale") is not None:
-                update_data["fitsFileImageScale"] = quality_results["image_scale"]
+            update_data = quality_metric_updates(quality_results)
             
             # Only update if we have data to update
             if update_data:
@@ -219,6 +412,8 @@ class EnhancedQualityAnalyzer:
                 
                 if rows_updated > 0:
                     logger.info(f"Updated quality metrics for file {fits_file_id}")
+                    from .session_quality import refresh_session_quality_for_files
+                    refresh_session_quality_for_files([fits_file_id])
                     return True
                 else:
                     logger.warning(f"No file found with ID {fits_file_id} to update")
@@ -460,12 +655,12 @@ class EnhancedQualityAnalyzer:
             numpy.ndarray: Array of detected sources or None if detection fails
         """
         try:
-            # Prepare data for SEP (needs to be C-contiguous)
-            data_sep = data.copy(order='C')
+            # Prepare data for SEP (needs a C-contiguous, native-order copy)
+            data_sub = np.array(data, dtype=data.dtype.newbyteorder('='), order='C')
             
-            # Subtract background
-            bkg = sep.Background(data_sep)
-            data_sub = data_sep - bkg
+            # Subtract background in place
+            bkg = sep.Background(data_sub)
+            bkg.subfrom(data_sub)
             
             # Extract sources
             objects = sep.extract(data_sub, self.detection_threshold, 
@@ -625,6 +820,187 @@ class EnhancedQualityAnalyzer:
         except Exception as e:
             logger.warning(f"Error in photutils star detection: {e}")
             return None
+
+    def _detect_stars_binned(self, data: np.ndarray,
+                             settings: FastAnalysisSettings) -> Optional[np.ndarray]:
+        """
+        Detect the brightest stars on a binned copy of the image.
+
+        Uses the same backend as _detect_stars() (SEP, else DAOStarFinder).
+
+        Args:
+            data: Full-resolution image data
+            settings: Binning parameters
+
+        Returns:
+            numpy.ndarray: Up to max_star_count stars, brightest first, with
+            full-resolution 'x', 'y', local 'background' and per-pixel 'rms';
+            None if detection fails
+        """
+        try:
+            binned = bin_image(data, settings.bin_factor)
+            if self.use_sep and SEP_AVAILABLE:
+                return self._detect_binned_sep(binned, settings.bin_factor)
+            elif PHOTUTILS_AVAILABLE:
+                return self._detect_binned_photutils(binned, settings.bin_factor)
+            else:
+                logger.warning("No star detection method available (SEP or photutils)")
+                return None
+        except Exception as e:
+            logger.warning(f"Error in binned star detection: {e}")
+            return None
+
+    def _binned_stars(self, x: np.ndarray, y: np.ndarray, flux: np.ndarray, factor: int,
+                      background: np.ndarray, rms: float) -> Optional[np.ndarray]:
+        """Keep the brightest binned detections and map them to full resolution."""
+        if len(x) == 0:
+            logger.warning("No stars detected on the binned image")
+            return None
+        order = np.argsort(flux)[::-1][:self.max_star_count]
+        stars = np.zeros(len(order), dtype=[('x', 'f8'), ('y', 'f8'),
+                                            ('background', 'f4'), ('rms', 'f4')])
+        # Binned pixel i covers full-resolution pixels [i*factor, (i+1)*factor)
+        stars['x'] = x[order] * factor + (factor - 1) / 2.0
+        stars['y'] = y[order] * factor + (factor - 1) / 2.0
+        if np.ndim(background) == 0:
+            stars['background'] = background
+        else:
+            rows = np.clip(np.rint(y[order]).astype(int), 0, background.shape[0] - 1)
+            cols = np.clip(np.rint(x[order]).astype(int), 0, background.shape[1] - 1)
+            stars['background'] = background[rows, cols]
+        # Averaging factor x factor pixels divides white noise by factor
+        stars['rms'] = rms * factor
+        logger.info(f"Binned detection ({factor}x{factor}) found {len(x)} sources, "
+                    f"measuring the {len(stars)} brightest")
+        return stars
+
+    def _detect_binned_sep(self, binned: np.ndarray, factor: int) -> Optional[np.ndarray]:
+        """Background and detection with SEP on a binned image."""
+        # Keep the background mesh at the full-resolution 64 pixel scale
+        box = max(8, 64 // factor)
+        bkg = sep.Background(binned, bw=box, bh=box)
+        background = bkg.back()
+        bkg.subfrom(binned)
+        objects = sep.extract(binned, self.detection_threshold, err=bkg.globalrms,
+                              minarea=max(1, math.ceil(self.min_area / factor ** 2)))
+        valid = (objects['a'] > 0) & (objects['b'] > 0) & \
+                np.isfinite(objects['a']) & np.isfinite(objects['b'])
+        objects = objects[valid]
+        return self._binned_stars(objects['x'], objects['y'], objects['flux'], factor,
+                                  background, bkg.globalrms)
+
+    def _detect_binned_photutils(self, binned: np.ndarray, factor: int) -> Optional[np.ndarray]:
+        """Detection with DAOStarFinder on a binned image."""
+        mean, median, std = sigma_clipped_stats(binned, sigma=3.0, maxiters=5)
+        fwhm = max(1.0, self.fwhm_estimate / factor)
+        # Same default and permissive criteria as _detect_stars_photutils()
+        criteria = (
+            (self.detection_threshold, self.sharpness_lo, self.sharpness_hi,
+             self.roundness_lo, self.roundness_hi),
+            (2.0, 0.05, 2.0, -2.0, 2.0),
+        )
+        sources = None
+        for nsigma, sharplo, sharphi, roundlo, roundhi in criteria:
+            daofind = DAOStarFinder(fwhm=fwhm, threshold=nsigma * std,
+                                    sharplo=sharplo, sharphi=sharphi,
+                                    roundlo=roundlo, roundhi=roundhi, exclude_border=True)
+            sources = daofind(binned - median)
+            if sources is not None and len(sources) > 0:
+                break
+        if sources is None:
+            sources = {'xcentroid': np.array([]), 'ycentroid': np.array([]), 'flux': np.array([])}
+        return self._binned_stars(np.asarray(sources['xcentroid'], dtype=float),
+                                  np.asarray(sources['ycentroid'], dtype=float),
+                                  np.asarray(sources['flux'], dtype=float),
+                                  factor, median, std)
+
+    def _analyze_star_cutouts(self, data: np.ndarray, stars: np.ndarray,
+                              image_scale: Optional[float],
+                              settings: FastAnalysisSettings) -> Dict:
+        """
+        Measure binned detections on full-resolution cutouts.
+
+        With SEP each cutout is measured with sep.extract() and the same
+        ellipse-based FWHM/HFR/eccentricity as the full SEP path; otherwise
+        all cutouts are measured together with measure_stars(), as in the
+        photutils path.
+
+        Args:
+            data: Full-resolution image data
+            stars: Stars from _detect_stars_binned()
+            image_scale: Image scale in arcsec/pixel
+            settings: Cutout parameters
+
+        Returns:
+            dict: Star analysis results
+        """
+        try:
+            half = settings.cutout_size // 2
+            height, width = data.shape
+            measured_stars = []
+            cutouts = []
+
+            for star in stars:
+                x, y = int(round(star['x'])), int(round(star['y']))
+                # Skip stars whose cutout would be clipped by the frame edge
+                if x < half or y < half or x >= width - half or y >= height - half:
+                    continue
+
+                measured_stars.append(star)
+                cutouts.append(np.array(data[y - half:y + half + 1, x - half:x + half + 1],
+                                        dtype=np.float32))
+
+            if self.use_sep and SEP_AVAILABLE:
+                star_props = [self._measure_star_sep(cutout, star['background'], star['rms'])
+                              for star, cutout in zip(measured_stars, cutouts)]
+                measured = {key: np.array([np.nan if props[key] is None else props[key]
+                                           for props in star_props], dtype=float)
+                            for key in ('fwhm', 'eccentricity', 'hfr')}
+            else:
+                measured = measure_star_cutouts(cutouts)
+
+            logger.info(f"Cutout analysis: {np.count_nonzero(np.isfinite(measured['fwhm']))} "
+                        f"valid measurements of {len(stars)} stars")
+            return self._summarize_measurements(measured, image_scale)
+
+        except Exception as e:
+            logger.warning(f"Error analyzing star cutouts: {e}")
+            return {}
+
+    def _measure_star_sep(self, cutout: np.ndarray, background: float, rms: float) -> Dict:
+        """
+        Measure the star at the center of a cutout with SEP.
+
+        Args:
+            cutout: C-contiguous float32 star cutout (modified in place)
+            background: Background level to subtract
+            rms: Per-pixel background noise
+
+        Returns:
+            dict: Star properties
+        """
+        try:
+            cutout -= np.float32(background)
+            objects = sep.extract(cutout, self.detection_threshold, err=float(rms),
+                                  minarea=self.min_area)
+            valid = (objects['a'] > 0) & (objects['b'] > 0) & \
+                    np.isfinite(objects['a']) & np.isfinite(objects['b'])
+            objects = objects[valid]
+            if len(objects) == 0:
+                return {'fwhm': None, 'eccentricity': None, 'hfr': None}
+
+            center_y, center_x = (np.array(cutout.shape) - 1) / 2.0
+            nearest = np.argmin((objects['x'] - center_x) ** 2 + (objects['y'] - center_y) ** 2)
+            a, b = float(objects['a'][nearest]), float(objects['b'][nearest])
+            return {
+                'fwhm': float(2.0 * np.sqrt(2.0 * np.log(2.0)) * np.sqrt(a * b)),
+                'eccentricity': float(np.sqrt(1.0 - (b / a) ** 2)),
+                'hfr': float(np.sqrt(a * b)),
+            }
+
+        except Exception as e:
+            logger.debug(f"Error measuring star with SEP: {e}")
+            return {'fwhm': None, 'eccentricity': None, 'hfr': None}
     
     def _analyze_star_properties(self, data: np.ndarray, sources, 
                                image_scale: Optional[float]) -> Dict:
@@ -727,11 +1103,9 @@ class EnhancedQualityAnalyzer:
             return {}
         
         try:
-            fwhm_values = []
-            eccentricity_values = []
-            hfr_values = []
+            cutouts = []
             
-            # Analyze each source
+            # Collect a cutout around each source
             for source in sources:
                 x, y = source['xcentroid'], source['ycentroid']
                 
@@ -753,301 +1127,68 @@ class EnhancedQualityAnalyzer:
                 if cutout.size == 0:
                     continue
                 
-                # Calculate star properties
-                star_props = self._measure_star_properties(cutout)
-                
-                if star_props['fwhm'] is not None:
-                    fwhm_values.append(star_props['fwhm'])
-                if star_props['eccentricity'] is not None:
-                    eccentricity_values.append(star_props['eccentricity'])
-                if star_props['hfr'] is not None:
-                    hfr_values.append(star_props['hfr'])
+                cutouts.append(cutout)
             
-            # Calculate averages
-            results = {}
+            # Measure all stars at once
+            measured = measure_star_cutouts(cutouts)
             
-            if fwhm_values:
-                avg_fwhm_pixels = np.median(fwhm_values)
-                results['avg_fwhm_pixels'] = float(avg_fwhm_pixels)
-                
-                # Convert to arcseconds if we have image scale
-                if image_scale is not None:
-                    results['avg_fwhm_arcsec'] = float(avg_fwhm_pixels * image_scale)
-                else:
-                    results['avg_fwhm_arcsec'] = None
-            else:
-                results['avg_fwhm_arcsec'] = None
-                
-            if eccentricity_values:
-                results['avg_eccentricity'] = float(np.median(eccentricity_values))
-            else:
-                results['avg_eccentricity'] = None
-                
-            if hfr_values:
-                avg_hfr_pixels = np.median(hfr_values)
-                results['avg_hfr_pixels'] = float(avg_hfr_pixels)
-                
-                # Convert to arcseconds if we have image scale
-                if image_scale is not None:
-                    results['avg_hfr_arcsec'] = float(avg_hfr_pixels * image_scale)
-                else:
-                    results['avg_hfr_arcsec'] = None
-            else:
-                results['avg_hfr_arcsec'] = None
-            
-            logger.info(f"Photutils analysis: {len(fwhm_values)} valid measurements")
-            return results
+            logger.info(f"Photutils analysis: {np.count_nonzero(np.isfinite(measured['fwhm']))} valid measurements")
+            return self._summarize_measurements(measured, image_scale)
             
         except Exception as e:
             logger.warning(f"Error analyzing photutils measurements: {e}")
             return {}
     
-    def _measure_star_properties(self, cutout: np.ndarray) -> Dict:
-        """
-        Measure FWHM, eccentricity, and HFR for a single star cutout.
-        
-        Args:
-            cutout: Star cutout image
-            
-        Returns:
-            dict: Star properties
-        """
-        try:
-            # Calculate background
-            mean, median, std = sigma_clipped_stats(cutout, sigma=2.0)
-            cutout_sub = cutout - median
-            
-            # Find the peak
-            peak_y, peak_x = np.unravel_index(np.argmax(cutout_sub), cutout_sub.shape)
-            
-            if cutout_sub[peak_y, peak_x] < 3 * std:
-                # Too faint
-                return {'fwhm': None, 'eccentricity': None, 'hfr': None}
-            
-            # Measure FWHM using radial profile
-            fwhm = self._measure_fwhm_radial(cutout_sub, peak_x, peak_y)
-            
-            # Measure eccentricity using moments
-            eccentricity = self._measure_eccentricity_moments(cutout_sub, peak_x, peak_y)
-            
-            # Measure HFR
-            hfr = self._measure_hfr(cutout_sub, peak_x, peak_y)
-            
-            return {
-                'fwhm': fwhm,
-                'eccentricity': eccentricity,
-                'hfr': hfr
-            }
-            
-        except Exception as e:
-            logger.debug(f"Error measuring star properties: {e}")
-            return {'fwhm': None, 'eccentricity': None, 'hfr': None}
-    
-    def _measure_fwhm_radial(self, cutout: np.ndarray, center_x: float, 
-                           center_y: float) -> Optional[float]:
+    def _summarize_measurements(self, measured: Dict[str, np.ndarray],
+                                image_scale: Optional[float]) -> Dict:
+        """Median frame metrics from per-star arrays (NaN for failed measurements)."""
+        valid = {key: values[np.isfinite(values)].tolist() for key, values in measured.items()}
+        return self._summarize_star_values(valid['fwhm'], valid['eccentricity'], valid['hfr'], image_scale)
+
+    def _summarize_star_values(self, fwhm_values: List[float], eccentricity_values: List[float],
+                               hfr_values: List[float], image_scale: Optional[float]) -> Dict:
         """
-        Measure FWHM using radial profile method.
-        
+        Combine per-star measurements into median frame metrics.
+
         Args:
-            cutout: Background-subtracted star cutout
-            center_x, center_y: Star center coordinates
-            
+            fwhm_values: FWHM per star in pixels
+            eccentricity_values: Eccentricity per star
+            hfr_values: HFR per star in pixels
+            image_scale: Image scale in arcsec/pixel
+
         Returns:
-            float: FWHM in pixels, or None if measurement fails
-        """
-        try:
-            # Create coordinate arrays
-            y, x = np.mgrid[:cutout.shape[0], :cutout.shape[1]]
-            r = np.sqrt((x - center_x)**2 + (y - center_y)**2)
-            
-            # Create radial profile with finer resolution
-            r_max = min(cutout.shape) // 2  # Use more of the cutout
-            r_bins = np.linspace(0, r_max, int(r_max * 4) + 1)  # Finer bins
-            
-            # Calculate radial profile
-            radial_profile = []
-            radial_counts = []
-            
-            for i in range(len(r_bins) - 1):
-                mask = (r >= r_bins[i]) & (r < r_bins[i + 1])
-                if np.any(mask):
-                    profile_value = np.mean(cutout[mask])
-                    pixel_count = np.sum(mask)
-                    radial_profile.append(profile_value)
-                    radial_counts.append(pixel_count)
-                else:
-                    radial_profile.append(0)
-                    radial_counts.append(0)
-            
-            radial_profile = np.array(radial_profile)
-            radial_counts = np.array(radial_counts)
-            r_centers = (r_bins[:-1] + r_bins[1:]) / 2
-            
-            # Only use bins with enough pixels for reliable measurement
-            valid_mask = radial_counts >= 3
-            if not np.any(valid_mask):
-                return None
-                
-            radial_profile = radial_profile[valid_mask]
-            r_centers = r_centers[valid_mask]
-            
-            # Find FWHM (half maximum)
-            max_value = np.max(radial_profile)
-            if max_value <= 0:
-                return None
-                
-            half_max = max_value / 2.0
-            
-            # Find where profile crosses half maximum
-            above_half = radial_profile >= half_max
-            if not np.any(above_half):
-                return None
-            
-            # Find the last radius where we're above half maximum
-            above_indices = np.where(above_half)[0]
-            if len(above_indices) > 0:
-                # Use interpolation for more precise FWHM measurement
-                last_above_idx = above_indices[-1]
-                
-                # Try to interpolate the crossing point
-                if last_above_idx < len(radial_profile) - 1:
-                    # Interpolate between the last point above and first point below
-                    r1, r2 = r_centers[last_above_idx], r_centers[last_above_idx + 1]
-                    v1, v2 = radial_profile[last_above_idx], radial_profile[last_above_idx + 1]
-                    
-                    if v1 != v2:  # Avoid division by zero
-                        # Linear interpolation to find exact crossing
-                        fwhm_radius = r1 + (half_max - v1) * (r2 - r1) / (v2 - v1)
-                    else:
-                        fwhm_radius = r1
-                else:
-                    fwhm_radius = r_centers[last_above_idx]
-                
-                # FWHM is full width (diameter), so multiply by 2
-                fwhm = fwhm_radius * 2.0
-                
-                # Sanity check: FWHM should be reasonable (0.5 to 50 pixels typically)
-                if 0.5 <= fwhm <= 50.0:
-                    return float(fwhm)
-            
-            return None
-            
-        except Exception as e:
-            logger.debug(f"Error in FWHM calculation: {e}")
-            return None
-    
-    def _measure_eccentricity_moments(self, cutout: np.ndarray, center_x: float, 
-                                    center_y: float) -> Optional[float]:
+            dict: Star analysis results
         """
-        Measure eccentricity using image moments.
+        # Calculate averages
+        results = {}
         
-        Args:
-            cutout: Background-subtracted star cutout
-            center_x, center_y: Star center coordinates
-            
-        Returns:
-            float: Eccentricity (0=circular, 1=highly elongated), or None if fails
-        """
-        try:
-            # Create coordinate arrays using mgrid for proper 2D arrays
-            yy, xx = np.mgrid[0:cutout.shape[0], 0:cutout.shape[1]]
-            x = xx.astype(float) - center_x
-            y = yy.astype(float) - center_y
-            
-            # Only use positive values for moments calculation
-            mask = cutout > 0
-            if not np.any(mask):
-                return None
-            
-            weights = cutout[mask]
-            x_coords = x[mask]
-            y_coords = y[mask]
-            
-            # Calculate second moments
-            total_weight = np.sum(weights)
-            if total_weight <= 0:
-                return None
-            
-            m20 = np.sum(weights * x_coords**2) / total_weight
-            m02 = np.sum(weights * y_coords**2) / total_weight
-            m11 = np.sum(weights * x_coords * y_coords) / total_weight
+        if fwhm_values:
+            avg_fwhm_pixels = np.median(fwhm_values)
+            results['avg_fwhm_pixels'] = float(avg_fwhm_pixels)
             
-            # Calculate eccentricity from moments
-            # e = sqrt(1 - b^2/a^2) where a, b are semi-major, semi-minor axes
-            trace = m20 + m02
-            det = m20 * m02 - m11**2
-            
-            if det <= 0 or trace <= 0:
-                return None
-            
-            # Semi-axes from eigenvalues
-            discriminant = (m20 - m02)**2 + 4*m11**2
-            if discriminant < 0:
-                return None
-            
-            a_sq = (trace + np.sqrt(discriminant)) / 2
-            b_sq = (trace - np.sqrt(discriminant)) / 2
+            # Convert to arcseconds if we have image scale
+            if image_scale is not None:
+                results['avg_fwhm_arcsec'] = float(avg_fwhm_pixels * image_scale)
+            else:
+                results['avg_fwhm_arcsec'] = None
+        else:
+            results['avg_fwhm_arcsec'] = None
             
-            if a_sq <= 0 or b_sq <= 0:
-                return None
+        if eccentricity_values:
+            results['avg_eccentricity'] = float(np.median(eccentricity_values))
+        else:
+            results['avg_eccentricity'] = None
             
-            eccentricity = np.sqrt(1 - b_sq / a_sq)
-            return float(np.clip(eccentricity, 0.0, 1.0))
+        if hfr_values:
+            avg_hfr_pixels = np.median(hfr_values)
+            results['avg_hfr_pixels'] = float(avg_hfr_pixels)
             
-        except Exception as e:
-            logger.debug(f"Error in eccentricity calculation: {e}")
-            return None
-    
-    def _measure_hfr(self, cutout: np.ndarray, center_x: float, center_y: float) -> Optional[float]:
-        """
-        Measure Half Flux Radius (HFR).
+            # Convert to arcseconds if we have image scale
+            if image_scale is not None:
+                results['avg_hfr_arcsec'] = float(avg_hfr_pixels * image_scale)
+            else:
+                results['avg_hfr_arcsec'] = None
+        else:
+            results['avg_hfr_arcsec'] = None
         
-        Args:
-            cutout: Background-subtracted star cutout
-            center_x, center_y: Star center coordinates
-            
-        Returns:
-            float: HFR in pixels, or None if measurement fails
-        """
-        try:
-            y, x = np.ogrid[:cutout.shape[0], :cutout.shape[1]]
-            r = np.sqrt((x - center_x)**2 + (y - center_y)**2)
-            
-            # Only consider positive flux
-            mask = cutout > 0
-            if not np.any(mask):
-                return None
-            
-            # Sort pixels by radius
-            flux_values = cutout[mask]
-            radius_values = r[mask]
-            
-            # Calculate cumulative flux as function of radius
-            max_radius = np.max(radius_values)
-            r_bins = np.linspace(0, max_radius, 100)
-            cumulative_flux = []
-            
-            total_flux = np.sum(flux_values)
-            if total_flux <= 0:
-                return None
-            
-            for radius in r_bins:
-                flux_within = np.sum(flux_values[radius_values <= radius])
-                cumulative_flux.append(flux_within)
-            
-            cumulative_flux = np.array(cumulative_flux)
-            
-            # Find radius containing half the flux
-            half_flux = total_flux / 2.0
-            
-            # Interpolate to find HFR
-            if len(cumulative_flux) > 1:
-                hfr_idx = np.searchsorted(cumulative_flux, half_flux)
-                if 0 < hfr_idx < len(r_bins):
-                    hfr = r_bins[hfr_idx]
-                    return float(hfr)
-            
-            return None
-            
-        except Exception:
-            return None
\ No newline at end of file
+        return results
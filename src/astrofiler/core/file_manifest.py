@@ -0,0 +1,136 @@
+"""
+Ingest manifest for AstroFiler.
+
+Walks an import folder once with os.scandir and records every candidate image
+file together with its stat information and pre-parsed primary FITS header.
+The registration stage and the master-frame filter both consume the manifest,
+so each header is read from disk only once per ingest.
+"""
+
+import os
+import logging
+from dataclasses import dataclass
+from typing import Any, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FileManifestEntry:
+    """A candidate image file discovered by the ingest scan."""
+    root: str
+    name: str
+    size: int
+    mtime_ns: int
+    inode: int
+    device: int
+    header: Any = None
+
+    @property
+    def path(self) -> str:
+        """Full path to the file."""
+        return os.path.join(self.root, self.name)
+
+    @property
+    def is_master(self) -> bool:
+        """True if the header IMAGETYP marks this as a master calibration frame."""
+        return is_master_header(self.header)
+
+    def load_header(self) -> Any:
+        """Read the primary header if the scan did not already parse it."""
+        if self.header is None and not self.name.lower().endswith('.xisf'):
+            self.header = _read_primary_header(self.path)
+        return self.header
+
+
+def is_master_header(hdr: Any) -> bool:
+    """Return True if FITS header IMAGETYP indicates a master calibration frame."""
+    if hdr is None:
+        return False
+    try:
+        imagetyp = str(hdr.get('IMAGETYP', '')).upper()
+    except Exception:
+        return False
+    if 'MASTER' not in imagetyp:
+        return False
+    return any(token in imagetyp for token in ('DARK', 'FLAT', 'BIAS'))
+
+
+def _read_primary_header(file_path: str) -> Any:
+    """Read the primary HDU header, or None if the file cannot be parsed."""
+    try:
+        from astropy.io import fits
+        return fits.getheader(file_path, 0)
+    except Exception as e:
+        logger.debug(f"Could not pre-read header for {file_path}: {e}")
+        return None
+
+
+def _iter_files(folder: str) -> Iterator[os.DirEntry]:
+    """Yield file entries below folder, files of a directory before its subdirectories.
+
+    Matches os.walk ordering and does not follow directory symlinks.
+    """
+    try:
+        with os.scandir(folder) as it:
+            entries = list(it)
+    except OSError as e:
+        logger.warning(f"Cannot scan folder {folder}: {e}")
+        return
+
+    subdirs = []
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.is_file():
+                yield entry
+        except OSError:
+            continue
+
+    for subdir in subdirs:
+        yield from _iter_files(subdir)
+
+
+def build_ingest_manifest(scan_folder: str, compressor=None, read_headers: bool = True) -> List[FileManifestEntry]:
+    """
+    Scan a folder once and build the list of candidate image files.
+
+    Candidates are FITS files (including externally compressed FITS) and XISF
+    files. The primary header is read for FITS candidates only; XISF files are
+    converted during registration and their header is read afterwards.
+
+    Args:
+        scan_folder: Folder to scan recursively
+        compressor: FitsCompressor used for FITS detection (defaults to the global one)
+        read_headers: Whether to pre-parse the primary FITS header
+
+    Returns:
+        List of FileManifestEntry in os.walk order
+    """
+    if compressor is None:
+        from .compress_files import get_fits_compressor
+        compressor = get_fits_compressor()
+
+    manifest: List[FileManifestEntry] = []
+    for entry in _iter_files(scan_folder):
+        is_fits = compressor.is_fits_file(entry.path)
+        if not (is_fits or entry.name.lower().endswith('.xisf')):
+            continue
+        try:
+            st = entry.stat()
+        except OSError as e:
+            logger.warning(f"Cannot stat {entry.path}: {e}")
+            continue
+        manifest.append(FileManifestEntry(
+            root=os.path.dirname(entry.path),
+            name=entry.name,
+            size=st.st_size,
+            mtime_ns=st.st_mtime_ns,
+            inode=st.st_ino,
+            device=st.st_dev,
+            header=_read_primary_header(entry.path) if (is_fits and read_headers) else None,
+        ))
+
+    logger.info(f"Ingest scan of {scan_folder} found {len(manifest)} candidate files")
+    return manifest
@@ -12,9 +12,13 @@ import uuid
 import zipfile
 import configparser
 import shutil
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
 from datetime import datetime
 from math import cos, sin
-from typing import Optional, Dict, Any, List, Tuple, Union
+from typing import Optional, Dict, Any, Callable, List, Tuple, Union
+import numpy as np
 from astropy.io import fits
 from peewee import IntegrityError
 
@@ -24,6 +28,7 @@ from .utils import (
     dwarfFixHeader,
     mapFitsHeader,
     get_master_calibration_path,
+    get_processing_precision,
 )
 from ..types import FilePath, FitsHeaderDict, ProcessingResult, QualityMetrics
 from ..exceptions import (
@@ -33,10 +38,31 @@ from ..exceptions import (
 from .file_formats import get_file_format_processor
 from .services.file_hash_calculator import get_file_hash_calculator
 from .compress_files import get_fits_compressor
+from .fits_access import read_fits_image
+from .services.hash_backfill import start_hash_backfill
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class PreparedRegistration:
+    """Result of the preparation stage of FITS registration.
+
+    Holds everything the commit stage needs to move the file into the
+    repository and insert its database record without re-reading the file.
+    """
+    source_path: str
+    file_path: str
+    header: Any = None
+    new_name: Optional[str] = None
+    file_hash: Optional[str] = None
+    partial_hash: Optional[str] = None
+    file_size: Optional[int] = None
+    cleanup_source_path: Optional[str] = None
+    is_master: bool = False
+    quality_future: Optional[Future] = None
+
+
 class FileProcessor:
     """
     Handles FITS file processing operations including registration and database operations.
@@ -53,6 +79,50 @@ class FileProcessor:
         self.format_processor = get_file_format_processor()
         self.hash_calculator = get_file_hash_calculator()
         self.compressor = get_fits_compressor()
+        
+        # Defer full SHA-256 hashing to the background backfill (default); duplicates
+        # are detected from size, header fingerprint and partial hash instead.
+        # With lazy_full_hash = false the full hash is computed during ingest and
+        # no partial hash is read.
+        self.lazy_full_hash: bool = config.getboolean('DEFAULT', 'lazy_full_hash', fallback=True)
+
+        # Analyze light frame quality during ingest, instead of in a later pass over the archive
+        self.ingest_quality: bool = config.getboolean('DEFAULT', 'ingest_quality', fallback=False)
+        self._quality_stage = None
+        self._quality_stage_lock = threading.Lock()
+
+    def _get_quality_stage(self):
+        """Return the ingest quality stage, starting it on first use; None if disabled."""
+        if not self.ingest_quality:
+            return None
+        with self._quality_stage_lock:
+            if self._quality_stage is None:
+                from .quality_engine import IngestQualityStage
+                self._quality_stage = IngestQualityStage()
+            return self._quality_stage
+
+    def flush_ingest_quality(self) -> None:
+        """Wait for quality analyses started during ingest and store their metrics."""
+        if self._quality_stage is not None:
+            self._quality_stage.write_results(wait=True)
+
+    def _submit_ingest_quality(self, file_path: str, hdr: Any) -> Optional[Future]:
+        """Decode a light frame for quality analysis and queue it, if enabled."""
+        stage = self._get_quality_stage()
+        if stage is None:
+            return None
+        try:
+            data, _ = read_fits_image(file_path, dtype=np.dtype(get_processing_precision()))
+        except Exception as e:
+            logger.warning(f"Skipping ingest quality analysis of {file_path}: {e}")
+            return None
+        # The registered header carries the vendor fixes and mappings used for the image scale
+        return stage.submit(data, hdr, file_path)
+
+    def _register_ingest_quality(self, prepared: PreparedRegistration, file_id: Union[str, bool, None]) -> None:
+        """Pair a committed frame with its pending quality analysis."""
+        if file_id and prepared.quality_future is not None and self._quality_stage is not None:
+            self._quality_stage.register(file_id, prepared.file_hash, prepared.quality_future)
 
     def calculateFileHash(self, filePath: FilePath) -> Optional[str]:
         """
@@ -413,14 +483,189 @@ class FileProcessor:
         
         return None
 
-    def submitFileToDB(self, fileName: str, hdr: Any, fileHash: Optional[str] = None) -> Optional[str]:
+    def _find_duplicate_file(self, FitsFileModel, fileName: str, hdr: Any, fileHash: Optional[str],
+                             partialHash: Optional[str], fileSize: int) -> Tuple[Any, Optional[str]]:
+        """
+        Tiered duplicate detection.
+        
+        1. Exact lookup on the full hash, when one is already known.
+        2. Candidates with the same header fingerprint (DATE-OBS, INSTRUME, EXPTIME).
+        3. Candidates whose size or partial hash differ are rejected.
+        4. Remaining candidates are confirmed with a full hash, computed only now
+           (for the new file and, if still missing, for the candidate).
+        
+        Args:
+            FitsFileModel: fitsFile model class
+            fileName: Full path to the new file
+            hdr: FITS header of the new file
+            fileHash: Full hash of the new file, or None if not computed yet
+            partialHash: Partial hash of the new file (None if fileHash is known)
+            fileSize: Size of the new file in bytes
+            
+        Returns:
+            Tuple (existing fitsFile or None, full hash of the new file if computed)
+        """
+        if fileHash is not None:
+            try:
+                return FitsFileModel.get(FitsFileModel.fitsFileHash == fileHash), fileHash
+            except FitsFileModel.DoesNotExist:
+                pass
+        
+        date_obs = hdr.get("DATE-OBS")
+        exposure = hdr.get("EXPTIME", hdr.get("EXPOSURE"))
+        if not date_obs or exposure is None:
+            return None, fileHash  # Header validation reports the problem
+        
+        candidates = FitsFileModel.select(
+            FitsFileModel.fitsFileId, FitsFileModel.fitsFileName, FitsFileModel.fitsFileSize,
+            FitsFileModel.fitsFilePartialHash, FitsFileModel.fitsFileHash
+        ).where(
+            (FitsFileModel.fitsFileDate == date_obs) &
+            (FitsFileModel.fitsFileInstrument == hdr.get("INSTRUME", "Unknown")) &
+            (FitsFileModel.fitsFileExpTime == exposure)
+        )
+        
+        for candidate in candidates:
+            is_duplicate, fileHash = self.confirm_duplicate_candidate(
+                FitsFileModel, candidate, fileName, fileHash, partialHash, fileSize)
+            if is_duplicate:
+                return candidate, fileHash
+        
+        return None, fileHash
+
+    def confirm_duplicate_candidate(self, FitsFileModel, candidate: Any, fileName: str,
+                                     fileHash: Optional[str], partialHash: Optional[str],
+                                     fileSize: int) -> Tuple[bool, Optional[str]]:
+        """
+        Check a fingerprint candidate against a new file (tiers 3 and 4).
+        
+        Args:
+            FitsFileModel: fitsFile model class
+            candidate: fitsFile row with the same header fingerprint
+            fileName: Full path to the new file
+            fileHash: Full hash of the new file, or None if not computed yet
+            partialHash: Partial hash of the new file, or None if its full hash
+                was computed instead
+            fileSize: Size of the new file in bytes
+            
+        Returns:
+            Tuple (True if the candidate is a duplicate, full hash of the new file if computed)
+        """
+        if candidate.fitsFileSize is not None and candidate.fitsFileSize != fileSize:
+            return False, fileHash
+        if (candidate.fitsFilePartialHash is not None and partialHash is not None
+                and candidate.fitsFilePartialHash != partialHash):
+            return False, fileHash
+        if candidate.fitsFileHash is not None and fileHash is not None:
+            return False, fileHash  # Already ruled out by the exact hash lookup
+        
+        # Cheap tiers collide: confirm with full hashes
+        if fileHash is None:
+            fileHash = self.calculateFileHash(fileName)
+        candidate_hash = candidate.fitsFileHash
+        if candidate_hash is None:
+            if not candidate.fitsFileName or not os.path.exists(candidate.fitsFileName):
+                return False, fileHash
+            candidate_hash = self.calculateFileHash(candidate.fitsFileName)
+            FitsFileModel.update(fitsFileHash=candidate_hash).where(
+                FitsFileModel.fitsFileId == candidate.fitsFileId).execute()
+        return candidate_hash == fileHash, fileHash
+
+    def build_file_record(self, fileName: str, hdr: Any, fileHash: Optional[str],
+                          partialHash: Optional[str], fileSize: Optional[int]) -> Dict[str, Any]:
+        """
+        Validate a FITS header and build the fitsFile row for a new file.
+        
+        Args:
+            fileName: Full path to the FITS file
+            hdr: FITS header object
+            fileHash: Full file hash (None when full hashing is lazy)
+            partialHash: Partial hash (size + first/last MiB)
+            fileSize: File size in bytes
+            
+        Returns:
+            Dictionary of fitsFile field values, including a new fitsFileId
+            
+        Raises:
+            ValidationError: If required header fields are missing
+        """
+        # Validate required header values
+        date_obs = hdr.get("DATE-OBS")
+        if not date_obs:
+            raise ValidationError(
+                "Missing required DATE-OBS field in FITS header",
+                field="DATE-OBS",
+                file_path=fileName
+            )
+        
+        image_type = hdr.get("IMAGETYP")
+        if not image_type:
+            raise ValidationError(
+                "Missing required IMAGETYP field in FITS header",
+                field="IMAGETYP", 
+                file_path=fileName
+            )
+        
+        # Get exposure time
+        exposure = hdr.get("EXPTIME", hdr.get("EXPOSURE"))
+        if exposure is None:
+            raise ValidationError(
+                "Missing required EXPTIME/EXPOSURE field in FITS header",
+                field="EXPTIME",
+                file_path=fileName
+            )
+        
+        # Get telescope and instrument
+        telescope = hdr.get("TELESCOP", "Unknown")
+        instrument = hdr.get("INSTRUME", "Unknown")
+        
+        # Check if telescope is iTelescope or instrument is SeeStar - mark as calibrated
+        is_precalibrated = False
+        if (telescope and "itelescope" in telescope.lower()) or \
+           (instrument and "seestar" in instrument.lower()):
+            is_precalibrated = True
+            if telescope and "itelescope" in telescope.lower():
+                logger.debug(f"Marking file as pre-calibrated from iTelescope: {telescope}")
+            else:
+                logger.debug(f"Marking file as pre-calibrated from SeeStar instrument: {instrument}")
+        
+        # Determine filter: blank for DARK and BIAS frames
+        image_type_upper = image_type.upper()
+        fits_filter = None if ('DARK' in image_type_upper or 'BIAS' in image_type_upper) else hdr.get("FILTER", None)
+
+        return {
+            'fitsFileId': str(uuid.uuid4()),
+            'fitsFileName': normalize_file_path(fileName),
+            'fitsFileDate': date_obs,
+            'fitsFileType': image_type.upper(),
+            # Use image type as object for calibration frames
+            'fitsFileObject': hdr["OBJECT"] if hdr.get("OBJECT") else image_type,
+            'fitsFileExpTime': exposure,
+            'fitsFileXBinning': hdr.get("XBINNING", 1),
+            'fitsFileYBinning': hdr.get("YBINNING", 1),
+            'fitsFileCCDTemp': hdr.get("CCD-TEMP", 0),
+            'fitsFileTelescop': telescope,
+            'fitsFileInstrument': instrument,
+            'fitsFileFilter': fits_filter,
+            'fitsFileHash': fileHash,
+            'fitsFileSize': fileSize,
+            'fitsFilePartialHash': partialHash,
+            'fitsFileSession': None,
+            'fitsFileCalibrated': 1 if is_precalibrated else 0,
+        }
+
+    def submitFileToDB(self, fileName: str, hdr: Any, fileHash: Optional[str] = None,
+                       partialHash: Optional[str] = None, fileSize: Optional[int] = None) -> Optional[str]:
         """
         Submit FITS file to database after processing.
         
         Args:
             fileName: Full path to the FITS file
             hdr: FITS header object
-            fileHash: Pre-calculated file hash
+            fileHash: Pre-calculated file hash (may be None when full hashing is lazy)
+            partialHash: Pre-calculated partial hash (size + first/last MiB);
+                only computed here when there is no full hash
+            fileSize: File size in bytes
             
         Returns:
             File ID if successful, None if failed
@@ -439,8 +684,8 @@ class FileProcessor:
             )
         
         try:
-            # Calculate hash if not provided
-            if fileHash is None:
+            # Calculate hash if not provided (unless deferred to the background backfill)
+            if fileHash is None and not self.lazy_full_hash:
                 fileHash = self.calculateFileHash(fileName)
                 if fileHash is None:
                     raise FileProcessingError(
@@ -448,96 +693,20 @@ class FileProcessor:
                         file_path=fileName,
                         error_code="HASH_CALCULATION_FAILED"
                     )
+            if fileSize is None:
+                fileSize = os.path.getsize(fileName)
+            if partialHash is None and fileHash is None:
+                partialHash = self.hash_calculator.calculate_partial_sha256(fileName)
             
-            # Check for duplicate files by hash
-            try:
-                existing_file = FitsFileModel.get(FitsFileModel.fitsFileHash == fileHash)
+            # Check for duplicate files (size/fingerprint/partial hash, then full hash)
+            existing_file, fileHash = self._find_duplicate_file(
+                FitsFileModel, fileName, hdr, fileHash, partialHash, fileSize)
+            if existing_file is not None:
                 logger.warning(f"Duplicate file detected: {fileName} matches {existing_file.fitsFileName}")
                 return existing_file.fitsFileId
-            except FitsFileModel.DoesNotExist:
-                pass  # File is unique, proceed with registration
-            
-            # Validate required header values
-            date_obs = hdr.get("DATE-OBS")
-            if not date_obs:
-                raise ValidationError(
-                    "Missing required DATE-OBS field in FITS header",
-                    field="DATE-OBS",
-                    file_path=fileName
-                )
             
-            image_type = hdr.get("IMAGETYP")
-            if not image_type:
-                raise ValidationError(
-                    "Missing required IMAGETYP field in FITS header",
-                    field="IMAGETYP", 
-                    file_path=fileName
-                )
-            
-            # Get exposure time
-            exposure = hdr.get("EXPTIME", hdr.get("EXPOSURE"))
-            if exposure is None:
-                raise ValidationError(
-                    "Missing required EXPTIME/EXPOSURE field in FITS header",
-                    field="EXPTIME",
-                    file_path=fileName
-                )
-            
-            # Get telescope and instrument
-            telescope = hdr.get("TELESCOP", "Unknown")
-            instrument = hdr.get("INSTRUME", "Unknown")
-            
-            # Check if telescope is iTelescope or instrument is SeeStar - mark as calibrated
-            is_precalibrated = False
-            if (telescope and "itelescope" in telescope.lower()) or \
-               (instrument and "seestar" in instrument.lower()):
-                is_precalibrated = True
-                if telescope and "itelescope" in telescope.lower():
-                    logger.debug(f"Marking file as pre-calibrated from iTelescope: {telescope}")
-                else:
-                    logger.debug(f"Marking file as pre-calibrated from SeeStar instrument: {instrument}")
-            
-            # Determine filter: blank for DARK and BIAS frames
-            image_type_upper = image_type.upper()
-            fits_filter = None if ('DARK' in image_type_upper or 'BIAS' in image_type_upper) else hdr.get("FILTER", None)
-
-            # Create new file record
-            if hdr.get("OBJECT"):
-                newfile = FitsFileModel.create(
-                    fitsFileId=str(uuid.uuid4()),
-                    fitsFileName=normalize_file_path(fileName),
-                    fitsFileDate=date_obs,
-                    fitsFileType=image_type.upper(),
-                    fitsFileObject=hdr["OBJECT"],
-                    fitsFileExpTime=exposure,
-                    fitsFileXBinning=hdr.get("XBINNING", 1),
-                    fitsFileYBinning=hdr.get("YBINNING", 1),
-                    fitsFileCCDTemp=hdr.get("CCD-TEMP", 0),
-                    fitsFileTelescop=telescope,
-                    fitsFileInstrument=instrument,
-                    fitsFileFilter=fits_filter,
-                    fitsFileHash=fileHash,
-                    fitsFileSession=None,
-                    fitsFileCalibrated=1 if is_precalibrated else 0
-                )
-            else:
-                newfile = FitsFileModel.create(
-                    fitsFileId=str(uuid.uuid4()),
-                    fitsFileName=normalize_file_path(fileName),
-                    fitsFileDate=date_obs,
-                    fitsFileType=image_type.upper(),
-                    fitsFileObject=image_type,  # Use image type as object for calibration frames
-                    fitsFileExpTime=exposure,
-                    fitsFileXBinning=hdr.get("XBINNING", 1),
-                    fitsFileYBinning=hdr.get("YBINNING", 1),
-                    fitsFileCCDTemp=hdr.get("CCD-TEMP", 0),
-                    fitsFileTelescop=telescope,
-                    fitsFileInstrument=instrument,
-                    fitsFileFilter=fits_filter,
-                    fitsFileHash=fileHash,
-                    fitsFileSession=None,
-                    fitsFileCalibrated=1 if is_precalibrated else 0
-                )
+            newfile = FitsFileModel.create(
+                **self.build_file_record(fileName, hdr, fileHash, partialHash, fileSize))
             
             logger.info(f"Successfully registered FITS file: {newfile.fitsFileId}")
             return newfile.fitsFileId
@@ -558,7 +727,7 @@ class FileProcessor:
                 error_code="DB_UNEXPECTED_ERROR"
             )
 
-    def registerFitsImage(self, root: str, file: str, moveFiles: bool) -> Union[str, bool]:
+    def registerFitsImage(self, root: str, file: str, moveFiles: bool, header: Any = None) -> Union[str, bool]:
         """
         Register a FITS image file, process headers, and move to repository structure.
         
@@ -566,6 +735,7 @@ class FileProcessor:
             root: Directory containing the file
             file: Filename
             moveFiles: Whether to move files to repository structure
+            header: Primary header already read by the ingest scan (optional)
             
         Returns:
             File ID if successful, False if failed
@@ -577,7 +747,7 @@ class FileProcessor:
             DatabaseError: If database operations fail
         """
         try:
-            return self._register_fits_image_internal(root, file, moveFiles)
+            return self._register_fits_image_internal(root, file, moveFiles, header)
         except (FileProcessingError, ValidationError, FitsHeaderError, DatabaseError) as e:
             logger.error(f"Error processing {os.path.join(root, file)}: {e}")
             return False
@@ -589,9 +759,42 @@ class FileProcessor:
                 error_code="UNEXPECTED_REGISTRATION_ERROR"
             )
     
-    def _register_fits_image_internal(self, root: str, file: str, moveFiles: bool) -> Union[str, bool]:
+    def _register_fits_image_internal(self, root: str, file: str, moveFiles: bool,
+                                      header: Any = None) -> Union[str, bool]:
         """Internal implementation of FITS image registration with proper error handling."""
-        newFitsFileId = None
+        prepared = self.prepare_fits_image(root, file, moveFiles, header)
+        if not prepared:
+            return False
+        file_id = self.commit_prepared_image(prepared, moveFiles)
+        # Store the metrics of frames whose inline quality analysis has finished
+        if self._quality_stage is not None:
+            self._quality_stage.write_results()
+        # Full hashes deferred during ingest are filled in on a background thread
+        if file_id and self.lazy_full_hash and not prepared.is_master:
+            start_hash_backfill()
+        return file_id
+
+    def prepare_fits_image(self, root: str, file: str, moveFiles: bool,
+                           header: Any = None) -> Union[PreparedRegistration, bool]:
+        """
+        Run the database-free part of FITS registration for a single file.
+
+        Converts the input format if required, reads and fixes the header, derives
+        the repository filename, compresses the file and calculates its hash. The
+        result is handed to commit_prepared_image(), which performs the repository
+        move and the database insert. This method does not touch the database
+        (beyond the cached header mappings) and is safe to run on worker threads.
+
+        Args:
+            root: Directory containing the file
+            file: Filename
+            moveFiles: Whether the file will be moved into the repository structure
+            header: Primary header already read by the ingest scan. Ignored if the
+                file has to be converted first (XISF, gzip, zip).
+
+        Returns:
+            PreparedRegistration, or False if the file is not a supported image
+        """
         file_name, file_extension = os.path.splitext(os.path.join(root, file))
 
         original_input_path = os.path.join(root, file)
@@ -616,6 +819,8 @@ class FileProcessor:
                 root = os.path.dirname(processed_file_path)
                 file = os.path.basename(processed_file_path)
                 file_name, file_extension = os.path.splitext(processed_file_path)
+                if processed_file_path != original_input_path:
+                    header = None  # Pre-read header belongs to the source archive
                 
                 logger.info(f"Successfully processed file: {processed_file_path}")
             else:
@@ -631,14 +836,22 @@ class FileProcessor:
         full_file_path = os.path.join(root, file)
         if self._is_master_file(full_file_path):
             logger.info(f"Detected master calibration frame: {file}")
-            # Register in Masters table instead of regular file table
-            return self._register_master_file(full_file_path)
+            # Register in Masters table instead of regular file table (commit stage)
+            return PreparedRegistration(
+                source_path=original_input_path,
+                file_path=full_file_path,
+                is_master=True,
+            )
         
-        # Open the FITS file for reading and close immediately after reading header
+        # Open the FITS file for reading and close immediately after reading header,
+        # unless the ingest scan already parsed it.
         try:
-            hdul = fits.open(os.path.join(root, file), mode='readonly')
-            hdr = hdul[0].header
-            hdul.close()
+            if header is not None:
+                hdr = header
+            else:
+                hdul = fits.open(os.path.join(root, file), mode='readonly')
+                hdr = hdul[0].header
+                hdul.close()
         except (OSError, IOError) as e:
             raise FileProcessingError(
                 f"Cannot read FITS file: {e}",
@@ -859,8 +1072,15 @@ class FileProcessor:
                 logger.error(f"Unexpected error saving modified header for {file}: {e}")
                 # Continue processing despite header save failure
 
-        # Process file for compression if enabled and appropriate
+        # Light frames are decoded for inline quality analysis right before
+        # compression and hashing read the same file. This is an extra decode,
+        # but the file is read from disk only once and then served from the page cache
         current_file_path = os.path.join(root, file)
+        quality_future = None
+        if "LIGHT" in hdr["IMAGETYP"].upper():
+            quality_future = self._submit_ingest_quality(current_file_path, hdr)
+
+        # Process file for compression if enabled and appropriate
         try:
             compressed_file_path = self.compressor.process_file_for_compression(current_file_path)
             if compressed_file_path != current_file_path:
@@ -873,6 +1093,104 @@ class FileProcessor:
             logger.warning(f"Compression processing failed for {current_file_path}: {e}")
             # Continue with original file if compression fails
 
+        # Hash the final file contents; moving the file later does not change them.
+        # The size and partial hash feed tiered duplicate detection while the full
+        # hash is deferred to the background backfill. A full hash computed here
+        # settles duplicates on its own, so the partial hash is not read then.
+        fileSize = os.path.getsize(current_file_path)
+        if self.lazy_full_hash:
+            partialHash = self.hash_calculator.calculate_partial_sha256(current_file_path)
+            fileHash = None
+        else:
+            partialHash = None
+            fileHash = self.calculateFileHash(current_file_path)
+
+        return PreparedRegistration(
+            source_path=original_input_path,
+            file_path=current_file_path,
+            header=hdr,
+            new_name=newName,
+            file_hash=fileHash,
+            partial_hash=partialHash,
+            file_size=fileSize,
+            cleanup_source_path=cleanup_source_path,
+            quality_future=quality_future,
+        )
+
+    def commit_prepared_image(self, prepared: PreparedRegistration, moveFiles: bool) -> Union[str, bool]:
+        """
+        Move a prepared file into the repository and register it in the database.
+
+        This is the second half of registration and must run on a single thread,
+        since it writes to the database and reorganizes the repository.
+
+        Args:
+            prepared: Result of prepare_fits_image()
+            moveFiles: Whether to move files to repository structure
+
+        Returns:
+            File ID (or master ID) if successful, False if failed
+
+        Raises:
+            FileProcessingError: If the repository move fails
+            DatabaseError: If database operations fail
+        """
+        if prepared.is_master:
+            return self._register_master_file(prepared.file_path)
+
+        current_file_path = self._move_prepared_to_repository(prepared, moveFiles)
+
+        # Submit file to database (use the potentially compressed file path)
+        newFitsFileId = self.submitFileToDB(current_file_path, prepared.header, prepared.file_hash,
+                                            partialHash=prepared.partial_hash,
+                                            fileSize=prepared.file_size)
+        self._cleanup_prepared_source(prepared, newFitsFileId)
+        self._register_ingest_quality(prepared, newFitsFileId)
+        
+        return newFitsFileId if newFitsFileId else False
+
+    def queue_prepared_image(self, prepared: PreparedRegistration, moveFiles: bool, writer,
+                             callback: Optional[Callable[[Union[str, bool]], None]] = None) -> None:
+        """
+        Move a prepared file into the repository and queue its database record.
+
+        Like commit_prepared_image(), but the insert is handed to a
+        BatchedRegistrationWriter and committed with the rest of its batch.
+        Must run on the writer's thread.
+
+        Args:
+            prepared: Result of prepare_fits_image()
+            moveFiles: Whether to move files to repository structure
+            writer: BatchedRegistrationWriter collecting the inserts
+            callback: Called with the file ID (or False) once the batch is committed
+
+        Raises:
+            FileProcessingError: If the repository move fails
+            ValidationError: If required header fields are missing
+        """
+        if prepared.is_master:
+            result = self._register_master_file(prepared.file_path)
+            if callback:
+                callback(result if result else False)
+            return
+
+        current_file_path = self._move_prepared_to_repository(prepared, moveFiles)
+
+        def on_committed(file_id: Union[str, bool]) -> None:
+            self._cleanup_prepared_source(prepared, file_id)
+            self._register_ingest_quality(prepared, file_id)
+            if callback:
+                callback(file_id)
+
+        writer.submit(current_file_path, prepared.header, prepared.file_hash,
+                      partialHash=prepared.partial_hash, fileSize=prepared.file_size,
+                      callback=on_committed, source_path=prepared.source_path)
+
+    def _move_prepared_to_repository(self, prepared: PreparedRegistration, moveFiles: bool) -> str:
+        """Move a prepared file into the repository structure if requested; return its path."""
+        hdr = prepared.header
+        current_file_path = prepared.file_path
+
         # If requested, move/rename the file into the repository structure.
         # This is required for the Images view "Load New" workflow.
         if moveFiles:
@@ -883,7 +1201,7 @@ class FileProcessor:
                 # Ensure the repository root folders exist (Light/Calibrate/Masters/Incoming/etc.)
                 repo_manager.createRepositoryStructure()
 
-                new_filename = newName
+                new_filename = prepared.new_name
 
                 moved_path = repo_manager.organizeFileByType(
                     current_file_path,
@@ -897,8 +1215,6 @@ class FileProcessor:
                         error_code="REPO_MOVE_FAILED",
                     )
 
-                root = os.path.dirname(moved_path)
-                file = os.path.basename(moved_path)
                 current_file_path = moved_path
             except Exception as e:
                 raise FileProcessingError(
@@ -906,20 +1222,17 @@ class FileProcessor:
                     file_path=current_file_path,
                     error_code="REPO_MOVE_FAILED",
                 )
+        return current_file_path
 
-        # Submit file to database (use the potentially compressed file path)
-        fileHash = self.calculateFileHash(current_file_path)
-        newFitsFileId = self.submitFileToDB(current_file_path, hdr, fileHash)
-
-        # Cleanup source gzip only after successful DB registration
-        if newFitsFileId and cleanup_source_path and os.path.exists(cleanup_source_path):
+    def _cleanup_prepared_source(self, prepared: PreparedRegistration, file_id: Union[str, bool, None]) -> None:
+        """Remove the source gzip of a converted file, only after successful DB registration."""
+        cleanup_source_path = prepared.cleanup_source_path
+        if file_id and cleanup_source_path and os.path.exists(cleanup_source_path):
             try:
                 os.remove(cleanup_source_path)
                 logger.info(f"Removed source gzip file after successful import: {cleanup_source_path}")
             except Exception as e:
                 logger.warning(f"Failed to remove source gzip file {cleanup_source_path}: {e}")
-        
-        return newFitsFileId if newFitsFileId else False
 
     # Legacy methods for backward compatibility - delegate to new services
     def extractZipFile(self, zip_path):
@@ -0,0 +1,302 @@
+"""
+Shared FITS image access for the processing pipelines.
+
+Master creation, stacking, calibration, quality analysis and compression all
+read FITS images through this module, so files are opened the same way
+everywhere:
+
+- probe_fits_image() reads headers only. It finds the image HDU and returns
+  its shape, BITPIX, decoded dtype and whether it is tile-compressed
+  (ZNAXISn/ZBITPIX), so checking frame dimensions never decodes pixels.
+- read_fits_image() decodes the image with fits_image_data(). Uncompressed
+  files are memory-mapped: unscaled data is paged in on demand and scaled
+  (BZERO/BSCALE) data is converted straight from the mapped raw pixels.
+- FitsImageReader keeps a file open and reads row bands through the HDU
+  section. Tile-compressed HDUs only decompress the tiles a band overlaps.
+  read_subsample() reads a strided grid of pixels for cheap statistics.
+
+Stream-compressed files (.gz, .bz2, .xz, .zip) cannot be seeked, so they are
+decoded in one pass and never read in sections.
+
+A (1, H, W) cube is treated as a 2D (H, W) image everywhere.
+"""
+
+import math
+import logging
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple
+
+import numpy as np
+from astropy.io import fits
+
+from .utils import fits_image_data
+
+logger = logging.getLogger(__name__)
+
+# Seeking in these restarts decompression, so they are never sectioned
+STREAM_COMPRESSED_SUFFIXES = ('.gz', '.bz2', '.xz', '.zip')
+
+# Pixels read by FitsImageReader.read_subsample() (about 256 x 256)
+DEFAULT_SUBSAMPLE_PIXELS = 65536
+
+_BITPIX_DTYPES = {
+    8: np.uint8,
+    16: np.int16,
+    32: np.int32,
+    64: np.int64,
+    -32: np.float32,
+    -64: np.float64,
+}
+
+_IMAGE_HDU_TYPES = (fits.PrimaryHDU, fits.ImageHDU, fits.CompImageHDU)
+
+
+@dataclass
+class FitsImageInfo:
+    """Header-only description of the image in a FITS file."""
+    path: str
+    hdu_index: int
+    shape: Tuple[int, ...]
+    bitpix: int
+    dtype: np.dtype
+    compressed: bool
+    header: Any
+
+    @property
+    def plane(self) -> Optional[int]:
+        """0 for (1, H, W) cubes, None for plain 2D images."""
+        return 0 if len(self.shape) == 3 and self.shape[0] == 1 else None
+
+    @property
+    def is_2d(self) -> bool:
+        """True for 2D images and single-plane cubes."""
+        return len(self.shape) == 2 or self.plane is not None
+
+    @property
+    def image_shape(self) -> Tuple[int, int]:
+        """(height, width) of the image."""
+        return tuple(self.shape[-2:])
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the decoded image in bytes."""
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+
+def is_stream_compressed(path: str) -> bool:
+    """Return True for gzip/bzip2/xz/zip compressed FITS files."""
+    return path.lower().endswith(STREAM_COMPRESSED_SUFFIXES)
+
+
+def _decoded_dtype(header: Any) -> np.dtype:
+    """dtype astropy decodes an image HDU to, from BITPIX, BZERO and BSCALE."""
+    bitpix = int(header.get('BITPIX', -32))
+    raw = np.dtype(_BITPIX_DTYPES.get(bitpix, np.float64))
+    bzero = header.get('BZERO', 0)
+    bscale = header.get('BSCALE', 1)
+    if bzero == 0 and bscale == 1:
+        return raw
+    if bscale == 1:
+        # Unsigned integers are stored as signed with an offset
+        if bitpix == 8 and bzero == -128:
+            return np.dtype(np.int8)
+        if bitpix in (16, 32, 64) and bzero == 2 ** (bitpix - 1):
+            return np.dtype(f'uint{bitpix}')
+    if bitpix > 16 or bitpix == -64:
+        return np.dtype(np.float64)
+    return np.dtype(np.float32)
+
+
+def _image_shape(header: Any) -> Tuple[int, ...]:
+    naxis = int(header.get('NAXIS', 0))
+    return tuple(int(header.get(f'NAXIS{axis}', 0)) for axis in range(naxis, 0, -1))
+
+
+def _find_image(path: str, hdul: Any) -> Optional[FitsImageInfo]:
+    """Describe the first HDU with 2D+ image data, reading only headers."""
+    for index, hdu in enumerate(hdul):
+        if not isinstance(hdu, _IMAGE_HDU_TYPES):
+            continue
+        # For tile-compressed HDUs astropy presents the image header, built
+        # from ZNAXISn/ZBITPIX, without decompressing anything
+        header = hdu.header
+        shape = _image_shape(header)
+        if len(shape) < 2 or not all(shape):
+            continue
+        return FitsImageInfo(
+            path=path,
+            hdu_index=index,
+            shape=shape,
+            bitpix=int(header.get('BITPIX', 0)),
+            dtype=_decoded_dtype(header),
+            compressed=isinstance(hdu, fits.CompImageHDU),
+            header=header.copy(),
+        )
+    return None
+
+
+def probe_fits_image(path: str) -> Optional[FitsImageInfo]:
+    """
+    Describe the image in a FITS file without reading any pixel data.
+
+    The image is the first HDU with 2D+ data, as in fits_image_data().
+
+    Args:
+        path: FITS file path
+
+    Returns:
+        FitsImageInfo, or None if the file has no image data
+
+    Raises:
+        OSError: If the file cannot be opened or is not FITS
+    """
+    with fits.open(path, lazy_load_hdus=True) as hdul:
+        return _find_image(path, hdul)
+
+
+def _single_plane(data: np.ndarray) -> np.ndarray:
+    if data.ndim == 3 and data.shape[0] == 1:
+        return data[0]
+    return data
+
+
+def read_fits_image(path: str, dtype: Any = None) -> Tuple[np.ndarray, Any]:
+    """
+    Decode the image of a FITS file.
+
+    Uncompressed files are memory-mapped. Without dtype the returned array may
+    be backed by the mapped file, which stays valid after this returns; pass a
+    dtype to get a writable copy in that precision.
+
+    Args:
+        path: FITS file path
+        dtype: Convert to this dtype (copy), or None to keep the decoded dtype
+
+    Returns:
+        (data, header) of the first image HDU; (1, H, W) cubes come back 2D
+
+    Raises:
+        ValueError: If the file has no image data
+        OSError: If the file cannot be opened or is not FITS
+    """
+    with fits.open(path, lazy_load_hdus=True) as hdul:
+        data, header = fits_image_data(hdul)
+        if data is None:
+            raise ValueError(f"No image data found in {path}")
+        data = _single_plane(data)
+        if dtype is not None:
+            data = np.array(data, dtype=dtype)
+        return data, header.copy()
+
+
+class FitsImageReader:
+    """
+    An open FITS image read whole or in row bands.
+
+    Use as a context manager, or call close():
+
+        with FitsImageReader(path) as reader:
+            for y0 in range(0, reader.image_shape[0], rows):
+                band = reader.read_rows(y0, y0 + rows)
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Open path and locate its image from the headers.
+
+        Raises:
+            ValueError: If the file has no 2D image
+            OSError: If the file cannot be opened or is not FITS
+        """
+        self.path = path
+        self._hdul = fits.open(path, lazy_load_hdus=True)
+        self._data: Optional[np.ndarray] = None
+        self._section = None
+        try:
+            self.info = _find_image(path, self._hdul)
+            if self.info is None or not self.info.is_2d:
+                raise ValueError("No 2D image data found in any HDU")
+            self._hdu = self._hdul[self.info.hdu_index]
+            if not is_stream_compressed(path):
+                self._section = self._open_section()
+        except Exception:
+            self._hdul.close()
+            raise
+
+    def __enter__(self) -> 'FitsImageReader':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def _open_section(self) -> Any:
+        section = getattr(self._hdu, 'section', None)
+        if section is None:
+            return None
+        try:
+            if self.info.plane is None:
+                section[0:1, :]
+            else:
+                section[self.info.plane, 0:1, :]
+        except Exception as e:
+            logger.debug(f"Section reads unavailable for {self.path}: {e}")
+            return None
+        return section
+
+    @property
+    def image_shape(self) -> Tuple[int, int]:
+        """(height, width) of the image."""
+        return self.info.image_shape
+
+    @property
+    def header(self) -> Any:
+        """Header of the image HDU."""
+        return self.info.header
+
+    @property
+    def sectioned(self) -> bool:
+        """True if row bands are read without decoding the whole image."""
+        return self._section is not None
+
+    def read(self) -> np.ndarray:
+        """Decode the whole image (decoded once and kept while open)."""
+        if self._data is None:
+            self._data = _single_plane(self._hdu.data)
+        return self._data
+
+    def read_rows(self, y0: int, y1: int) -> np.ndarray:
+        """Read image rows y0:y1."""
+        if self._section is None:
+            return self.read()[y0:y1]
+        if self.info.plane is None:
+            return self._section[y0:y1, :]
+        return self._section[self.info.plane, y0:y1, :]
+
+    def read_subsample(self, max_pixels: int = DEFAULT_SUBSAMPLE_PIXELS) -> np.ndarray:
+        """
+        Read every n-th row and column, choosing n so about max_pixels are read.
+
+        Enough for robust statistics such as a frame median, at a fraction of
+        the I/O of a full read.
+        """
+        height, width = self.image_shape
+        step = max(1, int(math.ceil(math.sqrt(height * width / max(1, max_pixels)))))
+        if self._section is None:
+            return self.read()[::step, ::step]
+        prefix = () if self.info.plane is None else (self.info.plane,)
+        if self.info.compressed:
+            # Strided section reads only decompress the tiles holding sampled rows
+            return self._section[prefix + (slice(None, None, step), slice(None, None, step))]
+        # Uncompressed strided sections are read element by element, so read whole rows
+        rows = [self._section[prefix + (slice(y, y + 1), slice(None))].reshape(-1)[::step]
+                for y in range(0, height, step)]
+        return np.stack(rows)
+
+    def close(self) -> None:
+        """Close the file."""
+        self._data = None
+        self._section = None
+        try:
+            self._hdul.close()
+        except Exception:
+            pass
@@ -0,0 +1,212 @@
+"""
+Quality-based frame selection and weighting for light stacking.
+
+EnhancedQualityAnalyzer stores per-frame FWHM, eccentricity, SNR and star
+count on fitsFile. select_stack_frames() uses those stored metrics, without
+opening any file, to:
+
+- reject frames whose metrics are poor relative to the rest of the session
+  (bloated stars, lost stars through cloud, low SNR, trailed stars), so they
+  are never read, registered or stacked
+- weight the remaining frames by SNR squared over FWHM squared, so sharp,
+  clean frames contribute more to the weighted mean
+- pick the registration reference (sharpest kept frame)
+
+Thresholds are relative to the session median, so they adapt to seeing and
+equipment. Frames without metrics are kept with a neutral weight of 1.
+Settings are read from the DEFAULT section of astrofiler.ini:
+
+- stack_frame_weighting: weight frames by quality (default true)
+- stack_frame_rejection: reject poor frames before stacking (default true)
+- stack_reject_fwhm_ratio: reject if FWHM > ratio x median (default 1.5)
+- stack_reject_star_ratio: reject if star count < ratio x median (default 0.5)
+- stack_reject_snr_ratio: reject if SNR < ratio x median (default 0.5)
+- stack_reject_eccentricity: reject if eccentricity > value (default 0.7)
+"""
+
+import os
+import logging
+import configparser
+from dataclasses import dataclass, field
+from statistics import median
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Keep weights within this factor of the mean so one frame cannot dominate
+_MAX_RELATIVE_WEIGHT = 10.0
+
+
+@dataclass
+class FrameSelectionSettings:
+    """Thresholds for quality-based frame selection."""
+    weighting: bool = True
+    rejection: bool = True
+    fwhm_ratio: float = 1.5
+    star_ratio: float = 0.5
+    snr_ratio: float = 0.5
+    max_eccentricity: float = 0.7
+
+    @classmethod
+    def from_config(cls, config_path: str = 'astrofiler.ini') -> 'FrameSelectionSettings':
+        """Read the stack_* frame selection settings from astrofiler.ini."""
+        config = configparser.ConfigParser()
+        config.read(config_path)
+        defaults = cls()
+
+        def _bool(key: str, fallback: bool) -> bool:
+            try:
+                return config.getboolean('DEFAULT', key, fallback=fallback)
+            except ValueError:
+                return fallback
+
+        def _float(key: str, fallback: float) -> float:
+            try:
+                return config.getfloat('DEFAULT', key, fallback=fallback)
+            except ValueError:
+                return fallback
+
+        return cls(
+            weighting=_bool('stack_frame_weighting', defaults.weighting),
+            rejection=_bool('stack_frame_rejection', defaults.rejection),
+            fwhm_ratio=_float('stack_reject_fwhm_ratio', defaults.fwhm_ratio),
+            star_ratio=_float('stack_reject_star_ratio', defaults.star_ratio),
+            snr_ratio=_float('stack_reject_snr_ratio', defaults.snr_ratio),
+            max_eccentricity=_float('stack_reject_eccentricity', defaults.max_eccentricity),
+        )
+
+
+@dataclass
+class FrameSelection:
+    """Result of select_stack_frames()."""
+    paths: List[str] = field(default_factory=list)
+    weights: Optional[Dict[str, float]] = None
+    rejected: Dict[str, str] = field(default_factory=dict)
+    reference_path: Optional[str] = None
+
+    def weight_list(self) -> Optional[List[float]]:
+        """Weights in the order of paths, or None if weighting is disabled."""
+        if self.weights is None:
+            return None
+        return [self.weights.get(path, 1.0) for path in self.paths]
+
+
+def _metric(frame: Any, name: str) -> Optional[float]:
+    value = getattr(frame, name, None)
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value == value else None  # Drop NaN
+
+
+def _session_median(values: Iterable[Optional[float]]) -> Optional[float]:
+    present = [v for v in values if v is not None and v > 0]
+    return median(present) if present else None
+
+
+def _rejection_reason(metrics: Dict[str, Optional[float]], medians: Dict[str, Optional[float]],
+                      settings: FrameSelectionSettings) -> Optional[str]:
+    fwhm, stars, snr, ecc = metrics['fwhm'], metrics['stars'], metrics['snr'], metrics['ecc']
+    if fwhm is not None and medians['fwhm'] and fwhm > settings.fwhm_ratio * medians['fwhm']:
+        return f"FWHM {fwhm:.2f}\" > {settings.fwhm_ratio:g} x median {medians['fwhm']:.2f}\""
+    if stars is not None and medians['stars'] and stars < settings.star_ratio * medians['stars']:
+        return f"{stars:.0f} stars < {settings.star_ratio:g} x median {medians['stars']:.0f}"
+    if snr is not None and medians['snr'] and snr < settings.snr_ratio * medians['snr']:
+        return f"SNR {snr:.2f} < {settings.snr_ratio:g} x median {medians['snr']:.2f}"
+    if ecc is not None and ecc > settings.max_eccentricity:
+        return f"eccentricity {ecc:.2f} > {settings.max_eccentricity:g}"
+    return None
+
+
+def _quality_weight(metrics: Dict[str, Optional[float]], medians: Dict[str, Optional[float]]) -> float:
+    """SNR^2 / FWHM^2 relative to the session medians; missing metrics count as median."""
+    weight = 1.0
+    if metrics['snr'] and medians['snr']:
+        weight *= (metrics['snr'] / medians['snr']) ** 2
+    fwhm = metrics['fwhm'] or metrics['hfr']
+    fwhm_median = medians['fwhm'] if metrics['fwhm'] else medians['hfr']
+    if fwhm and fwhm_median:
+        weight *= (fwhm_median / fwhm) ** 2
+    return weight
+
+
+def select_stack_frames(files: Iterable[Any], settings: Optional[FrameSelectionSettings] = None,
+                        min_frames: int = 2) -> FrameSelection:
+    """
+    Select, weight and pick a reference for light frames from stored quality metrics.
+
+    No file is opened: only paths that exist on disk and the fitsFile quality
+    columns are used. If rejection would leave fewer than min_frames frames,
+    nothing is rejected.
+
+    Args:
+        files: fitsFile records (or any objects with the same attributes)
+        settings: Selection thresholds (None reads astrofiler.ini)
+        min_frames: Minimum number of frames to keep
+
+    Returns:
+        FrameSelection with kept paths in input order, per-path weights
+        normalized to a mean of 1 (None if weighting is disabled), rejected
+        paths with their reasons, and the reference path (None if no kept
+        frame has FWHM or HFR)
+    """
+    if settings is None:
+        settings = FrameSelectionSettings.from_config()
+
+    frames = []
+    seen = set()
+    for f in files:
+        path = getattr(f, 'fitsFileName', None)
+        if not path or path in seen or not os.path.exists(path):
+            continue
+        seen.add(path)
+        frames.append((path, {
+            'fwhm': _metric(f, 'fitsFileAvgFWHMArcsec'),
+            'hfr': _metric(f, 'fitsFileAvgHFRArcsec'),
+            'stars': _metric(f, 'fitsFileStarCount'),
+            'snr': _metric(f, 'fitsFileImageSNR'),
+            'ecc': _metric(f, 'fitsFileAvgEccentricity'),
+        }))
+
+    medians = {key: _session_median(m[key] for _path, m in frames)
+               for key in ('fwhm', 'hfr', 'stars', 'snr')}
+
+    rejected: Dict[str, str] = {}
+    if settings.rejection:
+        for path, metrics in frames:
+            reason = _rejection_reason(metrics, medians, settings)
+            if reason:
+                rejected[path] = reason
+        if rejected and len(frames) - len(rejected) < min_frames:
+            logger.warning(f"Quality rejection would leave {len(frames) - len(rejected)} of {len(frames)} "
+                           f"frames; stacking all frames")
+            rejected = {}
+
+    kept = [(path, metrics) for path, metrics in frames if path not in rejected]
+    for path, reason in rejected.items():
+        logger.info(f"Rejected frame {os.path.basename(path)}: {reason}")
+
+    weights = None
+    if settings.weighting and kept:
+        raw = {path: _quality_weight(metrics, medians) for path, metrics in kept}
+        mean_weight = sum(raw.values()) / len(raw)
+        weights = {path: min(w / mean_weight, _MAX_RELATIVE_WEIGHT) for path, w in raw.items()}
+
+    # Reference: smallest FWHM (HFR if no frame has FWHM), ties broken by weight
+    size_key = 'fwhm' if any(m['fwhm'] for _path, m in kept) else 'hfr'
+    reference_path = None
+    best = None
+    for path, metrics in kept:
+        size = metrics[size_key]
+        if size is None or size <= 0:
+            continue
+        key = (size, -(weights or {}).get(path, 1.0))
+        if best is None or key < best:
+            best = key
+            reference_path = path
+
+    return FrameSelection(paths=[path for path, _metrics in kept], weights=weights,
+                          rejected=rejected, reference_path=reference_path)
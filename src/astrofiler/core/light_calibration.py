@@ -16,6 +16,9 @@ Key Features:
 - Progress callbacks for GUI integration
 - Professional astronomy-standard processing
 - Consistent cal_ prefix naming convention
+- Session calibration: masters are prepared once per session
+  (calibration_engine) and lights are calibrated in worker processes, with
+  the calibrated status written in one batch
 
 Calibration Formula:
     Calibrated = (Light - (Dark - Bias)) / ((Flat - (Dark - Bias)) / mean(Flat - (Dark - Bias)))
@@ -28,20 +31,23 @@ same exposure time as the light frames.
 
 import os
 import logging
-import hashlib
 import numpy as np
 from datetime import datetime
 from typing import Optional, Callable, Dict, List, Any
 from astropy.io import fits
 from ..models import fitsFile as FitsFileModel, fitsSession as FitsSessionModel
 from ..models.masters import Masters
-from .utils import normalize_file_path, fits_image_data as _fits_image_data
+from ..models.base import numeric_match
+from .utils import normalize_file_path, get_processing_precision, run_with_db_retry
+from .fits_access import read_fits_image
+from .calibration_engine import CalibrationMasters, SessionCalibrationEngine, master_checksum
 
 logger = logging.getLogger(__name__)
 
 def calibrate_light_frame(light_path: str, dark_master: Optional[str] = None, 
                          flat_master: Optional[str] = None, bias_master: Optional[str] = None, 
-                         output_path: Optional[str] = None, progress_callback: Optional[Callable] = None) -> Dict:
+                         output_path: Optional[str] = None, progress_callback: Optional[Callable] = None,
+                         masters: Optional[CalibrationMasters] = None) -> Dict:
     """
     Calibrate a single light frame using master calibration frames.
     
@@ -64,6 +70,8 @@ def calibrate_light_frame(light_path: str, dark_master: Optional[str] = None,
         bias_master (str, optional): Path to master bias frame (REQUIRED for proper dark correction)
         output_path (str, optional): Path for calibrated output file (auto-generated if not provided)
         progress_callback (callable, optional): Callback for progress updates
+        masters (CalibrationMasters, optional): Masters already prepared for the
+            session; when given, the master paths above are ignored
         
     Returns:
         dict: Calibration result with success status, output path, and metadata
@@ -90,169 +98,25 @@ def calibrate_light_frame(light_path: str, dark_master: Optional[str] = None,
         if progress_callback:
             progress_callback("Loading light frame...")
             
-        with fits.open(light_path) as hdul:
-            # Primary HDU may be empty on multi-extension FITS; search all HDUs for image data
-            original_data = None
-            light_header = None
-            for hdu in hdul:
-                if hdu.data is not None and hdu.data.ndim >= 2:
-                    original_data = hdu.data
-                    light_header = hdu.header.copy()
-                    break
-            if light_header is None:
-                light_header = hdul[0].header.copy()
-
-            if original_data is None:
-                return {"error": "No image data found in light frame"}
-            
-            # Convert to float64 for precision during calibration
-            light_data = original_data.astype(np.float64)
+        # One working copy in the configured precision (float32 by default);
+        # calibration then runs in place on it
+        try:
+            light_data, light_header = read_fits_image(light_path, dtype=np.dtype(get_processing_precision()))
+        except ValueError:
+            return {"error": "No image data found in light frame"}
         
         if light_data.size == 0:
             return {"error": "No image data found in light frame"}
         
-        calibrated_data = light_data.copy()
-        calibration_steps = []
-        corrected_dark = None  # bias-corrected dark, reused for flat correction
-        
-        # =================================================================
-        # STEP 1: DARK SUBTRACTION (or BIAS if no dark available)
-        # =================================================================
-        # CRITICAL FIX: Dark masters contain uncorrected bias signal because bias is not
-        # subtracted during dark master creation. We must subtract bias from the dark master
-        # before applying it to the light frame.
-        # 
-        # Correct formula: Light - (Dark - Bias) / Flat
-        # Which equals:    (Light - Dark + Bias) / Flat
-        
-        if dark_master and os.path.exists(dark_master):
-            if progress_callback:
-                progress_callback("Applying dark correction...")
-            try:
-                with fits.open(dark_master) as hdul:
-                    _dark_raw, dark_header = _fits_image_data(hdul)
-                    if _dark_raw is None:
-                        raise ValueError("No image data found in dark master")
-                    dark_data = _dark_raw.astype(np.float64)
-                    
-                    # Validate dimensions match
-                    if dark_data.shape != calibrated_data.shape:
-                        raise ValueError(f"Dark frame shape {dark_data.shape} doesn't match light frame {calibrated_data.shape}")
-                    
-                    # CRITICAL FIX: Subtract bias master from dark master before applying
-                    # Dark masters contain bias signal that must be removed
-                    if bias_master and os.path.exists(bias_master):
-                        try:
-                            with fits.open(bias_master) as bias_hdul:
-                                _bias_raw, _ = _fits_image_data(bias_hdul)
-                                if _bias_raw is None:
-                                    raise ValueError("No image data found in bias master")
-                                bias_data = _bias_raw.astype(np.float64)
-                                
-                                # Validate bias dimensions match
-                                if bias_data.shape != dark_scaled.shape:
-                                    logger.warning(f"Bias shape {bias_data.shape} doesn't match dark {dark_scaled.shape}, skipping bias correction")
-                                else:
-                                    # Remove bias from dark to get true thermal noise
-                                    dark_scaled = dark_scaled - bias_data
-                                    calibration_steps.append(f"DARK: {os.path.basename(dark_master)} - BIAS corrected")
-                                    logger.info(f"Bias-corrected dark frame: bias mean={np.mean(bias_data):.2f} ADU removed")
-                        except Exception as e:
-                            logger.warning(f"Failed to load bias for dark correction: {e}, using uncorrected dark")
-                            calibration_steps.append(f"DARK: {os.path.basename(dark_master)} - NO BIAS CORRECTION")
-                    else:
-                        logger.warning("No bias master available - dark correction will leave residual bias signal")
-                        calibration_steps.append(f"DARK: {os.path.basename(dark_master)} - NO BIAS CORRECTION")
-                    
-                    # Apply: Light - (Dark - Bias) 
-                    corrected_dark = dark_data
-                    calibrated_data = calibrated_data - dark_scaled
-                    logger.debug(f"Applied dark correction, data range: [{np.min(calibrated_data):.2f}, {np.max(calibrated_data):.2f}]")
-                    
-            except Exception as e:
-                logger.error(f"Failed to apply dark correction: {e}")
-                if progress_callback:
-                    progress_callback(f"Warning: Failed to apply dark correction: {e}")
-                    
-        elif bias_master and os.path.exists(bias_master):
-            # If we have bias but no dark, subtract bias from light
-            if progress_callback:
-                progress_callback("Applying bias correction...")
-            try:
-                with fits.open(bias_master) as hdul:
-                    _bias_raw, _ = _fits_image_data(hdul)
-                    if _bias_raw is None:
-                        raise ValueError("No image data found in bias master")
-                    bias_data = _bias_raw.astype(np.float64)
-                    
-                    # Validate dimensions match
-                    if bias_data.shape != calibrated_data.shape:
-                        raise ValueError(f"Bias frame shape {bias_data.shape} doesn't match light frame {calibrated_data.shape}")
-                    
-                    calibrated_data = calibrated_data - bias_data
-                    calibration_steps.append(f"BIAS: {os.path.basename(bias_master)}")
-                    logger.debug(f"Applied bias correction, data range: [{np.min(calibrated_data):.2f}, {np.max(calibrated_data):.2f}]")
-                    
-            except Exception as e:
-                logger.error(f"Failed to apply bias correction: {e}")
-                if progress_callback:
-                    progress_callback(f"Warning: Failed to apply bias correction: {e}")
-        
         # =================================================================
-        # STEP 2: FLAT FIELD CORRECTION
+        # DARK (or BIAS) SUBTRACTION AND FLAT FIELD CORRECTION
         # =================================================================
-        # Subtract master dark from flat, normalize by mean, then divide
-        
-        if flat_master and os.path.exists(flat_master):
-            if progress_callback:
-                progress_callback("Applying flat correction...")
-            try:
-                with fits.open(flat_master) as hdul:
-                    _flat_raw, _ = _fits_image_data(hdul)
-                    if _flat_raw is None:
-                        raise ValueError("No image data found in flat master")
-                    flat_data = _flat_raw.astype(np.float64)
-                    
-                    # Validate dimensions match
-                    if flat_data.shape != calibrated_data.shape:
-                        raise ValueError(f"Flat frame shape {flat_data.shape} doesn't match light frame {calibrated_data.shape}")
-                    
-                    # Subtract bias-corrected dark (Dark - Bias) from flat to remove
-                    # the bias pedestal and thermal signal. corrected_dark was already
-                    # computed in Step 1 and contains Dark - Bias with no scaling applied.
-                    flat_corrected = False
-                    if corrected_dark is not None and corrected_dark.shape == flat_data.shape:
-                        flat_data = flat_data - corrected_dark
-                        flat_corrected = True
-                        logger.info("Subtracted bias-corrected dark (Dark - Bias) from flat master")
-                    elif corrected_dark is not None:
-                        logger.warning("Corrected dark shape doesn't match flat shape, skipping dark subtraction from flat")
-
-                    # Normalize flat field by its mean value
-                    flat_mean = np.mean(flat_data)
-                    
-                    if flat_mean <= 0:
-                        raise ValueError("Flat frame mean is zero or negative after bias subtraction")
-                    
-                    flat_normalized = flat_data / flat_mean
-                    
-                    # Protect against division by very small values
-                    threshold = 0.1
-                    mask = flat_normalized < threshold
-                    if np.any(mask):
-                        logger.warning(f"Flat frame has {np.sum(mask)} pixels below threshold, clamping to {threshold}")
-                        flat_normalized = np.clip(flat_normalized, threshold, None)
-                    
-                    # Apply flat correction
-                    calibrated_data = calibrated_data / flat_normalized
-                    correction_note = "dark-corrected" if flat_corrected else "raw"
-                    calibration_steps.append(f"FLAT: {os.path.basename(flat_master)} ({correction_note}, mean: {flat_mean:.1f})")
-                    logger.debug(f"Applied flat correction, data range: [{np.min(calibrated_data):.2f}, {np.max(calibrated_data):.2f}]")
-                    
-            except Exception as e:
-                logger.error(f"Failed to apply flat correction: {e}")
-                if progress_callback:
-                    progress_callback(f"Warning: Failed to apply flat correction: {e}")
+        # Dark masters contain uncorrected bias signal, so the bias-corrected
+        # dark (Dark - Bias) and the flat normalized after subtracting it are
+        # prepared by CalibrationMasters; a session engine prepares them once.
+        if masters is None:
+            masters = CalibrationMasters.cached(dark_master, flat_master, bias_master)
+        calibrated_data, calibration_steps = masters.apply(light_data, progress_callback)
         
         # =================================================================
         # GENERATE OUTPUT PATH
@@ -273,11 +137,12 @@ def calibrate_light_frame(light_path: str, dark_master: Optional[str] = None,
         _update_calibrated_frame_header(
             light_header, 
             calibration_steps, 
-            bias_master, 
-            dark_master, 
-            flat_master, 
+            masters.bias_master, 
+            masters.dark_master, 
+            masters.flat_master, 
             calibrated_data, 
-            light_path
+            light_path,
+            master_checksums=masters.checksums
         )
         light_header['CALMETOD'] = 'Numpy'
         
@@ -288,12 +153,12 @@ def calibrate_light_frame(light_path: str, dark_master: Optional[str] = None,
         if progress_callback:
             progress_callback("Saving calibrated frame...")
             
-        # Calculate statistics for return
-        data_min = float(np.min(calibrated_data))
-        data_max = float(np.max(calibrated_data))
+        # Statistics for return (already computed for the header)
+        data_min = float(light_header['DATAMIN'])
+        data_max = float(light_header['DATAMAX'])
         data_range = data_max - data_min
-        data_mean = float(np.mean(calibrated_data))
-        data_std = float(np.std(calibrated_data))
+        data_mean = float(light_header['DATAMEAN'])
+        data_std = float(light_header['DATASTD'])
         
         logger.info(f"Calibrated data statistics: min={data_min:.2f}, max={data_max:.2f}, mean={data_mean:.2f}, range={data_range:.2f}")
         
@@ -302,11 +167,11 @@ def calibrate_light_frame(light_path: str, dark_master: Optional[str] = None,
         bzero_offset = 0.0
         if data_min < 0:
             bzero_offset = abs(data_min) + 100  # Add 100 ADU safety margin
-            calibrated_data = calibrated_data + bzero_offset
+            calibrated_data += bzero_offset
             logger.info(f"Applied BZERO offset of {bzero_offset:.2f} to shift negative values positive")
         
         # Save as float32 to preserve dynamic range while reducing file size
-        output_data = calibrated_data.astype(np.float32)
+        output_data = calibrated_data.astype(np.float32, copy=False)
         
         # Update BITPIX to indicate 32-bit float
         light_header['BITPIX'] = -32
@@ -393,62 +258,43 @@ def calibrate_session_lights(session_id: str, progress_callback: Optional[Callab
         error_count = 0
         results = []
         
-        for i, light_file in enumerate(light_files, 1):
-            if progress_callback:
-                progress_callback(f"Processing light frame {i}/{total_lights}: {os.path.basename(light_file.fitsFileName or '')}")
-                
+        to_calibrate = []
+        for light_file in light_files:
             # Check if already calibrated (unless forcing recalibration)
             if not force_recalibrate and light_file.fitsFileCalibrated == 1:
                 if progress_callback:
                     progress_callback(f"Skipping already calibrated: {os.path.basename(light_file.fitsFileName or '')}")
                 skipped_count += 1
                 continue
-                    
-            # Calibrate the light frame
-            result = calibrate_light_frame(
-                light_path=light_file.fitsFileName,
-                dark_master=master_frames['dark'],
-                flat_master=master_frames['flat'],
-                bias_master=master_frames['bias'],
-                progress_callback=progress_callback
-            )
-            
-            if result.get('success'):
-                calibrated_count += 1
-                
-                # Update database record with retry logic for locked database
-                max_retries = 5
-                retry_delay = 0.1  # seconds
-                db_updated = False
-                for attempt in range(max_retries):
-                    try:
-                        light_file.fitsFileCalibrated = 1
-                        light_file.fitsFileCalibrationDate = datetime.now()
-                        light_file.save()
-                        db_updated = True
-                        break  # Success, exit retry loop
-                    except Exception as e:
-                        if 'database is locked' in str(e).lower() and attempt < max_retries - 1:
-                            import time
-                            time.sleep(retry_delay * (attempt + 1))  # Exponential backoff
-                            logger.debug(f"Database locked, retrying ({attempt + 1}/{max_retries})...")
-                        else:
-                            logger.error(f"Failed to update database for calibrated file {light_file.fitsFileName} after {max_retries} retries: {e}")
-                            break
-                
-                if not db_updated:
-                    raise RuntimeError(f"Database update failed for {light_file.fitsFileName} after {max_retries} retry attempts")
-                
-                results.append({
-                    "light_file": os.path.basename(light_file.fitsFileName or ''),
-                    "output_file": os.path.basename(result['output_path']),
-                    "calibration_steps": result['calibration_steps'],
-                    "noise_level": result['noise_level']
-                })
-            else:
-                error_count += 1
+            to_calibrate.append(light_file)
+        
+        # Masters are loaded and prepared once for the whole session
+        calibrated_ids = []
+        with SessionCalibrationEngine(dark_master=master_frames['dark'],
+                                      flat_master=master_frames['flat'],
+                                      bias_master=master_frames['bias']) as engine:
+            light_paths = [light_file.fitsFileName for light_file in to_calibrate]
+            for i, (light_file, (_path, result)) in enumerate(
+                    zip(to_calibrate, engine.calibrate_files(light_paths)), 1):
                 if progress_callback:
-                    progress_callback(f"Error calibrating {os.path.basename(light_file.fitsFileName or '')}: {result.get('error', 'Unknown error')}")
+                    progress_callback(f"Processed light frame {i}/{len(to_calibrate)}: {os.path.basename(light_file.fitsFileName or '')}")
+                
+                if result.get('success'):
+                    calibrated_count += 1
+                    calibrated_ids.append(light_file.fitsFileId)
+                    results.append({
+                        "light_file": os.path.basename(light_file.fitsFileName or ''),
+                        "output_file": os.path.basename(result['output_path']),
+                        "calibration_steps": result['calibration_steps'],
+                        "noise_level": result['noise_level']
+                    })
+                else:
+                    error_count += 1
+                    if progress_callback:
+                        progress_callback(f"Error calibrating {os.path.basename(light_file.fitsFileName or '')}: {result.get('error', 'Unknown error')}")
+        
+        # Record calibration status in one batch
+        _mark_frames_calibrated(calibrated_ids)
                     
         if progress_callback:
             progress_callback(f"Calibration complete: {calibrated_count} processed, {skipped_count} skipped, {error_count} errors")
@@ -468,6 +314,35 @@ def calibrate_session_lights(session_id: str, progress_callback: Optional[Callab
         return {"error": f"Failed to calibrate session lights: {str(e)}"}
 
 
+def _mark_frames_calibrated(file_ids: List[str], max_retries: int = 5, retry_delay: float = 0.1) -> None:
+    """
+    Set fitsFileCalibrated and fitsFileCalibrationDate for calibrated frames in one transaction.
+    
+    Args:
+        file_ids (list): fitsFileId values of the calibrated light frames
+        max_retries (int): Attempts while the database is locked
+        retry_delay (float): Initial delay between attempts (seconds)
+        
+    Raises:
+        RuntimeError: If the database stays locked or the update fails
+    """
+    if not file_ids:
+        return
+    
+    calibration_date = datetime.now()
+
+    def mark() -> None:
+        # Chunked to stay within SQLite's bound-variable limit
+        for start in range(0, len(file_ids), 500):
+            chunk = file_ids[start:start + 500]
+            FitsFileModel.update(
+                fitsFileCalibrated=1,
+                fitsFileCalibrationDate=calibration_date
+            ).where(FitsFileModel.fitsFileId.in_(chunk)).execute()
+
+    run_with_db_retry(mark, f"{len(file_ids)} calibrated frames", max_retries, retry_delay)
+
+
 def get_session_master_frames(session_id: str) -> Dict[str, Optional[str]]:
     """
     Get the paths to master calibration frames for a session.
@@ -495,13 +370,15 @@ def get_session_master_frames(session_id: str) -> Dict[str, Optional[str]]:
                 (Masters.master_type == master_type) &
                 (Masters.telescope == criteria.get('telescope')) &
                 (Masters.instrument == criteria.get('instrument')) &
-                (Masters.binning_x == criteria.get('binning_x')) &
-                (Masters.binning_y == criteria.get('binning_y'))
+                numeric_match(Masters.binning_x, Masters.binning_x_value, criteria.get('binning_x')) &
+                numeric_match(Masters.binning_y, Masters.binning_y_value, criteria.get('binning_y'))
             )
             
             # Additional criteria for specific master types
             if master_type == 'dark':
-                master_query = master_query.where(Masters.exposure_time == criteria.get('exposure_time'))
+                master_query = master_query.where(
+                    numeric_match(Masters.exposure_time, Masters.exposure_time_value,
+                                  criteria.get('exposure_time')))
             elif master_type == 'flat':
                 master_query = master_query.where(Masters.filter_name == criteria.get('filter_name'))
             
@@ -521,7 +398,8 @@ def get_session_master_frames(session_id: str) -> Dict[str, Optional[str]]:
 
 def _update_calibrated_frame_header(header, calibration_steps: List[str], bias_master: Optional[str], 
                                    dark_master: Optional[str], flat_master: Optional[str], 
-                                   calibrated_data: np.ndarray, light_path: str) -> None:
+                                   calibrated_data: np.ndarray, light_path: str,
+                                   master_checksums: Optional[Dict[str, Optional[str]]] = None) -> None:
     """
     Update FITS header of calibrated light frame with comprehensive metadata.
     
@@ -540,7 +418,10 @@ def _update_calibrated_frame_header(header, calibration_steps: List[str], bias_m
         flat_master: Path to flat master (or None)
         calibrated_data: Calibrated image data array
         light_path: Original light frame path
+        master_checksums: Truncated MD5 per master type ('bias', 'dark', 'flat'),
+            computed from the master files when not given
     """
+    master_checksums = master_checksums or {}
     
     # =================================================================
     # PRIMARY CALIBRATION IDENTIFICATION
@@ -570,12 +451,9 @@ def _update_calibrated_frame_header(header, calibration_steps: List[str], bias_m
         header['BIASREF'] = (bias_master, 'Full path to master bias frame')
         
         # Add bias master hash for verification
-        try:
-            with open(bias_master, 'rb') as f:
-                bias_hash = hashlib.md5(f.read()).hexdigest()[:16]  # Truncate for FITS
+        bias_hash = master_checksums.get('bias') or master_checksum(bias_master)
+        if bias_hash:
             header['BIASMD5'] = (bias_hash, 'MD5 checksum of bias master (truncated)')
-        except:
-            pass
     
     if dark_master and os.path.exists(dark_master):
         master_count += 1
@@ -583,12 +461,9 @@ def _update_calibrated_frame_header(header, calibration_steps: List[str], bias_m
         header['DARKMAST'] = (os.path.basename(dark_master), 'Master dark frame filename')
         header['DARKREF'] = (dark_master, 'Full path to master dark frame')
         
-        try:
-            with open(dark_master, 'rb') as f:
-                dark_hash = hashlib.md5(f.read()).hexdigest()[:16]
+        dark_hash = master_checksums.get('dark') or master_checksum(dark_master)
+        if dark_hash:
             header['DARKMD5'] = (dark_hash, 'MD5 checksum of dark master (truncated)')
-        except:
-            pass
     
     if flat_master and os.path.exists(flat_master):
         master_count += 1
@@ -596,12 +471,9 @@ def _update_calibrated_frame_header(header, calibration_steps: List[str], bias_m
         header['FLATMAST'] = (os.path.basename(flat_master), 'Master flat frame filename')
         header['FLATREF'] = (flat_master, 'Full path to master flat frame')
         
-        try:
-            with open(flat_master, 'rb') as f:
-                flat_hash = hashlib.md5(f.read()).hexdigest()[:16]
+        flat_hash = master_checksums.get('flat') or master_checksum(flat_master)
+        if flat_hash:
             header['FLATMD5'] = (flat_hash, 'MD5 checksum of flat master (truncated)')
-        except:
-            pass
     
     # Summary information
     header['CALMAST'] = (master_count, 'Number of master frames used')
@@ -611,16 +483,16 @@ def _update_calibrated_frame_header(header, calibration_steps: List[str], bias_m
     # IMAGE STATISTICS AND QUALITY METRICS
     # =================================================================
     
-    # Calculate comprehensive statistics
+    # Calculate comprehensive statistics (sums accumulate in float64)
     header['DATAMIN'] = (float(np.min(calibrated_data)), 'Minimum pixel value after calibration')
     header['DATAMAX'] = (float(np.max(calibrated_data)), 'Maximum pixel value after calibration')
-    header['DATAMEAN'] = (float(np.mean(calibrated_data)), 'Mean pixel value after calibration')
+    header['DATAMEAN'] = (float(np.mean(calibrated_data, dtype=np.float64)), 'Mean pixel value after calibration')
     header['DATASTD'] = (float(np.std(calibrated_data)), 'Standard deviation after calibration')
-    header['DATAMEDIAN'] = (float(np.median(calibrated_data)), 'Median pixel value after calibration')
     
-    # Calculate percentiles for dynamic range assessment
+    # Median and percentiles for dynamic range assessment, from a single partition
     try:
-        p1, p99 = np.percentile(calibrated_data, [1, 99])
+        p1, median, p99 = np.percentile(calibrated_data, [1, 50, 99])
+        header['DATAMEDIAN'] = (float(median), 'Median pixel value after calibration')
         header['DATARANG'] = (float(p99 - p1), 'Dynamic range (99th - 1st percentile)')
         header['DATAP01'] = (float(p1), '1st percentile pixel value')
         header['DATAP99'] = (float(p99), '99th percentile pixel value')
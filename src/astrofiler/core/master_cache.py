@@ -0,0 +1,230 @@
+"""
+Process-wide LRU cache of decoded master calibration frames.
+
+A calibration workflow calibrates many sessions that usually share the same
+bias, dark and flat masters, and every session used to decode them from disk
+again. MasterFrameCache keeps decoded and pre-processed master arrays in
+memory, least recently used first out, within a byte budget
+('master_cache_mb' in astrofiler.ini, default 1024; 0 disables caching).
+
+Entries are keyed by the Masters record id plus the SHA-256 of the file, so
+a master that is rewritten on disk is decoded again rather than served
+stale. File hashes come from the persistent hash cache and are only
+recomputed when the file's size or mtime changes. Cached arrays are
+read-only; copy them before modifying.
+"""
+
+import os
+import logging
+import threading
+import configparser
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+import numpy as np
+
+from .services.file_hash_calculator import get_file_hash_calculator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MASTER_CACHE_MB = 1024
+
+
+def get_master_cache_budget(config_path: str = 'astrofiler.ini') -> int:
+    """
+    Get the memory budget of the master frame cache.
+
+    Reads 'master_cache_mb' from the DEFAULT section of astrofiler.ini.
+
+    Returns:
+        Budget in bytes (default 1024 MiB; 0 disables caching)
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    try:
+        budget_mb = config.getint('DEFAULT', 'master_cache_mb', fallback=DEFAULT_MASTER_CACHE_MB)
+    except ValueError:
+        budget_mb = DEFAULT_MASTER_CACHE_MB
+    return max(0, budget_mb) * 1024 * 1024
+
+
+class MasterFrameCache:
+    """Memory-bounded LRU cache with hit/miss counters. Thread-safe."""
+
+    def __init__(self, max_bytes: int) -> None:
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes: Total size of cached values in bytes (0 disables caching)
+        """
+        self.max_bytes = max(0, max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: 'OrderedDict[Hashable, Tuple[Any, int, Tuple[str, ...]]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def current_bytes(self) -> int:
+        """Bytes held by cached values."""
+        return self._bytes
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value for key (marking it recently used), or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, nbytes: int, paths: Iterable[str] = ()) -> None:
+        """
+        Cache value, evicting least recently used entries to stay within budget.
+
+        Values larger than the whole budget are not cached.
+
+        Args:
+            key: Cache key
+            value: Value to cache
+            nbytes: Memory held by value
+            paths: Master files the value was built from (see discard_path)
+        """
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            while self._entries and self._bytes + nbytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+            self._entries[key] = (value, nbytes, tuple(os.path.abspath(p) for p in paths))
+            self._bytes += nbytes
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Tuple[Any, int]],
+                    paths: Iterable[str] = ()) -> Any:
+        """
+        Return the cached value for key, loading and caching it on a miss.
+
+        Args:
+            key: Cache key
+            loader: Called on a miss; returns (value, nbytes)
+            paths: Master files the value is built from
+
+        Returns:
+            The cached or newly loaded value
+        """
+        value = self.get(key)
+        if value is None:
+            value, nbytes = loader()
+            self.put(key, value, nbytes, paths)
+        return value
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def discard_path(self, path: str) -> int:
+        """
+        Drop every entry built from the master file at path.
+
+        Returns:
+            Number of entries removed
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            keys = [key for key, (_value, _nbytes, paths) in self._entries.items() if path in paths]
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return entry count, memory use and hit/miss/eviction counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+def master_cache_key(master_path: str) -> Tuple[Any, str]:
+    """
+    Build the cache key of a master file.
+
+    Returns:
+        (Masters record id, or the absolute path if the file is not a
+        registered master, SHA-256 of the file)
+
+    Raises:
+        FileProcessingError: If the file cannot be hashed
+    """
+    record_id = None
+    try:
+        from ..models import Masters
+        record = (Masters.select(Masters.id)
+                  .where(Masters.master_path == master_path)
+                  .order_by(Masters.id.desc())
+                  .first())
+        record_id = record.id if record is not None else None
+    except Exception as e:
+        logger.debug(f"Masters lookup failed for {master_path}: {e}")
+    file_hash = get_file_hash_calculator().calculate_sha256(master_path)
+    return (record_id if record_id is not None else os.path.abspath(master_path)), file_hash
+
+
+def _decode_master(master_path: str) -> Tuple[np.ndarray, int]:
+    from .fits_access import read_fits_image
+
+    data, _header = read_fits_image(master_path, dtype=np.float32)
+    data.flags.writeable = False
+    return data, data.nbytes
+
+
+def load_master_array(master_path: str) -> np.ndarray:
+    """
+    Return the decoded image of a master frame as a read-only float32 array.
+
+    Args:
+        master_path: Path to the master FITS file
+
+    Raises:
+        ValueError: If the file has no image data
+        FileProcessingError: If the file cannot be hashed
+    """
+    key = ('array',) + master_cache_key(master_path)
+    return get_master_cache().get_or_load(key, lambda: _decode_master(master_path), (master_path,))
+
+
+_master_cache: Optional[MasterFrameCache] = None
+_master_cache_lock = threading.Lock()
+
+
+def get_master_cache() -> MasterFrameCache:
+    """Get the process-wide master frame cache."""
+    global _master_cache
+    if _master_cache is None:
+        with _master_cache_lock:
+            if _master_cache is None:
+                _master_cache = MasterFrameCache(get_master_cache_budget())
+    return _master_cache
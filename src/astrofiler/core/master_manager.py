@@ -13,8 +13,8 @@ If PySiril is not available, falls back to astropy-based simple averaging.
 """
 
 import os
+import errno
 import logging
-import hashlib
 import datetime
 import shutil
 import configparser
@@ -29,6 +29,11 @@ from typing import Optional, Dict, Any, List, Callable
 from ..models import Masters, fitsSession, fitsFile, db
 from ..config import get_temp_folder
 from .utils import fits_image_data
+from .fits_access import FitsImageReader, probe_fits_image, read_fits_image
+from .services.file_hash_calculator import get_file_hash_calculator
+from .stacking import BandStack, REJECTION_METHODS, combine_stack, get_stack_rejection_method
+from .alignment import RegistrationPool
+from .master_cache import get_master_cache, load_master_array
 
 logger = logging.getLogger(__name__)
 
@@ -46,6 +51,11 @@ except Exception as e:
     logger.warning(f"Could not configure SEP settings: {e}")
 
 
+def _is_file_limit_error(error: Exception) -> bool:
+    """True if error means the process ran out of file descriptors, not that a frame is bad."""
+    return isinstance(error, OSError) and error.errno in (errno.EMFILE, errno.ENFILE)
+
+
 def configure_sep_for_crowded_fields() -> bool:
     """Raise the SEP sub-object limit to handle very crowded star fields."""
     try:
@@ -180,17 +190,14 @@ class MasterFrameManager:
             if not session_id:
                 return None
 
-            from astropy.io import fits
             import numpy as np
             from PIL import Image
 
-            with fits.open(stacked_fits_path) as hdul:
-                data, _ = fits_image_data(hdul)
-            if data is None:
+            try:
+                arr, _header = read_fits_image(stacked_fits_path)
+            except ValueError:
                 return None
 
-            arr = np.asarray(data)
-
             # Normalize to 2D grayscale for thumbnailing.
             if arr.ndim == 3:
                 # Common FITS conventions are (C,H,W) or (H,W,C)
@@ -302,10 +309,26 @@ class MasterFrameManager:
             logger.error(f"Error finding matching master: {e}")
             return None
     
+    def load_master_data(self, master: Masters):
+        """
+        Get the decoded image of a master frame through the master cache.
+        
+        Args:
+            master: Master frame record
+            
+        Returns:
+            Read-only float32 array; copy it before modifying
+            
+        Raises:
+            ValueError: If the master file has no image data
+        """
+        return load_master_array(master.master_path)
+    
     def create_master_from_session(self, session_id: str, cal_type: str, 
                                  min_files: int = 2, 
                                  progress_callback: Optional[Callable] = None,
-                                 verbose: bool = False) -> Optional[Masters]:
+                                 verbose: bool = False,
+                                 rejection: Optional[str] = None) -> Optional[Masters]:
         """
         Create a master calibration frame from a session's files using advanced Siril integration.
         
@@ -315,6 +338,7 @@ class MasterFrameManager:
             min_files: Minimum number of files required
             progress_callback: Progress reporting function
             verbose: Enable verbose output showing which files are used
+            rejection: Pixel rejection method (None reads 'stack_rejection')
             
         Returns:
             Created master frame record or None if creation failed
@@ -388,7 +412,8 @@ class MasterFrameManager:
                 progress_callback(20, 100, "Creating master frame with internal stacking...")
             
             # Create master frame using internal sigma-clipped stacking
-            success = self._create_master_sigma_clip(file_paths, output_path, cal_type, progress_callback)
+            success = self._create_master_sigma_clip(file_paths, output_path, cal_type, progress_callback,
+                                                     rejection=rejection)
             
             if not success or not os.path.exists(output_path):
                 logger.error(f"Failed to create master {cal_type} frame")
@@ -461,6 +486,8 @@ class MasterFrameManager:
         progress_callback: Optional[Callable] = None,
         reference_path: Optional[str] = None,
         thumbnail_session_id: Optional[str] = None,
+        rejection: Optional[str] = None,
+        frame_weights: Optional[Dict[str, float]] = None,
     ) -> bool:
         """
         Create master frame using sigma-clipped averaging (internal implementation).
@@ -470,6 +497,10 @@ class MasterFrameManager:
             output_path: Output path for master frame
             cal_type: Type of calibration
             progress_callback: Progress reporting function
+            rejection: Pixel rejection method, a key of REJECTION_METHODS
+                (None reads 'stack_rejection', default 'sigma')
+            frame_weights: Optional per-path weights for the mean (see
+                frame_weighting.select_stack_frames); missing paths weigh 1
             
         Returns:
             True if successful, False otherwise
@@ -491,46 +522,19 @@ class MasterFrameManager:
             if progress_callback:
                 progress_callback(25, 100, f"Loading {len(file_paths)} {cal_type} frames...")
 
-            def _extract_image_hdu(hdul):
-                """Return the first HDU with 2D image data, or None."""
-                for hdu in hdul:
-                    data = getattr(hdu, 'data', None)
-                    if data is None:
-                        continue
-                    arr = np.asarray(data)
-                    # Some writers store a single plane as (1, H, W)
-                    if arr.ndim == 3 and arr.shape[0] == 1:
-                        arr = arr[0]
-                    if arr.ndim != 2:
-                        continue
-                    return hdu, arr
-                return None, None
-
-            def _read_fits_image(file_path: str):
-                """Read a FITS image, handling data-in-extension FITS files.
-
-                Returns (data, header). Header is taken from the image HDU when
-                available; falls back to primary header.
-                """
-                with fits.open(file_path) as hdul:
-                    primary_header = hdul[0].header.copy()
-                    hdu, data = _extract_image_hdu(hdul)
-                    if data is None:
-                        raise ValueError("No 2D image data found in any HDU")
-                    header = getattr(hdu, 'header', None)
-                    return data, (header.copy() if header is not None else primary_header)
-
-            # Find the first readable frame to get dimensions and dtype
+            # Find the first readable frame to get dimensions and dtype (headers only)
             header = None
             data_shape = None
             dtype = None
             first_data_file = None
             for candidate_path in file_paths:
                 try:
-                    data0, header0 = _read_fits_image(candidate_path)
-                    header = header0
-                    data_shape = data0.shape
-                    dtype = data0.dtype
+                    info = probe_fits_image(candidate_path)
+                    if info is None or not info.is_2d:
+                        raise ValueError("No 2D image data found in any HDU")
+                    header = info.header
+                    data_shape = info.image_shape
+                    dtype = info.dtype
                     first_data_file = candidate_path
                     logger.info(f"Frame dimensions: {data_shape}, dtype: {dtype}")
                     break
@@ -557,295 +561,91 @@ class MasterFrameManager:
 
                 candidate = reference_path if (reference_path and os.path.exists(reference_path)) else first_data_file
                 ref_path = candidate
-                ref_data, ref_header0 = _read_fits_image(candidate)
-                ref_full = ref_data.astype(np.float32, copy=False)
-                ref_header = ref_header0
-
-            def _is_astroalign_maxiter_error(exc: Exception) -> bool:
-                max_iter_error = getattr(aa, 'MaxIterError', None) if aa is not None else None
-                if max_iter_error is not None:
-                    try:
-                        if isinstance(exc, max_iter_error):
-                            return True
-                    except Exception:
-                        pass
-                return exc.__class__.__name__ == 'MaxIterError'
-
-            def _register_to_reference(data: np.ndarray, file_path: str) -> np.ndarray:
-                """Register a light frame to the reference frame using astroalign."""
-                if not is_light_stack or aa is None or ref_full is None:
-                    return data
-                if ref_path is not None and os.path.abspath(file_path) == os.path.abspath(ref_path):
-                    return data
+                ref_full, ref_header = read_fits_image(candidate, dtype=np.float32)
 
-                try:
-                    aligned, footprint = aa.register(data.astype(np.float32, copy=False), ref_full, fill_value=np.nan)
-                    aligned = aligned.astype(np.float32, copy=False)
-                    if footprint is not None:
-                        aligned = aligned.copy()
-                        aligned[footprint] = np.nan
-                    return aligned
-                except Exception as e:
-                    # SEP deblending overflow causes astroalign to raise TypeError
-                    # ("Input type for target not supported"). Retry once with a
-                    # higher sub-object limit before falling back to unaligned stacking.
-                    if ("deblending overflow" in str(e) or "sub-objects reached" in str(e) or
-                            "object deblending overflow" in str(e)):
-                        try:
-                            import sep as _sep
-                            _orig_limit = _sep.get_sub_object_limit()
-                            _sep.set_sub_object_limit(_orig_limit * 4)
-                            logger.info(
-                                "Increased SEP sub-object limit to %d for %s",
-                                _sep.get_sub_object_limit(),
-                                os.path.basename(file_path),
-                            )
-                            try:
-                                aligned, footprint = aa.register(
-                                    data.astype(np.float32, copy=False), ref_full, fill_value=np.nan
-                                )
-                                aligned = aligned.astype(np.float32, copy=False)
-                                if footprint is not None:
-                                    aligned = aligned.copy()
-                                    aligned[footprint] = np.nan
-                                return aligned
-                            finally:
-                                _sep.set_sub_object_limit(_orig_limit)
-                        except ImportError:
-                            pass
-                        except Exception as retry_e:
-                            e = retry_e  # Fall through with the retry error
-
-                    # Fall back for any registration failure we can recover from.
-                    should_fallback = (
-                        _is_astroalign_maxiter_error(e) or
-                        isinstance(e, TypeError) or
-                        "Input type for target not supported" in str(e) or
-                        "deblending overflow" in str(e) or
-                        "sub-objects reached" in str(e) or
-                        "object deblending overflow" in str(e)
-                    )
-                    if should_fallback:
-                        def _try_wcs_reproject() -> Optional[np.ndarray]:
-                            if ref_header is None or ref_full is None:
-                                return None
-                            if data.ndim != 2 or ref_full.ndim != 2:
-                                return None
-                            try:
-                                from astropy.wcs import WCS
-                                from astropy.wcs import FITSFixedWarning
-                                import warnings
-
-                                warnings.filterwarnings('ignore', category=FITSFixedWarning)
-                            except Exception:
-                                return None
-
-                            try:
-                                from reproject import reproject_interp  # type: ignore
-                            except Exception:
-                                return None
-
-                            try:
-                                with fits.open(file_path) as hdul:
-                                    hdu, _data = _extract_image_hdu(hdul)
-                                    if hdu is not None and getattr(hdu, 'header', None) is not None:
-                                        src_header = hdu.header
-                                    else:
-                                        src_header = hdul[0].header
-
-                                src_wcs = WCS(src_header)
-                                dst_wcs = WCS(ref_header)
-                                if not (getattr(src_wcs, 'has_celestial', False) and getattr(dst_wcs, 'has_celestial', False)):
-                                    return None
-
-                                reproj, footprint = reproject_interp(
-                                    (data.astype(np.float32, copy=False), src_wcs),
-                                    dst_wcs,
-                                    shape_out=ref_full.shape,
-                                    order='bilinear',
-                                )
-
-                                aligned = np.asarray(reproj, dtype=np.float32)
-                                if footprint is not None:
-                                    aligned = aligned.copy()
-                                    aligned[np.asarray(footprint) <= 0] = np.nan
-                                return aligned
-                            except Exception:
-                                return None
-
-                        aligned_wcs = _try_wcs_reproject()
-                        if aligned_wcs is not None:
-                            logger.warning(
-                                "Star registration failed for %s: %s. Used WCS reprojection fallback.",
-                                os.path.basename(file_path),
-                                e,
-                            )
-                            return aligned_wcs
-
-                        logger.warning(
-                            "Star registration failed for %s: %s. Proceeding without alignment for this frame.",
-                            os.path.basename(file_path),
-                            e,
-                        )
-                        return data.astype(np.float32, copy=False)
-                    raise
-            
             if progress_callback:
-                progress_callback(30, 100, "Computing statistics (pass 1/2)...")
-            
-            # Streaming approach using chunked processing
-            # Determine optimal chunk size based on available memory
-            # Process frames in chunks small enough to fit in memory
-            max_chunk_size = min(20, len(file_paths))  # Process up to 20 frames at a time
-            
-            valid_files = []
-            frame_medians = []
-            
-            # First pass: validate files and compute frame medians for flats
-            logger.info("Pass 1: Validating files and computing frame medians...")
-            for i, file_path in enumerate(file_paths):
-                try:
-                    data = None
-                    try:
-                        data, _hdr = _read_fits_image(file_path)
-                    except Exception as e:
-                        logger.warning(f"Skipping corrupted/unreadable file {file_path}: {e}")
-                        continue
+                progress_callback(30, 100, "Opening frames...")
+
+            # Open every frame once; dimensions are checked from the headers.
+            # Bias/dark/flat frames are read in row bands, and flats are normalized
+            # by a median estimated from a strided subsample. Lights are registered
+            # once (in worker processes) and spilled to a float32 memory-mapped file.
+            # Sorting makes the result independent of the input order.
+            n_inputs = len(file_paths)
+            with BandStack(data_shape, spill_dir=get_temp_folder()) as stack:
+                if is_light_stack:
+                    pool = RegistrationPool(ref_path, ref_full, ref_header)
+                    for i, (file_path, aligned) in enumerate(pool.align_files(sorted(file_paths), data_shape)):
+                        if aligned is not None:
+                            stack.add_array(file_path, aligned)
+                        if progress_callback:
+                            progress = 30 + int((i + 1) / n_inputs * 30)
+                            progress_callback(progress, 100, f"Registering: {i+1}/{n_inputs} frames...")
+                else:
+                    for i, file_path in enumerate(sorted(file_paths)):
+                        try:
+                            reader = FitsImageReader(file_path)
+                            if reader.image_shape != data_shape:
+                                reader.close()
+                                logger.warning(f"Skipping file with different dimensions: {file_path}")
+                                continue
+                            scale = 1.0
+                            if cal_type == 'flat':
+                                # Normalization median from a strided subsample, not a full decode
+                                try:
+                                    frame_median = float(np.nanmedian(reader.read_subsample()))
+                                except Exception:
+                                    reader.close()
+                                    raise
+                                if not np.isfinite(frame_median) or frame_median == 0:
+                                    reader.close()
+                                    logger.warning(f"Skipping flat with unusable median {frame_median}: {file_path}")
+                                    continue
+                                scale = 1.0 / frame_median
+                            stack.add_reader(reader, scale=scale)
+                        except RuntimeError:
+                            raise
+                        except Exception as e:
+                            if _is_file_limit_error(e):
+                                raise
+                            logger.warning(f"Skipping corrupted/unreadable file {file_path}: {e}")
+                            continue
 
-                    if data.shape != data_shape:
-                        logger.warning(f"Skipping file with different dimensions: {file_path}")
-                        continue
+                        if (i + 1) % 10 == 0 and progress_callback:
+                            progress = 30 + int((i + 1) / n_inputs * 30)
+                            progress_callback(progress, 100, f"Opening: {i+1}/{n_inputs} files...")
 
-                    valid_files.append(file_path)
-                    if cal_type == 'flat':
-                        frame_medians.append(float(np.median(data)))
-                    
-                    if (i + 1) % 10 == 0 and progress_callback:
-                        progress = 30 + int((i + 1) / len(file_paths) * 10)
-                        progress_callback(progress, 100, f"Validating: {i+1}/{len(file_paths)} files...")
-                except RuntimeError:
-                    raise
-                except Exception as e:
-                    logger.warning(f"Skipping corrupted file {file_path}: {e}")
-                    continue
-            
-            if not valid_files:
-                logger.error("No valid frames loaded")
-                return False
-            
-            n_frames = len(valid_files)
-            logger.info(f"Processing {n_frames} valid frames")
-            
-            if progress_callback:
-                progress_callback(40, 100, "Computing sigma clipping bounds...")
-            
-            # Compute median and std using chunked processing
-            logger.info(f"Computing statistics in chunks of {max_chunk_size} frames...")
-            median = None
-            M2 = None  # For Welford's online variance algorithm
-            
-            for chunk_start in range(0, n_frames, max_chunk_size):
-                chunk_end = min(chunk_start + max_chunk_size, n_frames)
-                chunk_files = valid_files[chunk_start:chunk_end]
-                
-                # Load chunk into memory
-                chunk_data = []
-                for file_path in chunk_files:
-                    data, _hdr = _read_fits_image(file_path)
-                    data = data.astype(np.float32, copy=False)
-                    if is_light_stack and ref_full is not None:
-                        data = _register_to_reference(data, file_path)
-                    chunk_data.append(data)
-                
-                chunk_array = np.array(chunk_data)
-                
-                # Update running statistics
-                if median is None:
-                    median = np.median(chunk_array, axis=0)
-                    M2 = np.sum((chunk_array - median[np.newaxis, ...]) ** 2, axis=0)
-                else:
-                    # Combine statistics from chunks
-                    chunk_median = np.median(chunk_array, axis=0)
-                    median = (median + chunk_median) / 2  # Approximate for speed
-                    M2 += np.sum((chunk_array - median[np.newaxis, ...]) ** 2, axis=0)
-                
-                del chunk_data, chunk_array
-                
-                if progress_callback:
-                    progress = 40 + int((chunk_end / n_frames) * 20)
-                    progress_callback(progress, 100, f"Statistics: {chunk_end}/{n_frames} frames...")
-            
-            std = np.sqrt(M2 / n_frames)
-            del M2
-            
-            # Sigma clipping parameters
-            sigma_low = 3.0
-            sigma_high = 3.0
-            lower_bound = median - sigma_low * std
-            upper_bound = median + sigma_high * std
-            
-            logger.info("Sigma clipping bounds computed")
-            
-            if progress_callback:
-                progress_callback(60, 100, f"Combining {n_frames} frames with sigma clipping (pass 2/2)...")
-            
-            # Pass 2 - Accumulate with sigma clipping
-            logger.info("Pass 2: Combining frames with sigma clipping...")
-            accumulator = np.zeros(data_shape, dtype=np.float32)
-            count = np.zeros(data_shape, dtype=np.uint16)
-            rejected_pixels = 0
-            total_pixels = 0
-            
-            for i, file_path in enumerate(valid_files):
-                try:
-                    data, _hdr = _read_fits_image(file_path)
-                    data = data.astype(np.float32, copy=False)
+                if not len(stack):
+                    logger.error("No valid frames loaded")
+                    return False
 
-                    # For light stacks, register stars to the reference frame
-                    if is_light_stack and ref_full is not None:
-                        data = _register_to_reference(data, file_path)
+                n_frames = len(stack)
+                logger.info(f"Processing {n_frames} valid frames")
 
-                    # Apply flat normalization if needed
-                    if cal_type == 'flat':
-                        data = data / frame_medians[i]
+                # Rejection parameters
+                method = rejection or get_stack_rejection_method()
+                sigma_low = 3.0
+                sigma_high = 3.0
 
-                    # Apply sigma clipping mask
-                    mask = np.isfinite(data) & (data >= lower_bound) & (data <= upper_bound)
+                if progress_callback:
+                    progress_callback(60, 100, f"Combining {n_frames} frames ({method} rejection)...")
 
-                    # Accumulate valid pixels
-                    accumulator += np.where(mask, data, 0)
-                    count += mask.astype(np.uint16)
+                def _band_progress(rows_done: int, total_rows: int) -> None:
+                    if progress_callback:
+                        progress_callback(60 + int(rows_done / total_rows * 20), 100,
+                                          f"Combining: {rows_done}/{total_rows} rows...")
+
+                weights = None
+                if frame_weights:
+                    weights = np.array([frame_weights.get(p, 1.0) for p in stack.paths], dtype=np.float64)
+
+                master_data, rejected_pixels, total_pixels = combine_stack(
+                    stack, method, weights=weights, progress=_band_progress,
+                    sigma_low=sigma_low, sigma_high=sigma_high)
 
-                    rejected_pixels += np.sum(~mask)
-                    total_pixels += data.size
-                    
-                    if (i + 1) % 5 == 0 and progress_callback:
-                        progress = 60 + int((i + 1) / n_frames * 20)
-                        progress_callback(progress, 100, f"Pass 2: {i+1}/{n_frames} frames...")
-                        
-                except RuntimeError:
-                    raise
-                except Exception as e:
-                    logger.warning(f"Error processing {file_path}: {e}")
-                    continue
-            
             rejection_rate = (rejected_pixels / total_pixels) * 100 if total_pixels > 0 else 0
-            logger.info(f"Sigma clipping: {rejected_pixels}/{total_pixels} pixels rejected ({rejection_rate:.3f}%)")
-            
-            if progress_callback:
-                progress_callback(80, 100, "Computing final master frame...")
-            
-            # Compute final master without triggering divide-by-zero warnings.
-            # Note: np.where would still evaluate (accumulator / count) for all pixels.
-            master_data = np.empty_like(accumulator, dtype=np.float32)
-            np.divide(accumulator, count, out=master_data, where=(count > 0))
-            if median is not None:
-                master_data[count == 0] = median[count == 0] if hasattr(median, 'shape') else median
+            logger.info(f"Pixel rejection ({method}): {rejected_pixels}/{total_pixels} pixels rejected ({rejection_rate:.3f}%)")
 
-            # Replace any remaining NaN/Inf (e.g. from pathological inputs) with median.
-            if median is not None:
-                master_data = np.where(np.isfinite(master_data), master_data, median)
-            
             if cal_type == 'flat':
                 logger.info("Applied multiplicative normalization for flat frames")
             else:
@@ -858,8 +658,10 @@ class MasterFrameManager:
             header['HISTORY'] = f'Master {cal_type} created from {n_frames} files'
             header['NFILES'] = n_frames
             header['CREATOR'] = 'AstroFiler Internal Stacking'
-            header['METHOD'] = f'Sigma-clipped mean (sigma_low={sigma_low}, sigma_high={sigma_high})'
+            header['METHOD'] = REJECTION_METHODS[method][1]
+            header['REJECT'] = (method, 'Pixel rejection method')
             header['REJECTED'] = f'{rejection_rate:.3f}%'
+            header['WEIGHTED'] = (weights is not None, 'Frames weighted by stored quality metrics')
             header['DATE'] = datetime.datetime.now().isoformat()
             
             # Convert to appropriate dtype (preserve as uint16 for most cases, float32 for flats)
@@ -900,12 +702,15 @@ class MasterFrameManager:
         progress_callback: Optional[Callable] = None,
         reference_path: Optional[str] = None,
         thumbnail_session_id: Optional[str] = None,
+        frame_weights: Optional[Dict[str, float]] = None,
     ) -> bool:
         """Create a photometry-safe light stack.
 
         This uses star registration (astroalign) and a NaN-aware mean combine.
         It intentionally performs no sigma clipping / outlier rejection and
-        writes float32 output to preserve linearity for photometry.
+        writes float32 output to preserve linearity for photometry. If
+        frame_weights is given (per path, missing paths weigh 1) the mean is
+        weighted, which is still linear in flux.
         """
         try:
             from astropy.io import fits
@@ -934,154 +739,26 @@ class MasterFrameManager:
             if progress_callback:
                 progress_callback(0, 100, f"Loading {len(file_paths)} light frames...")
 
-            with fits.open(file_paths[0]) as hdul:
-                _d0, header = fits_image_data(hdul)
-                header = header.copy()
-                data_shape = _d0.shape
+            info = probe_fits_image(file_paths[0])
+            if info is None or not info.is_2d:
+                logger.error("No 2D image data found in %s", file_paths[0])
+                return False
+            header = info.header
+            data_shape = info.image_shape
 
             # Prepare reference
             candidate = reference_path if (reference_path and os.path.exists(reference_path)) else file_paths[0]
             ref_path = candidate
-            with fits.open(candidate) as hdul:
-                _ref_d, _ref_h = fits_image_data(hdul)
-                ref_full = _ref_d.astype(np.float32)
-                ref_header = _ref_h.copy()
-
-            def _is_astroalign_maxiter_error(exc: Exception) -> bool:
-                max_iter_error = getattr(aa, 'MaxIterError', None)
-                if max_iter_error is not None:
-                    try:
-                        if isinstance(exc, max_iter_error):
-                            return True
-                    except Exception:
-                        pass
-                return exc.__class__.__name__ == 'MaxIterError'
-
-            def _register_to_reference(data: np.ndarray, file_path: str) -> np.ndarray:
-                if os.path.abspath(file_path) == os.path.abspath(ref_path):
-                    return data.astype(np.float32, copy=False)
-                try:
-                    aligned, footprint = aa.register(
-                        data.astype(np.float32, copy=False),
-                        ref_full,
-                        fill_value=np.nan,
-                    )
-                    aligned = aligned.astype(np.float32, copy=False)
-                    if footprint is not None:
-                        aligned = aligned.copy()
-                        aligned[footprint] = np.nan
-                    return aligned
-                except Exception as e:
-                    # SEP deblending overflow causes astroalign to raise TypeError
-                    # ("Input type for target not supported"). Retry once with a
-                    # higher sub-object limit before falling back to unaligned stacking.
-                    if ("deblending overflow" in str(e) or "sub-objects reached" in str(e) or
-                            "object deblending overflow" in str(e)):
-                        try:
-                            import sep as _sep
-                            _orig_limit = _sep.get_sub_object_limit()
-                            _sep.set_sub_object_limit(_orig_limit * 4)
-                            logger.info(
-                                "Increased SEP sub-object limit to %d for %s",
-                                _sep.get_sub_object_limit(),
-                                os.path.basename(file_path),
-                            )
-                            try:
-                                aligned, footprint = aa.register(
-                                    data.astype(np.float32, copy=False),
-                                    ref_full,
-                                    fill_value=np.nan,
-                                )
-                                aligned = aligned.astype(np.float32, copy=False)
-                                if footprint is not None:
-                                    aligned = aligned.copy()
-                                    aligned[footprint] = np.nan
-                                return aligned
-                            finally:
-                                _sep.set_sub_object_limit(_orig_limit)
-                        except ImportError:
-                            pass
-                        except Exception as retry_e:
-                            e = retry_e  # Fall through with the retry error
-
-                    # Fall back for any registration failure we can recover from.
-                    should_fallback = (
-                        _is_astroalign_maxiter_error(e) or
-                        isinstance(e, TypeError) or
-                        "Input type for target not supported" in str(e) or
-                        "deblending overflow" in str(e) or
-                        "sub-objects reached" in str(e) or
-                        "object deblending overflow" in str(e)
-                    )
-                    if should_fallback:
-                        def _try_wcs_reproject() -> Optional[np.ndarray]:
-                            if ref_full is None:
-                                return None
-                            if data.ndim != 2 or ref_full.ndim != 2:
-                                return None
-                            try:
-                                from astropy.wcs import WCS
-                                from astropy.wcs import FITSFixedWarning
-                                import warnings
-
-                                warnings.filterwarnings('ignore', category=FITSFixedWarning)
-                            except Exception:
-                                return None
-
-                            try:
-                                from reproject import reproject_interp  # type: ignore
-                            except Exception:
-                                return None
-
-                            try:
-                                with fits.open(file_path) as hdul:
-                                    _, src_header = fits_image_data(hdul)
-                                src_wcs = WCS(src_header)
-                                dst_wcs = WCS(ref_header)
-                                if not (getattr(src_wcs, 'has_celestial', False) and getattr(dst_wcs, 'has_celestial', False)):
-                                    return None
-
-                                reproj, footprint = reproject_interp(
-                                    (data.astype(np.float32, copy=False), src_wcs),
-                                    dst_wcs,
-                                    shape_out=ref_full.shape,
-                                    order='bilinear',
-                                )
-
-                                aligned = np.asarray(reproj, dtype=np.float32)
-                                if footprint is not None:
-                                    aligned = aligned.copy()
-                                    aligned[np.asarray(footprint) <= 0] = np.nan
-                                return aligned
-                            except Exception:
-                                return None
-
-                        aligned_wcs = _try_wcs_reproject()
-                        if aligned_wcs is not None:
-                            logger.warning(
-                                "Star registration failed for %s: %s. Used WCS reprojection fallback.",
-                                os.path.basename(file_path),
-                                e,
-                            )
-                            return aligned_wcs
-
-                        logger.warning(
-                            "Star registration failed for %s: %s. Proceeding without alignment for this frame.",
-                            os.path.basename(file_path),
-                            e,
-                        )
-                        return data.astype(np.float32, copy=False)
-                    raise
-
-            # Validate and stream accumulate
+            ref_full, ref_header = read_fits_image(candidate, dtype=np.float32)
+
+            # Validate from the headers only, then stream accumulate
             valid_files: List[str] = []
             for i, file_path in enumerate(file_paths):
                 try:
-                    with fits.open(file_path) as hdul:
-                        _fd, _ = fits_image_data(hdul)
-                        if _fd is None or _fd.shape != data_shape:
-                            logger.warning("Skipping file with different dimensions: %s", file_path)
-                            continue
+                    frame_info = probe_fits_image(file_path)
+                    if frame_info is None or not frame_info.is_2d or frame_info.image_shape != data_shape:
+                        logger.warning("Skipping file with different dimensions: %s", file_path)
+                        continue
                     valid_files.append(file_path)
                 except Exception as e:
                     logger.warning("Skipping corrupted file %s: %s", file_path, e)
@@ -1094,16 +771,18 @@ class MasterFrameManager:
                 return False
 
             accumulator = np.zeros(data_shape, dtype=np.float64)
-            count = np.zeros(data_shape, dtype=np.uint16)
+            count = np.zeros(data_shape, dtype=np.float64)
 
-            for i, file_path in enumerate(valid_files):
-                with fits.open(file_path) as hdul:
-                    _fd, _ = fits_image_data(hdul)
-                    data = _fd.astype(np.float32)
-                data = _register_to_reference(data, file_path)
+            stacked = 0
+            pool = RegistrationPool(ref_path, ref_full, ref_header)
+            for i, (file_path, data) in enumerate(pool.align_files(valid_files, data_shape)):
+                if data is None:
+                    continue
+                stacked += 1
+                weight = frame_weights.get(file_path, 1.0) if frame_weights else 1.0
                 mask = np.isfinite(data)
-                accumulator += np.where(mask, data, 0.0).astype(np.float64, copy=False)
-                count += mask.astype(np.uint16)
+                accumulator += np.where(mask, data, 0.0).astype(np.float64, copy=False) * weight
+                count += mask * weight
 
                 if progress_callback and (i + 1) % 2 == 0:
                     progress = 10 + int(((i + 1) / len(valid_files)) * 80)
@@ -1113,10 +792,10 @@ class MasterFrameManager:
             valid = count > 0
             mean[valid] = (accumulator[valid] / count[valid]).astype(np.float32)
 
-            header['HISTORY'] = f'Photometric light stack created from {len(valid_files)} files'
-            header['NFILES'] = len(valid_files)
+            header['HISTORY'] = f'Photometric light stack created from {stacked} files'
+            header['NFILES'] = stacked
             header['CREATOR'] = 'AstroFiler Photometric Stacking'
-            header['METHOD'] = 'Registered mean (no clipping)'
+            header['METHOD'] = 'Registered weighted mean (no clipping)' if frame_weights else 'Registered mean (no clipping)'
             header['REFPATH'] = os.path.basename(ref_path)
             header['DATE'] = datetime.datetime.now().isoformat()
 
@@ -1160,34 +839,36 @@ class MasterFrameManager:
                 return False
             
             # Read first file to get dimensions and header
-            with fits.open(file_paths[0]) as hdul:
-                _d0, _h0 = fits_image_data(hdul)
-                header = _h0.copy()
-                data_shape = _d0.shape
-                data_stack = np.zeros((len(file_paths), *data_shape), dtype=np.float32)
-                data_stack[0] = _d0.astype(np.float32)
-            
-            # Read remaining files
-            for i, file_path in enumerate(file_paths[1:], 1):
-                try:
-                    with fits.open(file_path) as hdul:
-                        _fd, _ = fits_image_data(hdul)
-                        data_stack[i] = _fd.astype(np.float32)
-                except Exception as e:
-                    logger.warning(f"Skipping corrupted file {file_path}: {e}")
-                    continue
-            
-            # Calculate average
-            master_data = np.mean(data_stack, axis=0)
-            
+            info = probe_fits_image(file_paths[0])
+            if info is None:
+                logger.error("No image data found in %s", file_paths[0])
+                return False
+            header = info.header
+            data_shape = info.image_shape
+
+            # Average band by band instead of holding every frame in memory
+            with BandStack(data_shape, spill_dir=get_temp_folder()) as stack:
+                for file_path in file_paths:
+                    try:
+                        stack.add_file(file_path)
+                    except Exception as e:
+                        if _is_file_limit_error(e):
+                            raise
+                        logger.warning(f"Skipping corrupted file {file_path}: {e}")
+                        continue
+                n_frames = len(stack)
+                if not n_frames:
+                    return False
+                master_data, _rejected, _total = combine_stack(stack, 'none')
+
             # Update header
-            header['HISTORY'] = f'Created master frame from {len(file_paths)} files'
-            header['NFILES'] = len(file_paths)
+            header['HISTORY'] = f'Created master frame from {n_frames} files'
+            header['NFILES'] = n_frames
             header['CREATOR'] = 'AstroFiler Master Frame Manager'
             header['DATE'] = datetime.datetime.now().isoformat()
             
             # Save master frame
-            hdu = fits.PrimaryHDU(data=master_data.astype(np.uint16), header=header)
+            hdu = fits.PrimaryHDU(data=np.clip(master_data, 0, 65535).astype(np.uint16), header=header)
             hdu.writeto(output_path, overwrite=True)
             
             logger.info(f"Created simple average master frame: {output_path}")
@@ -1391,6 +1072,7 @@ class MasterFrameManager:
                     
                     # Get file size before deletion
                     file_size = 0
+                    get_master_cache().discard_path(master.master_path)
                     if os.path.exists(master.file_path):
                         file_size = os.path.getsize(master.file_path)
                         os.remove(master.file_path)
@@ -1473,7 +1155,8 @@ class MasterFrameManager:
                 'avg_frame_count': 0,
                 'validation_status': {},
                 'creation_dates': [],
-                'avg_quality': 0
+                'avg_quality': 0,
+                'cache': get_master_cache().stats()
             }
             
             masters = list(Masters.select())
@@ -1537,13 +1220,9 @@ class MasterFrameManager:
             return {}
     
     def _calculate_file_hash(self, file_path: str) -> str:
-        """Calculate SHA-256 hash of a file."""
+        """Calculate SHA-256 hash of a file, always reading it (used to detect corruption)."""
         try:
-            hash_sha256 = hashlib.sha256()
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_sha256.update(chunk)
-            return hash_sha256.hexdigest()
+            return get_file_hash_calculator().calculate_sha256(file_path, use_cache=False)
         except Exception as e:
             logger.error(f"Error calculating hash for {file_path}: {e}")
             return ""
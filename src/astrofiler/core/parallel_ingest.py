@@ -0,0 +1,247 @@
+"""
+Parallel ingest engine for AstroFiler.
+
+Registration of a FITS file is split into two stages:
+
+- Preparation (FileProcessor.prepare_fits_image): format conversion, header
+  parsing and fixes, compression and hashing. These are CPU/IO heavy and run
+  on a pool of worker threads.
+- Commit (FileProcessor.queue_prepared_image): repository move and database
+  insert. These run on a single writer thread - the thread that calls run() -
+  so SQLite only ever sees one writer and progress callbacks are invoked from
+  the caller's thread (which keeps Qt progress dialogs safe). Inserts go
+  through a BatchedRegistrationWriter, so many files share one transaction.
+
+With 'ingest_quality' enabled, preparation also queues a quality analysis of
+each light frame (see IngestQualityStage); the metrics of all analyzed frames
+are stored before run() returns.
+
+Files are committed in the order they were submitted, so progress reporting
+and the returned file list match the serial implementation. The
+register_manifest_entries() helper picks the serial or parallel path based on
+the worker count.
+"""
+
+import os
+import logging
+import configparser
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from .utils import mapFitsHeader
+from .file_manifest import FileManifestEntry
+from .registration_writer import BatchedRegistrationWriter
+from ..exceptions import (
+    FileProcessingError, FitsHeaderError, DatabaseError, ValidationError
+)
+
+logger = logging.getLogger(__name__)
+
+
+def get_ingest_worker_count(config_path: str = 'astrofiler.ini') -> int:
+    """
+    Get the configured number of ingest workers.
+
+    Reads 'ingest_workers' from the DEFAULT section of astrofiler.ini. A value
+    of 0 means "one worker per CPU core"; 1 (the default) keeps the original
+    serial registration path.
+
+    Returns:
+        Number of worker threads to use (at least 1)
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    try:
+        workers = config.getint('DEFAULT', 'ingest_workers', fallback=1)
+    except ValueError:
+        workers = 1
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return max(1, workers)
+
+
+def resolve_workers(workers: Optional[int]) -> Optional[int]:
+    """
+    Translate a --workers command line option into an ingest worker count.
+
+    Args:
+        workers: Requested workers; None uses 'ingest_workers' from
+            astrofiler.ini and 0 or less means one per CPU core
+
+    Returns:
+        Worker count, or None to use the configured value
+    """
+    if workers is None:
+        return None
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+class ParallelIngestEngine:
+    """
+    Registers FITS files using a worker pool for preparation and a single writer.
+    """
+
+    def __init__(self, file_processor, workers: int = 4, queue_depth: Optional[int] = None):
+        """
+        Initialize the ingest engine.
+
+        Args:
+            file_processor: FileProcessor used for both stages
+            workers: Number of preparation worker threads
+            queue_depth: Maximum number of prepared-but-uncommitted files kept in
+                memory (defaults to twice the worker count)
+        """
+        self.file_processor = file_processor
+        self.workers = max(1, int(workers))
+        self.queue_depth = max(self.workers, queue_depth or self.workers * 2)
+
+    def _prepare(self, entry, moveFiles: bool):
+        """Worker-side preparation with the same error policy as registerFitsImage."""
+        return _prepare_entry(self.file_processor, entry, moveFiles)
+
+    def run(
+        self,
+        candidates: Iterable[FileManifestEntry],
+        moveFiles: bool,
+        progress_callback: Optional[Callable[[int, int, str], bool]] = None,
+        total_files: int = 0,
+    ) -> List[Tuple[FileManifestEntry, str]]:
+        """
+        Register a sequence of files.
+
+        Args:
+            candidates: Manifest entries in processing order
+            moveFiles: Whether to move files into the repository structure
+            progress_callback: Optional callback(current, total, filename) -> bool.
+                If it returns False, no further files are started; files already
+                being prepared are finished and committed.
+            total_files: Total reported to the progress callback
+
+        Returns:
+            List of (entry, file_id) pairs for files registered successfully
+        """
+        registered: List[Tuple[FileManifestEntry, str]] = []
+        current_file = 0
+        cancelled = False
+
+        # Load the header mapping cache once on this thread so workers only read it.
+        mapFitsHeader({}, '')
+
+        pending = deque()
+
+        def commit_oldest() -> None:
+            nonlocal current_file, cancelled
+            entry, future = pending[0]
+            # Commit a waiting batch on time while the next file is still being prepared
+            while not wait([future], timeout=writer.time_until_flush()).done:
+                writer.flush_if_due()
+            pending.popleft()
+            if future.cancelled():
+                return
+            prepared = future.result()
+            current_file += 1
+            if prepared:
+                _queue_prepared(self.file_processor, entry, prepared, moveFiles, writer, registered)
+            if progress_callback and not cancelled:
+                if not progress_callback(current_file, total_files, entry.path):
+                    cancelled = True
+                    # Drop work that has not started yet
+                    for _path, queued in pending:
+                        queued.cancel()
+
+        with BatchedRegistrationWriter(self.file_processor) as writer, \
+                ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ingest') as pool:
+            for entry in candidates:
+                if cancelled:
+                    break
+                future = pool.submit(self._prepare, entry, moveFiles)
+                pending.append((entry, future))
+                # Back-pressure: never hold more than queue_depth prepared files
+                while len(pending) >= self.queue_depth:
+                    commit_oldest()
+            while pending:
+                commit_oldest()
+        self.file_processor.flush_ingest_quality()
+
+        logger.info(f"Parallel ingest completed: {len(registered)} files registered "
+                    f"using {self.workers} workers")
+        return registered
+
+
+def register_manifest_entries(
+    file_processor,
+    entries: List[FileManifestEntry],
+    moveFiles: bool,
+    progress_callback: Optional[Callable[[int, int, str], bool]] = None,
+    workers: Optional[int] = None,
+) -> List[Tuple[FileManifestEntry, str]]:
+    """
+    Register manifest entries serially or with the ParallelIngestEngine.
+
+    Args:
+        file_processor: FileProcessor used for registration
+        entries: Manifest entries to register, in order
+        moveFiles: Whether to move files into the repository structure
+        progress_callback: Optional callback(current, total, filename) -> bool
+        workers: Worker count; None reads 'ingest_workers' from astrofiler.ini
+
+    Returns:
+        List of (entry, file_id) pairs for files registered successfully
+    """
+    if workers is None:
+        workers = get_ingest_worker_count()
+    total_files = len(entries)
+
+    if workers > 1:
+        engine = ParallelIngestEngine(file_processor, workers=workers)
+        return engine.run(entries, moveFiles, progress_callback, total_files)
+
+    registered: List[Tuple[FileManifestEntry, str]] = []
+    current_file = 0
+    with BatchedRegistrationWriter(file_processor) as writer:
+        for entry in entries:
+            current_file += 1
+            prepared = _prepare_entry(file_processor, entry, moveFiles)
+            if prepared:
+                _queue_prepared(file_processor, entry, prepared, moveFiles, writer, registered)
+            # Masters and failed files are not submitted; keep the batch age bound anyway
+            writer.flush_if_due()
+            if progress_callback:
+                # Call with expected signature: current, total, filename
+                if not progress_callback(current_file, total_files, entry.path):
+                    break  # Stop if callback returns False (user cancelled)
+    file_processor.flush_ingest_quality()
+    return registered
+
+
+def _prepare_entry(file_processor, entry: FileManifestEntry, moveFiles: bool):
+    """Prepare one file with the same error policy as registerFitsImage."""
+    file_path = entry.path
+    try:
+        return file_processor.prepare_fits_image(
+            entry.root, entry.name, moveFiles, header=entry.header)
+    except (FileProcessingError, ValidationError, FitsHeaderError, DatabaseError) as e:
+        logger.error(f"Error processing {file_path}: {e}")
+        return False
+    except Exception as e:
+        logger.error(f"Unexpected error processing {file_path}: {e}")
+        return False
+
+
+def _queue_prepared(file_processor, entry: FileManifestEntry, prepared, moveFiles: bool,
+                    writer: BatchedRegistrationWriter,
+                    registered: List[Tuple[FileManifestEntry, str]]) -> None:
+    """Move a prepared file and queue its insert; successful results are appended to registered."""
+    def on_committed(result) -> None:
+        if result:  # If registration was successful
+            registered.append((entry, result))
+
+    try:
+        file_processor.queue_prepared_image(prepared, moveFiles, writer, on_committed)
+    except (FileProcessingError, ValidationError, FitsHeaderError, DatabaseError) as e:
+        logger.error(f"Error processing {prepared.source_path}: {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error processing {prepared.source_path}: {e}")
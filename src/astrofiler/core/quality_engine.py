@@ -0,0 +1,436 @@
+"""
+Parallel, resumable quality assessment for AstroFiler.
+
+perform_quality_assessment() used to analyze at most 100 light frames per
+run, one at a time. QualityAssessmentEngine makes the whole archive
+assessable:
+
+- only frames that need it are analyzed: frames without metrics
+  (fitsFileStarCount is NULL) and frames whose file changed since the
+  metrics were measured (its SHA-256 differs from fitsFileQualityHash, or
+  from fitsFileHash for frames measured before that column existed)
+- EnhancedQualityAnalyzer.analyze_image_quality() runs in a process pool
+  ('quality_workers' in astrofiler.ini); results come back in input order
+- metrics and the hash of the analyzed file are written in batches of
+  'quality_batch_size' frames, one transaction per batch. Every committed
+  batch is a checkpoint: an interrupted or cancelled run resumes with the
+  frames that were not written yet
+
+Only frames that already have metrics are hashed when deciding what to
+analyze, through the persistent hash cache, so unchanged files are only
+stat()ed. Frames without metrics are hashed by the worker that analyzes
+them, next to the analysis. Workers never use the database: they hash
+without the cache and return the digest, which the calling process stores
+with the metrics.
+
+IngestQualityStage analyzes light frames while they are being registered
+('ingest_quality' in astrofiler.ini). Registration decodes each light frame
+for it once more, just before compression and hashing read the same file, so
+the decode is mostly served from the page cache and the metrics land in
+fitsFile without a later pass over the archive.
+"""
+
+import os
+import logging
+import threading
+import configparser
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .services.file_hash_calculator import FileHashCalculator, get_file_hash_calculator
+from .utils import get_worker_count, ordered_process_map, run_with_db_retry
+from ..exceptions import FileProcessingError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUALITY_BATCH_SIZE = 50
+
+
+def _read_int_setting(key: str, default: int, config_path: str) -> int:
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    try:
+        return config.getint('DEFAULT', key, fallback=default)
+    except ValueError:
+        return default
+
+
+def get_quality_worker_count(config_path: str = 'astrofiler.ini') -> int:
+    """
+    Get the number of processes used for quality assessment.
+
+    Reads 'quality_workers' from the DEFAULT section of astrofiler.ini.
+    A value of 1 analyzes frames in the calling process.
+
+    Returns:
+        Worker count (default: CPU count - 1, at most 4)
+    """
+    return get_worker_count('quality_workers', config_path)
+
+
+def get_quality_batch_size(config_path: str = 'astrofiler.ini') -> int:
+    """
+    Get the number of frames whose metrics are written per transaction.
+
+    Reads 'quality_batch_size' from the DEFAULT section of astrofiler.ini.
+
+    Returns:
+        Batch size (default 50)
+    """
+    return max(1, _read_int_setting('quality_batch_size', DEFAULT_QUALITY_BATCH_SIZE, config_path))
+
+
+@dataclass
+class QualityCandidate:
+    """A frame scheduled for quality analysis."""
+    file_id: str
+    path: str
+    # None until the analysis worker hashes the file
+    file_hash: Optional[str]
+
+
+def find_frames_needing_assessment(session_id: Optional[str] = None,
+                                   force: bool = False) -> List[QualityCandidate]:
+    """
+    Find the frames whose quality metrics are missing or out of date.
+
+    Args:
+        session_id: Only frames of this session (any type); None selects all
+            light frames
+        force: Select every frame, even if its metrics are up to date
+
+    Returns:
+        Frames to analyze, in database order. Missing files are skipped, as
+        are frames with metrics whose file cannot be hashed
+    """
+    from ..models import fitsFile
+
+    query = fitsFile.select(
+        fitsFile.fitsFileId,
+        fitsFile.fitsFileName,
+        fitsFile.fitsFileStarCount,
+        fitsFile.fitsFileQualityHash,
+        fitsFile.fitsFileHash,
+    ).where(
+        fitsFile.fitsFileName.is_null(False),
+        fitsFile.fitsFileSoftDelete == False,
+    )
+    if session_id:
+        query = query.where(fitsFile.fitsFileSession == session_id)
+    else:
+        query = query.where(fitsFile.fitsFileType == 'LIGHT')
+
+    calculator = get_file_hash_calculator()
+    candidates = []
+    missing = 0
+    for file_id, path, star_count, quality_hash, file_hash in query.tuples().iterator():
+        if not os.path.exists(path):
+            missing += 1
+            continue
+        if force or star_count is None:
+            # Analyzed anyway; the worker hashes the file with the analysis
+            candidates.append(QualityCandidate(file_id, path, None))
+            continue
+        measured_hash = quality_hash or file_hash
+        if not measured_hash:
+            continue
+        try:
+            current_hash = calculator.calculate_sha256(path)
+        except FileProcessingError as e:
+            logger.warning(f"Skipping quality assessment of {path}: {e}")
+            continue
+        if current_hash != measured_hash:
+            candidates.append(QualityCandidate(file_id, path, current_hash))
+    if missing:
+        logger.info(f"Skipped {missing} frames whose files are missing")
+    return candidates
+
+
+def write_quality_batch(updates: List[Tuple[str, Dict]], max_retries: int = 5,
+                        retry_delay: float = 0.1) -> None:
+    """
+    Write quality metrics for several frames in one transaction.
+
+    The quality rollups of the sessions containing the frames are refreshed
+    in the same transaction.
+
+    Args:
+        updates: (fitsFileId, {fitsFile field: value}) pairs
+        max_retries: Attempts while the database is locked
+        retry_delay: Initial delay between attempts (seconds)
+
+    Raises:
+        RuntimeError: If the database stays locked or the update fails
+    """
+    if not updates:
+        return
+    from ..models import fitsFile
+    from .session_quality import refresh_session_quality_for_files
+
+    def write() -> None:
+        for file_id, fields in updates:
+            fitsFile.update(**fields).where(fitsFile.fitsFileId == file_id).execute()
+        refresh_session_quality_for_files(file_id for file_id, _ in updates)
+
+    run_with_db_retry(write, f"{len(updates)} quality results", max_retries, retry_delay)
+
+
+_worker_analyzer = None
+_worker_calculator: Optional[FileHashCalculator] = None
+
+
+def _init_quality_worker() -> None:
+    global _worker_analyzer, _worker_calculator
+    from .enhanced_quality import EnhancedQualityAnalyzer
+    _worker_analyzer = EnhancedQualityAnalyzer()
+    # The hash cache lives in the database, which workers must not touch
+    _worker_calculator = FileHashCalculator(use_cache=False)
+
+
+def _analyze_file(analyzer, calculator: FileHashCalculator, path: str) -> Dict:
+    try:
+        # Hashed first, so the analysis reads the file from the page cache
+        file_hash = calculator.calculate_sha256(path)
+        result = analyzer.analyze_image_quality(path)
+        result['file_hash'] = file_hash
+        return result
+    except Exception as e:
+        return {"status": "error", "message": str(e), "file_path": path}
+
+
+def _analyze_file_in_worker(path: str) -> Dict:
+    return _analyze_file(_worker_analyzer, _worker_calculator, path)
+
+
+class QualityAssessmentEngine:
+    """
+    Analyzes frame quality in a worker pool and writes metrics in batches.
+
+    At most max_pending frames are queued or in flight.
+    """
+
+    def __init__(self, workers: Optional[int] = None, batch_size: Optional[int] = None,
+                 max_pending: Optional[int] = None) -> None:
+        """
+        Initialize the engine.
+
+        Args:
+            workers: Worker processes (None reads 'quality_workers'; 1 runs in-process)
+            batch_size: Frames written per transaction (None reads 'quality_batch_size')
+            max_pending: Maximum frames in flight (default 2 per worker)
+        """
+        self.workers = get_quality_worker_count() if workers is None else max(1, workers)
+        self.batch_size = get_quality_batch_size() if batch_size is None else max(1, batch_size)
+        self.max_pending = max_pending or self.workers * 2
+
+    def _analyze_serial(self, paths: Iterable[str]) -> Iterator[Tuple[str, Dict]]:
+        from .enhanced_quality import EnhancedQualityAnalyzer
+        analyzer = EnhancedQualityAnalyzer()
+        calculator = get_file_hash_calculator()
+        for path in paths:
+            yield path, _analyze_file(analyzer, calculator, path)
+
+    def analyze_files(self, paths: Iterable[str]) -> Iterator[Tuple[str, Dict]]:
+        """
+        Analyze frames without touching the database.
+
+        Args:
+            paths: Frame paths, in the order results should be yielded
+
+        Yields:
+            (path, result) with the analyze_image_quality() result dict and
+            the SHA-256 of the analyzed file as 'file_hash'
+        """
+        paths = list(paths)
+        if self.workers > 1 and len(paths) > 1:
+            logger.info(f"Analyzing {len(paths)} frames with {self.workers} worker processes")
+        yield from ordered_process_map(_analyze_file_in_worker, paths, self._analyze_serial,
+                                       self.workers, self.max_pending, 'Quality',
+                                       initializer=_init_quality_worker)
+
+    def assess(self, candidates: List[QualityCandidate],
+               progress_callback: Optional[Callable[[int, int, str], Optional[bool]]] = None,
+               result_callback: Optional[Callable[[QualityCandidate, Dict], None]] = None) -> Dict[str, int]:
+        """
+        Analyze frames and store their metrics, committing every batch_size frames.
+
+        Failed analyses are not written, so those frames are retried on the
+        next run. Pending results are written even if the run is interrupted.
+
+        Args:
+            candidates: Frames to analyze (see find_frames_needing_assessment)
+            progress_callback: Called as (done, total, message); returning
+                False stops after writing the results so far
+            result_callback: Called as (candidate, result) for every frame
+
+        Returns:
+            dict: Counts of 'total', 'analyzed', 'failed' and 'remaining' frames
+        """
+        from .enhanced_quality import quality_metric_updates
+
+        total = len(candidates)
+        analyzed = failed = done = 0
+        batch: List[Tuple[str, Dict]] = []
+        try:
+            results = self.analyze_files(candidate.path for candidate in candidates)
+            for candidate, (path, result) in zip(candidates, results):
+                done += 1
+                if result_callback:
+                    result_callback(candidate, result)
+                if result.get("status") == "success":
+                    fields = quality_metric_updates(result)
+                    fields['fitsFileQualityHash'] = candidate.file_hash or result.get('file_hash')
+                    batch.append((candidate.file_id, fields))
+                    analyzed += 1
+                else:
+                    failed += 1
+                    logger.warning(f"Failed to analyze {path}: {result.get('message', 'Unknown error')}")
+
+                if len(batch) >= self.batch_size:
+                    full_batch, batch = batch, []
+                    write_quality_batch(full_batch)
+
+                if progress_callback and progress_callback(
+                        done, total, f"Analyzed {os.path.basename(path)} ({done}/{total})") is False:
+                    logger.info(f"Quality assessment stopped after {done} of {total} frames")
+                    break
+        finally:
+            write_quality_batch(batch)
+
+        return {'total': total, 'analyzed': analyzed, 'failed': failed, 'remaining': total - done}
+
+
+class IngestQualityStage:
+    """
+    Analyzes light frames in a thread pool while they are being ingested.
+
+    Ingest preparation decodes each light frame for it and submits the pixels;
+    the compressor does not expose the pixels it decodes. Once the
+    frame's fitsFile row is committed, register() pairs the pending analysis
+    with the row and finished results are written in batches. Threads are used
+    rather than processes so frames reach the analyzer without being copied.
+
+    Metrics that are never written (failed analysis, or the process exits
+    before a flush) leave fitsFileStarCount NULL, so the next
+    QualityAssessmentEngine run picks those frames up.
+    """
+
+    def __init__(self, workers: Optional[int] = None, batch_size: Optional[int] = None,
+                 max_pending: Optional[int] = None) -> None:
+        """
+        Initialize the stage.
+
+        Args:
+            workers: Analysis threads (None reads 'quality_workers')
+            batch_size: Frames written per transaction (None reads 'quality_batch_size')
+            max_pending: Maximum frames queued or being analyzed (default 2 per
+                worker); submit() blocks beyond that, which bounds the pixels
+                held in memory
+        """
+        from .enhanced_quality import EnhancedQualityAnalyzer
+
+        self.workers = get_quality_worker_count() if workers is None else max(1, workers)
+        self.batch_size = get_quality_batch_size() if batch_size is None else max(1, batch_size)
+        self.max_pending = max_pending or self.workers * 2
+        self._analyzer = EnhancedQualityAnalyzer()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ingest-quality')
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._registered: List[Tuple[str, Optional[str], Future]] = []
+
+    def submit(self, data: np.ndarray, header: Any, path: str) -> Future:
+        """
+        Queue analysis of a decoded frame.
+
+        Safe to call from ingest worker threads. Blocks while max_pending
+        frames are queued or being analyzed.
+
+        Args:
+            data: 2D image data (kept until the analysis finishes)
+            header: Image header
+            path: File the image came from
+
+        Returns:
+            Future resolving to the analyze_image_data() result
+        """
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(self._analyzer.analyze_image_data, data, header, path)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _future: self._slots.release())
+        return future
+
+    def register(self, file_id: str, file_hash: Optional[str], future: Future) -> None:
+        """
+        Pair an analysis with the committed fitsFile row of its frame.
+
+        Must run on the thread that writes to the database. Writes finished
+        results once a batch of them is ready.
+
+        Args:
+            file_id: fitsFileId of the committed row
+            file_hash: SHA-256 of the registered file, stored as
+                fitsFileQualityHash (None when full hashing is deferred)
+            future: Result of submit() for the frame
+        """
+        self._registered.append((file_id, file_hash, future))
+        if sum(1 for _, _, pending in self._registered if pending.done()) >= self.batch_size:
+            self.write_results()
+
+    def write_results(self, wait: bool = False) -> int:
+        """
+        Write the metrics of registered frames whose analysis has finished.
+
+        Must run on the thread that writes to the database. A failed write is
+        logged and its frames are left for the next quality assessment.
+
+        Args:
+            wait: Wait for every registered analysis instead of only the finished ones
+
+        Returns:
+            Number of frames whose metrics were written
+        """
+        from .enhanced_quality import quality_metric_updates
+
+        updates: List[Tuple[str, Dict]] = []
+        waiting = []
+        for file_id, file_hash, future in self._registered:
+            if not (wait or future.done()):
+                waiting.append((file_id, file_hash, future))
+                continue
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"status": "error", "message": str(e)}
+            if result.get("status") == "success":
+                fields = quality_metric_updates(result)
+                if file_hash:
+                    fields['fitsFileQualityHash'] = file_hash
+                updates.append((file_id, fields))
+            else:
+                logger.warning(f"Ingest quality analysis failed for {result.get('file_path', file_id)}: "
+                               f"{result.get('message', 'Unknown error')}")
+        self._registered = waiting
+
+        written = 0
+        for start in range(0, len(updates), self.batch_size):
+            batch = updates[start:start + self.batch_size]
+            try:
+                write_quality_batch(batch)
+                written += len(batch)
+            except RuntimeError as e:
+                logger.warning(f"Could not store ingest quality metrics: {e}")
+        if written:
+            logger.info(f"Stored quality metrics for {written} ingested frames")
+        return written
+
+    def close(self) -> None:
+        """Write all pending results and stop the analysis threads."""
+        try:
+            self.write_results(wait=True)
+        finally:
+            self._pool.shutdown(wait=True)
@@ -0,0 +1,352 @@
+"""
+Batched database writer for FITS file registration.
+
+submitFileToDB() looks up duplicates and inserts one row per file, each in
+its own autocommit transaction, so every registered frame costs an fsync.
+BatchedRegistrationWriter collects registrations and commits them together:
+
+- duplicates are resolved per batch with one IN (...) lookup on the full hash
+  and one fingerprint lookup, plus a check against earlier files in the batch
+- new rows are written with insert_many inside a single transaction
+- if the batch insert fails, rows are retried one by one so a bad file only
+  fails itself
+
+A batch is committed once it holds 'db_batch_size' files or its oldest file
+has waited 'db_batch_interval_ms' milliseconds (both read from astrofiler.ini),
+and on flush()/close(). The age is checked by submit() and flush_if_due(); the
+ingest engine calls flush_if_due() while it waits for the next prepared file,
+so a batch is committed on time even when no further file arrives. The writer
+is not thread-safe; use it from the single writer thread of the ingest engine.
+"""
+
+import time
+import logging
+import configparser
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from peewee import IntegrityError
+
+from ..exceptions import DatabaseError, FileProcessingError
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound variables per statement
+_LOOKUP_CHUNK_SIZE = 500
+# fitsFile rows bind ~18 values each; keep insert_many well below 999 variables
+_INSERT_CHUNK_SIZE = 50
+
+
+def get_registration_batch_settings(config_path: str = 'astrofiler.ini') -> Tuple[int, int]:
+    """
+    Get the configured registration batch size and interval.
+
+    Reads 'db_batch_size' (default 200) and 'db_batch_interval_ms' (default 2000)
+    from the DEFAULT section of astrofiler.ini.
+
+    Returns:
+        Tuple (batch size in files, maximum batch age in milliseconds)
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    try:
+        batch_size = config.getint('DEFAULT', 'db_batch_size', fallback=200)
+    except ValueError:
+        batch_size = 200
+    try:
+        interval_ms = config.getint('DEFAULT', 'db_batch_interval_ms', fallback=2000)
+    except ValueError:
+        interval_ms = 2000
+    return max(1, batch_size), max(0, interval_ms)
+
+
+@dataclass
+class PendingRegistration:
+    """A file waiting in a BatchedRegistrationWriter batch."""
+    file_name: str
+    source_path: str
+    record: Dict[str, Any]
+    callback: Optional[Callable[[Union[str, bool]], None]] = None
+    existing_id: Optional[str] = None
+    duplicate_of: Optional['PendingRegistration'] = None
+    error: Optional[Exception] = None
+    result: Union[str, bool, None] = None
+
+    @property
+    def resolved(self) -> bool:
+        """True once the file is known to be a duplicate or to have failed."""
+        return self.existing_id is not None or self.duplicate_of is not None or self.error is not None
+
+    @property
+    def fingerprint(self) -> Tuple[str, str, str]:
+        """Header fingerprint used to find duplicate candidates."""
+        return (str(self.record['fitsFileDate']), str(self.record['fitsFileInstrument']),
+                str(self.record['fitsFileExpTime']))
+
+
+class BatchedRegistrationWriter:
+    """
+    Collects fitsFile registrations and commits them in batched transactions.
+    """
+
+    def __init__(self, file_processor, batch_size: Optional[int] = None,
+                 flush_interval_ms: Optional[int] = None):
+        """
+        Initialize the writer.
+
+        Args:
+            file_processor: FileProcessor used to build records and confirm duplicates
+            batch_size: Files per transaction (None reads 'db_batch_size')
+            flush_interval_ms: Maximum age of a batch in milliseconds
+                (None reads 'db_batch_interval_ms')
+        """
+        config_batch_size, config_interval_ms = get_registration_batch_settings()
+        self.file_processor = file_processor
+        self.batch_size = max(1, batch_size or config_batch_size)
+        self.flush_interval = (config_interval_ms if flush_interval_ms is None else flush_interval_ms) / 1000.0
+        self.commits = 0
+        self._pending: List[PendingRegistration] = []
+        self._batch_started: Optional[float] = None
+
+    def __enter__(self) -> 'BatchedRegistrationWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def submit(self, fileName: str, hdr: Any, fileHash: Optional[str] = None,
+               partialHash: Optional[str] = None, fileSize: Optional[int] = None,
+               callback: Optional[Callable[[Union[str, bool]], None]] = None,
+               source_path: Optional[str] = None) -> None:
+        """
+        Queue a file for registration.
+
+        The header is validated immediately; duplicate detection and the insert
+        happen when the batch is committed, after which callback is called with
+        the new (or existing duplicate) file ID, or False if registration failed.
+
+        Args:
+            fileName: Full path to the FITS file
+            hdr: FITS header object
+            fileHash: Full file hash (None when full hashing is lazy)
+            partialHash: Partial hash (size + first/last MiB)
+            fileSize: File size in bytes
+            callback: Called with the registration result after commit
+            source_path: Original path used in error messages (defaults to fileName)
+
+        Raises:
+            ValidationError: If required header fields are missing
+        """
+        record = self.file_processor.build_file_record(fileName, hdr, fileHash, partialHash, fileSize)
+        self._pending.append(PendingRegistration(
+            file_name=fileName,
+            source_path=source_path or fileName,
+            record=record,
+            callback=callback,
+        ))
+        if self._batch_started is None:
+            self._batch_started = time.monotonic()
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def time_until_flush(self) -> Optional[float]:
+        """Seconds until the current batch is due, 0 if it is overdue, None if nothing is pending."""
+        if self._batch_started is None:
+            return None
+        return max(0.0, self._batch_started + self.flush_interval - time.monotonic())
+
+    def flush_if_due(self) -> int:
+        """
+        Commit the current batch if its oldest file has waited the flush interval.
+
+        Returns:
+            Number of files newly inserted
+        """
+        if self.time_until_flush() == 0.0:
+            return self.flush()
+        return 0
+
+    def close(self) -> None:
+        """Commit any pending registrations."""
+        self.flush()
+        if self.commits:
+            logger.debug(f"Registration writer committed {self.commits} transactions")
+
+    def flush(self) -> int:
+        """
+        Commit the current batch.
+
+        Returns:
+            Number of files newly inserted
+        """
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, []
+        self._batch_started = None
+
+        try:
+            from ..models import db, fitsFile as FitsFileModel
+            self._resolve_duplicates(FitsFileModel, batch)
+            inserted = self._insert(db, FitsFileModel, [p for p in batch if not p.resolved])
+        except Exception as e:
+            inserted = 0
+            for pending in batch:
+                if not pending.resolved:
+                    pending.error = DatabaseError(
+                        f"Batch registration failed: {e}",
+                        file_path=pending.file_name,
+                        error_code="DB_BATCH_ERROR"
+                    )
+
+        for pending in batch:
+            self._complete(pending)
+        return inserted
+
+    def _resolve_duplicates(self, FitsFileModel, batch: List[PendingRegistration]) -> None:
+        """Mark files that are already registered, or repeated within the batch."""
+        # Tier 1: exact full-hash lookup for the whole batch
+        hashes = list({p.record['fitsFileHash'] for p in batch if p.record['fitsFileHash']})
+        by_hash: Dict[str, Any] = {}
+        for i in range(0, len(hashes), _LOOKUP_CHUNK_SIZE):
+            query = (FitsFileModel
+                     .select(FitsFileModel.fitsFileId, FitsFileModel.fitsFileName, FitsFileModel.fitsFileHash)
+                     .where(FitsFileModel.fitsFileHash.in_(hashes[i:i + _LOOKUP_CHUNK_SIZE])))
+            for row in query:
+                by_hash.setdefault(row.fitsFileHash, row)
+        for pending in batch:
+            existing = by_hash.get(pending.record['fitsFileHash'])
+            if existing is not None:
+                self._mark_existing(pending, existing)
+
+        # Tier 2: fingerprint candidates, fetched for the whole batch
+        remaining = [p for p in batch if not p.resolved]
+        candidates = self._load_fingerprint_candidates(FitsFileModel, remaining)
+
+        seen_hashes: Dict[str, PendingRegistration] = {}
+        seen_fingerprints: Dict[Tuple, List[PendingRegistration]] = {}
+        for pending in remaining:
+            record = pending.record
+            try:
+                # Tiers 3-4 against registered files: size, partial hash, full hash
+                for candidate in candidates.get(pending.fingerprint, ()):
+                    is_duplicate, record['fitsFileHash'] = self.file_processor.confirm_duplicate_candidate(
+                        FitsFileModel, candidate, pending.file_name, record['fitsFileHash'],
+                        record['fitsFilePartialHash'], record['fitsFileSize'])
+                    if is_duplicate:
+                        self._mark_existing(pending, candidate)
+                        break
+                if pending.resolved:
+                    continue
+
+                # Same file submitted twice in this batch
+                file_hash = record['fitsFileHash']
+                if file_hash and file_hash in seen_hashes:
+                    self._mark_batch_duplicate(pending, seen_hashes[file_hash])
+                    continue
+                key = pending.fingerprint + (record['fitsFileSize'], record['fitsFilePartialHash'])
+                for earlier in seen_fingerprints.get(key, ()):
+                    if record['fitsFileHash'] is None:
+                        record['fitsFileHash'] = self.file_processor.calculateFileHash(pending.file_name)
+                    if earlier.record['fitsFileHash'] is None:
+                        earlier.record['fitsFileHash'] = self.file_processor.calculateFileHash(earlier.file_name)
+                    if earlier.record['fitsFileHash'] == record['fitsFileHash']:
+                        self._mark_batch_duplicate(pending, earlier)
+                        break
+                if pending.resolved:
+                    continue
+
+                if record['fitsFileHash']:
+                    seen_hashes[record['fitsFileHash']] = pending
+                seen_fingerprints.setdefault(key, []).append(pending)
+            except (FileProcessingError, DatabaseError) as e:
+                pending.error = e
+            except Exception as e:
+                pending.error = DatabaseError(
+                    f"Duplicate check failed: {e}",
+                    file_path=pending.file_name,
+                    error_code="DB_UNEXPECTED_ERROR"
+                )
+
+    def _load_fingerprint_candidates(self, FitsFileModel,
+                                     pending: List[PendingRegistration]) -> Dict[Tuple, List[Any]]:
+        """Return registered files sharing a header fingerprint with the pending files, by fingerprint."""
+        wanted = {p.fingerprint for p in pending}
+        dates = list({p.record['fitsFileDate'] for p in pending})
+        candidates: Dict[Tuple, List[Any]] = {}
+        for i in range(0, len(dates), _LOOKUP_CHUNK_SIZE):
+            query = FitsFileModel.select(
+                FitsFileModel.fitsFileId, FitsFileModel.fitsFileName, FitsFileModel.fitsFileDate,
+                FitsFileModel.fitsFileInstrument, FitsFileModel.fitsFileExpTime,
+                FitsFileModel.fitsFileSize, FitsFileModel.fitsFilePartialHash, FitsFileModel.fitsFileHash
+            ).where(FitsFileModel.fitsFileDate.in_(dates[i:i + _LOOKUP_CHUNK_SIZE]))
+            for row in query:
+                key = (str(row.fitsFileDate), str(row.fitsFileInstrument), str(row.fitsFileExpTime))
+                if key in wanted:
+                    candidates.setdefault(key, []).append(row)
+        return candidates
+
+    def _mark_existing(self, pending: PendingRegistration, existing: Any) -> None:
+        logger.warning(f"Duplicate file detected: {pending.file_name} matches {existing.fitsFileName}")
+        pending.existing_id = existing.fitsFileId
+
+    def _mark_batch_duplicate(self, pending: PendingRegistration, earlier: PendingRegistration) -> None:
+        logger.warning(f"Duplicate file detected: {pending.file_name} matches {earlier.file_name}")
+        pending.duplicate_of = earlier
+
+    def _insert(self, db, FitsFileModel, to_insert: List[PendingRegistration]) -> int:
+        """Insert new rows in one transaction, falling back to per-file inserts on failure."""
+        if not to_insert:
+            return 0
+        try:
+            with db.atomic():
+                for i in range(0, len(to_insert), _INSERT_CHUNK_SIZE):
+                    FitsFileModel.insert_many(
+                        [p.record for p in to_insert[i:i + _INSERT_CHUNK_SIZE]]).execute()
+            self.commits += 1
+            for pending in to_insert:
+                pending.result = pending.record['fitsFileId']
+            return len(to_insert)
+        except Exception as e:
+            logger.warning(f"Batched insert of {len(to_insert)} files failed ({e}); retrying individually")
+
+        inserted = 0
+        for pending in to_insert:
+            try:
+                with db.atomic():
+                    FitsFileModel.insert(**pending.record).execute()
+                self.commits += 1
+                pending.result = pending.record['fitsFileId']
+                inserted += 1
+            except IntegrityError as e:
+                pending.error = DatabaseError(
+                    f"Database integrity constraint violated: {e}",
+                    file_path=pending.file_name,
+                    error_code="DB_INTEGRITY_ERROR"
+                )
+            except Exception as e:
+                pending.error = DatabaseError(
+                    f"Unexpected database error: {e}",
+                    file_path=pending.file_name,
+                    error_code="DB_UNEXPECTED_ERROR"
+                )
+        return inserted
+
+    def _complete(self, pending: PendingRegistration) -> None:
+        """Report the outcome of one file and run its callback."""
+        if pending.error is not None:
+            logger.error(f"Error processing {pending.source_path}: {pending.error}")
+            pending.result = False
+        elif pending.existing_id is not None:
+            pending.result = pending.existing_id
+        elif pending.duplicate_of is not None:
+            pending.result = pending.duplicate_of.result or False
+        else:
+            logger.info(f"Successfully registered FITS file: {pending.result}")
+
+        if pending.callback:
+            try:
+                pending.callback(pending.result)
+            except Exception as e:
+                logger.error(f"Registration callback failed for {pending.source_path}: {e}")
@@ -0,0 +1,213 @@
+"""
+Incremental repository synchronization for AstroFiler.
+
+A full repository sync re-hashes every file only to find most of them already
+registered. The incremental sync keeps a journal of (path, size, mtime_ns,
+inode, hash) in the `fileJournal` table and only hashes and registers files
+whose stat signature changed since the last sync. Files still recorded in the
+database but no longer on disk are reported.
+"""
+
+import os
+import logging
+import datetime
+from typing import Any, Callable, Dict, Optional
+
+from .utils import normalize_file_path
+from .file_manifest import build_ingest_manifest
+from .parallel_ingest import register_manifest_entries
+from .services.hash_backfill import start_hash_backfill
+from ..exceptions import DatabaseError
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound variables per statement
+_DB_BATCH_SIZE = 500
+
+
+class IncrementalRepositorySync:
+    """
+    Synchronizes the database with a repository folder using the file journal.
+    """
+
+    def __init__(self, file_processor) -> None:
+        """
+        Initialize the sync.
+
+        Args:
+            file_processor: FileProcessor used to register new or modified files
+        """
+        self.file_processor = file_processor
+
+    def _load_journal(self, FileJournal) -> Dict[str, Any]:
+        """Load all journal rows keyed by normalized path."""
+        return {row.path: row for row in FileJournal.select()}
+
+    def _load_registered(self) -> Dict[str, tuple]:
+        """Return {id: (path, soft_deleted)} for registered files and masters."""
+        from ..models import fitsFile, Masters
+
+        registered: Dict[str, tuple] = {}
+        query = (fitsFile
+                 .select(fitsFile.fitsFileId, fitsFile.fitsFileName, fitsFile.fitsFileSoftDelete)
+                 .tuples())
+        for file_id, file_name, soft_deleted in query:
+            registered[file_id] = (file_name, bool(soft_deleted))
+        try:
+            query = Masters.select(Masters.master_id, Masters.master_path, Masters.soft_delete).tuples()
+            for master_id, master_path, soft_deleted in query:
+                registered[master_id] = (normalize_file_path(master_path), bool(soft_deleted))
+        except Exception as e:
+            logger.debug(f"Masters table not available for sync: {e}")
+        return registered
+
+    def sync(
+        self,
+        repo_folder: str,
+        progress_callback: Optional[Callable[[int, int, str], bool]] = None,
+        workers: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Register new or modified files in repo_folder and report missing ones.
+
+        Args:
+            repo_folder: Repository folder to scan
+            progress_callback: Optional callback(current, total, filename) -> bool,
+                called for the files that need registering
+            workers: Ingest worker count (None reads 'ingest_workers')
+
+        Returns:
+            dict with keys:
+                registered: list of paths registered (or re-registered) in this run
+                unchanged: number of files skipped because their stat signature matched
+                changed: number of new or modified files that were processed
+                missing: list of registered file paths no longer present on disk
+
+        Raises:
+            DatabaseError: If the journal cannot be read or written
+        """
+        try:
+            from ..models import db, FileJournal
+        except ImportError as e:
+            raise DatabaseError(
+                f"Cannot import database models: {e}",
+                error_code="MODEL_IMPORT_ERROR"
+            )
+
+        repo_prefix = normalize_file_path(os.path.abspath(repo_folder)).rstrip('/') + '/'
+
+        # Stat-only scan; headers are read only for files that need registering.
+        manifest = build_ingest_manifest(repo_folder, read_headers=False)
+
+        try:
+            journal = self._load_journal(FileJournal)
+            registered_ids = self._load_registered()
+        except Exception as e:
+            raise DatabaseError(f"Failed to load file journal: {e}", error_code="JOURNAL_READ_ERROR")
+
+        unchanged = 0
+        changed_entries = []
+        seen_paths = set()
+        for entry in manifest:
+            path = normalize_file_path(entry.path)
+            seen_paths.add(path)
+            row = journal.get(path)
+            if (row is not None
+                    and row.fits_file_id in registered_ids
+                    and row.matches_stat(entry.size, entry.mtime_ns, entry.inode)):
+                unchanged += 1
+                continue
+            entry.load_header()
+            if entry.is_master:
+                continue  # Masters are registered by registerMasters()
+            changed_entries.append(entry)
+
+        logger.info(f"Incremental sync: {unchanged} unchanged, {len(changed_entries)} new or modified files")
+
+        registered = register_manifest_entries(
+            self.file_processor, changed_entries, False, progress_callback, workers)
+
+        self._journal_registered(db, FileJournal, registered)
+        if registered and getattr(self.file_processor, 'lazy_full_hash', False):
+            start_hash_backfill()
+
+        # Files that are registered under the repository but no longer on disk
+        missing = sorted(
+            name for name, soft_deleted in registered_ids.values()
+            if name and not soft_deleted and name.startswith(repo_prefix) and name not in seen_paths
+        )
+        if missing:
+            logger.warning(f"Incremental sync: {len(missing)} registered files are missing from disk")
+            for name in missing:
+                logger.info(f"Missing from disk: {name}")
+
+        stale = [path for path in journal if path.startswith(repo_prefix) and path not in seen_paths]
+        try:
+            for i in range(0, len(stale), _DB_BATCH_SIZE):
+                FileJournal.delete().where(FileJournal.path.in_(stale[i:i + _DB_BATCH_SIZE])).execute()
+        except Exception as e:
+            logger.warning(f"Could not prune stale journal entries: {e}")
+
+        return {
+            'registered': [entry.path for entry, _file_id in registered],
+            'unchanged': unchanged,
+            'changed': len(changed_entries),
+            'missing': missing,
+        }
+
+    def _journal_registered(self, db, FileJournal, registered) -> None:
+        """Record the post-registration stat signature and hash of registered files."""
+        if not registered:
+            return
+        from ..models import fitsFile
+
+        ids = [file_id for _entry, file_id in registered]
+        file_info: Dict[str, tuple] = {}
+        for i in range(0, len(ids), _DB_BATCH_SIZE):
+            query = (fitsFile
+                     .select(fitsFile.fitsFileId, fitsFile.fitsFileName, fitsFile.fitsFileHash)
+                     .where(fitsFile.fitsFileId.in_(ids[i:i + _DB_BATCH_SIZE]))
+                     .tuples())
+            for file_id, file_name, file_hash in query:
+                file_info[file_id] = (file_name, file_hash)
+
+        now = datetime.datetime.now()
+        rows = []
+        for entry, file_id in registered:
+            file_name, file_hash = file_info.get(file_id, (None, None))
+            # Journal the source path and, if registration changed it (e.g. a
+            # format conversion), the registered file too.
+            for path in {normalize_file_path(entry.path), file_name}:
+                if not path:
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                rows.append({
+                    'path': path,
+                    'file_size': st.st_size,
+                    'mtime_ns': st.st_mtime_ns,
+                    'inode': st.st_ino,
+                    'file_hash': file_hash if path == file_name else None,
+                    'fits_file_id': file_id,
+                    'last_seen': now,
+                })
+
+        try:
+            with db.atomic():
+                for i in range(0, len(rows), 100):
+                    FileJournal.insert_many(rows[i:i + 100]).on_conflict_replace().execute()
+        except Exception as e:
+            raise DatabaseError(f"Failed to update file journal: {e}", error_code="JOURNAL_WRITE_ERROR")
+
+
+def clear_file_journal() -> int:
+    """
+    Remove all file journal entries, forcing the next incremental sync to be a full one.
+
+    Returns:
+        Number of rows deleted
+    """
+    from ..models import FileJournal
+    return FileJournal.delete().execute()
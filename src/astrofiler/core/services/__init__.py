@@ -1,5 +1,7 @@
 """Service modules for AstroFiler core functionality."""
 
-from .file_hash_calculator import FileHashCalculator, get_file_hash_calculator
+from .file_hash_calculator import FileHashCalculator, get_file_hash_calculator, clear_file_hash_cache
+from .hash_backfill import HashBackfillWorker, start_hash_backfill, wait_for_hash_backfill
 
-__all__ = ['FileHashCalculator', 'get_file_hash_calculator']
\ No newline at end of file
+__all__ = ['FileHashCalculator', 'get_file_hash_calculator', 'clear_file_hash_cache',
+           'HashBackfillWorker', 'start_hash_backfill', 'wait_for_hash_backfill']
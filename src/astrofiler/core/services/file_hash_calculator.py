@@ -2,74 +2,245 @@
 File hash calculation service for AstroFiler.
 
 Provides hash calculation functionality with multiple algorithms
-following Single Responsibility Principle.
+following Single Responsibility Principle. SHA-256 and MD5 digests can be
+cached in the `fileHashCache` table so unchanged files are only stat'ed.
 """
 
+import os
+import mmap
+import time
 import hashlib
 import logging
-from typing import Optional
+import datetime
+import configparser
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
 from ...types import FilePath
 from ...exceptions import FileProcessingError
 
 logger = logging.getLogger(__name__)
 
+# Read buffer sizes chosen by file size when no fixed buffer size is given
+_SMALL_BUFFER_SIZE = 256 * 1024
+_LARGE_BUFFER_SIZE = 4 * 1024 * 1024
+_LARGE_FILE_THRESHOLD = 16 * 1024 * 1024
+
+# Files at least this big are hashed through a read-only memory map
+_MMAP_THRESHOLD = 64 * 1024 * 1024
+
+# Digests stored in the persistent hash cache
+_CACHED_ALGORITHMS = ('sha256', 'md5')
+
+# Files modified more recently than this are not cached: a write landing in the
+# same mtime tick after hashing would otherwise go unnoticed.
+_CACHE_MIN_AGE_NS = 2 * 1000 * 1000 * 1000
+
+_HASH_FACTORIES = {
+    'sha256': hashlib.sha256,
+    'md5': hashlib.md5,
+    'sha1': hashlib.sha1,
+}
+
 
 class FileHashCalculator:
     """
     Service for calculating file hashes.
     
     Single responsibility: File hash calculation with various algorithms.
+
+    All algorithms share one read loop: the file is read once into a reused
+    buffer (or memory-mapped when large) and every requested digest is updated
+    from the same data. hashlib releases the GIL while digesting, so
+    hash_files() scales across threads.
     """
     
-    def __init__(self, buffer_size: int = 4096):
+    def __init__(self, buffer_size: Optional[int] = None, mmap_threshold: Optional[int] = _MMAP_THRESHOLD,
+                 use_cache: bool = False):
         """
         Initialize hash calculator.
         
         Args:
-            buffer_size: Size of read buffer in bytes (default 4096)
+            buffer_size: Fixed read buffer size in bytes; None picks a size
+                based on the file size
+            mmap_threshold: Files at least this many bytes are memory-mapped;
+                None disables memory mapping
+            use_cache: Reuse and record SHA-256/MD5 digests in the fileHashCache
+                table, keyed by (device, inode) and validated by (size, mtime_ns)
         """
         self.buffer_size = buffer_size
-    
-    def calculate_sha256(self, file_path: FilePath) -> str:
+        self.mmap_threshold = mmap_threshold
+        self.use_cache = use_cache
+
+    def _buffer_size_for(self, file_size: int) -> int:
+        """Return the read buffer size to use for a file of file_size bytes."""
+        if self.buffer_size:
+            return self.buffer_size
+        if file_size >= _LARGE_FILE_THRESHOLD:
+            return _LARGE_BUFFER_SIZE
+        return _SMALL_BUFFER_SIZE
+
+    def _digest_file(self, file_path: FilePath, algorithms: Iterable[str]) -> Dict[str, str]:
         """
-        Calculate SHA-256 hash of a file.
-        
-        Args:
-            file_path: Path to the file
-            
-        Returns:
-            SHA-256 hash hex string
-            
+        Read a file once and return the hex digest for each algorithm.
+
         Raises:
-            FileProcessingError: If file cannot be read
+            FileProcessingError: If the algorithm is unknown or the file cannot be read
         """
+        algorithms = list(algorithms)
+        invalid_algorithms = set(algorithms) - set(_HASH_FACTORIES)
+        if invalid_algorithms:
+            raise FileProcessingError(
+                f"Unsupported hash algorithms: {invalid_algorithms}",
+                file_path=str(file_path),
+                error_code="INVALID_HASH_ALGORITHM"
+            )
+        hashers = {algorithm: _HASH_FACTORIES[algorithm]() for algorithm in algorithms}
+        updaters = [hasher.update for hasher in hashers.values()]
+
         try:
-            hash_sha256 = hashlib.sha256()
             with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(self.buffer_size), b""):
-                    hash_sha256.update(chunk)
-            return hash_sha256.hexdigest()
-        except (OSError, IOError) as e:
-            logger.error(f"Error reading file for SHA-256 calculation: {file_path}")
+                file_size = os.fstat(f.fileno()).st_size
+                if self.mmap_threshold is not None and file_size >= self.mmap_threshold:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        view = memoryview(mapped)
+                        try:
+                            step = _LARGE_BUFFER_SIZE
+                            for offset in range(0, file_size, step):
+                                chunk = view[offset:offset + step]
+                                for update in updaters:
+                                    update(chunk)
+                                chunk.release()
+                        finally:
+                            view.release()
+                else:
+                    buffer = bytearray(self._buffer_size_for(file_size))
+                    view = memoryview(buffer)
+                    while True:
+                        count = f.readinto(buffer)
+                        if not count:
+                            break
+                        for update in updaters:
+                            update(view[:count])
+            return {algorithm: hasher.hexdigest() for algorithm, hasher in hashers.items()}
+        except (OSError, IOError, ValueError) as e:
+            logger.error(f"Error reading file for hash calculation: {file_path}")
             raise FileProcessingError(
                 f"Cannot read file for hash calculation: {e}",
                 file_path=str(file_path),
                 error_code="FILE_READ_ERROR"
             )
         except Exception as e:
-            logger.error(f"Unexpected error calculating SHA-256 for {file_path}: {str(e)}")
+            logger.error(f"Unexpected error calculating hashes for {file_path}: {str(e)}")
             raise FileProcessingError(
                 f"Hash calculation failed: {e}",
                 file_path=str(file_path),
                 error_code="HASH_CALC_ERROR"
             )
     
-    def calculate_md5(self, file_path: FilePath) -> str:
+    def _cache_lookup(self, st: os.stat_result):
+        """Return the cache row for the file identity in st, or None."""
+        try:
+            from ...models import FileHashCache
+            return FileHashCache.get_or_none(
+                (FileHashCache.device == st.st_dev) & (FileHashCache.inode == st.st_ino))
+        except Exception as e:
+            self._cache_error(e)
+            return None
+
+    def _cache_store(self, file_path: FilePath, st: os.stat_result, digests: Dict[str, str], row) -> None:
+        """Record digests for the stat signature the file had before it was read."""
+        if not st.st_ino or time.time_ns() - st.st_mtime_ns < _CACHE_MIN_AGE_NS:
+            return
+        values = {algorithm: digests.get(algorithm) for algorithm in _CACHED_ALGORITHMS}
+        if row is not None and row.matches_stat(st.st_size, st.st_mtime_ns):
+            for algorithm in _CACHED_ALGORITHMS:
+                values[algorithm] = values[algorithm] or getattr(row, algorithm)
+        try:
+            from ...models import FileHashCache
+            FileHashCache.insert(
+                device=st.st_dev,
+                inode=st.st_ino,
+                file_size=st.st_size,
+                mtime_ns=st.st_mtime_ns,
+                path=str(file_path),
+                hashed_at=datetime.datetime.now(),
+                **values
+            ).on_conflict_replace().execute()
+        except Exception as e:
+            self._cache_error(e)
+
+    def _cache_error(self, error: Exception) -> None:
+        """Disable the cache if its table is missing; otherwise just log."""
+        if 'no such table' in str(error).lower():
+            logger.info("File hash cache table not available, hash caching disabled")
+            self.use_cache = False
+        else:
+            logger.debug(f"File hash cache unavailable: {error}")
+
+    def _hashes(self, file_path: FilePath, algorithms: Iterable[str], use_cache: bool = True) -> Dict[str, str]:
+        """
+        Return digests for file_path, reading the file only for digests not cached.
+
+        Args:
+            file_path: Path to the file
+            algorithms: Algorithms to compute
+            use_cache: If False, always read the file (integrity checks); the
+                cache is still refreshed with the result
+
+        Raises:
+            FileProcessingError: If the file cannot be read
+        """
+        algorithms = list(algorithms)
+        if not self.use_cache or not any(a in _CACHED_ALGORITHMS for a in algorithms):
+            return self._digest_file(file_path, algorithms)
+
+        try:
+            st = os.stat(file_path)
+        except OSError as e:
+            logger.error(f"Error reading file for hash calculation: {file_path}")
+            raise FileProcessingError(
+                f"Cannot read file for hash calculation: {e}",
+                file_path=str(file_path),
+                error_code="FILE_READ_ERROR"
+            )
+
+        row = self._cache_lookup(st)
+        results: Dict[str, str] = {}
+        if use_cache and row is not None and row.matches_stat(st.st_size, st.st_mtime_ns):
+            for algorithm in algorithms:
+                if algorithm in _CACHED_ALGORITHMS and getattr(row, algorithm):
+                    results[algorithm] = getattr(row, algorithm)
+
+        missing = [algorithm for algorithm in algorithms if algorithm not in results]
+        if missing:
+            results.update(self._digest_file(file_path, missing))
+            if self.use_cache:
+                self._cache_store(file_path, st, results, row)
+        return {algorithm: results[algorithm] for algorithm in algorithms}
+
+    def calculate_sha256(self, file_path: FilePath, use_cache: bool = True) -> str:
+        """
+        Calculate SHA-256 hash of a file.
+        
+        Args:
+            file_path: Path to the file
+            use_cache: If False, read the file even if a cached digest is valid
+            
+        Returns:
+            SHA-256 hash hex string
+            
+        Raises:
+            FileProcessingError: If file cannot be read
+        """
+        return self._hashes(file_path, ('sha256',), use_cache)['sha256']
+    
+    def calculate_md5(self, file_path: FilePath, use_cache: bool = True) -> str:
         """
         Calculate MD5 hash of a file.
         
         Args:
             file_path: Path to the file
+            use_cache: If False, read the file even if a cached digest is valid
             
         Returns:
             MD5 hash hex string
@@ -77,26 +248,7 @@ class FileHashCalculator:
         Raises:
             FileProcessingError: If file cannot be read
         """
-        try:
-            hash_md5 = hashlib.md5()
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(self.buffer_size), b""):
-                    hash_md5.update(chunk)
-            return hash_md5.hexdigest()
-        except (OSError, IOError) as e:
-            logger.error(f"Error reading file for MD5 calculation: {file_path}")
-            raise FileProcessingError(
-                f"Cannot read file for hash calculation: {e}",
-                file_path=str(file_path),
-                error_code="FILE_READ_ERROR"
-            )
-        except Exception as e:
-            logger.error(f"Unexpected error calculating MD5 for {file_path}: {str(e)}")
-            raise FileProcessingError(
-                f"Hash calculation failed: {e}",
-                file_path=str(file_path),
-                error_code="HASH_CALC_ERROR"
-            )
+        return self._hashes(file_path, ('md5',), use_cache)['md5']
     
     def calculate_sha1(self, file_path: FilePath) -> str:
         """
@@ -108,31 +260,51 @@ class FileHashCalculator:
         Returns:
             SHA-1 hash hex string
             
+        Raises:
+            FileProcessingError: If file cannot be read
+        """
+        return self._digest_file(file_path, ('sha1',))['sha1']
+    
+    def calculate_partial_sha256(self, file_path: FilePath, edge_size: int = 1024 * 1024) -> str:
+        """
+        Calculate a partial SHA-256 over the file size, first and last edge_size bytes.
+
+        This is a cheap pre-filter for duplicate detection: files with different
+        partial hashes are certainly different, while equal partial hashes still
+        have to be confirmed with a full hash.
+
+        Args:
+            file_path: Path to the file
+            edge_size: Number of bytes to read from each end (default 1 MiB)
+
+        Returns:
+            Partial SHA-256 hash hex string
+
         Raises:
             FileProcessingError: If file cannot be read
         """
         try:
-            hash_sha1 = hashlib.sha1()
+            hash_partial = hashlib.sha256()
             with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(self.buffer_size), b""):
-                    hash_sha1.update(chunk)
-            return hash_sha1.hexdigest()
+                f.seek(0, 2)
+                size = f.tell()
+                hash_partial.update(str(size).encode('ascii'))
+                f.seek(0)
+                hash_partial.update(f.read(edge_size))
+                if size > edge_size:
+                    f.seek(max(edge_size, size - edge_size))
+                    hash_partial.update(f.read(edge_size))
+            return hash_partial.hexdigest()
         except (OSError, IOError) as e:
-            logger.error(f"Error reading file for SHA-1 calculation: {file_path}")
+            logger.error(f"Error reading file for partial hash calculation: {file_path}")
             raise FileProcessingError(
                 f"Cannot read file for hash calculation: {e}",
                 file_path=str(file_path),
                 error_code="FILE_READ_ERROR"
             )
-        except Exception as e:
-            logger.error(f"Unexpected error calculating SHA-1 for {file_path}: {str(e)}")
-            raise FileProcessingError(
-                f"Hash calculation failed: {e}",
-                file_path=str(file_path),
-                error_code="HASH_CALC_ERROR"
-            )
-    
-    def calculate_multiple_hashes(self, file_path: FilePath, algorithms: list[str] = None) -> dict[str, str]:
+
+    def calculate_multiple_hashes(self, file_path: FilePath, algorithms: list[str] = None,
+                                  use_cache: bool = True) -> dict[str, str]:
         """
         Calculate multiple hashes for a file in a single pass.
         
@@ -140,6 +312,7 @@ class FileHashCalculator:
             file_path: Path to the file
             algorithms: List of algorithms to use ['sha256', 'md5', 'sha1']
                        If None, defaults to ['sha256']
+            use_cache: If False, read the file even if cached digests are valid
             
         Returns:
             Dictionary mapping algorithm names to hash values
@@ -149,51 +322,39 @@ class FileHashCalculator:
         """
         if algorithms is None:
             algorithms = ['sha256']
-        
-        # Validate algorithms
-        valid_algorithms = {'sha256', 'md5', 'sha1'}
-        invalid_algorithms = set(algorithms) - valid_algorithms
-        if invalid_algorithms:
-            raise FileProcessingError(
-                f"Unsupported hash algorithms: {invalid_algorithms}",
-                file_path=str(file_path),
-                error_code="INVALID_HASH_ALGORITHM"
-            )
-        
-        try:
-            # Initialize hash objects
-            hashers = {}
-            for algorithm in algorithms:
-                if algorithm == 'sha256':
-                    hashers[algorithm] = hashlib.sha256()
-                elif algorithm == 'md5':
-                    hashers[algorithm] = hashlib.md5()
-                elif algorithm == 'sha1':
-                    hashers[algorithm] = hashlib.sha1()
-            
-            # Read file and update all hashers
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(self.buffer_size), b""):
-                    for hasher in hashers.values():
-                        hasher.update(chunk)
-            
-            # Return results
-            return {algorithm: hasher.hexdigest() for algorithm, hasher in hashers.items()}
-            
-        except (OSError, IOError) as e:
-            logger.error(f"Error reading file for hash calculation: {file_path}")
-            raise FileProcessingError(
-                f"Cannot read file for hash calculation: {e}",
-                file_path=str(file_path),
-                error_code="FILE_READ_ERROR"
-            )
-        except Exception as e:
-            logger.error(f"Unexpected error calculating hashes for {file_path}: {str(e)}")
-            raise FileProcessingError(
-                f"Hash calculation failed: {e}",
-                file_path=str(file_path),
-                error_code="HASH_CALC_ERROR"
-            )
+        return self._hashes(file_path, algorithms, use_cache)
+
+    def hash_files(self, file_paths: Iterable[FilePath], algorithms: list[str] = None,
+                   workers: Optional[int] = None) -> Dict[str, Optional[dict[str, str]]]:
+        """
+        Hash many files concurrently, reading each file once.
+
+        Args:
+            file_paths: Paths of the files to hash
+            algorithms: Algorithms to compute for every file (default ['sha256'])
+            workers: Number of hashing threads (default: CPU count, at most 8)
+
+        Returns:
+            Dictionary mapping each path to its {algorithm: hash} dictionary, or
+            to None if the file could not be read
+        """
+        if algorithms is None:
+            algorithms = ['sha256']
+        paths = [str(path) for path in file_paths]
+        if workers is None:
+            workers = min(8, os.cpu_count() or 1)
+
+        def hash_one(path: str) -> Optional[dict[str, str]]:
+            try:
+                return self._hashes(path, algorithms)
+            except FileProcessingError as e:
+                logger.warning(f"Could not hash {path}: {e}")
+                return None
+
+        if workers <= 1 or len(paths) <= 1:
+            return {path: hash_one(path) for path in paths}
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hash') as pool:
+            return dict(zip(paths, pool.map(hash_one, paths)))
 
 
 # Global instance for convenience
@@ -203,16 +364,36 @@ _global_calculator: Optional[FileHashCalculator] = None
 def get_file_hash_calculator() -> FileHashCalculator:
     """
     Get the global file hash calculator instance.
+
+    The persistent hash cache is enabled unless 'hash_cache' is set to false
+    in the DEFAULT section of astrofiler.ini.
     
     Returns:
         Singleton FileHashCalculator instance
     """
     global _global_calculator
     if _global_calculator is None:
-        _global_calculator = FileHashCalculator()
+        config = configparser.ConfigParser()
+        config.read('astrofiler.ini')
+        try:
+            use_cache = config.getboolean('DEFAULT', 'hash_cache', fallback=True)
+        except ValueError:
+            use_cache = True
+        _global_calculator = FileHashCalculator(use_cache=use_cache)
     return _global_calculator
 
 
+def clear_file_hash_cache() -> int:
+    """
+    Remove all cached file digests.
+
+    Returns:
+        Number of rows deleted
+    """
+    from ...models import FileHashCache
+    return FileHashCache.delete().execute()
+
+
 def reset_file_hash_calculator() -> None:
     """Reset the global calculator (mainly for testing)."""
     global _global_calculator
@@ -0,0 +1,127 @@
+"""
+Background full-hash backfill service for AstroFiler.
+
+When 'lazy_full_hash' is enabled (the default), files are registered with only their size
+and partial hash; the full SHA-256 is filled in later by this service on a
+background thread so ingest throughput does not depend on disk bandwidth.
+"""
+
+import os
+import logging
+import threading
+from typing import Optional
+
+from .file_hash_calculator import get_file_hash_calculator
+from ...exceptions import FileProcessingError
+
+logger = logging.getLogger(__name__)
+
+
+class HashBackfillWorker(threading.Thread):
+    """
+    Background thread that computes missing fitsFileHash values.
+
+    Rows are processed in batches; each batch is written in one transaction.
+    """
+
+    def __init__(self, batch_size: int = 100):
+        """
+        Initialize the worker.
+
+        Args:
+            batch_size: Number of files hashed per database transaction
+        """
+        super().__init__(name='hash-backfill', daemon=True)
+        self.batch_size = batch_size
+        self.hashed = 0
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        """Ask the worker to stop after the current file."""
+        self._stop_event.set()
+
+    def run(self) -> None:
+        from ...models import db, fitsFile
+
+        calculator = get_file_hash_calculator()
+        failed = set()
+        try:
+            while not self._stop_event.is_set():
+                query = (fitsFile
+                         .select(fitsFile.fitsFileId, fitsFile.fitsFileName)
+                         .where(fitsFile.fitsFileHash.is_null()))
+                if failed:
+                    query = query.where(fitsFile.fitsFileId.not_in(list(failed)))
+                batch = list(query.limit(self.batch_size).tuples())
+                if not batch:
+                    break
+
+                updates = []
+                for file_id, name in batch:
+                    if self._stop_event.is_set():
+                        break
+                    if not name or not os.path.exists(name):
+                        failed.add(file_id)
+                        continue
+                    try:
+                        updates.append((file_id, calculator.calculate_sha256(name)))
+                    except FileProcessingError as e:
+                        logger.warning(f"Hash backfill skipped {name}: {e}")
+                        failed.add(file_id)
+
+                if updates:
+                    with db.atomic():
+                        for file_id, file_hash in updates:
+                            (fitsFile
+                             .update(fitsFileHash=file_hash)
+                             .where(fitsFile.fitsFileId == file_id)
+                             .execute())
+                    self.hashed += len(updates)
+        except Exception as e:
+            logger.error(f"Hash backfill failed: {e}")
+        finally:
+            logger.info(f"Hash backfill finished: {self.hashed} files hashed, {len(failed)} skipped")
+            try:
+                db.close()
+            except Exception:
+                pass
+
+
+_backfill_worker: Optional[HashBackfillWorker] = None
+_backfill_lock = threading.Lock()
+
+
+def start_hash_backfill() -> HashBackfillWorker:
+    """
+    Start the background hash backfill unless it is already running.
+
+    Returns:
+        The running HashBackfillWorker
+    """
+    global _backfill_worker
+    with _backfill_lock:
+        if _backfill_worker is None or not _backfill_worker.is_alive():
+            _backfill_worker = HashBackfillWorker()
+            _backfill_worker.start()
+        return _backfill_worker
+
+
+def wait_for_hash_backfill(timeout: Optional[float] = None) -> bool:
+    """
+    Wait for a running hash backfill to finish.
+
+    The backfill runs on a daemon thread, so command-line tools call this
+    before exiting to leave no registered file without its full hash.
+
+    Args:
+        timeout: Seconds to wait (None waits until it finishes)
+
+    Returns:
+        True if no backfill is running any more
+    """
+    with _backfill_lock:
+        worker = _backfill_worker
+    if worker is None:
+        return True
+    worker.join(timeout)
+    return not worker.is_alive()
@@ -0,0 +1,141 @@
+"""
+Set-based session building for AstroFiler.
+
+Session creation used to load full fitsFile rows and save() each one after
+assigning its session, which is one UPDATE (and one commit) per frame. The
+helpers here let SessionProcessor work in three steps:
+
+1. fetch_unassigned_files() selects only the columns grouping needs, as tuples
+2. the caller computes session boundaries in memory and records them in a
+   SessionBuilder
+3. SessionBuilder.commit() writes all new sessions with insert_many and all
+   file assignments with one UPDATE ... WHERE fitsFileId IN (...) per session,
+   inside a single transaction
+"""
+
+import uuid
+import logging
+from typing import Any, Dict, List, Sequence
+
+from ..models import db
+from ..models.fits_file import fitsFile as FitsFileModel
+from ..models.fits_session import fitsSession as fitsSessionModel
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound variables per statement
+_UPDATE_CHUNK_SIZE = 500
+# fitsSession rows bind ~20 values each; keep insert_many well below 999 variables
+_INSERT_CHUNK_SIZE = 40
+
+# Columns needed to group files into sessions and describe the session
+_SESSION_COLUMNS = (
+    FitsFileModel.fitsFileId,
+    FitsFileModel.fitsFileName,
+    FitsFileModel.fitsFileObject,
+    FitsFileModel.fitsFileDate,
+    FitsFileModel.fitsFileTelescop,
+    FitsFileModel.fitsFileInstrument,
+    FitsFileModel.fitsFileExpTime,
+    FitsFileModel.fitsFileXBinning,
+    FitsFileModel.fitsFileYBinning,
+    FitsFileModel.fitsFileCCDTemp,
+    FitsFileModel.fitsFileGain,
+    FitsFileModel.fitsFileOffset,
+    FitsFileModel.fitsFileFilter,
+)
+
+
+def fetch_unassigned_files(type_contains: str, order_by: Sequence[Any]) -> List[Any]:
+    """
+    Fetch files of a type that are not assigned to a session.
+
+    Args:
+        type_contains: Substring of fitsFileType to match (e.g. "Light", "DARK")
+        order_by: fitsFile fields to sort by
+
+    Returns:
+        List of named tuples with the fitsFile session columns
+    """
+    return list(FitsFileModel
+                .select(*_SESSION_COLUMNS)
+                .where(FitsFileModel.fitsFileSession.is_null(True),
+                       FitsFileModel.fitsFileType.contains(type_contains))
+                .order_by(*order_by)
+                .namedtuples())
+
+
+class SessionBuilder:
+    """
+    Collects new sessions and file assignments and writes them in one transaction.
+    """
+
+    def __init__(self) -> None:
+        self.sessions: List[Dict[str, Any]] = []
+        self.assignments: Dict[Any, List[str]] = {}
+
+    def add_session(self, fits_file: Any, object_name: Any, session_date: Any) -> uuid.UUID:
+        """
+        Record a new session described by its first file.
+
+        Args:
+            fits_file: Row from fetch_unassigned_files()
+            object_name: Session object name
+            session_date: Session date (DateField value)
+
+        Returns:
+            The new session ID
+        """
+        session_id = uuid.uuid4()
+        self.sessions.append({
+            'fitsSessionId': session_id,
+            'fitsSessionObjectName': object_name,
+            'fitsSessionTelescope': fits_file.fitsFileTelescop,
+            'fitsSessionImager': fits_file.fitsFileInstrument,
+            'fitsSessionDate': session_date,
+            'fitsSessionExposure': fits_file.fitsFileExpTime,
+            'fitsSessionBinningX': fits_file.fitsFileXBinning,
+            'fitsSessionBinningY': fits_file.fitsFileYBinning,
+            'fitsSessionCCDTemp': fits_file.fitsFileCCDTemp,
+            'fitsSessionGain': fits_file.fitsFileGain,
+            'fitsSessionOffset': fits_file.fitsFileOffset,
+            'fitsSessionFilter': fits_file.fitsFileFilter,
+            'fitsBiasSession': None,
+            'fitsDarkSession': None,
+            'fitsFlatSession': None,
+        })
+        self.assignments[session_id] = []
+        return session_id
+
+    def assign(self, session_id: uuid.UUID, file_id: str) -> None:
+        """Assign a file to a session recorded with add_session()."""
+        self.assignments[session_id].append(file_id)
+
+    def commit(self) -> int:
+        """
+        Write the recorded sessions and assignments in a single transaction.
+
+        Returns:
+            Number of files assigned
+
+        Raises:
+            IntegrityError: If a session could not be inserted (nothing is written)
+        """
+        if not self.sessions:
+            return 0
+        assigned = 0
+        with db.atomic():
+            for i in range(0, len(self.sessions), _INSERT_CHUNK_SIZE):
+                fitsSessionModel.insert_many(self.sessions[i:i + _INSERT_CHUNK_SIZE]).execute()
+            for session_id, file_ids in self.assignments.items():
+                for i in range(0, len(file_ids), _UPDATE_CHUNK_SIZE):
+                    chunk = file_ids[i:i + _UPDATE_CHUNK_SIZE]
+                    (FitsFileModel
+                     .update(fitsFileSession=session_id)
+                     .where(FitsFileModel.fitsFileId.in_(chunk))
+                     .execute())
+                    assigned += len(chunk)
+        logger.debug(f"Wrote {len(self.sessions)} sessions and {assigned} file assignments")
+        self.sessions = []
+        self.assignments = {}
+        return assigned
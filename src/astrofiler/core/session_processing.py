@@ -6,13 +6,16 @@ including creating light sessions, calibration sessions, and linking them togeth
 """
 
 import logging
-import uuid
 from datetime import datetime, timedelta
 from typing import Optional, List, Union
 from peewee import IntegrityError
 
 from ..models.fits_file import fitsFile as FitsFileModel
 from ..models.fits_session import fitsSession as fitsSessionModel
+from ..models import db
+from .session_builder import SessionBuilder, fetch_unassigned_files
+from .session_quality import refresh_session_quality, session_quality_percentiles
+from .calibration_matcher import CalibrationSessionMatcher, MATCH_COLUMNS
 
 logger = logging.getLogger(__name__)
 
@@ -42,19 +45,18 @@ class SessionProcessor:
         sessionsCreated = []
         
         # Query for all fits files that are not assigned to a session, sort by object, date, filter
-        unassigned_files = FitsFileModel.select().where(
-            FitsFileModel.fitsFileSession.is_null(True), 
-            FitsFileModel.fitsFileType.contains("Light")
-        ).order_by(
+        unassigned_files = fetch_unassigned_files("Light", (
             FitsFileModel.fitsFileObject, 
             FitsFileModel.fitsFileDate, 
             FitsFileModel.fitsFileFilter
-        )
+        ))
 
         # How many unassigned_files are there?
         logger.info("createSessions found "+str(len(unassigned_files))+" unassigned files to session")
 
-        # Loop through each unassigned file and create a session each time the object, date, or filter changes
+        # Loop through each unassigned file and create a session each time the object, date, or filter changes.
+        # Sessions and assignments are collected in memory and written in one transaction.
+        builder = SessionBuilder()
         currentObject = ""
         currentDate = None
         currentFilter = None
@@ -78,41 +80,21 @@ class SessionProcessor:
             if (str(currentFitsFile.fitsFileObject) != currentObject or
                 fits_date != currentDate or
                 fits_filter != currentFilter):
-                # Create a new fitsSession record
-                currentSessionId = uuid.uuid4()
+                currentSessionId = builder.add_session(currentFitsFile, currentFitsFile.fitsFileObject, fits_date)
                 currentDate = fits_date
                 currentFilter = fits_filter
-
-                try:
-                    newFitsSession = fitsSessionModel.create(
-                        fitsSessionId=currentSessionId,
-                        fitsSessionObjectName=currentFitsFile.fitsFileObject,
-                        fitsSessionTelescope=currentFitsFile.fitsFileTelescop,
-                        fitsSessionImager=currentFitsFile.fitsFileInstrument,
-                        fitsSessionDate=fits_date,
-                        fitsSessionExposure=currentFitsFile.fitsFileExpTime,
-                        fitsSessionBinningX=currentFitsFile.fitsFileXBinning,
-                        fitsSessionBinningY=currentFitsFile.fitsFileYBinning,
-                        fitsSessionCCDTemp=currentFitsFile.fitsFileCCDTemp,
-                        fitsSessionGain=currentFitsFile.fitsFileGain,
-                        fitsSessionOffset=currentFitsFile.fitsFileOffset,
-                        fitsSessionFilter=fits_filter,
-                        fitsBiasSession=None,
-                        fitsDarkSession=None,
-                        fitsFlatSession=None
-                    )
-                    sessionsCreated.append(currentSessionId)
-                    logger.debug("New session created for "+str(newFitsSession.fitsSessionId))
-                except IntegrityError as e:
-                    # Handle the integrity error
-                    logger.error("IntegrityError: "+str(e))
-                    continue
+                sessionsCreated.append(currentSessionId)
                 currentObject = str(currentFitsFile.fitsFileObject)
 
             # Assign the current session to the fits file
-            currentFitsFile.fitsFileSession = currentSessionId
-            currentFitsFile.save()
-            logger.debug("Assigned "+str(currentFitsFile.fitsFileName)+" to session "+str(currentSessionId))
+            builder.assign(currentSessionId, currentFitsFile.fitsFileId)
+
+        try:
+            builder.commit()
+        except IntegrityError as e:
+            # Handle the integrity error; the transaction was rolled back
+            logger.error("IntegrityError: "+str(e))
+            return []
             
         # Get unique sessions count
         unique_sessions = len(set(sessionsCreated))
@@ -129,65 +111,33 @@ class SessionProcessor:
         """
         Calculate and update average quality metrics for sessions.
         
+        The averages come from one grouped aggregate query over the sessions'
+        files and are written with a bulk update (see session_quality).
+        
         Args:
             session_ids: List of session IDs to update
+            
+        Returns:
+            int: Number of sessions updated
+        """
+        try:
+            return refresh_session_quality(session_ids)
+        except Exception as e:
+            logger.error(f"Error updating quality metrics for {len(session_ids)} sessions: {e}")
+            return 0
+
+    def getSessionQualityPercentiles(self, session_ids, percentiles=(50,)):
         """
-        import numpy as np
+        Calculate percentiles (the median by default) of session quality metrics.
         
-        for session_id in session_ids:
-            try:
-                # Get all files in this session with quality metrics
-                session_files = FitsFileModel.select().where(
-                    FitsFileModel.fitsFileSession == session_id
-                )
-                
-                # Collect quality metrics
-                fwhm_values = []
-                ecc_values = []
-                hfr_values = []
-                snr_values = []
-                star_counts = []
-                scale_values = []
-                
-                for f in session_files:
-                    if f.fitsFileAvgFWHMArcsec is not None:
-                        fwhm_values.append(f.fitsFileAvgFWHMArcsec)
-                    if f.fitsFileAvgEccentricity is not None:
-                        ecc_values.append(f.fitsFileAvgEccentricity)
-                    if f.fitsFileAvgHFRArcsec is not None:
-                        hfr_values.append(f.fitsFileAvgHFRArcsec)
-                    if f.fitsFileImageSNR is not None:
-                        snr_values.append(f.fitsFileImageSNR)
-                    if f.fitsFileStarCount is not None:
-                        star_counts.append(f.fitsFileStarCount)
-                    if f.fitsFileImageScale is not None:
-                        scale_values.append(f.fitsFileImageScale)
-                
-                # Calculate averages and update session
-                update_data = {}
-                if fwhm_values:
-                    update_data['fitsSessionAvgFWHMArcsec'] = float(np.mean(fwhm_values))
-                if ecc_values:
-                    update_data['fitsSessionAvgEccentricity'] = float(np.mean(ecc_values))
-                if hfr_values:
-                    update_data['fitsSessionAvgHFRArcsec'] = float(np.mean(hfr_values))
-                if snr_values:
-                    update_data['fitsSessionImageSNR'] = float(np.mean(snr_values))
-                if star_counts:
-                    update_data['fitsSessionStarCount'] = int(np.mean(star_counts))
-                if scale_values:
-                    update_data['fitsSessionImageScale'] = float(np.mean(scale_values))
-                
-                if update_data:
-                    query = fitsSessionModel.update(**update_data).where(
-                        fitsSessionModel.fitsSessionId == session_id
-                    )
-                    query.execute()
-                    logger.debug(f"Updated quality metrics for session {session_id}")
-                    
-            except Exception as e:
-                logger.error(f"Error updating quality metrics for session {session_id}: {e}")
-                continue
+        Args:
+            session_ids: List of session IDs to summarize
+            percentiles: Percentiles to compute (0-100)
+            
+        Returns:
+            dict: {session ID: {metric name: {percentile: value}}}
+        """
+        return session_quality_percentiles(session_ids, percentiles)
 
     def shouldCreateNewCalibrationSession(self, currentFile, currentSession, calType):
         """
@@ -330,253 +280,80 @@ class SessionProcessor:
         Returns:
             list: List of session IDs that were created
         """
-        createdCalibrationSessions = []
-        createdBiasSessions = []
-        createdDarkSessions = []
-        createdFlatSessions = []
-        
         # Query for all calibration files that are not assigned to a session
         # Order by telescope, instrument, date, then binning so grouping is stable
-        unassignedBiases = FitsFileModel.select().where(
-            FitsFileModel.fitsFileSession.is_null(True), 
-            FitsFileModel.fitsFileType.contains("BIAS")
-        ).order_by(
+        unassignedBiases = fetch_unassigned_files("BIAS", (
             FitsFileModel.fitsFileTelescop,
             FitsFileModel.fitsFileInstrument,
             FitsFileModel.fitsFileDate,
             FitsFileModel.fitsFileXBinning,
             FitsFileModel.fitsFileYBinning
-        )
+        ))
         
         # Order by telescope, instrument, date, then exposure and binning for darks
-        unassignedDarks = FitsFileModel.select().where(
-            FitsFileModel.fitsFileSession.is_null(True), 
-            FitsFileModel.fitsFileType.contains("DARK")
-        ).order_by(
+        unassignedDarks = fetch_unassigned_files("DARK", (
             FitsFileModel.fitsFileTelescop,
             FitsFileModel.fitsFileInstrument,
             FitsFileModel.fitsFileDate,
             FitsFileModel.fitsFileExpTime,
             FitsFileModel.fitsFileXBinning,
             FitsFileModel.fitsFileYBinning
-        )
+        ))
         
         # Order by telescope, instrument, date, then filter and binning for flats
-        unassignedFlats = FitsFileModel.select().where(
-            FitsFileModel.fitsFileSession.is_null(True), 
-            FitsFileModel.fitsFileType.contains("FLAT")
-        ).order_by(
+        unassignedFlats = fetch_unassigned_files("FLAT", (
             FitsFileModel.fitsFileTelescop,
             FitsFileModel.fitsFileInstrument,
             FitsFileModel.fitsFileDate,
             FitsFileModel.fitsFileFilter,
             FitsFileModel.fitsFileXBinning,
             FitsFileModel.fitsFileYBinning
-        )
+        ))
         
         # Calculate total files for progress tracking
         total_biases = len(unassignedBiases)
         total_darks = len(unassignedDarks)
         total_flats = len(unassignedFlats)
         total_files = total_biases + total_darks + total_flats
-        current_count = 0
         
         # How many unassigned_files are there?
         logger.info("createCalibrationSessions found "+str(total_biases)+" unassigned Bias calibration files to Session")
         logger.info("createCalibrationSessions found "+str(total_darks)+" unassigned Dark calibration files to Session")
         logger.info("createCalibrationSessions found "+str(total_flats)+" unassigned Flat calibration files to Session")
 
+        # Sessions and assignments are collected in memory and written in one transaction
+        builder = SessionBuilder()
+        progress = {'current': 0, 'total': total_files, 'callback': progress_callback}
+        
         # Bias calibration files - group by date, telescope, imager, binning
-        currentDate = None
-        currentTelescope = None
-        currentImager = None 
-        currentBinningX = None
-        currentBinningY = None
-        uuidStr = None
-                        
-        for biasFitsFile in unassignedBiases:
-            current_count += 1
-            
-            # Call progress callback if provided
-            if progress_callback:
-                should_continue = progress_callback(current_count, total_files, f"Bias: {biasFitsFile.fitsFileName}")
-                if not should_continue:
-                    logger.info("Calibration Session creation cancelled by user")
-                    return createdCalibrationSessions
-            
-            # Check if we need to create a new session
-            fits_date = self.dateToDateField(biasFitsFile.fitsFileDate)
-            if (fits_date != currentDate or
-                biasFitsFile.fitsFileTelescop != currentTelescope or
-                biasFitsFile.fitsFileInstrument != currentImager or
-                biasFitsFile.fitsFileXBinning != currentBinningX or
-                biasFitsFile.fitsFileYBinning != currentBinningY):
-                    
-                logger.debug("Creating new bias session for date " + str(biasFitsFile.fitsFileDate))
-                uuidStr = uuid.uuid4()  # New Session
-                newFitsSession = fitsSessionModel.create(
-                    fitsSessionId=uuidStr,
-                    fitsSessionDate=fits_date,
-                    fitsSessionObjectName='Bias',
-                    fitsSessionTelescope=biasFitsFile.fitsFileTelescop,
-                    fitsSessionImager=biasFitsFile.fitsFileInstrument,
-                    fitsSessionExposure=biasFitsFile.fitsFileExpTime,
-                    fitsSessionBinningX=biasFitsFile.fitsFileXBinning,
-                    fitsSessionBinningY=biasFitsFile.fitsFileYBinning,
-                    fitsSessionCCDTemp=biasFitsFile.fitsFileCCDTemp,
-                    fitsSessionGain=biasFitsFile.fitsFileGain,
-                    fitsSessionOffset=biasFitsFile.fitsFileOffset,
-                    fitsSessionFilter=biasFitsFile.fitsFileFilter,
-                    fitsBiasSession=None,
-                    fitsDarkSession=None,
-                    fitsFlatSession=None
-                )
-                
-                # Update current session tracking
-                currentDate = fits_date
-                currentTelescope = biasFitsFile.fitsFileTelescop
-                currentImager = biasFitsFile.fitsFileInstrument
-                currentBinningX = biasFitsFile.fitsFileXBinning
-                currentBinningY = biasFitsFile.fitsFileYBinning
-                
-                # Only add to created sessions list when we actually create a new session
-                createdCalibrationSessions.append(uuidStr)
-                createdBiasSessions.append(uuidStr)
-                logger.debug(f"New bias session {uuidStr} for {biasFitsFile.fitsFileTelescop}/{biasFitsFile.fitsFileInstrument} {biasFitsFile.fitsFileXBinning}x{biasFitsFile.fitsFileYBinning}") 
-            
-            biasFitsFile.fitsFileSession = uuidStr
-            biasFitsFile.save()   
-            logger.debug("Set Session for bias "+biasFitsFile.fitsFileName+" to "+str(uuidStr))
+        createdBiasSessions, cancelled = self._groupCalibrationFiles(
+            builder, unassignedBiases, 'Bias',
+            ('fitsFileTelescop', 'fitsFileInstrument', 'fitsFileXBinning', 'fitsFileYBinning'),
+            progress)
         
         # Dark calibration files - group by date, telescope, imager, exposure, binning
-        currentDate = None
-        currentTelescope = None
-        currentImager = None
-        currentExpTime = None
-        currentBinningX = None
-        currentBinningY = None
-        uuidStr = None
-        
-        for darkFitsFile in unassignedDarks:
-            current_count += 1
-            
-            # Call progress callback if provided
-            if progress_callback:
-                should_continue = progress_callback(current_count, total_files, f"Dark: {darkFitsFile.fitsFileName}")
-                if not should_continue:
-                    logger.info("Calibration Session creation cancelled by user")
-                    return createdCalibrationSessions
-            
-            # Check if we need to create a new session
-            fits_date = self.dateToDateField(darkFitsFile.fitsFileDate)
-            if (fits_date != currentDate or
-                darkFitsFile.fitsFileTelescop != currentTelescope or
-                darkFitsFile.fitsFileInstrument != currentImager or
-                darkFitsFile.fitsFileExpTime != currentExpTime or
-                darkFitsFile.fitsFileXBinning != currentBinningX or
-                darkFitsFile.fitsFileYBinning != currentBinningY):
-                    
-                logger.debug("Creating new dark session for date " + str(darkFitsFile.fitsFileDate))
-                uuidStr = uuid.uuid4()  # New Session
-                newFitsSession = fitsSessionModel.create(
-                    fitsSessionId=uuidStr,
-                    fitsSessionDate=fits_date,
-                    fitsSessionObjectName='Dark',
-                    fitsSessionTelescope=darkFitsFile.fitsFileTelescop,
-                    fitsSessionImager=darkFitsFile.fitsFileInstrument,
-                    fitsSessionExposure=darkFitsFile.fitsFileExpTime,
-                    fitsSessionBinningX=darkFitsFile.fitsFileXBinning,
-                    fitsSessionBinningY=darkFitsFile.fitsFileYBinning,
-                    fitsSessionCCDTemp=darkFitsFile.fitsFileCCDTemp,
-                    fitsSessionGain=darkFitsFile.fitsFileGain,
-                    fitsSessionOffset=darkFitsFile.fitsFileOffset,
-                    fitsSessionFilter=darkFitsFile.fitsFileFilter,
-                    fitsBiasSession=None,
-                    fitsDarkSession=None,
-                    fitsFlatSession=None
-                )
-                
-                # Update current session tracking  
-                currentDate = fits_date
-                currentTelescope = darkFitsFile.fitsFileTelescop
-                currentImager = darkFitsFile.fitsFileInstrument
-                currentExpTime = darkFitsFile.fitsFileExpTime
-                currentBinningX = darkFitsFile.fitsFileXBinning
-                currentBinningY = darkFitsFile.fitsFileYBinning
-                
-                # Only add to created sessions list when we actually create a new session
-                createdCalibrationSessions.append(uuidStr)
-                createdDarkSessions.append(uuidStr)
-                logger.debug(f"New dark session {uuidStr} for {darkFitsFile.fitsFileTelescop}/{darkFitsFile.fitsFileInstrument} {darkFitsFile.fitsFileXBinning}x{darkFitsFile.fitsFileYBinning} {darkFitsFile.fitsFileExpTime}s") 
-            
-            darkFitsFile.fitsFileSession = uuidStr
-            darkFitsFile.save()   
-            logger.debug("Set Session for dark "+darkFitsFile.fitsFileName+" to "+str(uuidStr))
+        createdDarkSessions = []
+        if not cancelled:
+            createdDarkSessions, cancelled = self._groupCalibrationFiles(
+                builder, unassignedDarks, 'Dark',
+                ('fitsFileTelescop', 'fitsFileInstrument', 'fitsFileExpTime',
+                 'fitsFileXBinning', 'fitsFileYBinning'),
+                progress)
             
         # Flat calibration files - group by date, telescope, imager, filter, binning
-        currentDate = None
-        currentTelescope = None
-        currentImager = None
-        currentFilter = None
-        currentBinningX = None
-        currentBinningY = None
-        uuidStr = None
-        
-        for flatFitsFile in unassignedFlats:
-            current_count += 1
-            
-            # Call progress callback if provided
-            if progress_callback:
-                should_continue = progress_callback(current_count, total_files, f"Flat: {flatFitsFile.fitsFileName}")
-                if not should_continue:
-                    logger.info("Calibration Session creation cancelled by user")
-                    return createdCalibrationSessions
-            
-            # Check if we need to create a new session
-            fits_date = self.dateToDateField(flatFitsFile.fitsFileDate)
-            if (fits_date != currentDate or
-                flatFitsFile.fitsFileTelescop != currentTelescope or
-                flatFitsFile.fitsFileInstrument != currentImager or
-                flatFitsFile.fitsFileFilter != currentFilter or
-                flatFitsFile.fitsFileXBinning != currentBinningX or
-                flatFitsFile.fitsFileYBinning != currentBinningY):
-                    
-                logger.debug("Creating new flat session for date " + str(flatFitsFile.fitsFileDate))
-                uuidStr = uuid.uuid4()  # New Session
-                newFitsSession = fitsSessionModel.create(
-                    fitsSessionId=uuidStr,
-                    fitsSessionDate=fits_date,
-                    fitsSessionObjectName='Flat',
-                    fitsSessionTelescope=flatFitsFile.fitsFileTelescop,
-                    fitsSessionImager=flatFitsFile.fitsFileInstrument,
-                    fitsSessionExposure=flatFitsFile.fitsFileExpTime,
-                    fitsSessionBinningX=flatFitsFile.fitsFileXBinning,
-                    fitsSessionBinningY=flatFitsFile.fitsFileYBinning,
-                    fitsSessionCCDTemp=flatFitsFile.fitsFileCCDTemp,
-                    fitsSessionGain=flatFitsFile.fitsFileGain,
-                    fitsSessionOffset=flatFitsFile.fitsFileOffset,
-                    fitsSessionFilter=flatFitsFile.fitsFileFilter,
-                    fitsBiasSession=None,
-                    fitsDarkSession=None,
-                    fitsFlatSession=None
-                )
-                
-                # Update current session tracking
-                currentDate = fits_date
-                currentTelescope = flatFitsFile.fitsFileTelescop
-                currentImager = flatFitsFile.fitsFileInstrument
-                currentFilter = flatFitsFile.fitsFileFilter
-                currentBinningX = flatFitsFile.fitsFileXBinning
-                currentBinningY = flatFitsFile.fitsFileYBinning
-                
-                # Only add to created sessions list when we actually create a new session
-                createdCalibrationSessions.append(uuidStr)
-                createdFlatSessions.append(uuidStr)
-                logger.debug(f"New flat session {uuidStr} for {flatFitsFile.fitsFileTelescop}/{flatFitsFile.fitsFileInstrument} {flatFitsFile.fitsFileXBinning}x{flatFitsFile.fitsFileYBinning} {flatFitsFile.fitsFileFilter}") 
-            
-            flatFitsFile.fitsFileSession = uuidStr
-            flatFitsFile.save()   
-            logger.debug("Set Session for flat "+flatFitsFile.fitsFileName+" to "+str(uuidStr))
+        createdFlatSessions = []
+        if not cancelled:
+            createdFlatSessions, cancelled = self._groupCalibrationFiles(
+                builder, unassignedFlats, 'Flat',
+                ('fitsFileTelescop', 'fitsFileInstrument', 'fitsFileFilter',
+                 'fitsFileXBinning', 'fitsFileYBinning'),
+                progress)
+        
+        createdCalibrationSessions = createdBiasSessions + createdDarkSessions + createdFlatSessions
+        builder.commit()
+        if cancelled:
+            logger.info("Calibration Session creation cancelled by user")
+            return createdCalibrationSessions
         
         # Calculate session counts by type
         bias_sessions_created = len(createdBiasSessions)
@@ -591,6 +368,52 @@ class SessionProcessor:
         logger.info(f"  Total calibration sessions: {total_sessions_created}")
         return createdCalibrationSessions
 
+    def _groupCalibrationFiles(self, builder, files, sessionName, keyFields, progress):
+        """
+        Group sorted calibration files into sessions recorded in a SessionBuilder.
+        
+        A new session starts whenever the date or any of keyFields changes
+        from the previous file.
+        
+        Args:
+            builder: SessionBuilder collecting sessions and assignments
+            files: Rows from fetch_unassigned_files(), sorted by the grouping keys
+            sessionName: Session object name ('Bias', 'Dark' or 'Flat')
+            keyFields: fitsFile attribute names that must match within a session
+            progress: Dict with 'current', 'total' and 'callback' for progress updates
+            
+        Returns:
+            tuple: (list of session IDs created, True if cancelled by the user)
+        """
+        createdSessions = []
+        currentKey = None
+        uuidStr = None
+        callback = progress['callback']
+        
+        for calFitsFile in files:
+            progress['current'] += 1
+            
+            # Call progress callback if provided
+            if callback:
+                should_continue = callback(progress['current'], progress['total'],
+                                           f"{sessionName}: {calFitsFile.fitsFileName}")
+                if not should_continue:
+                    return createdSessions, True
+            
+            # Check if we need to create a new session
+            fits_date = self.dateToDateField(calFitsFile.fitsFileDate)
+            key = (fits_date,) + tuple(getattr(calFitsFile, field) for field in keyFields)
+            if key != currentKey:
+                uuidStr = builder.add_session(calFitsFile, sessionName, fits_date)
+                currentKey = key
+                createdSessions.append(uuidStr)
+                logger.debug(f"New {sessionName.lower()} session {uuidStr} for {calFitsFile.fitsFileTelescop}/"
+                             f"{calFitsFile.fitsFileInstrument} {calFitsFile.fitsFileXBinning}x{calFitsFile.fitsFileYBinning}")
+            
+            builder.assign(uuidStr, calFitsFile.fitsFileId)
+        
+        return createdSessions, False
+
     def linkSessions(self, progress_callback=None):
         """
         Link calibration sessions to light sessions based on telescope, imager, and specific matching criteria.
@@ -601,9 +424,13 @@ class SessionProcessor:
         - Binning settings (all calibration types)
         - Gain and offset settings (all calibration types)
         - Exposure time (darks only)
-        - CCD temperature within 5 degrees (darks only)
+        - CCD temperature within 5 degrees (darks only; 'dark_temperature_tolerance'
+          in astrofiler.ini)
         - Filter (flats only)
         
+        Calibration sessions are loaded once and matched in memory by
+        CalibrationSessionMatcher; all link updates are written in one transaction.
+        
         Args:
             progress_callback: Optional callback function for progress updates
             
@@ -614,17 +441,28 @@ class SessionProcessor:
         
         try:
             # Get all light sessions that need calibration linking
-            light_sessions = (fitsSessionModel
-                             .select()
+            light_sessions = list(fitsSessionModel
+                             .select(*MATCH_COLUMNS,
+                                     fitsSessionModel.fitsBiasSession,
+                                     fitsSessionModel.fitsDarkSession,
+                                     fitsSessionModel.fitsFlatSession)
                              .where(fitsSessionModel.fitsSessionObjectName != 'Bias',
                                    fitsSessionModel.fitsSessionObjectName != 'Dark',
-                                   fitsSessionModel.fitsSessionObjectName != 'Flat'))
+                                   fitsSessionModel.fitsSessionObjectName != 'Flat')
+                             .namedtuples())
             
             total_sessions = len(light_sessions)
             current_count = 0
             
             logger.info(f"Found {total_sessions} light sessions to process for calibration linking")
             
+            # Load all calibration sessions once and match in memory
+            matcher = CalibrationSessionMatcher().load()
+            
+            # Link updates grouped by the links to set, so sessions sharing the
+            # same calibration sessions are written with a single UPDATE
+            pending_links = {}
+            
             for light_session in light_sessions:
                 current_count += 1
                 
@@ -636,95 +474,46 @@ class SessionProcessor:
                         logger.info("Session linking cancelled by user")
                         break
                 
-                session_updated = False
-                
-                # Use session-level fields for matching criteria instead of querying individual files
-                light_exp_time = light_session.fitsSessionExposure
-                light_x_binning = light_session.fitsSessionBinningX
-                light_y_binning = light_session.fitsSessionBinningY
-                light_filter = light_session.fitsSessionFilter
-                light_gain = light_session.fitsSessionGain
-                light_offset = light_session.fitsSessionOffset
-                light_ccd_temp = light_session.fitsSessionCCDTemp
-                
-                logger.debug(f"Light session {light_session.fitsSessionId} criteria: exp={light_exp_time}, binning={light_x_binning}x{light_y_binning}, filter={light_filter}, gain={light_gain}, offset={light_offset}, temp={light_ccd_temp}")
+                links = {}
                 
                 # Find most recent bias session with matching telescope/imager/binning/gain/offset
                 if not light_session.fitsBiasSession:
-                    bias_session = (fitsSessionModel
-                                   .select()
-                                   .where(fitsSessionModel.fitsSessionObjectName == 'Bias',
-                                         fitsSessionModel.fitsSessionTelescope == light_session.fitsSessionTelescope,
-                                         fitsSessionModel.fitsSessionImager == light_session.fitsSessionImager,
-                                         fitsSessionModel.fitsSessionDate <= light_session.fitsSessionDate,
-                                         fitsSessionModel.fitsSessionBinningX == light_x_binning,
-                                         fitsSessionModel.fitsSessionBinningY == light_y_binning,
-                                         fitsSessionModel.fitsSessionGain == light_gain,
-                                         fitsSessionModel.fitsSessionOffset == light_offset)
-                                   .order_by(fitsSessionModel.fitsSessionDate.desc())
-                                   .first())
-                    
-                    if bias_session:
-                        light_session.fitsBiasSession = str(bias_session.fitsSessionId)
-                        session_updated = True
-                        logger.debug(f"Linked bias session {bias_session.fitsSessionId} to light session {light_session.fitsSessionId} (binning: {light_x_binning}x{light_y_binning}, gain: {light_gain}, offset: {light_offset})")
+                    bias_session_id = matcher.find('Bias', light_session)
+                    if bias_session_id:
+                        links['fitsBiasSession'] = bias_session_id
                     else:
                         logger.debug(f"No matching bias session found for light session {light_session.fitsSessionId}")
                 
                 # Find most recent dark session with matching telescope/imager/binning/exposure/gain/offset/ccd_temp (within 5 degrees)
                 if not light_session.fitsDarkSession:
-                    # Select most recent dark session matching parameters (excluding CCD temperature)
-                    dark_session = (fitsSessionModel
-                        .select()
-                        .where(
-                            fitsSessionModel.fitsSessionObjectName == 'Dark',
-                            fitsSessionModel.fitsSessionTelescope == light_session.fitsSessionTelescope,
-                            fitsSessionModel.fitsSessionImager == light_session.fitsSessionImager,
-                            fitsSessionModel.fitsSessionDate <= light_session.fitsSessionDate,
-                            fitsSessionModel.fitsSessionBinningX == light_x_binning,
-                            fitsSessionModel.fitsSessionBinningY == light_y_binning,
-                            fitsSessionModel.fitsSessionExposure == light_exp_time,
-                            fitsSessionModel.fitsSessionGain == light_gain,
-                            fitsSessionModel.fitsSessionOffset == light_offset
-                        )
-                        .order_by(fitsSessionModel.fitsSessionDate.desc())
-                        .first()
-                    )
-                    if dark_session:
-                        light_session.fitsDarkSession = str(dark_session.fitsSessionId)
-                        session_updated = True
-                        logger.debug(f"Linked dark session {dark_session.fitsSessionId} to light session {light_session.fitsSessionId} (exp: {light_exp_time}s, binning: {light_x_binning}x{light_y_binning}, gain: {light_gain}, offset: {light_offset})")
+                    dark_session_id = matcher.find('Dark', light_session)
+                    if dark_session_id:
+                        links['fitsDarkSession'] = dark_session_id
                     else:
-                        logger.debug(f"No matching dark session found for light session {light_session.fitsSessionId} (exp: {light_exp_time}s)")
+                        logger.debug(f"No matching dark session found for light session {light_session.fitsSessionId} (exp: {light_session.fitsSessionExposure}s, temp: {light_session.fitsSessionCCDTemp})")
                 
                 # Find most recent flat session with matching telescope/imager/binning/filter/gain/offset
                 if not light_session.fitsFlatSession:
-                    flat_session = (fitsSessionModel
-                                   .select()
-                                   .where(fitsSessionModel.fitsSessionObjectName == 'Flat',
-                                         fitsSessionModel.fitsSessionTelescope == light_session.fitsSessionTelescope,
-                                         fitsSessionModel.fitsSessionImager == light_session.fitsSessionImager,
-                                         fitsSessionModel.fitsSessionDate <= light_session.fitsSessionDate,
-                                         fitsSessionModel.fitsSessionBinningX == light_x_binning,
-                                         fitsSessionModel.fitsSessionBinningY == light_y_binning,
-                                         fitsSessionModel.fitsSessionFilter == light_filter,
-                                         fitsSessionModel.fitsSessionGain == light_gain,
-                                         fitsSessionModel.fitsSessionOffset == light_offset)
-                                   .order_by(fitsSessionModel.fitsSessionDate.desc())
-                                   .first())
-                    
-                    if flat_session:
-                        light_session.fitsFlatSession = str(flat_session.fitsSessionId)
-                        session_updated = True
-                        logger.debug(f"Linked flat session {flat_session.fitsSessionId} to light session {light_session.fitsSessionId} (filter: {light_filter}, binning: {light_x_binning}x{light_y_binning}, gain: {light_gain}, offset: {light_offset})")
+                    flat_session_id = matcher.find('Flat', light_session)
+                    if flat_session_id:
+                        links['fitsFlatSession'] = flat_session_id
                     else:
-                        logger.debug(f"No matching flat session found for light session {light_session.fitsSessionId} (filter: {light_filter})")
+                        logger.debug(f"No matching flat session found for light session {light_session.fitsSessionId} (filter: {light_session.fitsSessionFilter})")
                 
-                # Save the session if any links were updated
-                if session_updated:
-                    light_session.save()
+                if links:
+                    pending_links.setdefault(tuple(sorted(links.items())), []).append(
+                        str(light_session.fitsSessionId))
                     updated_sessions.append(str(light_session.fitsSessionId))
-                    logger.debug(f"Updated light session {light_session.fitsSessionId} with calibration links")
+                    logger.debug(f"Linking light session {light_session.fitsSessionId} to {links}")
+            
+            # Write all link updates in one transaction
+            with db.atomic():
+                for links, session_ids in pending_links.items():
+                    for i in range(0, len(session_ids), 500):
+                        (fitsSessionModel
+                         .update(**dict(links))
+                         .where(fitsSessionModel.fitsSessionId.in_(session_ids[i:i + 500]))
+                         .execute())
             
             logger.info(f"Session linking complete. Updated {len(updated_sessions)} light sessions with calibration links")
             
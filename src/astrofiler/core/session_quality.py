@@ -0,0 +1,181 @@
+"""
+Set-based session quality rollups for AstroFiler.
+
+Session quality metrics used to be computed by loading every fitsFile row of
+each session into Python, averaging the metric columns with numpy and issuing
+one UPDATE per session. The helpers here keep the work in the database:
+
+1. refresh_session_quality() computes AVG and COUNT of the frame metrics with
+   one grouped SELECT ... GROUP BY fitsFileSession
+2. the averages are written with one bulk UPDATE ... SET col = CASE
+   fitsSessionId WHEN ... END per batch of sessions, inside a single
+   transaction. Only metrics with frame values are written, so a session
+   keeps its stored value for a metric none of its frames has
+3. refresh_session_quality_for_files() refreshes only the sessions of frames
+   whose metrics were just written, so rollups follow quality assessment
+   instead of only being computed when sessions are created
+
+SQLite has no median or percentile aggregate, so session_quality_percentiles()
+reads just the metric columns of the requested sessions in one ordered query
+and computes the percentiles per session with numpy.
+"""
+
+import logging
+from itertools import groupby
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+from peewee import fn
+
+from ..models import db
+from ..models.fits_file import fitsFile as FitsFileModel
+from ..models.fits_session import fitsSession as fitsSessionModel
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound variables per statement
+_SELECT_CHUNK_SIZE = 500
+# Each session binds its id and one value per metric in every CASE, plus its
+# id in the WHERE clause; keep bulk updates well below 999 variables
+_UPDATE_BATCH_SIZE = 50
+
+# (fitsFile column, fitsSession column, rollup name) per quality metric
+SESSION_QUALITY_METRICS = (
+    (FitsFileModel.fitsFileAvgFWHMArcsec, fitsSessionModel.fitsSessionAvgFWHMArcsec, 'fwhm_arcsec'),
+    (FitsFileModel.fitsFileAvgEccentricity, fitsSessionModel.fitsSessionAvgEccentricity, 'eccentricity'),
+    (FitsFileModel.fitsFileAvgHFRArcsec, fitsSessionModel.fitsSessionAvgHFRArcsec, 'hfr_arcsec'),
+    (FitsFileModel.fitsFileImageSNR, fitsSessionModel.fitsSessionImageSNR, 'snr'),
+    (FitsFileModel.fitsFileStarCount, fitsSessionModel.fitsSessionStarCount, 'star_count'),
+    (FitsFileModel.fitsFileImageScale, fitsSessionModel.fitsSessionImageScale, 'image_scale'),
+)
+
+
+def _unique_ids(ids: Iterable) -> List[str]:
+    """Distinct, non-empty ids as strings, in first-seen order."""
+    return list(dict.fromkeys(str(value) for value in ids if value))
+
+
+def refresh_session_quality(session_ids: Iterable) -> int:
+    """
+    Recompute the average quality metrics of sessions from their frames.
+
+    Each session metric is the average of the non-null frame values and the
+    star count is truncated to an integer. Metrics without any frame value
+    keep their stored session value, and sessions without any are left
+    unchanged.
+
+    Args:
+        session_ids: Session IDs to refresh
+
+    Returns:
+        int: Number of sessions updated
+    """
+    session_ids = _unique_ids(session_ids)
+    if not session_ids:
+        return 0
+
+    averages = [fn.AVG(file_column).alias(session_column.name)
+                for file_column, session_column, _ in SESSION_QUALITY_METRICS]
+    # Sessions grouped by the metric columns they have values for, so each
+    # group is written with one bulk update of exactly those columns
+    updates: Dict[tuple, List] = {}
+    with db.atomic():
+        for start in range(0, len(session_ids), _SELECT_CHUNK_SIZE):
+            chunk = session_ids[start:start + _SELECT_CHUNK_SIZE]
+            query = (FitsFileModel
+                     .select(FitsFileModel.fitsFileSession, *averages)
+                     .where(FitsFileModel.fitsFileSession.in_(chunk))
+                     .group_by(FitsFileModel.fitsFileSession)
+                     .dicts())
+            for row in query:
+                values = {session_column.name: row[session_column.name]
+                          for _, session_column, _ in SESSION_QUALITY_METRICS
+                          if row[session_column.name] is not None}
+                if not values:
+                    continue
+                if 'fitsSessionStarCount' in values:
+                    values['fitsSessionStarCount'] = int(values['fitsSessionStarCount'])
+                updates.setdefault(tuple(values), []).append(
+                    fitsSessionModel(fitsSessionId=row['fitsFileSession'], **values))
+
+        for columns, sessions in updates.items():
+            fitsSessionModel.bulk_update(sessions, fields=list(columns), batch_size=_UPDATE_BATCH_SIZE)
+    updated = sum(len(sessions) for sessions in updates.values())
+    logger.debug(f"Refreshed quality rollups for {updated} of {len(session_ids)} sessions")
+    return updated
+
+
+def refresh_session_quality_for_files(file_ids: Iterable) -> int:
+    """
+    Refresh the quality rollups of the sessions containing the given frames.
+
+    Args:
+        file_ids: fitsFile IDs whose quality metrics changed
+
+    Returns:
+        int: Number of sessions updated
+    """
+    file_ids = _unique_ids(file_ids)
+    session_ids = []
+    for start in range(0, len(file_ids), _SELECT_CHUNK_SIZE):
+        chunk = file_ids[start:start + _SELECT_CHUNK_SIZE]
+        query = (FitsFileModel
+                 .select(FitsFileModel.fitsFileSession)
+                 .where(FitsFileModel.fitsFileId.in_(chunk) &
+                        FitsFileModel.fitsFileSession.is_null(False))
+                 .distinct()
+                 .tuples())
+        session_ids.extend(session_id for (session_id,) in query)
+    return refresh_session_quality(session_ids)
+
+
+def session_quality_percentiles(session_ids: Iterable,
+                                percentiles: Sequence[float] = (50,)) -> Dict[str, Dict[str, Dict[float, float]]]:
+    """
+    Percentiles of the frame quality metrics of sessions.
+
+    Args:
+        session_ids: Session IDs to summarize
+        percentiles: Percentiles to compute (0-100); 50 is the median
+
+    Returns:
+        dict: {session ID: {metric name: {percentile: value}}} for the metric
+        names in SESSION_QUALITY_METRICS. Metrics without measured frames are
+        omitted, as are sessions without frames.
+    """
+    session_ids = _unique_ids(session_ids)
+    percentiles = [float(value) for value in percentiles]
+    columns = [file_column for file_column, _, _ in SESSION_QUALITY_METRICS]
+    names = [name for _, _, name in SESSION_QUALITY_METRICS]
+    rollups = {}
+    for start in range(0, len(session_ids), _SELECT_CHUNK_SIZE):
+        chunk = session_ids[start:start + _SELECT_CHUNK_SIZE]
+        query = (FitsFileModel
+                 .select(FitsFileModel.fitsFileSession, *columns)
+                 .where(FitsFileModel.fitsFileSession.in_(chunk))
+                 .order_by(FitsFileModel.fitsFileSession)
+                 .tuples())
+        for session_id, rows in groupby(query, key=lambda row: row[0]):
+            values = np.array([row[1:] for row in rows], dtype=np.float64)
+            metrics = {}
+            for index, name in enumerate(names):
+                column = values[:, index]
+                column = column[~np.isnan(column)]
+                if column.size:
+                    metrics[name] = dict(zip(percentiles, np.percentile(column, percentiles).tolist()))
+            rollups[session_id] = metrics
+    return rollups
+
+
+def session_quality_medians(session_ids: Iterable) -> Dict[str, Dict[str, float]]:
+    """
+    Median frame quality metrics of sessions.
+
+    Args:
+        session_ids: Session IDs to summarize
+
+    Returns:
+        dict: {session ID: {metric name: median}}
+    """
+    return {session_id: {name: values[50.0] for name, values in metrics.items()}
+            for session_id, metrics in session_quality_percentiles(session_ids, (50,)).items()}
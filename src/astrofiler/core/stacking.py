@@ -0,0 +1,622 @@
+"""
+Band-wise frame stacking for AstroFiler.
+
+Master creation used to read every frame three times (validation, statistics,
+accumulation) and approximated the per-pixel median across chunks of 20
+frames. BandStack instead opens every input frame once and reads it in row
+bands across the whole stack:
+
+- plain and tile-compressed FITS images are read through ``hdu.section``,
+  so a band only reads and decodes the rows (or tiles) it needs. The first
+  get_max_open_readers() of them stay open in a FitsImageReader and the
+  others are reopened for every band, so open files do not grow with the
+  frame count and large stacks stay below the process file limit
+- frames that cannot be sectioned (gzip, older tile-compressed readers) or
+  that were transformed in memory (registered lights) are decoded once and
+  spilled to a single float32 file in the temp folder shared by all of them
+
+The band height is chosen so the working set of the rejection method stays
+within the configured ``stack_memory_mb`` budget. Each band is combined with one of the pixel
+rejection methods in REJECTION_METHODS (sigma clip by default, with exact
+per-pixel median/MAD) and an optionally weighted mean. Statistics do not
+depend on frame order.
+"""
+
+import os
+import shutil
+import logging
+import functools
+import tempfile
+import warnings
+import configparser
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .fits_access import FitsImageReader
+
+logger = logging.getLogger(__name__)
+
+# Default working-memory budget for band-wise stacking (MiB)
+DEFAULT_STACK_MEMORY_MB = 1024
+DEFAULT_SIGMA_CLIP_ITERATIONS = 5
+
+# Scale factor from median absolute deviation to standard deviation (normal data)
+MAD_TO_SIGMA = 1.4826
+
+# Float32-sized copies of a band held at once by combine_band() when the
+# rejection method is not known (see the working copies in REJECTION_METHODS)
+_BAND_WORKING_COPIES = 6
+# Float32-sized per-pixel arrays held on top of them (counts, medians, sigmas,
+# float64 sums), which dominate for stacks of a few frames
+_PIXEL_WORKING_COPIES = 16
+
+# The linear fit holds about ten float32 copies of the values it fits, so a
+# band is fitted in this many slices of pixels
+_LINEAR_FIT_SLICES = 4
+
+# Sectioned inputs kept open between bands; later inputs are reopened per band.
+# An open reader can hold two descriptors (file and memory map), so the limit
+# is lowered to an eighth of the process file limit where that is smaller.
+MAX_OPEN_READERS = 32
+
+
+def get_stack_memory_budget(config_path: str = 'astrofiler.ini') -> int:
+    """
+    Get the working-memory budget for band-wise stacking.
+
+    Reads 'stack_memory_mb' from the DEFAULT section of astrofiler.ini.
+
+    Returns:
+        Budget in bytes (default 1024 MiB)
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    try:
+        megabytes = config.getint('DEFAULT', 'stack_memory_mb', fallback=DEFAULT_STACK_MEMORY_MB)
+    except ValueError:
+        megabytes = DEFAULT_STACK_MEMORY_MB
+    return max(16, megabytes) * 1024 * 1024
+
+
+class _FrameSource:
+    """Reads row bands of one input frame as float32."""
+
+    def __init__(self, path: str, reader: Callable[[int, int], np.ndarray], scale: float = 1.0) -> None:
+        self.path = path
+        self._reader = reader
+        self.scale = scale
+
+    def read_rows(self, y0: int, y1: int) -> np.ndarray:
+        rows = np.asarray(self._reader(y0, y1), dtype=np.float32)
+        if self.scale != 1.0:
+            rows = rows * np.float32(self.scale)
+        return rows
+
+
+def get_max_open_readers() -> int:
+    """Number of sectioned inputs a BandStack keeps open (see MAX_OPEN_READERS)."""
+    try:
+        import resource
+        soft, _hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft != resource.RLIM_INFINITY:
+            return max(1, min(MAX_OPEN_READERS, soft // 8))
+    except (ImportError, ValueError, OSError):
+        # No resource module on Windows, where the C runtime allows 512 files
+        pass
+    return MAX_OPEN_READERS
+
+
+def _read_rows_reopened(path: str, y0: int, y1: int) -> np.ndarray:
+    """Open path, read image rows y0:y1 and close it again."""
+    with FitsImageReader(path) as reader:
+        return np.array(reader.read_rows(y0, y1), dtype=np.float32)
+
+
+class BandStack:
+    """
+    A stack of equally-sized frames that is processed in row bands.
+
+    Use as a context manager so open files and spill files are released:
+
+        with BandStack(shape, spill_dir=get_temp_folder()) as stack:
+            stack.add_file(path)
+            for y0, y1, band in stack.bands(budget):
+                ...
+    """
+
+    def __init__(self, shape: Tuple[int, int], spill_dir: Optional[str] = None) -> None:
+        """
+        Initialize an empty stack.
+
+        Args:
+            shape: (height, width) every frame must have
+            spill_dir: Parent folder for spill files (None uses the system temp folder)
+        """
+        self.shape = tuple(shape)
+        self.sources: List[_FrameSource] = []
+        self._spill_parent = spill_dir
+        self._spill_dir: Optional[str] = None
+        self._open_files: List[FitsImageReader] = []
+        self._max_open_files = get_max_open_readers()
+        self._spill_file = None
+        self._spill_frames = 0
+
+    def __enter__(self) -> 'BandStack':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    @property
+    def paths(self) -> List[str]:
+        """Input paths in stack order."""
+        return [source.path for source in self.sources]
+
+    def add_file(self, path: str, scale: float = 1.0, decoded: Optional[np.ndarray] = None) -> None:
+        """
+        Add a FITS file, reading it band by band when its rows can be sectioned.
+
+        Args:
+            path: FITS file path
+            scale: Multiplier applied to every value read (e.g. 1/median for flats)
+            decoded: Already decoded image data, spilled instead of decoding the
+                file again when the file cannot be sectioned
+
+        Raises:
+            ValueError: If the file has no 2D image or a different shape
+        """
+        self.add_reader(FitsImageReader(path), scale, decoded)
+
+    def add_reader(self, reader: FitsImageReader, scale: float = 1.0,
+                   decoded: Optional[np.ndarray] = None) -> None:
+        """
+        Add an open frame. The stack takes ownership of reader and closes it.
+
+        Once get_max_open_readers() frames are held open, further sectioned
+        frames are closed here and reopened for each band.
+
+        Args:
+            reader: Open reader of the frame
+            scale: Multiplier applied to every value read
+            decoded: Already decoded image data, spilled instead of decoding the
+                file again when the file cannot be sectioned
+
+        Raises:
+            ValueError: If the frame has a different shape
+        """
+        try:
+            shape = reader.image_shape
+            if shape != self.shape:
+                raise ValueError(f"Frame shape {shape} does not match stack shape {self.shape}")
+            if not reader.sectioned:
+                self.add_array(reader.path, decoded if decoded is not None else reader.read(), scale)
+                reader.close()
+                return
+        except Exception:
+            reader.close()
+            raise
+
+        if len(self._open_files) < self._max_open_files:
+            self._open_files.append(reader)
+            self.sources.append(_FrameSource(reader.path, reader.read_rows, scale))
+        else:
+            reader.close()
+            self.sources.append(_FrameSource(reader.path, functools.partial(_read_rows_reopened, reader.path),
+                                             scale))
+
+    def add_array(self, path: str, data: np.ndarray, scale: float = 1.0) -> None:
+        """
+        Add decoded image data by appending it to the stack's float32 spill file.
+
+        Args:
+            path: Original file path (for logging and ordering)
+            data: 2D image data
+            scale: Multiplier applied to every value read
+
+        Raises:
+            ValueError: If the data has a different shape
+        """
+        if tuple(data.shape) != self.shape:
+            raise ValueError(f"Frame shape {tuple(data.shape)} does not match stack shape {self.shape}")
+        if self._spill_file is None:
+            self._spill_dir = tempfile.mkdtemp(prefix='astrofiler_stack_', dir=self._spill_parent)
+            self._spill_file = open(os.path.join(self._spill_dir, 'frames.f32'), 'w+b')
+        offset = self._spill_frames * self.shape[0] * self.shape[1] * 4
+        self._spill_file.seek(offset)
+        self._spill_file.write(np.ascontiguousarray(data, dtype=np.float32).data)
+        self._spill_frames += 1
+        self.sources.append(_FrameSource(path, functools.partial(self._read_spill, offset), scale))
+
+    def _read_spill(self, offset: int, y0: int, y1: int) -> np.ndarray:
+        """Read rows y0:y1 of the spilled frame starting at offset."""
+        rows = np.empty((y1 - y0, self.shape[1]), dtype=np.float32)
+        self._spill_file.seek(offset + y0 * self.shape[1] * 4)
+        if self._spill_file.readinto(rows.data) != rows.nbytes:
+            raise OSError(f"Short read from stack spill file {self._spill_file.name}")
+        return rows
+
+    def band_rows(self, memory_budget: int, working_copies: float = _BAND_WORKING_COPIES) -> int:
+        """
+        Rows per band that keep the combining working set within memory_budget bytes.
+
+        Args:
+            memory_budget: Working-memory budget in bytes
+            working_copies: Float32-sized copies of the band held at once,
+                including the band itself
+        """
+        copies = max(1, len(self.sources)) * working_copies + _PIXEL_WORKING_COPIES
+        bytes_per_row = int(self.shape[1] * 4 * copies)
+        return int(max(1, min(self.shape[0], memory_budget // bytes_per_row)))
+
+    def bands(self, memory_budget: int,
+              working_copies: float = _BAND_WORKING_COPIES) -> Iterator[Tuple[int, int, np.ndarray]]:
+        """
+        Iterate over row bands of the whole stack.
+
+        Each source is read exactly once per band.
+
+        Args:
+            memory_budget: Working-memory budget in bytes
+            working_copies: See band_rows()
+
+        Yields:
+            (y0, y1, band) with band shaped (frames, y1 - y0, width), float32
+        """
+        rows = self.band_rows(memory_budget, working_copies)
+        height, width = self.shape
+        for y0 in range(0, height, rows):
+            y1 = min(height, y0 + rows)
+            band = np.empty((len(self.sources), y1 - y0, width), dtype=np.float32)
+            for i, source in enumerate(self.sources):
+                band[i] = source.read_rows(y0, y1)
+            yield y0, y1, band
+
+    def close(self) -> None:
+        """Close open inputs and remove spill files."""
+        for reader in self._open_files:
+            reader.close()
+        self._open_files = []
+        self.sources = []
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+            self._spill_frames = 0
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+
+
+def _nanmedian(values: np.ndarray) -> np.ndarray:
+    """
+    Per-pixel median along the frame axis, ignoring NaNs (NaN if all are NaN).
+
+    Same values as np.nanmedian(values, axis=0), which works on several
+    masked copies of small stacks; this sorts a single copy.
+    """
+    ordered = np.sort(values, axis=0)
+    count = values.shape[0] - np.isnan(ordered).sum(axis=0)
+    middle = np.maximum(count - 1, 0)[np.newaxis]
+    low = np.take_along_axis(ordered, middle // 2, axis=0)[0]
+    high = np.take_along_axis(ordered, middle - middle // 2, axis=0)[0]
+    del ordered
+    median = low + high
+    median /= 2
+    median[count == 0] = np.nan
+    return median
+
+
+def _median_sigma(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-pixel median and MAD-based sigma of a (frames, rows, width) array with NaNs."""
+    center = _nanmedian(values)
+    deviation = np.subtract(values, center)
+    np.abs(deviation, out=deviation)
+    sigma = MAD_TO_SIGMA * _nanmedian(deviation)
+    return center, sigma
+
+
+def _within(deviation: np.ndarray, keep: np.ndarray, low: np.ndarray, high: np.ndarray) -> np.ndarray:
+    """keep & (low <= deviation <= high), without float-sized temporaries."""
+    inside = np.greater_equal(deviation, low)
+    inside &= deviation <= high
+    inside &= keep
+    return inside
+
+
+def _nanstd(values: np.ndarray, invalid: np.ndarray, count: np.ndarray) -> np.ndarray:
+    """
+    np.nanstd(values, axis=0) computed in place; values is overwritten.
+
+    Args:
+        values: Values, NaN where invalid
+        invalid: np.isnan(values)
+        count: Valid values per pixel
+    """
+    values[invalid] = 0
+    mean = values.sum(axis=0)
+    np.true_divide(mean, count, out=mean, casting='unsafe')
+    values -= mean
+    values[invalid] = 0
+    np.multiply(values, values, out=values)
+    variance = values.sum(axis=0)
+    np.true_divide(variance, count, out=variance, casting='unsafe')
+    return np.sqrt(variance)
+
+
+def _sorted_ranks(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (order, sorted values) along the frame axis; NaNs sort last."""
+    order = np.argsort(values, axis=0, kind='stable')
+    return order, np.take_along_axis(values, order, axis=0)
+
+
+def _unsort(order: np.ndarray, sorted_mask: np.ndarray) -> np.ndarray:
+    """Map a mask over sorted positions back to frame order."""
+    mask = np.empty_like(sorted_mask)
+    np.put_along_axis(mask, order, sorted_mask, axis=0)
+    return mask
+
+
+def _reject_none(band: np.ndarray, keep: np.ndarray, **_params) -> np.ndarray:
+    return keep
+
+
+def _reject_sigma_clip(band: np.ndarray, keep: np.ndarray, sigma_low: float = 3.0, sigma_high: float = 3.0,
+                       max_iterations: int = DEFAULT_SIGMA_CLIP_ITERATIONS, **_params) -> np.ndarray:
+    """Iterative median/MAD sigma clip."""
+    for _ in range(max(1, max_iterations)):
+        values = np.where(keep, band, np.nan)
+        center, sigma = _median_sigma(values)
+        values -= center
+        clipped = _within(values, keep, -sigma_low * sigma, sigma_high * sigma)
+        del values
+        if np.array_equal(clipped, keep):
+            break
+        keep = clipped
+    return keep
+
+
+def _reject_winsorized(band: np.ndarray, keep: np.ndarray, sigma_low: float = 3.0, sigma_high: float = 3.0,
+                       max_iterations: int = DEFAULT_SIGMA_CLIP_ITERATIONS, **_params) -> np.ndarray:
+    """Sigma clip with a robust sigma from winsorized (1.5 sigma clamped) values."""
+    for _ in range(max(1, max_iterations)):
+        values = np.where(keep, band, np.nan)
+        center, sigma = _median_sigma(values)
+        invalid = np.isnan(values)
+        count = values.shape[0] - invalid.sum(axis=0)
+        winsorized = np.empty_like(values)
+        for _refine in range(10):
+            np.clip(values, center - 1.5 * sigma, center + 1.5 * sigma, out=winsorized)
+            # 1.134 corrects the standard deviation of 1.5 sigma winsorized normal data
+            refined = 1.134 * _nanstd(winsorized, invalid, count)
+            converged = np.allclose(refined, sigma, rtol=5e-4, equal_nan=True)
+            sigma = refined
+            if converged:
+                break
+        del winsorized, invalid
+        values -= center
+        clipped = _within(values, keep, -sigma_low * sigma, sigma_high * sigma)
+        del values
+        if np.array_equal(clipped, keep):
+            break
+        keep = clipped
+    return keep
+
+
+def _reject_linear_fit(band: np.ndarray, keep: np.ndarray, sigma_low: float = 3.0, sigma_high: float = 3.0,
+                       max_iterations: int = DEFAULT_SIGMA_CLIP_ITERATIONS, **_params) -> np.ndarray:
+    """
+    Reject values far from a straight line fitted to each pixel's sorted values.
+
+    The spread is the mean absolute deviation from the fit, which suits large
+    stacks with a gradient of values (e.g. changing sky background). Pixels
+    are fitted independently, in _LINEAR_FIT_SLICES slices of the band.
+    """
+    frames = band.shape[0]
+    pixels = band[0].size
+    values = band.reshape(frames, 1, pixels)
+    valid = keep.reshape(frames, 1, pixels)
+    clipped = np.empty_like(valid)
+    step = max(1, -(-pixels // _LINEAR_FIT_SLICES))
+    for start in range(0, pixels, step):
+        pixel_slice = slice(start, start + step)
+        clipped[:, :, pixel_slice] = _linear_fit_keep(
+            values[:, :, pixel_slice], valid[:, :, pixel_slice], sigma_low, sigma_high, max_iterations)
+    return clipped.reshape(keep.shape)
+
+
+def _linear_fit_keep(band: np.ndarray, keep: np.ndarray, sigma_low: float, sigma_high: float,
+                     max_iterations: int) -> np.ndarray:
+    """Linear fit clipping of a (frames, rows, width) array; see _reject_linear_fit()."""
+    order, ordered = _sorted_ranks(np.where(keep, band, np.nan))
+    sorted_keep = np.isfinite(ordered)
+    ranks = np.arange(band.shape[0], dtype=np.float32).reshape(-1, 1, 1)
+    for _ in range(max(1, max_iterations)):
+        weight = sorted_keep.astype(np.float32)
+        n = weight.sum(axis=0)
+        x_mean = (ranks * weight).sum(axis=0) / np.maximum(n, 1)
+        y_mean = np.where(sorted_keep, ordered, 0).sum(axis=0) / np.maximum(n, 1)
+        dx = (ranks - x_mean) * weight
+        slope_den = (dx * dx).sum(axis=0)
+        slope = np.where(slope_den > 0,
+                         (dx * np.where(sorted_keep, ordered - y_mean, 0)).sum(axis=0) / np.maximum(slope_den, 1e-12),
+                         0)
+        fit = y_mean + slope * (ranks - x_mean)
+        residual = np.where(sorted_keep, ordered - fit, np.nan)
+        sigma = np.nanmean(np.abs(residual), axis=0)
+        clipped = sorted_keep & (residual >= -sigma_low * sigma) & (residual <= sigma_high * sigma)
+        if np.array_equal(clipped, sorted_keep):
+            break
+        sorted_keep = clipped
+    return _unsort(order, sorted_keep)
+
+
+def _reject_min_max(band: np.ndarray, keep: np.ndarray, min_max_low: int = 1, min_max_high: int = 1,
+                    **_params) -> np.ndarray:
+    """Reject the min_max_low lowest and min_max_high highest values of each pixel."""
+    order, ordered = _sorted_ranks(np.where(keep, band, np.nan))
+    count = np.isfinite(ordered).sum(axis=0)
+    ranks = np.arange(band.shape[0]).reshape(-1, 1, 1)
+    sorted_keep = (ranks >= min_max_low) & (ranks < count - min_max_high)
+    return _unsort(order, sorted_keep) & keep
+
+
+def _reject_percentile(band: np.ndarray, keep: np.ndarray, percentile_low: float = 0.2,
+                       percentile_high: float = 0.1, **_params) -> np.ndarray:
+    """Reject values more than a fraction of the median below or above it (small stacks)."""
+    center = _nanmedian(np.where(keep, band, np.nan))
+    scale = np.abs(center)
+    return _within(band, keep, center - percentile_low * scale, center + percentile_high * scale)
+
+
+# Rejection algorithms: name -> (function, description for headers and help,
+# peak float32-sized copies of the band held by combine_band(), band included)
+REJECTION_METHODS: Dict[str, Tuple[Callable[..., np.ndarray], str, float]] = {
+    'sigma': (_reject_sigma_clip, 'Sigma-clipped mean (median/MAD)', 5),
+    'winsorized': (_reject_winsorized, 'Winsorized sigma-clipped mean', 5),
+    'linear_fit': (_reject_linear_fit, 'Linear fit clipped mean', 5),
+    'minmax': (_reject_min_max, 'Min/max rejected mean', 5.5),
+    'percentile': (_reject_percentile, 'Percentile clipped mean', 4),
+    'none': (_reject_none, 'Mean (no rejection)', 4),
+}
+
+DEFAULT_REJECTION_METHOD = 'sigma'
+
+
+def get_stack_rejection_method(config_path: str = 'astrofiler.ini') -> str:
+    """
+    Get the configured pixel rejection method for stacking.
+
+    Reads 'stack_rejection' from the DEFAULT section of astrofiler.ini.
+
+    Returns:
+        A key of REJECTION_METHODS (default 'sigma')
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    method = config.get('DEFAULT', 'stack_rejection', fallback=DEFAULT_REJECTION_METHOD).strip().lower()
+    if method not in REJECTION_METHODS:
+        logger.warning(f"Unknown stack_rejection '{method}', using '{DEFAULT_REJECTION_METHOD}'")
+        return DEFAULT_REJECTION_METHOD
+    return method
+
+
+def combine_band(band: np.ndarray, method: str = DEFAULT_REJECTION_METHOD,
+                 weights: Optional[np.ndarray] = None, **params
+                 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Reject outliers along the frame axis of a band and average what is left.
+
+    Non-finite values are treated as missing.
+
+    Args:
+        band: Array shaped (frames, rows, width)
+        method: Key of REJECTION_METHODS
+        weights: Optional per-frame weights for the mean
+        **params: Method parameters (sigma_low, sigma_high, max_iterations,
+            min_max_low, min_max_high, percentile_low, percentile_high)
+
+    Returns:
+        (mean, count, center): weighted mean of kept values (float32), number of
+        kept values per pixel, and the per-pixel median of the valid values,
+        used where every value was rejected
+
+    Raises:
+        ValueError: If method is unknown
+    """
+    if method not in REJECTION_METHODS:
+        raise ValueError(f"Unknown rejection method '{method}'")
+    reject, _description, _working_copies = REJECTION_METHODS[method]
+    valid = np.isfinite(band)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # All-NaN pixels
+        keep = reject(band, valid, **params)
+        del valid
+        center = _nanmedian(np.where(np.isfinite(band), band, np.nan))
+
+        count = keep.sum(axis=0)
+        values = np.where(keep, band, 0)
+        if weights is None:
+            total = values.sum(axis=0, dtype=np.float64)
+            norm = count
+        else:
+            # Accumulated frame by frame to avoid float64 copies of the band
+            total = np.zeros(count.shape, dtype=np.float64)
+            norm = np.zeros(count.shape, dtype=np.float64)
+            for frame_values, frame_keep, weight in zip(values, keep, np.asarray(weights, dtype=np.float64)):
+                total += frame_values * weight
+                norm += frame_keep * weight
+        mean = np.empty(count.shape, dtype=np.float32)
+        np.divide(total, norm, out=mean, where=norm > 0, casting='unsafe')
+        mean[norm <= 0] = center[norm <= 0]
+    return mean, count, center
+
+
+def sigma_clip_band(band: np.ndarray, sigma_low: float = 3.0, sigma_high: float = 3.0,
+                    max_iterations: int = DEFAULT_SIGMA_CLIP_ITERATIONS
+                    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Iterative median/MAD sigma clip along the frame axis of a band.
+
+    Equivalent to combine_band(band, 'sigma', ...).
+    """
+    return combine_band(band, 'sigma', sigma_low=sigma_low, sigma_high=sigma_high,
+                        max_iterations=max_iterations)
+
+
+def combine_stack(stack: BandStack, method: str = DEFAULT_REJECTION_METHOD,
+                  weights: Optional[np.ndarray] = None, memory_budget: Optional[int] = None,
+                  progress: Optional[Callable[[int, int], None]] = None, **params
+                  ) -> Tuple[np.ndarray, int, int]:
+    """
+    Combine a BandStack band by band with a rejection method.
+
+    Args:
+        stack: Frames to combine
+        method: Key of REJECTION_METHODS
+        weights: Optional per-frame weights, in stack order
+        memory_budget: Working-memory budget in bytes (None reads 'stack_memory_mb')
+        progress: Called with (rows done, total rows) after each band
+        **params: Method parameters, see combine_band()
+
+    Returns:
+        (master, rejected, total): float32 master image, number of rejected or
+        missing values, and number of values examined
+    """
+    if memory_budget is None:
+        memory_budget = get_stack_memory_budget()
+    if weights is not None and len(weights) != len(stack):
+        raise ValueError(f"Got {len(weights)} weights for {len(stack)} frames")
+    if method not in REJECTION_METHODS:
+        raise ValueError(f"Unknown rejection method '{method}'")
+    working_copies = REJECTION_METHODS[method][2]
+    height = stack.shape[0]
+    master = np.empty(stack.shape, dtype=np.float32)
+    rejected = 0
+    total = 0
+    logger.debug(f"Combining {len(stack)} frames ({method}) in bands of "
+                 f"{stack.band_rows(memory_budget, working_copies)} rows")
+    for y0, y1, band in stack.bands(memory_budget, working_copies):
+        mean, count, _center = combine_band(band, method, weights, **params)
+        master[y0:y1] = mean
+        total += band.size
+        rejected += band.size - int(count.sum())
+        if progress:
+            progress(y1, height)
+    return master, rejected, total
+
+
+def combine_sigma_clip(stack: BandStack, sigma_low: float = 3.0, sigma_high: float = 3.0,
+                       max_iterations: int = DEFAULT_SIGMA_CLIP_ITERATIONS,
+                       memory_budget: Optional[int] = None,
+                       progress: Optional[Callable[[int, int], None]] = None
+                       ) -> Tuple[np.ndarray, int, int]:
+    """
+    Combine a BandStack with an exact per-pixel iterative sigma clip.
+
+    Equivalent to combine_stack(stack, 'sigma', ...).
+    """
+    return combine_stack(stack, 'sigma', memory_budget=memory_budget, progress=progress,
+                         sigma_low=sigma_low, sigma_high=sigma_high, max_iterations=max_iterations)
@@ -0,0 +1,260 @@
+"""
+Batched star measurement kernels for quality analysis.
+
+EnhancedQualityAnalyzer measures FWHM, eccentricity and half flux radius on
+small cutouts around each selected star. Measuring one cutout at a time
+rebuilt the coordinate grids and ran astropy's sigma_clipped_stats() per
+star, so the Python overhead grew with the star count. measure_stars() stacks
+all cutouts into one (N, H, W) array and measures them together:
+
+- background: iterative 2-sigma clipped median and standard deviation per
+  cutout; each cutout is sorted once and clipping only narrows the run of
+  sorted values kept, so every iteration is a few comparisons over the stack
+- FWHM: radial profile around the peak pixel in 0.25 pixel bins, built for
+  all stars with one bincount; the half-maximum crossing is interpolated
+  between the last bin above it and the next populated bin
+- eccentricity: second moments of the positive background-subtracted flux
+- HFR: radius enclosing half of the positive flux, on 100 radius steps
+
+The results match the former per-star measurement. Stars fainter than three
+background sigma, and measurements that fail, are NaN.
+"""
+
+import logging
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Radial profile bins per pixel of radius
+RADIAL_BINS_PER_PIXEL = 4
+
+# Radius steps of the enclosed flux curve
+HFR_STEPS = 100
+
+# Measured FWHM outside this range (pixels) is rejected
+FWHM_RANGE = (0.5, 50.0)
+
+
+def sigma_clipped_stats_batch(stack: np.ndarray, sigma: float = 2.0,
+                              maxiters: int = 5) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sigma-clipped mean, median and standard deviation of each image in a stack.
+
+    Equivalent to astropy's sigma_clipped_stats() (median center, standard
+    deviation, iterating until nothing more is clipped) applied per image.
+
+    Args:
+        stack: (N, ...) array; statistics are computed over all but the first axis
+        sigma: Clipping threshold in standard deviations
+        maxiters: Maximum clipping iterations
+
+    Returns:
+        (mean, median, std) arrays of shape (N,)
+    """
+    values = np.sort(np.array(stack, dtype=np.float64).reshape(len(stack), -1), axis=1)
+    count = len(values)
+    rows = np.arange(count)
+    # NaNs sort last; the unclipped values are always a contiguous run
+    # values[lo:hi] of the sorted data, so each iteration only moves lo and hi
+    lo = np.zeros(count, dtype=np.intp)
+    hi = np.count_nonzero(~np.isnan(values), axis=1)
+
+    # Prefix sums of values centered per row, for the mean and variance of any run
+    center = values[rows, np.maximum(hi - 1, 0) // 2][:, None]
+    centered = np.nan_to_num(values - center)
+    zero = np.zeros((count, 1))
+    sums = np.hstack([zero, np.cumsum(centered, axis=1)])
+    squares = np.hstack([zero, np.cumsum(centered ** 2, axis=1)])
+
+    def stats(lo, hi):
+        n = hi - lo
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (sums[rows, hi] - sums[rows, lo]) / n
+            variance = (squares[rows, hi] - squares[rows, lo]) / n - mean ** 2
+            mid = lo + n // 2
+            upper = values[rows, np.minimum(mid, values.shape[1] - 1)]
+            lower = values[rows, np.maximum(mid - 1, 0)]
+            median = np.where(n % 2 == 1, upper, (lower + upper) / 2.0)
+        empty = n <= 0
+        mean = np.where(empty, np.nan, mean + center[:, 0])
+        median = np.where(empty, np.nan, median)
+        std = np.where(empty, np.nan, np.sqrt(np.maximum(variance, 0.0)))
+        return mean, median, std
+
+    for _ in range(maxiters):
+        _, median, std = stats(lo, hi)
+        with np.errstate(invalid='ignore'):
+            new_lo = np.maximum(lo, np.count_nonzero(values < (median - sigma * std)[:, None], axis=1))
+            new_hi = np.minimum(hi, np.count_nonzero(values <= (median + sigma * std)[:, None], axis=1))
+        if np.array_equal(new_lo, lo) and np.array_equal(new_hi, hi):
+            break
+        lo, hi = new_lo, new_hi
+    return stats(lo, hi)
+
+
+def _radial_fwhm(stack: np.ndarray, r: np.ndarray) -> np.ndarray:
+    """FWHM (pixels) from the radial profiles of background-subtracted cutouts."""
+    count, height, width = stack.shape
+    r_max = min(height, width) // 2
+    nbins = int(r_max * RADIAL_BINS_PER_PIXEL)
+    fwhm = np.full(count, np.nan)
+    if nbins == 0:
+        return fwhm
+
+    # Bins are [k / 4, (k + 1) / 4) pixels; radii beyond r_max are ignored
+    bins = np.floor(r * RADIAL_BINS_PER_PIXEL).astype(np.intp)
+    inside = bins < nbins
+    flat = (np.arange(count)[:, None, None] * nbins + bins)[inside]
+    sums = np.bincount(flat, weights=stack[inside], minlength=count * nbins).reshape(count, nbins)
+    counts = np.bincount(flat, minlength=count * nbins).reshape(count, nbins)
+
+    # Only bins with enough pixels give a reliable profile value
+    valid = counts >= 3
+    with np.errstate(invalid='ignore', divide='ignore'):
+        profile = np.where(valid, sums / np.maximum(counts, 1), -np.inf)
+    peak = profile.max(axis=1)
+    half = peak / 2.0
+    above = valid & (profile >= half[:, None])
+
+    indices = np.arange(nbins)
+    last_above = np.where(above, indices, -1).max(axis=1)
+    measurable = (peak > 0) & np.isfinite(peak) & (last_above >= 0)
+
+    # First populated bin after the last one above half maximum
+    following = np.where(valid, indices, nbins)
+    next_valid = np.minimum.accumulate(following[:, ::-1], axis=1)[:, ::-1]
+    after = np.minimum(last_above + 1, nbins - 1)
+    next_index = np.where(last_above + 1 < nbins,
+                          np.take_along_axis(next_valid, after[:, None], axis=1)[:, 0], nbins)
+
+    centers = (indices + 0.5) / RADIAL_BINS_PER_PIXEL
+    rows = np.arange(count)
+    last = np.maximum(last_above, 0)
+    r1 = centers[last]
+    v1 = profile[rows, last]
+    has_next = next_index < nbins
+    nxt = np.minimum(next_index, nbins - 1)
+    r2 = centers[nxt]
+    v2 = profile[rows, nxt]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        interpolated = r1 + (half - v1) * (r2 - r1) / (v2 - v1)
+    radius = np.where(has_next & (v1 != v2), interpolated, r1)
+
+    diameter = radius * 2.0
+    accepted = measurable & (diameter >= FWHM_RANGE[0]) & (diameter <= FWHM_RANGE[1])
+    fwhm[accepted] = diameter[accepted]
+    return fwhm
+
+
+def _moment_eccentricity(weights: np.ndarray, dx: np.ndarray, dy: np.ndarray) -> np.ndarray:
+    """Eccentricity (0 = round) from second moments of the positive flux."""
+    total = weights.sum(axis=(1, 2))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        m20 = (weights * dx ** 2).sum(axis=(1, 2)) / total
+        m02 = (weights * dy ** 2).sum(axis=(1, 2)) / total
+        m11 = (weights * dx * dy).sum(axis=(1, 2)) / total
+        trace = m20 + m02
+        det = m20 * m02 - m11 ** 2
+        root = np.sqrt((m20 - m02) ** 2 + 4 * m11 ** 2)
+        a_sq = (trace + root) / 2
+        b_sq = (trace - root) / 2
+        eccentricity = np.clip(np.sqrt(1 - b_sq / a_sq), 0.0, 1.0)
+    valid = (total > 0) & (det > 0) & (trace > 0) & (a_sq > 0) & (b_sq > 0)
+    return np.where(valid, eccentricity, np.nan)
+
+
+def _half_flux_radius(weights: np.ndarray, r: np.ndarray) -> np.ndarray:
+    """Radius (pixels) enclosing half the positive flux, on HFR_STEPS radius steps."""
+    count = len(weights)
+    positive = weights > 0
+    total = weights.sum(axis=(1, 2))
+    max_radius = np.where(positive, r, 0.0).max(axis=(1, 2))
+    steps = np.linspace(0.0, max_radius, HFR_STEPS, axis=1)
+
+    # Index of the first step at or beyond each pixel's radius
+    with np.errstate(invalid='ignore', divide='ignore'):
+        step_size = max_radius / (HFR_STEPS - 1)
+        first = np.ceil(r / step_size[:, None, None])
+    first = np.clip(np.nan_to_num(first, nan=0.0), 0, HFR_STEPS - 1).astype(np.intp)
+    rows = np.broadcast_to(np.arange(count)[:, None, None], first.shape)
+    # Correct floating point rounding against the linspace steps
+    first = np.where(steps[rows, np.maximum(first - 1, 0)] >= r, np.maximum(first - 1, 0), first)
+    first = np.where((steps[rows, first] < r) & (first < HFR_STEPS - 1), first + 1, first)
+
+    flat = (rows * HFR_STEPS + first)[positive]
+    enclosed = np.bincount(flat, weights=weights[positive], minlength=count * HFR_STEPS)
+    enclosed = np.cumsum(enclosed.reshape(count, HFR_STEPS), axis=1)
+    index = (enclosed < (total / 2.0)[:, None]).sum(axis=1)
+
+    valid = (total > 0) & (index > 0) & (index < HFR_STEPS)
+    hfr = np.full(count, np.nan)
+    hfr[valid] = steps[np.arange(count)[valid], index[valid]]
+    return hfr
+
+
+def measure_stars(stack: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Measure FWHM, eccentricity and HFR of the star in each cutout.
+
+    Each star is measured around the brightest pixel of its cutout, after
+    subtracting the cutout's sigma-clipped median background.
+
+    Args:
+        stack: (N, H, W) array of equally sized star cutouts
+
+    Returns:
+        dict: 'fwhm', 'eccentricity' and 'hfr' arrays of shape (N,); FWHM and
+        HFR in pixels, NaN where a star is too faint or a measurement fails
+    """
+    stack = np.asarray(stack, dtype=np.float64)
+    count, height, width = stack.shape
+    if count == 0:
+        empty = np.empty(0)
+        return {'fwhm': empty, 'eccentricity': empty.copy(), 'hfr': empty.copy()}
+
+    _, median, std = sigma_clipped_stats_batch(stack, sigma=2.0)
+    stack = stack - median[:, None, None]
+
+    peak = np.argmax(stack.reshape(count, -1), axis=1)
+    peak_y, peak_x = np.unravel_index(peak, (height, width))
+    # Too faint to measure
+    bright = stack.reshape(count, -1)[np.arange(count), peak] >= 3 * std
+
+    yy, xx = np.mgrid[:height, :width]
+    dx = xx[None, :, :] - peak_x[:, None, None].astype(np.float64)
+    dy = yy[None, :, :] - peak_y[:, None, None].astype(np.float64)
+    r = np.sqrt(dx ** 2 + dy ** 2)
+    weights = np.where(stack > 0, stack, 0.0)
+
+    results = {
+        'fwhm': _radial_fwhm(stack, r),
+        'eccentricity': _moment_eccentricity(weights, dx, dy),
+        'hfr': _half_flux_radius(weights, r),
+    }
+    for values in results.values():
+        values[~bright] = np.nan
+    return results
+
+
+def measure_star_cutouts(cutouts: Sequence[np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Measure a list of star cutouts, batching cutouts of the same shape.
+
+    Args:
+        cutouts: 2D star cutouts (edge cutouts may be smaller)
+
+    Returns:
+        dict: 'fwhm', 'eccentricity' and 'hfr' arrays aligned with cutouts
+    """
+    results = {key: np.full(len(cutouts), np.nan) for key in ('fwhm', 'eccentricity', 'hfr')}
+    by_shape: Dict[Tuple[int, ...], list] = {}
+    for index, cutout in enumerate(cutouts):
+        if cutout.size:
+            by_shape.setdefault(cutout.shape, []).append(index)
+    for indices in by_shape.values():
+        measured = measure_stars(np.stack([cutouts[index] for index in indices]))
+        for key, values in measured.items():
+            results[key][indices] = values
+    return results
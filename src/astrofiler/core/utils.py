@@ -6,9 +6,14 @@ for path normalization, string sanitization, and FITS header processing.
 """
 
 import os
+import time
 import logging
 import configparser
-from typing import Optional, Dict, Any, List, Union
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Dict, Any, Callable, Iterator, List, Sequence, Tuple, Union
 from pathlib import Path
 
 from ..types import FilePath, FitsHeaderDict
@@ -401,4 +406,131 @@ def get_master_calibration_path() -> Optional[str]:
         return os.path.join(repo_folder, 'Masters')
     except Exception as e:
         logger.error(f"Error getting master calibration path: {e}")
-        return os.path.join('.', 'Masters')
\ No newline at end of file
+        return os.path.join('.', 'Masters')
+
+PROCESSING_PRECISIONS = ('float32', 'float64')
+
+
+def get_processing_precision(config_path: str = 'astrofiler.ini') -> str:
+    """
+    Get the floating-point precision used for calibration and quality analysis.
+
+    Reads 'processing_precision' from the DEFAULT section of astrofiler.ini.
+    float32 halves the working memory of every frame; calibrated output is
+    written as float32 either way.
+
+    Returns:
+        'float32' (default) or 'float64'
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    precision = config.get('DEFAULT', 'processing_precision', fallback='float32').strip().lower()
+    if precision not in PROCESSING_PRECISIONS:
+        logger.warning(f"Unknown processing_precision '{precision}', using float32")
+        precision = 'float32'
+    return precision
+
+
+def get_worker_count(key: str, config_path: str = 'astrofiler.ini') -> int:
+    """
+    Get the number of worker processes configured for a pool.
+
+    Reads key (e.g. 'quality_workers') from the DEFAULT section of
+    astrofiler.ini. A value of 1 runs the work in the calling process.
+
+    Returns:
+        Worker count (default: CPU count - 1, at most 4)
+    """
+    default = max(1, min(4, (os.cpu_count() or 2) - 1))
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    try:
+        workers = config.getint('DEFAULT', key, fallback=default)
+    except ValueError:
+        workers = default
+    return max(1, workers)
+
+
+def ordered_process_map(func: Callable[[Any], Any], items: Sequence[Any],
+                        serial: Callable[[Sequence[Any]], Iterator[Tuple[Any, Any]]],
+                        workers: int, max_pending: int, name: str,
+                        initializer: Optional[Callable[..., None]] = None,
+                        initargs: Tuple = ()) -> Iterator[Tuple[Any, Any]]:
+    """
+    Run func over items in a process pool, yielding results in input order.
+
+    At most max_pending items are queued or in flight. With one worker or a
+    single item, or once the pool breaks (a worker crashed), the remaining
+    items are handed to serial in the calling process.
+
+    Workers are spawned rather than forked on every platform, so they never
+    inherit the parent's open SQLite connection; func and initializer must
+    not write to the database and should return what is to be stored.
+
+    Args:
+        func: Picklable worker function, called as func(item)
+        items: Items to process
+        serial: In-process fallback yielding (item, result) for a list of items
+        workers: Worker processes
+        max_pending: Maximum items in flight
+        name: Pool name for log messages (e.g. 'Quality')
+        initializer: Worker initializer
+        initargs: Arguments of the initializer
+
+    Yields:
+        (item, result) in the order of items
+    """
+    items = list(items)
+    if workers <= 1 or len(items) < 2:
+        yield from serial(items)
+        return
+
+    done = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=initializer, initargs=initargs) as pool:
+            pending = deque()
+            for item in items:
+                pending.append((item, pool.submit(func, item)))
+                if len(pending) >= max_pending:
+                    item_done, future = pending.popleft()
+                    yield item_done, future.result()
+                    done += 1
+            while pending:
+                item_done, future = pending.popleft()
+                yield item_done, future.result()
+                done += 1
+    except BrokenProcessPool as e:
+        logger.warning(f"{name} worker pool failed ({e}); processing remaining {len(items) - done} items in-process")
+        yield from serial(items[done:])
+
+
+def run_with_db_retry(operation: Callable[[], Any], description: str,
+                      max_retries: int = 5, retry_delay: float = 0.1) -> Any:
+    """
+    Run a database operation in one transaction, retrying while the database is locked.
+
+    Args:
+        operation: Callable doing the writes
+        description: What is written, for the error message
+        max_retries: Attempts while the database is locked
+        retry_delay: Initial delay between attempts (seconds)
+
+    Returns:
+        The operation's return value
+
+    Raises:
+        RuntimeError: If the database stays locked or the operation fails
+    """
+    from ..models import db
+
+    for attempt in range(max_retries):
+        try:
+            with db.atomic():
+                return operation()
+        except Exception as e:
+            if 'database is locked' in str(e).lower() and attempt < max_retries - 1:
+                time.sleep(retry_delay * (attempt + 1))
+                logger.debug(f"Database locked, retrying ({attempt + 1}/{max_retries})...")
+            else:
+                raise RuntimeError(f"Database update failed for {description}: {e}")
@@ -9,5 +9,8 @@ from .fits_file import fitsFile
 from .fits_session import fitsSession
 from .mapping import Mapping
 from .masters import Masters
+from .file_journal import FileJournal
+from .file_hash_cache import FileHashCache
+from .alignment_transform import AlignmentTransform
 
-__all__ = ['BaseModel', 'db', 'fitsFile', 'fitsSession', 'Mapping', 'Masters']
\ No newline at end of file
+__all__ = ['BaseModel', 'db', 'fitsFile', 'fitsSession', 'Mapping', 'Masters', 'FileJournal', 'FileHashCache', 'AlignmentTransform']
\ No newline at end of file
@@ -0,0 +1,34 @@
+"""
+Alignment transform cache model for AstroFiler.
+
+This model stores the affine transform that registers a light frame onto a
+reference frame, keyed by the content hashes of both files, so star matching
+runs once per (frame, reference) pair across passes and stacks.
+"""
+
+import json
+import peewee as pw
+from .base import BaseModel
+
+class AlignmentTransform(BaseModel):
+    """Model caching the 3x3 affine matrix mapping a frame onto a reference frame."""
+    
+    frame_hash = pw.TextField()  # SHA-256 of the frame file
+    reference_hash = pw.TextField()  # SHA-256 of the reference file
+    matrix = pw.TextField()  # JSON 3x3 matrix, frame (x, y) -> reference (x, y)
+    method = pw.TextField(default='astroalign')
+    frame_path = pw.TextField(null=True)  # Last path the frame was aligned under (informational)
+    created_at = pw.DateTimeField(null=True)
+
+    class Meta:
+        table_name = 'alignmentTransform'
+        primary_key = pw.CompositeKey('frame_hash', 'reference_hash')
+    
+    def get_matrix(self):
+        """
+        Decode the stored transform.
+        
+        Returns:
+            list: 3x3 matrix as nested lists
+        """
+        return json.loads(self.matrix)
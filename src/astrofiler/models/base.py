@@ -39,4 +39,29 @@ class BaseModel(pw.Model):
     """Base model class for all AstroFiler database models."""
     
     class Meta:
-        database = db
\ No newline at end of file
+        database = db
+
+def numeric_match(text_field, value_field, value):
+    """Build a match expression for a numeric value stored as TEXT.
+
+    Compares against the typed shadow column (maintained by triggers) when the
+    value parses as a number, so "300" matches "300.0" and the composite
+    indexes can be used. Non-numeric values fall back to the text column.
+
+    Args:
+        text_field: The TEXT field (e.g. fitsFile.fitsFileExpTime)
+        value_field: Its numeric shadow field (e.g. fitsFile.fitsFileExpTimeValue)
+        value: Value to match
+
+    Returns:
+        A peewee expression
+    """
+    try:
+        number = float(str(value).strip())
+    except (TypeError, ValueError):
+        return text_field == value
+    if isinstance(value_field, pw.IntegerField):
+        if not number.is_integer():
+            return text_field == value
+        number = int(number)
+    return value_field == number
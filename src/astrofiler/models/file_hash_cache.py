@@ -0,0 +1,39 @@
+"""
+File hash cache model for AstroFiler.
+
+This model stores content digests keyed by file identity (device, inode) and
+validated by the stat signature (size, mtime_ns), so a file that has not
+changed since it was last hashed never has to be read again.
+"""
+
+import peewee as pw
+from .base import BaseModel
+
+class FileHashCache(BaseModel):
+    """Model caching SHA-256 and MD5 digests of a file identified by device and inode."""
+    
+    device = pw.BigIntegerField()
+    inode = pw.BigIntegerField()
+    file_size = pw.BigIntegerField()
+    mtime_ns = pw.BigIntegerField()
+    sha256 = pw.TextField(null=True)
+    md5 = pw.TextField(null=True)
+    path = pw.TextField(null=True)  # Last path the file was hashed under (informational)
+    hashed_at = pw.DateTimeField(null=True)
+
+    class Meta:
+        table_name = 'fileHashCache'
+        primary_key = pw.CompositeKey('device', 'inode')
+    
+    def matches_stat(self, file_size, mtime_ns):
+        """
+        Check whether the cached digests are still valid for a stat signature.
+        
+        Args:
+            file_size (int): Current file size in bytes
+            mtime_ns (int): Current modification time in nanoseconds
+            
+        Returns:
+            bool: True if the file is unchanged since it was hashed
+        """
+        return self.file_size == file_size and self.mtime_ns == mtime_ns
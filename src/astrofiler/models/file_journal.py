@@ -0,0 +1,42 @@
+"""
+File journal model for AstroFiler.
+
+This model records the stat signature of every repository file that has been
+registered, so repository syncs can skip files that have not changed.
+"""
+
+import peewee as pw
+from .base import BaseModel
+
+class FileJournal(BaseModel):
+    """Model recording the last known stat signature and hash of a repository file."""
+    
+    path = pw.TextField(primary_key=True)  # Normalized full path
+    file_size = pw.BigIntegerField()
+    mtime_ns = pw.BigIntegerField()
+    inode = pw.BigIntegerField(null=True)
+    file_hash = pw.TextField(null=True)  # SHA-256 of the registered file
+    fits_file_id = pw.TextField(null=True)  # fitsFile or Masters id the file was registered as
+    last_seen = pw.DateTimeField(null=True)
+
+    class Meta:
+        table_name = 'fileJournal'
+    
+    def matches_stat(self, file_size, mtime_ns, inode):
+        """
+        Check whether a stat signature matches the journaled one.
+        
+        Args:
+            file_size (int): Current file size in bytes
+            mtime_ns (int): Current modification time in nanoseconds
+            inode (int): Current inode number (0 where the platform has none)
+            
+        Returns:
+            bool: True if the file is unchanged since it was journaled
+        """
+        if self.file_size != file_size or self.mtime_ns != mtime_ns:
+            return False
+        # Some platforms/filesystems report inode 0; only compare real inodes
+        if self.inode and inode and self.inode != inode:
+            return False
+        return True
@@ -29,6 +29,8 @@ class fitsFile(BaseModel):
     fitsFileObserver = pw.TextField(null=True)
     fitsFileNotes = pw.TextField(null=True)
     fitsFileHash = pw.TextField(null=True)
+    fitsFileSize = pw.BigIntegerField(null=True)  # File size in bytes (duplicate pre-filter)
+    fitsFilePartialHash = pw.TextField(null=True)  # SHA-256 of size + first/last MiB
     fitsFileSession = pw.TextField(null=True)
     fitsFileCloudURL = pw.TextField(null=True)
     fitsFileSoftDelete = pw.BooleanField(null=True, default=False)
@@ -43,6 +45,15 @@ class fitsFile(BaseModel):
     fitsFileImageSNR = pw.FloatField(null=True)  # Signal-to-noise ratio for image
     fitsFileStarCount = pw.IntegerField(null=True)  # Number of detected stars
     fitsFileImageScale = pw.FloatField(null=True)  # Arcsec/pixel scale
+    fitsFileQualityHash = pw.TextField(null=True)  # SHA-256 of the file when the metrics were measured
+
+    # Typed shadows of the TEXT matching fields, maintained by database triggers
+    fitsFileExpTimeValue = pw.FloatField(null=True)
+    fitsFileXBinningValue = pw.IntegerField(null=True)
+    fitsFileYBinningValue = pw.IntegerField(null=True)
+    fitsFileCCDTempValue = pw.FloatField(null=True)
+    fitsFileGainValue = pw.FloatField(null=True)
+    fitsFileOffsetValue = pw.FloatField(null=True)
 
     class Meta:
         table_name = 'fitsFile'
@@ -40,6 +40,14 @@ class fitsSession(BaseModel):
     fitsSessionStarCount = pw.IntegerField(null=True)  # Average detected stars
     fitsSessionImageScale = pw.FloatField(null=True)  # Image scale in arcsec/pixel
 
+    # Typed shadows of the TEXT matching fields, maintained by database triggers
+    fitsSessionExposureValue = pw.FloatField(null=True)
+    fitsSessionBinningXValue = pw.IntegerField(null=True)
+    fitsSessionBinningYValue = pw.IntegerField(null=True)
+    fitsSessionCCDTempValue = pw.FloatField(null=True)
+    fitsSessionGainValue = pw.FloatField(null=True)
+    fitsSessionOffsetValue = pw.FloatField(null=True)
+
     class Meta:
         table_name = 'fitsSession'
     
@@ -6,11 +6,10 @@ This model handles master calibration frames separately from fitsFile and fitsSe
 
 import peewee as pw
 import datetime
-import hashlib
 import os
 import logging
 import time
-from .base import BaseModel
+from .base import BaseModel, numeric_match
 
 logger = logging.getLogger(__name__)
 
@@ -42,6 +41,14 @@ class Masters(BaseModel):
     notes = pw.TextField(null=True)  # Additional notes
     soft_delete = pw.BooleanField(default=False)  # Soft delete flag
 
+    # Typed shadows of the TEXT matching fields, maintained by database triggers
+    exposure_time_value = pw.FloatField(null=True)
+    binning_x_value = pw.IntegerField(null=True)
+    binning_y_value = pw.IntegerField(null=True)
+    ccd_temp_value = pw.FloatField(null=True)
+    gain_value = pw.FloatField(null=True)
+    offset_value = pw.FloatField(null=True)
+
     class Meta:
         table_name = 'Masters'
 
@@ -68,14 +75,16 @@ class Masters(BaseModel):
         
         # Add type-specific criteria
         if master_type == 'dark' and 'exposure_time' in criteria:
-            query = query.where(cls.exposure_time == criteria['exposure_time'])
+            query = query.where(numeric_match(cls.exposure_time, cls.exposure_time_value,
+                                              criteria['exposure_time']))
         elif master_type == 'flat' and 'filter_name' in criteria:
             query = query.where(cls.filter_name == criteria['filter_name'])
             
         # Add binning criteria only (removed ccd_temp, gain, offset for more flexible matching)
         for field in ['binning_x', 'binning_y']:
             if field in criteria and criteria[field] is not None:
-                query = query.where(getattr(cls, field) == criteria[field])
+                query = query.where(numeric_match(getattr(cls, field), getattr(cls, f'{field}_value'),
+                                                  criteria[field]))
                 
         return query.first()
     
@@ -129,8 +138,8 @@ class Masters(BaseModel):
         file_size = None
         if os.path.exists(master_path):
             file_size = os.path.getsize(master_path)
-            with open(master_path, 'rb') as f:
-                file_hash = hashlib.md5(f.read()).hexdigest()
+            from ..core.services.file_hash_calculator import get_file_hash_calculator
+            file_hash = get_file_hash_calculator().calculate_md5(master_path)
         
         def create_operation():
             return cls.create(
@@ -166,9 +175,9 @@ class Masters(BaseModel):
             return False
             
         if self.hash_value:
-            with open(self.master_path, 'rb') as f:
-                current_hash = hashlib.md5(f.read()).hexdigest()
-                return current_hash == self.hash_value
+            from ..core.services.file_hash_calculator import get_file_hash_calculator
+            current_hash = get_file_hash_calculator().calculate_md5(self.master_path, use_cache=False)
+            return current_hash == self.hash_value
                 
         return True
     
@@ -1,11 +1,16 @@
 import os
 import logging
-import hashlib
 from pathlib import Path
 
+from ..core.services.file_hash_calculator import get_file_hash_calculator
+
 # Debug flag: if True, only report actions; if False, perform sync
 DEBUG = False
 
+# Local files whose hashes are computed together during the upload phase;
+# progress is reported and cancellation checked between chunks
+HASH_CHUNK_SIZE = 32
+
 logger = logging.getLogger(__name__)
 
 def _calculate_md5_hash(file_path):
@@ -19,11 +24,7 @@ def _calculate_md5_hash(file_path):
         str: MD5 hash as hexadecimal string, or None if error
     """
     try:
-        hash_md5 = hashlib.md5()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+        return get_file_hash_calculator().calculate_md5(file_path)
     except Exception as e:
         logger.error(f"Error calculating MD5 hash for {file_path}: {e}")
         return None
@@ -118,7 +119,7 @@ def _get_cloud_file_hashes(client, bucket_name, prefix):
         logger.error(f"Error retrieving cloud file hashes: {e}")
         return {}
 
-def _should_upload_file_bulk(cloud_hashes, gcs_object_name, local_file_path):
+def _should_upload_file_bulk(cloud_hashes, gcs_object_name, local_file_path, local_md5=None):
     """
     Determine if a file should be uploaded using pre-fetched cloud hashes.
     This is more efficient than checking files individually.
@@ -127,6 +128,7 @@ def _should_upload_file_bulk(cloud_hashes, gcs_object_name, local_file_path):
         cloud_hashes (dict): Dictionary of cloud object names to MD5 hashes
         gcs_object_name (str): Object name in GCS
         local_file_path (str): Path to local file
+        local_md5 (str): Pre-computed MD5 of the local file, if available
         
     Returns:
         tuple: (should_upload: bool, reason: str)
@@ -136,7 +138,8 @@ def _should_upload_file_bulk(cloud_hashes, gcs_object_name, local_file_path):
         return True, "file does not exist in cloud"
     
     # Calculate local file hash
-    local_md5 = _calculate_md5_hash(local_file_path)
+    if not local_md5:
+        local_md5 = _calculate_md5_hash(local_file_path)
     if not local_md5:
         return True, "could not calculate local file hash"
     
@@ -479,6 +482,16 @@ def sync_with_google_cloud_repo(gcs_repo_path, auth_info, local_repo_path, sync_
         excluded_count = 0
         replaced_count = 0  # Files replaced due to header modifications
         
+        # Local files that also exist in the cloud are hashed concurrently, one
+        # chunk of HASH_CHUNK_SIZE files at a time as the loop reaches them
+        def needs_hash(file_path):
+            normalized_path = file_path.replace('\\', '/')
+            return prefix + normalized_path in cloud_hashes and normalized_path not in downloaded_files
+
+        calculator = get_file_hash_calculator()
+        local_hashes = {}
+        hashed_until = 0
+        
         for i, file_path in enumerate(local_files):
             try:
                 full_local_path = os.path.join(local_repo_path, file_path)
@@ -507,8 +520,15 @@ def sync_with_google_cloud_repo(gcs_repo_path, auth_info, local_repo_path, sync_
                         logger.info("Google Sync operation was cancelled by user")
                         return
                 
+                if i >= hashed_until:
+                    hashed_until = i + HASH_CHUNK_SIZE
+                    local_hashes = calculator.hash_files(
+                        [os.path.join(local_repo_path, path) for path in local_files[i:hashed_until] if needs_hash(path)],
+                        ['md5'])
+                
                 # Check if file should be uploaded (compare hashes using bulk method)
-                should_upload, reason = _should_upload_file_bulk(cloud_hashes, gcs_object_name, full_local_path)
+                local_md5 = (local_hashes.get(full_local_path) or {}).get('md5')
+                should_upload, reason = _should_upload_file_bulk(cloud_hashes, gcs_object_name, full_local_path, local_md5)
                 
                 # Special case: If this file was downloaded but now has a different hash due to
                 # header modifications during registration, we should replace the cloud version
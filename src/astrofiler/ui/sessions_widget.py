@@ -496,6 +496,7 @@ class SessionsWidget(QWidget):
             from astropy.io import fits
             import numpy as np
             from ..core.master_manager import get_master_manager
+            from ..core.fits_access import read_fits_image
             from ..models import Masters
             from ..core.utils import normalize_file_path
             import uuid
@@ -613,55 +614,24 @@ class SessionsWidget(QWidget):
             master_dark_data = None
             master_flat_data = None
 
-            def _extract_image_hdu(hdul):
-                """Return the first HDU with 2D image data, or None."""
-                for hdu in hdul:
-                    data = getattr(hdu, 'data', None)
-                    if data is None:
-                        continue
-                    arr = np.asarray(data)
-                    # Some writers store a single plane as (1, H, W)
-                    if arr.ndim == 3 and arr.shape[0] == 1:
-                        arr = arr[0]
-                    if arr.ndim != 2:
-                        continue
-                    return hdu, arr
-                return None, None
-
-            def _read_fits_image(file_path: str):
-                """Read a FITS image, handling data-in-extension FITS files.
-
-                Returns (data, header). Header is taken from the image HDU when
-                available; falls back to primary header.
-                """
-                with fits.open(file_path) as hdul:
-                    primary_header = hdul[0].header.copy()
-                    hdu, data = _extract_image_hdu(hdul)
-                    if data is None:
-                        raise ValueError("No 2D image data found in any HDU")
-                    header = getattr(hdu, 'header', None)
-                    return data, (header.copy() if header is not None else primary_header)
-            
+            # Masters come from the shared master cache (read-only float32 arrays)
             try:
                 if has_bias:
                     progress.setLabelText("Loading bias master...")
                     QApplication.processEvents()
-                    bias_data, _bias_header = _read_fits_image(master_bias.master_path)
-                    master_bias_data = bias_data.astype(np.float32, copy=False)
+                    master_bias_data = master_manager.load_master_data(master_bias)
                     logger.info(f"Loaded bias master: {os.path.basename(master_bias.master_path)}")
                 
                 if has_dark:
                     progress.setLabelText("Loading dark master...")
                     QApplication.processEvents()
-                    dark_data, _dark_header = _read_fits_image(master_dark.master_path)
-                    master_dark_data = dark_data.astype(np.float32, copy=False)
+                    master_dark_data = master_manager.load_master_data(master_dark)
                     logger.info(f"Loaded dark master: {os.path.basename(master_dark.master_path)}")
                 
                 if has_flat:
                     progress.setLabelText("Loading flat master...")
                     QApplication.processEvents()
-                    flat_data, _flat_header = _read_fits_image(master_flat.master_path)
-                    master_flat_data = flat_data.astype(np.float32, copy=False)
+                    master_flat_data = master_manager.load_master_data(master_flat)
                     flat_mean = np.mean(master_flat_data)
                     if flat_mean > 0:
                         master_flat_data = master_flat_data / flat_mean
@@ -703,13 +673,10 @@ class SessionsWidget(QWidget):
                         error_count += 1
                         continue
                     
-                    # Load light frame
-                    light_data0, light_header = _read_fits_image(light_file.fitsFileName)
-                    light_data = light_data0.astype(np.float32, copy=False)
+                    # Load light frame as a writable float32 copy
+                    calibrated_data, light_header = read_fits_image(light_file.fitsFileName, dtype=np.float32)
                     
                     # Apply calibration: (Light - Bias - Dark) / Flat
-                    calibrated_data = light_data.copy()
-                    
                     bias_data = master_bias_data
                     if bias_data is not None and bias_data.shape != calibrated_data.shape:
                         logger.warning(
@@ -852,6 +819,7 @@ class SessionsWidget(QWidget):
         """Create a quick stack of calibrated frames for review and open it in external viewer."""
         progress = None
         try:
+            from ..core.frame_weighting import select_stack_frames
             from ..core.master_manager import get_master_manager
             from ..core.utils import sanitize_filesystem_name
 
@@ -920,7 +888,9 @@ class SessionsWidget(QWidget):
                 QMessageBox.information(self, "No Frames", "No light frames were found to stack.")
                 return
 
-            file_paths = [f.fitsFileName for f in stack_candidates if f.fitsFileName and os.path.exists(f.fitsFileName)]
+            # Reject and weight frames from stored quality metrics before any pixel I/O
+            selection = select_stack_frames(stack_candidates)
+            file_paths = selection.paths
             if len(file_paths) < 2:
                 QMessageBox.information(self, "Not Enough Frames", "Need at least 2 frames to create a stack.")
                 return
@@ -961,7 +931,9 @@ class SessionsWidget(QWidget):
                 output_path=output_path,
                 cal_type='light',
                 progress_callback=_progress_callback,
+                reference_path=selection.reference_path,
                 thumbnail_session_id=str(session.fitsSessionId),
+                frame_weights=selection.weights,
             )
 
             progress.setValue(100)
@@ -988,6 +960,7 @@ class SessionsWidget(QWidget):
         """Create a photometry-safe stack of light frames and open it in the external viewer."""
         progress = None
         try:
+            from astrofiler.core.frame_weighting import select_stack_frames
             from astrofiler.core.master_manager import get_master_manager
             from astrofiler.core.utils import sanitize_filesystem_name
             from astrofiler.models import fitsSession as FitsSessionModel
@@ -1054,28 +1027,15 @@ class SessionsWidget(QWidget):
                 QMessageBox.information(self, "No Frames", "No light frames were found to stack.")
                 return
 
-            file_paths = [f.fitsFileName for f in stack_candidates if f.fitsFileName and os.path.exists(f.fitsFileName)]
+            # Reject and weight frames from stored quality metrics before any pixel I/O
+            selection = select_stack_frames(stack_candidates)
+            file_paths = selection.paths
             if len(file_paths) < 2:
                 QMessageBox.information(self, "Not Enough Frames", "Need at least 2 frames to create a stack.")
                 return
 
-            # Prefer best-HFR as reference if available
-            best_ref_path = None
-            best_hfr = None
-            for f in stack_candidates:
-                p = getattr(f, 'fitsFileName', None)
-                if not p or not os.path.exists(p):
-                    continue
-                hfr = getattr(f, 'fitsFileAvgHFRArcsec', None)
-                if hfr is None:
-                    continue
-                try:
-                    hfr_val = float(hfr)
-                except Exception:
-                    continue
-                if best_hfr is None or hfr_val < best_hfr:
-                    best_hfr = hfr_val
-                    best_ref_path = p
+            # Prefer the sharpest kept frame as reference if metrics are available
+            best_ref_path = selection.reference_path
 
             out_dir = os.path.dirname(file_paths[0])
             date_str = str(session.fitsSessionDate) if session.fitsSessionDate else "unknown_date"
@@ -1110,6 +1070,7 @@ class SessionsWidget(QWidget):
                 progress_callback=_progress_callback,
                 reference_path=best_ref_path,
                 thumbnail_session_id=str(session.fitsSessionId),
+                frame_weights=selection.weights,
             )
 
             progress.setValue(100)
@@ -0,0 +1,11 @@
+"""Pytest configuration: import astrofiler from src rather than the root astrofiler.py."""
+
+import os
+import sys
+
+src_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+# Ensure src path is first in path to avoid conflicts with root astrofiler.py
+if src_path in sys.path:
+    sys.path.remove(src_path)
+sys.path.insert(0, src_path)
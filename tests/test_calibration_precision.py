@@ -0,0 +1,84 @@
+"""
+Precision of float32 light calibration against float64.
+
+CalibrationMasters.apply() calibrates integer lights in the configured
+processing precision. These tests calibrate synthetic uint16 lights with a
+bias, a dark and a vignetted flat in float32 and in float64 and check that
+the float32 result stays within FLOAT32_TOLERANCE of the float64 one,
+relative to the peak of the calibrated frame.
+"""
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from astrofiler.core import calibration_engine
+from astrofiler.core.calibration_engine import FLOAT32_TOLERANCE, FLAT_THRESHOLD, CalibrationMasters
+
+SHAPE = (256, 320)
+
+
+def _write(path, data):
+    fits.PrimaryHDU(data).writeto(path, overwrite=True)
+    return str(path)
+
+
+@pytest.fixture
+def frames(tmp_path):
+    """Bias, dark and vignetted flat masters, plus uint16 lights."""
+    rng = np.random.default_rng(42)
+    yy, xx = np.mgrid[:SHAPE[0], :SHAPE[1]]
+    radius = np.hypot((yy - SHAPE[0] / 2) / SHAPE[0], (xx - SHAPE[1] / 2) / SHAPE[1])
+
+    bias = rng.normal(500.0, 5.0, SHAPE).astype(np.float32)
+    dark = bias + rng.gamma(2.0, 20.0, SHAPE).astype(np.float32)
+    vignetting = 1.0 - 0.6 * radius ** 2
+    flat = (bias + 30000.0 * vignetting * rng.normal(1.0, 0.01, SHAPE)).astype(np.float32)
+
+    lights = []
+    for _ in range(3):
+        sky = 2000.0
+        stars = np.zeros(SHAPE)
+        for y, x in rng.uniform((0, 0), SHAPE, size=(40, 2)):
+            stars += 40000.0 * np.exp(-((yy - y) ** 2 + (xx - x) ** 2) / (2 * 2.0 ** 2))
+        light = rng.poisson(dark + (sky + stars) * vignetting)
+        lights.append(np.clip(light, 0, 65535).astype(np.uint16))
+
+    masters = {
+        'bias_master': _write(tmp_path / 'bias.fits', bias),
+        'dark_master': _write(tmp_path / 'dark.fits', dark),
+        'flat_master': _write(tmp_path / 'flat.fits', flat),
+    }
+    return masters, lights, (bias, dark, flat)
+
+
+def _calibrate(monkeypatch, masters, light, precision):
+    monkeypatch.setattr(calibration_engine, 'get_processing_precision', lambda *args, **kwargs: precision)
+    calibrated, steps = CalibrationMasters.load(**masters).apply(light)
+    assert calibrated.dtype == np.dtype(precision)
+    assert len(steps) == 2
+    return calibrated
+
+
+def _relative_error(result, reference):
+    return np.max(np.abs(result.astype(np.float64) - reference)) / np.max(np.abs(reference))
+
+
+def test_float32_matches_float64_calibration(monkeypatch, frames):
+    masters, lights, _ = frames
+    for light in lights:
+        single = _calibrate(monkeypatch, masters, light, 'float32')
+        double = _calibrate(monkeypatch, masters, light, 'float64')
+        assert _relative_error(single, double) <= FLOAT32_TOLERANCE
+
+
+def test_float32_matches_float64_reference(monkeypatch, frames):
+    masters, lights, (bias, dark, flat) = frames
+    # (Light - (Dark - Bias)) / normalized flat, entirely in float64
+    dark = dark.astype(np.float64) - bias
+    flat = flat.astype(np.float64) - dark
+    flat = np.maximum(flat / flat.mean(), FLAT_THRESHOLD)
+    for light in lights:
+        reference = (light.astype(np.float64) - dark) / flat
+        single = _calibrate(monkeypatch, masters, light, 'float32')
+        assert _relative_error(single, reference) <= FLOAT32_TOLERANCE
@@ -0,0 +1,158 @@
+"""
+Behaviour of the band-wise stacking rejection methods and frame sources.
+
+Every pixel of the synthetic stack holds the same symmetric set of offsets
+around a per-pixel base value, shuffled across frames, so no method rejects
+anything from a clean pixel and min/max rejection leaves its mean unchanged.
+Two pixels get a hot and a cold outlier in one frame each.
+"""
+
+import gzip
+import shutil
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from astrofiler.core import stacking
+from astrofiler.core.stacking import REJECTION_METHODS, BandStack, combine_band, combine_stack
+
+OFFSETS = np.array([-1.0, -0.6, -0.3, -0.1, 0.0, 0.1, 0.3, 0.6, 1.0], dtype=np.float32)
+SHAPE = (12, 10)
+HOT = (5, 4)
+COLD = (2, 7)
+REJECTING_METHODS = [method for method in REJECTION_METHODS if method != 'none']
+
+
+@pytest.fixture
+def stack_data():
+    """(frames, base): a shuffled stack with one hot and one cold outlier, and its clean values."""
+    rng = np.random.default_rng(7)
+    base = rng.uniform(500.0, 1500.0, SHAPE).astype(np.float32)
+    frames = np.stack([base + offset for offset in OFFSETS])
+    order = np.argsort(rng.random(frames.shape), axis=0)
+    frames = np.take_along_axis(frames, order, axis=0)
+    frames[3][HOT] = base[HOT] + 5000.0
+    frames[6][COLD] = base[COLD] * 0.5
+    return frames, base
+
+
+def _clean_pixels():
+    clean = np.ones(SHAPE, dtype=bool)
+    clean[HOT] = clean[COLD] = False
+    return clean
+
+
+def _write(path, data):
+    fits.PrimaryHDU(data).writeto(path, overwrite=True)
+    return str(path)
+
+
+def _gzip(path):
+    with open(path, 'rb') as source, gzip.open(f'{path}.gz', 'wb') as target:
+        shutil.copyfileobj(source, target)
+    return f'{path}.gz'
+
+
+@pytest.mark.parametrize('method', REJECTING_METHODS)
+def test_rejection_removes_outliers_and_keeps_clean_pixels(stack_data, method):
+    frames, base = stack_data
+    mean, count, _center = combine_band(frames, method)
+    # min/max rejection always drops the lowest and the highest value
+    dropped = 2 if method == 'minmax' else 0
+    clean = _clean_pixels()
+
+    assert np.all(count[clean] == len(OFFSETS) - dropped)
+    np.testing.assert_allclose(mean[clean], frames.mean(axis=0)[clean], rtol=1e-6)
+    for pixel in (HOT, COLD):
+        assert count[pixel] == len(OFFSETS) - max(1, dropped)
+        assert abs(mean[pixel] - base[pixel]) < 0.5
+
+
+def test_no_rejection_keeps_every_value(stack_data):
+    frames, _base = stack_data
+    mean, count, _center = combine_band(frames, 'none')
+    assert np.all(count == len(OFFSETS))
+    np.testing.assert_allclose(mean, frames.mean(axis=0), rtol=1e-6)
+
+
+def test_non_finite_values_are_missing(stack_data):
+    frames, base = stack_data
+    frames[0, 0, 0] = np.nan
+    frames[1, 0, 0] = np.inf
+    frames[:, 1, 1] = np.nan
+    mean, count, _center = combine_band(frames, 'sigma')
+    assert count[0, 0] == len(OFFSETS) - 2
+    assert np.isfinite(mean[0, 0])
+    assert count[1, 1] == 0
+    assert np.isnan(mean[1, 1])
+
+
+@pytest.mark.parametrize('method', list(REJECTION_METHODS))
+def test_combine_stack_does_not_depend_on_frame_order(stack_data, method):
+    frames, _base = stack_data
+    weights = np.linspace(0.5, 2.0, len(frames))
+    reverse = np.random.default_rng(3).permutation(len(frames))
+
+    results = []
+    for order in (np.arange(len(frames)), reverse):
+        with BandStack(SHAPE) as stack:
+            for index in order:
+                stack.add_array(f'frame{index}.fits', frames[index])
+            results.append(combine_stack(stack, method, weights=weights[order], memory_budget=1))
+
+    (master, rejected, total), (reordered, reordered_rejected, reordered_total) = results
+    np.testing.assert_allclose(reordered, master, rtol=1e-6)
+    assert (reordered_rejected, reordered_total) == (rejected, total)
+
+
+def test_weighted_combine_stack_is_weighted_mean(stack_data):
+    frames, base = stack_data
+    weights = np.linspace(0.5, 2.0, len(frames))
+    with BandStack(SHAPE) as stack:
+        for index, frame in enumerate(frames):
+            stack.add_array(f'frame{index}.fits', frame)
+        plain, _rejected, _total = combine_stack(stack, 'none', weights=weights)
+        clipped, rejected, total = combine_stack(stack, 'sigma', weights=weights)
+        with pytest.raises(ValueError):
+            combine_stack(stack, 'sigma', weights=weights[1:])
+
+    np.testing.assert_allclose(plain, np.average(frames, axis=0, weights=weights), rtol=1e-6)
+    clean = _clean_pixels()
+    np.testing.assert_allclose(clipped[clean], np.average(frames, axis=0, weights=weights)[clean], rtol=1e-6)
+    for pixel in (HOT, COLD):
+        assert abs(clipped[pixel] - base[pixel]) < 0.5
+    assert (rejected, total) == (2, frames.size)
+
+
+@pytest.mark.parametrize('method', list(REJECTION_METHODS))
+def test_band_stack_sources_match_in_memory_stack(tmp_path, monkeypatch, stack_data, method):
+    frames, _base = stack_data
+    # Two frames stay open, the other plain files are reopened for every band
+    monkeypatch.setattr(stacking, 'get_max_open_readers', lambda: 2)
+    paths = [_write(tmp_path / f'frame{index}.fits', frame) for index, frame in enumerate(frames)]
+
+    expected, _count, _center = combine_band(frames, method)
+    with BandStack(SHAPE, spill_dir=str(tmp_path)) as stack:
+        for index, path in enumerate(paths):
+            if index == 4:
+                stack.add_array(path, frames[index])
+            elif index % 3 == 2:
+                # Stream-compressed frames cannot be sectioned and are spilled
+                stack.add_file(_gzip(path))
+            else:
+                stack.add_file(path)
+        assert len(stack._open_files) == 2
+        assert stack._spill_frames == 4
+        for memory_budget in (1, None):
+            master, _rejected, _total = combine_stack(stack, method, memory_budget=memory_budget)
+            np.testing.assert_array_equal(master, expected)
+
+    assert not list(tmp_path.glob('astrofiler_stack_*'))
+
+
+def test_band_stack_rejects_mismatched_frames():
+    with BandStack(SHAPE) as stack:
+        with pytest.raises(ValueError):
+            stack.add_array('frame.fits', np.zeros((SHAPE[0], SHAPE[1] + 1), dtype=np.float32))
+        assert len(stack) == 0